@@ -7,6 +7,7 @@ import math
 import argparse
 from Bio import SeqIO
 from scripts.Validator.sequencevalidator import SequenceValidator
+from scripts import sequencerecords
 
 
 class Anonymizer(SequenceValidator):
@@ -36,6 +37,23 @@ class Anonymizer(SequenceValidator):
 	_label = "Anonymizer"
 	_legal_formats = ["fastq", "fasta"]
 
+	@staticmethod
+	def _read_records(input_stream, file_format):
+		"""
+			Iterate over the raw records of a stream, read by SeqIO only if it has no underlying binary buffer
+
+			@param input_stream: Input stream of fasta format data
+			@type input_stream: file | io.FileIO | StringIO.StringIO
+			@param file_format: Fasta format of input. Either 'fasta' or 'fastq'.
+			@type file_format: str
+
+			@rtype: collections.Iterable[bytes]
+		"""
+		buffer = getattr(input_stream, "buffer", None)
+		if buffer is not None:
+			return sequencerecords.read_records(buffer, file_format)
+		return (seq_record.format(file_format).encode() for seq_record in SeqIO.parse(input_stream, file_format))
+
 	def anonymize_sequences(
 		self, mapping, input_stream=sys.stdin, output_stream=sys.stdout,
 		sequence_prefix='', file_format="fasta"):
@@ -67,13 +85,11 @@ class Anonymizer(SequenceValidator):
 		assert file_format in self._legal_formats
 
 		sequence_counter = 0
-		for seq_record in SeqIO.parse(input_stream, file_format):
+		for record in self._read_records(input_stream, file_format):
 			anonymous_id = "{pre}{ct}".format(pre=sequence_prefix, ct=sequence_counter)
-			map_line = "{oldid}\t{newid}\n".format(oldid=seq_record.id, newid=anonymous_id)
+			map_line = "{oldid}\t{newid}\n".format(oldid=sequencerecords.get_id(record).decode(), newid=anonymous_id)
 			mapping.write(map_line)
-			seq_record.id = anonymous_id
-			seq_record.description = ''
-			output_stream.write(seq_record.format(file_format))
+			output_stream.write(sequencerecords.rename(record, anonymous_id.encode(), file_format).decode())
 			sequence_counter += 1
 
 	def anonymize_sequence_pairs(
@@ -107,17 +123,15 @@ class Anonymizer(SequenceValidator):
 		assert file_format in self._legal_formats
 
 		sequence_counter = 0
-		for seq_record in SeqIO.parse(input_stream, file_format):
+		for record in self._read_records(input_stream, file_format):
 			mod_value = sequence_counter % 2
 			anonymous_id = "{pre}{ct}/{pair}".format(
 				pre=sequence_prefix,
 				ct=int(math.floor(sequence_counter/2.0)),
 				pair=mod_value+1)
-			map_line = "{oldid}\t{newid}\n".format(oldid=seq_record.id, newid=anonymous_id)
+			map_line = "{oldid}\t{newid}\n".format(oldid=sequencerecords.get_id(record).decode(), newid=anonymous_id)
 			mapping.write(map_line)
-			seq_record.id = anonymous_id
-			seq_record.description = ''
-			output_stream.write(seq_record.format(file_format))
+			output_stream.write(sequencerecords.rename(record, anonymous_id.encode(), file_format).decode())
 			sequence_counter += 1
 
 if __name__ == "__main__":
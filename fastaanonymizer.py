@@ -4,10 +4,15 @@ __version__ = '0.0.8'
 import sys
 import os
 import io
+import math
+import itertools
 import random
+import shutil
+import struct
 import tempfile
-import subprocess
 from scripts.Validator.sequencevalidator import SequenceValidator
+from scripts import sequencerecords
+from scripts.GoldStandardFileFormat.goldstandardfileformat import GoldStandardFileFormat
 
 
 class FastaAnonymizer(SequenceValidator):
@@ -33,51 +38,54 @@ class FastaAnonymizer(SequenceValidator):
 
 	output is the same file with anonymous ids and a mapping form old ids to new ones
 
+	Sequences, or pairs of sequences, are shuffled in external memory:
+	they are scattered into seeded random buckets on disk, each bucket small enough to be shuffled in memory.
+	Concatenating the shuffled buckets gives a random permutation, the same one for the same seed.
 	"""
 
 	_legal_formats = ["fastq", "fasta"]
-	_random_source_file_path = None
 
-	def __init__(self, logfile=None, verbose=True, debug=False, seed=None, tmp_dir=None):
+	# memory of a bucket in relation to its size on disk, while shuffled
+	_bucket_memory_factor = 3
+	_record_size = struct.Struct("<I")
+	_buffer_size = 2**20
+
+	def __init__(self, logfile=None, verbose=True, debug=False, seed=None, tmp_dir=None, max_memory=1):
 		"""
 			Anonymize fasta sequences
 
-			@attention: 'shuf' is used which loads everything into memory!
-
 			@param logfile: file handler or file path to a log file
 			@type logfile: file | io.FileIO | StringIO.StringIO | str | unicode
 			@param verbose: Not verbose means that only warnings and errors will be past to stream
 			@type verbose: bool
 			@param debug: more output and files are kept, manual clean up required
 			@type debug: bool
-			@param seed: The seed written to the random_source file used by the 'shuf' command
+			@param seed: Seed of the random state the seeds of shuffles are drawn from
 			@type seed: long | int | float | str | unicode
-			@param tmp_dir: directory for temporary files, like the random_source file for 'shuf'
+			@param tmp_dir: directory for temporary files, like the buckets of shuffled sequences
 			@type tmp_dir: str | unicode
+			@param max_memory: Maximum memory (RAM) in gigabyte used to shuffle a bucket of sequences
+			@type max_memory: int | float
 
 			@return: None
 			@rtype: None
 		"""
 		assert isinstance(verbose, bool)
 		assert isinstance(debug, bool)
-		assert seed is None or isinstance(seed, (long, int, float, str))
+		assert seed is None or isinstance(seed, (int, float, str))
+		assert isinstance(max_memory, (int, float)) and max_memory > 0
 		assert tmp_dir is None or isinstance(tmp_dir, str)
 		if tmp_dir is not None:
 			assert self.validate_dir(tmp_dir)
 		else:
 			tmp_dir = tempfile.gettempdir()
 		self._tmp_dir = tmp_dir
+		self._max_memory = int(max_memory * 2**30)
 		super(FastaAnonymizer, self).__init__(logfile, verbose, debug, label="FastaAnonymizer")
 
 		if seed is not None:
 			random.seed(seed)
 
-		script_dir = os.path.dirname(self.get_full_path(__file__))
-		self._anonymizer = os.path.join(script_dir, "anonymizer.py")
-		self._fastastreamer = os.path.join(script_dir, "fastastreamer.py")
-		assert self.validate_file(self._anonymizer)
-		assert self.validate_file(self._fastastreamer)
-
 	def _close(self):
 		self._logger = None
 		if self._debug:
@@ -87,103 +95,9 @@ class FastaAnonymizer(SequenceValidator):
 	def _get_seed():
 		return random.randint(0, sys.maxsize)
 
-	def get_command(
-		self, file_path_mapping, path_input, file_path_output,
-		sequence_prefix, file_format, paired=False, file_extension=None):
-		"""
-			Get the normalized absolute path.
-
-			@attention:
-
-			@param file_path_mapping: file path where the mapping should be saved
-			@type file_path_mapping: str | unicode
-			@param path_input: file path or directory of the input file(s)
-			@type path_input: str | unicode
-			@param file_path_output: output file path where the anonymous sequences should be saved
-			@type file_path_output: str | unicode
-			@param sequence_prefix: Prefix of the anonymous sequence id.
-			@type sequence_prefix: str | unicode
-			@param file_format: Fasta format of input and output. Either 'fasta' or 'fastq'.
-			@type file_format: str | unicode
-			@param paired: sequences are streamed as pair, else one by one
-			@type paired: bool
-			@param file_extension: file extension to be filtered for
-			@type file_extension: str | unicode | None
-
-			@return: System command line
-			@rtype: str
-		"""
-		assert isinstance(path_input, str)
-		assert self.validate_dir(path_input, silent=True) or self.validate_file(path_input, silent=True)
-		assert isinstance(file_path_output, str)
-		assert self.validate_dir(file_path_output, only_parent=True)
-		assert isinstance(file_path_mapping, str)
-		assert self.validate_dir(file_path_mapping, only_parent=True)
-		assert isinstance(sequence_prefix, str)
-		assert isinstance(file_format, str)
-		file_format = file_format.lower()
-		assert file_format in self._legal_formats
-		assert file_extension is None or isinstance(file_extension, str)
-		assert isinstance(paired, bool)
-
-		# https://www.gnu.org/software/coreutils/manual/html_node/Random-sources.html#Random-sources
-		continuous_random_byte_stream = \
-			'get_seeded_random() { seed="$1"; openssl enc -aes-256-ctr -pass pass:"$seed" -nosalt < /dev/zero 2>/dev/null; }; '
-
-		# ##################
-		# fastastreamer
-		# ##################
-		fastastreamer_args = [
-			"-input '{}'".format(path_input),
-			# "-out '{}'".format(file_path_output),
-			"-format '{}'".format(file_format),
-			]
-		if file_extension is not None:
-			fastastreamer_args.append("-ext '{}'".format(file_extension))
-
-		# ##################
-		# shuffle
-		# ##################
-		shuffle = ["shuf"]
-
-		shuffle_args = ["-z"]
-		seed = self._get_seed()
-		shuffle_args.append("--random-source=<(get_seeded_random {seed})".format(seed=seed))
-
-		# ##################
-		# anonymizer args
-		# ##################
-		anonymizer_args = [
-			"-prefix '{}'".format(sequence_prefix),
-			"-format '{}'".format(file_format),
-			"-map '{}'".format(file_path_mapping),
-			"-out '{}'".format(file_path_output)]
-
-		if not paired:
-			anonymizer_args.append("-s")
-			fastastreamer_args.append("-s")
-
-		if self._logfile is not None:
-			anonymizer_args.append("-log '{}'".format(self._logfile))
-			fastastreamer_args.append("-log '{}'".format(self._logfile))
-
-		command = continuous_random_byte_stream + "python3 '{fastastreamer}' {fastastreamer_args}".format(
-			fastastreamer=self._fastastreamer,
-			fastastreamer_args=" ".join(fastastreamer_args),
-			)
-		command += " | {shuf} {shuffle_args}".format(
-			shuf=" ".join(shuffle),
-			shuffle_args=" ".join(shuffle_args),
-			)
-		command += " | tr -d '\\000' | python3 '{anonymizer}' {anonymizer_args}".format(
-			anonymizer=self._anonymizer,
-			anonymizer_args=" ".join(anonymizer_args)
-			)
-		self._logger.debug(command)
-		return command
-
 	def shuffle_anonymize(
-		self, path_input, file_path_output=None, file_path_mapping=None, prefix="", file_format=None, file_extension=None):
+		self, path_input, file_path_output=None, file_path_mapping=None, prefix="", file_format=None, file_extension=None,
+		gold_standard=None):
 		"""
 			Shuffle and anonymize sequences
 
@@ -201,6 +115,8 @@ class FastaAnonymizer(SequenceValidator):
 			@type file_format: str | unicode
 			@param file_extension: file extension to be filtered for
 			@type file_extension: str | unicode | None
+			@param gold_standard: Genome id and tax id of each sequence id, if given the mapping is written as gold standard
+			@type gold_standard: dict[bytes, bytes] | None
 
 			@return: file path of original to anonymous id mapping
 			@rtype: str | unicode, str | unicode
@@ -219,27 +135,16 @@ class FastaAnonymizer(SequenceValidator):
 		assert isinstance(file_format, str)
 		file_format = file_format.lower()
 		assert file_format in self._legal_formats
+		assert gold_standard is None or isinstance(gold_standard, dict)
 
 		self._logger.info("Shuffle and anonymize '{}'".format(path_input))
-
-		command = self.get_command(
-			file_path_mapping=file_path_mapping,
-			path_input=path_input,
-			file_path_output=file_path_output,
-			sequence_prefix=prefix,
-			file_format=file_format,
-			paired=False,
-			file_extension=file_extension)
-
-		exit_status = subprocess.call(command, shell=True, executable="bash")
-		if not exit_status == 0:
-			msg = "Error occurred anonymizing '{}'".format(path_input)
-			self._logger.error(msg)
-			raise OSError(msg)
+		self._shuffle_anonymize(
+			path_input, file_path_output, file_path_mapping, prefix, file_format, False, file_extension, gold_standard)
 		return file_path_output, file_path_mapping
 
 	def interweave_shuffle_anonymize(
-		self, path_input, file_path_output=None, file_path_mapping=None, prefix="", file_format=None, file_extension=None):
+		self, path_input, file_path_output=None, file_path_mapping=None, prefix="", file_format=None, file_extension=None,
+		gold_standard=None):
 		"""
 			Interweave, shuffle and anonymize sequences
 
@@ -257,6 +162,8 @@ class FastaAnonymizer(SequenceValidator):
 			@type file_format: str | unicode
 			@param file_extension: file extension to be filtered for
 			@type file_extension: str | unicode | None
+			@param gold_standard: Genome id and tax id of each sequence id, if given the mapping is written as gold standard
+			@type gold_standard: dict[bytes, bytes] | None
 
 			@return: file path of original to anonymous id mapping
 			@rtype: str | unicode, str | unicode
@@ -275,21 +182,190 @@ class FastaAnonymizer(SequenceValidator):
 		assert isinstance(file_format, str)
 		file_format = file_format.lower()
 		assert file_format in self._legal_formats
+		assert gold_standard is None or isinstance(gold_standard, dict)
 
 		self._logger.info("Interweave shuffle and anonymize")
+		self._shuffle_anonymize(
+			path_input, file_path_output, file_path_mapping, prefix, file_format, True, file_extension, gold_standard)
+		return file_path_output, file_path_mapping
+
+	# #######################################################
+	#
+	# 				External memory shuffle
+	#
+	# #######################################################
+
+	def _get_file_paths(self, path_input, paired, file_extension):
+		"""
+			Get input files, in a fixed order so a seed always gives the same output.
+			Sequences of a file ending with '1.<extension>' are paired with those of the one ending with '2.<extension>'.
+
+			@return: single files, or pairs of files
+			@rtype: list[str|unicode] | list[(str|unicode, str|unicode)]
+		"""
+		if self.validate_file(path_input, silent=True):
+			return [self.get_full_path(path_input)]
+		if file_extension is None:
+			directory = self.get_full_path(path_input)
+			list_of_file_paths = sorted(
+				os.path.join(directory, file_name) for file_name in os.listdir(directory)
+				if os.path.isfile(os.path.join(directory, file_name)))
+			file_extension = ""
+		else:
+			list_of_file_paths = sorted(self.get_files_in_directory(path_input, extension=file_extension))
+		if not paired:
+			return list_of_file_paths
+		file_extension = file_extension.lstrip('.')
+		suffix_forward = "1.{}".format(file_extension)
+		suffix_reverse = "2.{}".format(file_extension)
+		return [
+			(file_path, file_path[:file_path.rfind(suffix_forward)] + suffix_reverse)
+			for file_path in list_of_file_paths if file_path.endswith(suffix_forward)]
+
+	def _read_units(self, list_of_file_paths, file_format, paired):
+		"""
+			Read the units to be shuffled, single records or pairs of records
+
+			@rtype: collections.Iterable[list[bytes]]
+		"""
+		if not paired:
+			for file_path in list_of_file_paths:
+				for record in sequencerecords.read_file_records(file_path, file_format):
+					yield [record]
+			return
+		for item in list_of_file_paths:
+			if isinstance(item, tuple):
+				file_path_forward, file_path_reverse = item
+				records_forward = sequencerecords.read_file_records(file_path_forward, file_format)
+				records_reverse = sequencerecords.read_file_records(file_path_reverse, file_format)
+			else:
+				# consecutive records of a single file are pairs
+				file_path_forward = file_path_reverse = item
+				records = sequencerecords.read_file_records(item, file_format)
+				records_forward = records_reverse = records
+			for record_forward, record_reverse in itertools.zip_longest(records_forward, records_reverse):
+				if record_forward is None or record_reverse is None:
+					msg = "forward and backward file have an unequal amount of sequences:\n"
+					msg += "forward: '{}'\nbackward: '{}'\n".format(file_path_forward, file_path_reverse)
+					self._logger.error(msg)
+					raise IOError(msg)
+				yield [record_forward, record_reverse]
+
+	def _get_number_of_buckets(self, list_of_file_paths):
+		"""
+			Get the number of buckets, so that each one can be shuffled within the memory limit
+
+			@rtype: int
+		"""
+		total_size = 0
+		for item in list_of_file_paths:
+			for file_path in (item if isinstance(item, tuple) else [item]):
+				total_size += os.path.getsize(file_path)
+		return max(1, int(math.ceil(total_size * self._bucket_memory_factor / float(self._max_memory))))
+
+	def _shuffle_anonymize(
+		self, path_input, file_path_output, file_path_mapping, prefix, file_format, paired, file_extension,
+		gold_standard=None):
+		"""
+			Shuffle sequences in external memory and replace their ids
+
+			@param path_input: A directory or file path
+			@type path_input: str | unicode
+			@param file_path_output: Path of file the output will be written to.
+			@type file_path_output: str | unicode
+			@param file_path_mapping: Path of file the sequence id mapping will be written to.
+			@type file_path_mapping: str | unicode
+			@param prefix: Prefix of the anonymous sequence id.
+			@type prefix: str | unicode
+			@param file_format: Either 'fasta' or 'fastq'.
+			@type file_format: str | unicode
+			@param paired: Pairs of sequences are shuffled together and named '<id>/1', '<id>/2'
+			@type paired: bool
+			@param file_extension: file extension to be filtered for
+			@type file_extension: str | unicode | None
+			@param gold_standard: Genome id and tax id of each sequence id, if given the mapping is written as gold standard
+			@type gold_standard: dict[bytes, bytes] | None
+
+			@raises: IOError, ValueError, KeyError
+		"""
+		list_of_file_paths = self._get_file_paths(path_input, paired, file_extension)
+		number_of_buckets = self._get_number_of_buckets(list_of_file_paths)
+		random_generator = random.Random(self._get_seed())
+		self._logger.debug("Shuffling in {} buckets".format(number_of_buckets))
+
+		directory_buckets = tempfile.mkdtemp(dir=self._tmp_dir, prefix="anonymizer_buckets_")
+		try:
+			list_of_file_paths_buckets = [
+				os.path.join(directory_buckets, str(index)) for index in range(number_of_buckets)]
+			list_of_streams = [open(file_path, 'wb', self._buffer_size) for file_path in list_of_file_paths_buckets]
+			try:
+				for unit in self._read_units(list_of_file_paths, file_format, paired):
+					stream_bucket = list_of_streams[random_generator.randrange(number_of_buckets)]
+					for record in unit:
+						stream_bucket.write(self._record_size.pack(len(record)))
+						stream_bucket.write(record)
+			finally:
+				for stream_bucket in list_of_streams:
+					stream_bucket.close()
+
+			prefix = prefix.encode()
+			unit_size = 2 if paired else 1
+			unit_counter = 0
+			with open(file_path_output, 'wb', self._buffer_size) as stream_output, \
+					open(file_path_mapping, 'wb', self._buffer_size) as stream_mapping:
+				if gold_standard is not None:
+					stream_mapping.write(GoldStandardFileFormat.read_mapping_header.encode())
+				for file_path_bucket in list_of_file_paths_buckets:
+					records = self._read_bucket(file_path_bucket)
+					units = [records[index:index + unit_size] for index in range(0, len(records), unit_size)]
+					del records
+					random_generator.shuffle(units)
+					for unit in units:
+						for index, record in enumerate(unit):
+							anonymous_id = b"%s%d" % (prefix, unit_counter)
+							if paired:
+								anonymous_id += b"/%d" % (index + 1)
+							read_id = sequencerecords.get_id(record)
+							if gold_standard is None:
+								stream_mapping.write(b"%s\t%s\n" % (read_id, anonymous_id))
+							else:
+								stream_mapping.write(b"%s\t%s\t%s\n" % (
+									anonymous_id, self._get_read_gold_standard(read_id, gold_standard), read_id))
+							stream_output.write(sequencerecords.rename(record, anonymous_id, file_format))
+						unit_counter += 1
+		finally:
+			if not self._debug:
+				shutil.rmtree(directory_buckets)
+
+	def _get_read_gold_standard(self, read_id, gold_standard):
+		"""
+			Get genome id and tax id of a read, from the sequence id it is named after: '<sequence_id>-<index>'
+
+			@rtype: bytes
 
-		command = self.get_command(
-			file_path_mapping=file_path_mapping,
-			path_input=path_input,
-			file_path_output=file_path_output,
-			sequence_prefix=prefix,
-			file_format=file_format,
-			paired=True,
-			file_extension=file_extension)
-
-		exit_status = subprocess.call(command, shell=True, executable="bash")
-		if not exit_status == 0:
-			msg = "Error occurred anonymizing '{}'".format(path_input)
+			@raises: ValueError, KeyError
+		"""
+		if b'-' not in read_id:
+			msg = "missing '-' reads2anonymous: {}\n".format(read_id.decode())
 			self._logger.error(msg)
-			raise OSError(msg)
-		return file_path_output, file_path_mapping
+			raise ValueError(msg)
+		sequence_id = read_id.rsplit(b'-', 1)[0]
+		if sequence_id not in gold_standard:
+			msg = "sequence_id '{}' not found in mapping\n".format(sequence_id.decode())
+			self._logger.error(msg)
+			raise KeyError(msg)
+		return gold_standard[sequence_id]
+
+	def _read_bucket(self, file_path):
+		"""
+			Read the records of a bucket
+
+			@rtype: list[bytes]
+		"""
+		records = []
+		with open(file_path, 'rb', self._buffer_size) as stream_input:
+			while True:
+				size = stream_input.read(self._record_size.size)
+				if not size:
+					return records
+				records.append(stream_input.read(self._record_size.unpack(size)[0]))
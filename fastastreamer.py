@@ -8,8 +8,8 @@ import io
 import errno
 import itertools
 import argparse
-from Bio import SeqIO
 from scripts.Validator.sequencevalidator import SequenceValidator
+from scripts import sequencerecords
 
 
 class FastaStreamer(SequenceValidator):
@@ -141,13 +141,13 @@ class FastaStreamer(SequenceValidator):
 
 		sequence_count = 0
 		for src in list_of_file_paths:
-			for seq_record in SeqIO.parse(src, file_format):
+			for record in sequencerecords.read_file_records(src, file_format):
 				new_line_suffix = '\0'
 				if paired and sequence_count % 2 == 0:
 					new_line_suffix = ""
 				try:
-					seq_record.description = ''
-					out_stream.write(seq_record.format(file_format)+new_line_suffix)
+					record = sequencerecords.rename(record, sequencerecords.get_id(record), file_format)
+					out_stream.write(record.decode()+new_line_suffix)
 				except IOError as e:
 					if e.errno == errno.EPIPE or e.errno == errno.EINVAL:
 						self._logger.error("Broken Pipe!")
@@ -203,14 +203,16 @@ class FastaStreamer(SequenceValidator):
 			file_path_one = file_path
 			file_path_second = file_path[:file_path.rfind(file_path_one_suffix)] + file_path_second_suffix
 
-			for seq_record_f, seq_record_b in itertools.zip_longest(SeqIO.parse(file_path_one, file_format), SeqIO.parse(file_path_second, file_format)):
-				if seq_record_f is None or seq_record_b is None:
+			for record_f, record_b in itertools.zip_longest(
+				sequencerecords.read_file_records(file_path_one, file_format),
+				sequencerecords.read_file_records(file_path_second, file_format)):
+				if record_f is None or record_b is None:
 					msg = "forward and backward file have an unequal amount of sequences:\n"
 					msg += "forward: '{}'\nbackward: '{}'\n".format(file_path_one, file_path_second)
 					self._logger.error(msg)
 					raise Exception(msg)
-				out_stream.write(seq_record_f.format(file_format))
-				out_stream.write(seq_record_b.format(file_format))
+				out_stream.write(record_f.decode())
+				out_stream.write(record_b.decode())
 				out_stream.write('\0')
 
 if __name__ == "__main__":
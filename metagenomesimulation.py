@@ -8,6 +8,7 @@ import os
 import shutil
 import traceback
 import tempfile
+import random
 from Bio import SeqIO
 from fastaanonymizer import FastaAnonymizer
 from scripts.Archive.compress import Compress
@@ -15,12 +16,118 @@ from scripts.argumenthandler import ArgumentHandler
 from scripts.ComunityDesign.communitydesign import CommunityDesign
 from scripts.ComunityDesign.taxonomicprofile import TaxonomicProfile
 from scripts.GenomePreparation.genomepreparation import GenomePreparation
+from scripts.GenomePreparation.genomestatistics import GenomeStatisticsIndex
+from scripts.GenomePreparation.genomestore import GenomeStore
 from scripts.GoldStandardAssembly.goldstandardassembly import GoldStandardAssembly
 from scripts.GoldStandardAssembly.samtoolswrapper import SamtoolsWrapper
+from scripts.jobmanifest import JobManifest
 from scripts.GoldStandardFileFormat.goldstandardfileformat import GoldStandardFileFormat
 from scripts.MetaDataTable.metadatatable import MetadataTable
 from scripts.NcbiTaxonomy.ncbitaxonomy import NcbiTaxonomy
 from scripts.ReadSimulationWrapper.readsimulationwrapper import dict_of_read_simulators
+from scripts.ReadSimulationWrapper.readcache import ReadCache
+from scripts.parallel import TaskThread, TaskFailure, runThreadScheduled
+
+
+def _anonymize_sample(sample_index, seeds, file_paths, options):
+    """
+    Anonymize reads and assembly of a sample and write their gold standard mappings, run in a process of its own.
+
+    @param sample_index: Index of the sample
+    @type sample_index: int
+    @param seeds: Seeds of the shuffling of reads and of the assembly
+    @type seeds: tuple[int, int]
+    @param file_paths: Log file, input directories, assembly and output file paths of the sample
+    @type file_paths: dict[str, str|unicode|None]
+    @param options: Settings shared by all samples
+    @type options: dict
+
+    @return: Files to be compressed and their destination, or an error message
+    @rtype: list[tuple[str|unicode, str|unicode]] | str
+    """
+    try:
+        file_path_log = file_paths["log"]
+        list_tuple_archive_files = []
+        fastaanonymizer = FastaAnonymizer(
+            logfile=file_path_log,
+            verbose=options["verbose"],
+            debug=options["debug"],
+            seed=seeds[0],
+            tmp_dir=options["tmp_dir"],
+            max_memory=options["max_memory"]
+        )
+        if options["compress"]:
+            file_path_anonymous_gs_mapping = tempfile.mktemp(dir=options["tmp_dir"], prefix="anonymous_gs_mapping")
+        else:
+            file_path_anonymous_gs_mapping = file_paths["reads_map_out"]
+        # the read gold standard is written while reads are renamed
+        if options["paired_end"]:
+            file_path_anonymous_reads_tmp, file_path_anonymous_gs_mapping = fastaanonymizer.interweave_shuffle_anonymize(
+                file_paths["reads"],
+                file_path_mapping=file_path_anonymous_gs_mapping,
+                prefix="S{}R".format(sample_index),
+                file_format="fastq",
+                file_extension="fq",
+                gold_standard=options["read_gold_standard"])
+        else:
+            file_path_anonymous_reads_tmp, file_path_anonymous_gs_mapping = fastaanonymizer.shuffle_anonymize(
+                file_paths["reads"],
+                file_path_mapping=file_path_anonymous_gs_mapping,
+                prefix="S{}R".format(sample_index),
+                file_format="fastq",
+                file_extension="fq",
+                gold_standard=options["read_gold_standard"])
+        if options["compress"]:
+            list_tuple_archive_files.append(
+                (file_path_anonymous_reads_tmp, file_paths["reads_out"]+".gz"))
+            list_tuple_archive_files.append(
+                (file_path_anonymous_gs_mapping, file_paths["reads_map_out"]+".gz"))
+        else:
+            shutil.move(file_path_anonymous_reads_tmp, file_paths["reads_out"])
+
+        if not options["anonymize_gsa"]:
+            return list_tuple_archive_files
+
+        gs_mapping = GoldStandardFileFormat(
+            column_name_gid=options["column_name_gid"],
+            column_name_ncbi=options["column_name_ncbi"],
+            separator=options["separator"],
+            logfile=file_path_log,
+            verbose=options["verbose"],
+            tmp_dir=options["tmp_dir"]
+        )
+        fastaanonymizer = FastaAnonymizer(
+            logfile=file_path_log,
+            verbose=options["verbose"],
+            debug=options["debug"],
+            seed=seeds[1],
+            tmp_dir=options["tmp_dir"],
+            max_memory=options["max_memory"]
+        )
+        file_path_output_anonymous_gsa, file_path_anonymous_mapping_tmp = fastaanonymizer.shuffle_anonymize(
+            path_input=file_paths["gsa"],
+            prefix="S{}C".format(sample_index),
+            file_format="fasta")
+        if options["compress"]:
+            file_path_anonymous_gsa_mapping = tempfile.mktemp(dir=options["tmp_dir"], prefix="anonymous_gsa_mapping")
+        else:
+            file_path_anonymous_gsa_mapping = file_paths["gsa_map_out"]
+        with open(file_path_anonymous_gsa_mapping, 'w') as stream_output:
+            gs_mapping.gs_contig_mapping(
+                options["file_path_genome_locations"], options["file_path_metadata"], file_path_anonymous_mapping_tmp,
+                [file_paths["bam"]], stream_output
+            )
+        if options["compress"]:
+            list_tuple_archive_files.append(
+                (file_path_output_anonymous_gsa, file_paths["gsa_out"]+".gz"))
+            list_tuple_archive_files.append(
+                (file_path_anonymous_gsa_mapping, file_paths["gsa_map_out"]+".gz"))
+        else:
+            shutil.move(file_path_output_anonymous_gsa, file_paths["gsa_out"])
+        return list_tuple_archive_files
+    except Exception:
+        return "Anonymization of sample {} failed, see '{}':\n{}".format(
+            sample_index, file_paths["log"], traceback.format_exc())
 
 
 class MetagenomeSimulation(ArgumentHandler):
@@ -31,6 +138,8 @@ class MetagenomeSimulation(ArgumentHandler):
     _label = "MetagenomeSimulationPipeline"
 
     _list_tuple_archive_files = []
+    _genome_statistics = None
+    _genome_store = None
 
     def run_pipeline(self):
         """
@@ -95,8 +204,7 @@ class MetagenomeSimulation(ArgumentHandler):
             # Read simulation (Art Illumina)
             if self._phase_simulate_reads:
                 self._logger.info("Read simulation")
-                for sample_index, file_path_distribution in enumerate(list_of_file_paths_distributions):
-                    self._simulate_reads(file_path_distribution, sample_index)
+                self._simulate_reads(list_of_file_paths_distributions)
 
             # Generate gold standard assembly
             list_of_output_gsa = None
@@ -147,6 +255,34 @@ class MetagenomeSimulation(ArgumentHandler):
     #
     # #########################
 
+    def _get_genome_statistics(self):
+        """
+        Get the index of genome statistics of the project, genomes are validated and scanned once
+
+        @rtype: GenomeStatisticsIndex
+        """
+        if self._genome_statistics is None:
+            self._genome_statistics = GenomeStatisticsIndex(
+                directory_index=self._project_file_folder_handler.get_genome_statistics_dir(),
+                logfile=self._logfile,
+                verbose=self._verbose,
+                debug=self._debug)
+        return self._genome_statistics
+
+    def _get_genome_store(self):
+        """
+        Get the 2 bit packed genomes of the project, filled once genomes are moved into the project
+
+        @rtype: GenomeStore
+        """
+        if self._genome_store is None:
+            self._genome_store = GenomeStore(
+                self._project_file_folder_handler.get_genome_store_dir(),
+                logfile=self._logfile,
+                verbose=self._verbose,
+                debug=self._debug)
+        return self._genome_store
+
     def _validate_raw_genomes(self):
         """
         Validate format raw genomes
@@ -154,9 +290,7 @@ class MetagenomeSimulation(ArgumentHandler):
         @return: True if all genomes valid
         @rtype: bool
         """
-        prepare_genomes = GenomePreparation(
-            logfile=self._logfile,
-            verbose=self._verbose)
+        genome_statistics = self._get_genome_statistics()
 
         meta_data_table = MetadataTable(
             separator=self._separator,
@@ -168,7 +302,7 @@ class MetagenomeSimulation(ArgumentHandler):
             meta_data_table.read(community.file_path_genome_locations)
             list_of_file_paths = meta_data_table.get_column(1)
 
-            if not prepare_genomes.validate_format(
+            if not genome_statistics.validate_format(
                 list_of_file_paths,
                 file_format="fasta",  # TODO: should be done dynamically
                 sequence_type="dna",
@@ -288,8 +422,9 @@ class MetagenomeSimulation(ArgumentHandler):
         directory_output = self._project_file_folder_handler.get_genome_dir()
         prepare_genomes.move_genome_files(
             genome_id_to_path_map=genome_id_to_path_map,
-            directory_output=directory_output
+            directory_output=directory_output,
             # sequence_min_length=1000 TODO
+            genome_store=self._get_genome_store()
             )
 
         file_path_genome_locations = self._project_file_folder_handler.get_genome_location_file_path()
@@ -301,22 +436,24 @@ class MetagenomeSimulation(ArgumentHandler):
     #
     # #########################
 
-    def _simulate_reads(self, file_path_distribution, sample_index):
+    def _simulate_reads(self, list_of_file_paths_distributions):
         """
-        Start the simulation of illumina reads
+        Start the simulation of reads of all samples.
+        The simulation tasks of all samples are run at once, the most costly ones first.
+        Output is kept in the internal read simulation folder until all samples are done,
+        so a run that was interrupted skips the jobs recorded as complete in its manifest.
+
+        @attention: Resuming only works within this phase. Once all samples are simulated, bam and fastq files
+        are moved out and the read simulation folder is removed with its manifest, unless in debug mode.
+        A run interrupted in a later phase simulates all reads again.
 
-        @param file_path_distribution: File path to a distribution
-        @type file_path_distribution: str | unicode
-        @param sample_index: Sample index
-        @type sample_index: int | long
+        @param list_of_file_paths_distributions: File path to the distribution of each sample
+        @type list_of_file_paths_distributions: list[str|unicode]
 
         @rtype: None
         """
         self._project_file_folder_handler._location_reads = [True, True]  # TODO write public method for this
-        
-        sample_id = str(sample_index)
-        directory_output_tmp = self._project_file_folder_handler.get_reads_dir(True, sample_id)
-        directory_bam = self._project_file_folder_handler.get_bam_dir(sample_id)
+
         # directory_script = os.path.dirname(__file__)
         # file_path_executable = os.path.join(directory_script, "tools", "readsimulator", "art_illumina")
         # directory_error_profiles = os.path.join(directory_script, "tools", "readsimulator", "profile")
@@ -324,6 +461,37 @@ class MetagenomeSimulation(ArgumentHandler):
         if self._read_simulator_type not in dict_of_read_simulators:
             raise ValueError("Read simulator type '{}' not supported.".format(self._read_simulator_type))
 
+        # convert sam to bam, while simulating if sam output is streamed
+        samtools = SamtoolsWrapper(
+            file_path_samtools=self._executable_samtools,
+            max_processes=self._max_processors,
+            tmp_dir=self._project_file_folder_handler.get_tmp_wd(),
+            logfile=self._logfile,
+            verbose=self._verbose,
+            debug=self._debug,
+            memory_budget=self._memory_budget
+        )
+
+        directory_read_simulation = self._project_file_folder_handler.get_read_simulation_dir()
+        for sample_index in range(len(list_of_file_paths_distributions)):
+            directory_sample = self._project_file_folder_handler.get_read_simulation_dir(str(sample_index))
+            if not os.path.isdir(directory_sample):
+                os.makedirs(directory_sample)
+        manifest = JobManifest(
+            self._project_file_folder_handler.get_read_simulation_manifest_file_path(),
+            logfile=self._logfile,
+            verbose=self._verbose,
+            debug=self._debug)
+
+        read_cache = None
+        if self._directory_read_cache:
+            read_cache = ReadCache(
+                self._directory_read_cache,
+                int(self._read_cache_size * 2**30),
+                logfile=self._logfile,
+                verbose=self._verbose,
+                debug=self._debug)
+
         simulator = dict_of_read_simulators[self._read_simulator_type](
             file_path_executable=self._executable_readsim,
             directory_error_profiles=self._directory_error_profiles,
@@ -333,52 +501,69 @@ class MetagenomeSimulation(ArgumentHandler):
             verbose=self._verbose,
             debug=self._debug,
             seed=None,  # todo: setting seed here would cause the same seed used for every simulation
-            tmp_dir=self._project_file_folder_handler.get_tmp_wd())
-
-        file_path_genome_locations = self._project_file_folder_handler.get_genome_location_file_path()
-        if self._read_simulator_type == "art":
-            simulator.simulate(
-                file_path_distribution=file_path_distribution,
-                file_path_genome_locations=file_path_genome_locations,
-                directory_output=directory_output_tmp,
-                total_size=self._sample_size_in_base_pairs,
-                profile=self._error_profile,
-                fragment_size_mean=self._fragments_size_mean_in_bp,
-                fragment_size_standard_deviation=self._fragment_size_standard_deviation_in_bp,
-                profile_filename=self._custom_profile_filename,
-                own_read_length=self._custom_readlength)
-        else:
-            simulator.simulate(
-                file_path_distribution=file_path_distribution,
-                file_path_genome_locations=file_path_genome_locations,
-                directory_output=directory_output_tmp,
-                total_size=self._sample_size_in_base_pairs,
-                profile=self._error_profile,
-                fragment_size_mean=self._fragments_size_mean_in_bp,
-                fragment_size_standard_deviation=self._fragment_size_standard_deviation_in_bp)
-
-        # convert sam to bam
-        samtools = SamtoolsWrapper(
-            file_path_samtools=self._executable_samtools,
-            max_processes=self._max_processors,
             tmp_dir=self._project_file_folder_handler.get_tmp_wd(),
-            logfile=self._logfile,
-            verbose=self._verbose,
-            debug=self._debug
-        )
+            samtools=samtools if self._stream_bam else None,
+            genome_statistics=self._get_genome_statistics(),
+            genome_store=self._get_genome_store(),
+            manifest=manifest,
+            memory_budget=self._memory_budget,
+            read_cache=read_cache)
 
-        directory_sam = directory_output_tmp
-        samtools.convert_sam_to_bam(directory_sam, directory_bam)
-
-        if not self._phase_anonymize:
-            list_of_file_path = self._validator.get_files_in_directory(directory_output_tmp, extension="fq")
-            directory_output_fastq = self._project_file_folder_handler.get_reads_dir(False, sample_id)
-            if self._phase_compress:
-                for file_path in list_of_file_path:
-                    self._list_tuple_archive_files.append((file_path, directory_output_fastq))
+        file_path_genome_locations = self._project_file_folder_handler.get_genome_location_file_path()
+        simulator.defer_tasks(subsample=self._subsample_reads)
+        for sample_index, file_path_distribution in enumerate(list_of_file_paths_distributions):
+            sample_id = str(sample_index)
+            directory_output_tmp = self._project_file_folder_handler.get_read_simulation_dir(sample_id)
+            simulator.set_directory_bam(directory_output_tmp)
+            if self._read_simulator_type == "art":
+                simulator.simulate(
+                    file_path_distribution=file_path_distribution,
+                    file_path_genome_locations=file_path_genome_locations,
+                    directory_output=directory_output_tmp,
+                    total_size=self._sample_size_in_base_pairs,
+                    profile=self._error_profile,
+                    fragment_size_mean=self._fragments_size_mean_in_bp,
+                    fragment_size_standard_deviation=self._fragment_size_standard_deviation_in_bp,
+                    profile_filename=self._custom_profile_filename,
+                    own_read_length=self._custom_readlength)
             else:
-                for file_path in list_of_file_path:
-                    shutil.move(file_path, directory_output_fastq)
+                simulator.simulate(
+                    file_path_distribution=file_path_distribution,
+                    file_path_genome_locations=file_path_genome_locations,
+                    directory_output=directory_output_tmp,
+                    total_size=self._sample_size_in_base_pairs,
+                    profile=self._error_profile,
+                    fragment_size_mean=self._fragments_size_mean_in_bp,
+                    fragment_size_standard_deviation=self._fragment_size_standard_deviation_in_bp)
+        simulator.run_deferred_tasks()
+
+        for sample_index in range(len(list_of_file_paths_distributions)):
+            sample_id = str(sample_index)
+            directory_output_tmp = self._project_file_folder_handler.get_reads_dir(True, sample_id)
+            directory_bam = self._project_file_folder_handler.get_bam_dir(sample_id)
+            directory_sample = self._project_file_folder_handler.get_read_simulation_dir(sample_id)
+            if not self._stream_bam:
+                samtools.convert_sam_to_bam(directory_sample, directory_sample, manifest=manifest)
+            for file_path in self._validator.get_files_in_directory(directory_sample, extension="bam"):
+                shutil.move(file_path, directory_bam)
+            for file_path in self._validator.get_files_in_directory(directory_sample, extension="bai"):
+                shutil.move(file_path, directory_bam)
+            for file_path in self._validator.get_files_in_directory(directory_sample, extension="fq"):
+                shutil.move(file_path, directory_output_tmp)
+
+            if not self._phase_anonymize:
+                list_of_file_path = self._validator.get_files_in_directory(directory_output_tmp, extension="fq")
+                directory_output_fastq = self._project_file_folder_handler.get_reads_dir(False, sample_id)
+                if self._phase_compress:
+                    for file_path in list_of_file_path:
+                        self._list_tuple_archive_files.append((file_path, directory_output_fastq))
+                else:
+                    for file_path in list_of_file_path:
+                        shutil.move(file_path, directory_output_fastq)
+
+        # the manifest records files that were just moved, it is removed along with them
+        if not self._debug:
+            shutil.rmtree(directory_read_simulation)
 
     # #########################
     #
@@ -402,7 +587,8 @@ class MetagenomeSimulation(ArgumentHandler):
             max_processes=self._max_processors,
             tmp_dir=self._project_file_folder_handler.get_tmp_wd(),
             logfile=self._logfile,
-            verbose=self._verbose)
+            verbose=self._verbose,
+            genome_store=self._get_genome_store())
 
         list_of_output_gsa = []
         for directory_bam in list_of_directory_bam:
@@ -448,7 +634,8 @@ class MetagenomeSimulation(ArgumentHandler):
             max_processes=self._max_processors,
             tmp_dir=self._project_file_folder_handler.get_tmp_wd(),
             logfile=self._logfile,
-            verbose=self._verbose)
+            verbose=self._verbose,
+            genome_store=self._get_genome_store())
 
         file_path_genome_locations = self._project_file_folder_handler.get_genome_location_file_path()
         meta_data_table.read(file_path_genome_locations)
@@ -484,7 +671,8 @@ class MetagenomeSimulation(ArgumentHandler):
 
         @rtype: None
         """
-        gff = GoldStandardFileFormat(logfile = self._logfile, verbose = self._verbose)
+        gff = GoldStandardFileFormat(
+            logfile=self._logfile, verbose=self._verbose, tmp_dir=self._project_file_folder_handler.get_tmp_wd())
         # read-based binning
         file_path_metadata = self._project_file_folder_handler.get_genome_metadata_file_path()
         file_path_genome_locations = self._project_file_folder_handler.get_genome_location_file_path()
@@ -495,7 +683,7 @@ class MetagenomeSimulation(ArgumentHandler):
             self._project_file_folder_handler.get_reads_dir(True, str(sample_index))
             for sample_index in range(self._number_of_samples)]
 
-        if (self._read_simulator_type == "art" or self._read_simulator_type == "wgsim"):
+        if self._read_simulator_type in ("art", "wgsim", "numpy"):
             paired_end = True
         else:
             paired_end = False
@@ -509,38 +697,27 @@ class MetagenomeSimulation(ArgumentHandler):
                     prefix="gs_mapping")
             else:
                 file_path_gs_mapping = self._project_file_folder_handler.get_anonymous_reads_map_file_path(sample_id)
-            samtools = SamtoolsWrapper(
-                file_path_samtools=self._executable_samtools,
-                max_processes=self._max_processors,
-                tmp_dir=self._project_file_folder_handler.get_tmp_wd(),
-                logfile=self._logfile,
-                verbose=self._verbose,
-                debug=self._debug
-                )
-            list_file_paths_read_positions = [ 
-                samtools.read_start_positions_from_dir_of_bam(self._project_file_folder_handler.get_bam_dir(sample_id))
-                ]
-            dict_original_seq_pos = gff.get_dict_sequence_name_to_positions(list_file_paths_read_positions)
+            dict_original_seq_pos = gff.get_dict_sequence_name_to_positions_from_dir_of_bam(
+                [self._project_file_folder_handler.get_bam_dir(sample_id)], self._max_processors)
             with open(file_path_gs_mapping, 'w') as stream_output:
                 row_format = "{aid}\t{gid}\t{tid}\t{sid}\n"
-                line = '#' + row_format.format(
+                rows = ['#' + row_format.format(
                     aid="anonymous_read_id",
                     gid="genome_id",
                     tid="tax_id",
-                    sid="read_id")
-                stream_output.write(line)
+                    sid="read_id")]
                 for read in dict_original_seq_pos:
                     seq_id = read.strip().split(' ')[0]
                     gen_id = read.strip().split('-')[0]
                     genome_id = dict_sequence_to_genome_id[gen_id]
                     tax_id = dict_genome_id_to_tax_id[genome_id]
-                    line = row_format.format(
+                    rows.append(row_format.format(
                         aid=seq_id,
                         gid=genome_id,
                         tid=tax_id,
                         sid=seq_id,
-                    )
-                    stream_output.write(line)
+                    ))
+                stream_output.write("".join(rows))
             if self._phase_compress:
                 self._list_tuple_archive_files.append(
                     (file_path_gs_mapping, self._project_file_folder_handler.get_anonymous_reads_map_file_path(sample_id)+".gz"))
@@ -551,25 +728,13 @@ class MetagenomeSimulation(ArgumentHandler):
                     prefix="anonymous_gsa_mapping")
             else:
                 file_path_gsa_mapping = self._project_file_folder_handler.get_anonymous_gsa_map_file_path(sample_id)
-            samtools = SamtoolsWrapper(
-                file_path_samtools=self._executable_samtools,
-                max_processes=self._max_processors,
-                tmp_dir=self._project_file_folder_handler.get_tmp_wd(),
-                logfile=self._logfile,
-                verbose=self._verbose,
-                debug=self._debug
-                )
-            list_file_paths_read_positions = [
-                samtools.read_start_positions_from_dir_of_bam(self._project_file_folder_handler.get_bam_dir(sample_id))
-                ]
-            dict_original_seq_pos = gff.get_dict_sequence_name_to_positions(list_file_paths_read_positions)
             file_path_output_anonymous_gsa_out = self._project_file_folder_handler.get_anonymous_gsa_file_path(sample_id)
             
             gsa = list_of_output_gsa[sample_index]
             with open(gsa, 'r') as gs:
                 with open(file_path_gsa_mapping, 'w') as stream_output:
                     row_format = "{name}\t{genome_id}\t{tax_id}\t{length}\n"
-                    stream_output.write("@@SEQUENCEID\tBINID\tTAXID\t_LENGTH\n")
+                    rows = ["@@SEQUENCEID\tBINID\tTAXID\t_LENGTH\n"]
                     for seq_id in gs:
                         if not seq_id.startswith(">"):
                             continue
@@ -583,13 +748,14 @@ class MetagenomeSimulation(ArgumentHandler):
 
                         genome_id = dict_sequence_to_genome_id[sequence_id]
                         tax_id = dict_genome_id_to_tax_id[genome_id]
-                        stream_output.write(row_format.format(
+                        rows.append(row_format.format(
                             name=seq_id,
                             genome_id=genome_id,
                             tax_id=tax_id,
                             length=str(pos_end-pos_start+1)
                             )
                         )
+                    stream_output.write("".join(rows))
                 if self._phase_compress:
                     self._list_tuple_archive_files.append(
                         (file_path_gsa_mapping, self._project_file_folder_handler.get_anonymous_gsa_map_file_path(sample_id)))
@@ -605,6 +771,7 @@ class MetagenomeSimulation(ArgumentHandler):
     def _anonymize_data(self, list_of_output_gsa, file_path_output_gsa_pooled):
         """
         Anonymize reads and assemblies.
+        Samples are anonymized in parallel, each one logging into a file of its own.
 
         @param list_of_output_gsa: List of file paths of assemblies
         @type list_of_output_gsa: list[str|unicode]
@@ -613,184 +780,117 @@ class MetagenomeSimulation(ArgumentHandler):
 
         @rtype: None
         """
-        gs_mapping = GoldStandardFileFormat(
-            column_name_gid=self._column_name_genome_id,
-            column_name_ncbi=self._column_name_ncbi,
-            separator=self._separator,
-            logfile=self._logfile,
-            verbose=self._verbose
-        )
-        file_path_metadata = self._project_file_folder_handler.get_genome_metadata_file_path()
-
-        directories_fastq_dir_in = [
-            self._project_file_folder_handler.get_reads_dir(True, str(sample_index))
-            for sample_index in range(self._number_of_samples)]
-
-        if (self._read_simulator_type == "art" or self._read_simulator_type == "wgsim"):
+        if self._read_simulator_type in ("art", "wgsim", "numpy"):
             paired_end = True
         else:
             paired_end = False
 
+        number_of_processes = min(self._max_processors, self._number_of_samples)
+        max_memory = 1
+        memory_budget = None
+        if self._memory_budget:
+            # the shuffling memory of all samples anonymized at the same time fits into the budget
+            max_memory = float(self._memory_budget) / number_of_processes
+            memory_budget = int(self._memory_budget * 2**30)
         file_path_genome_locations = self._project_file_folder_handler.get_genome_location_file_path()
-        for sample_index in range(self._number_of_samples):
-            file_path_anonymous_reads_tmp, file_path_anonymous_mapping_tmp = self._anonymize_reads(
-                directories_fastq_dir_in[sample_index],
-                "S{}R".format(sample_index),
-                paired_end)
-            sample_id = str(sample_index)
-            file_path_anonymous_reads_out = self._project_file_folder_handler.get_anonymous_reads_file_path(sample_id)
-            file_path_anonymous_gs_mapping_out = self._project_file_folder_handler.get_anonymous_reads_map_file_path(sample_id)
-            if self._phase_compress:
-                file_path_anonymous_gs_mapping = tempfile.mktemp(
-                    dir=self._project_file_folder_handler.get_tmp_wd(),
-                    prefix="anonymous_gs_mapping")
-            else:
-                file_path_anonymous_gs_mapping = self._project_file_folder_handler.get_anonymous_reads_map_file_path(sample_id)
-            with open(file_path_anonymous_gs_mapping, 'w') as stream_output:
-                gs_mapping.gs_read_mapping(
-                    file_path_genome_locations, file_path_metadata, file_path_anonymous_mapping_tmp, stream_output
-                )
-            if self._phase_compress:
-                self._list_tuple_archive_files.append(
-                    (file_path_anonymous_reads_tmp, file_path_anonymous_reads_out+".gz"))
-                self._list_tuple_archive_files.append(
-                    (file_path_anonymous_gs_mapping, file_path_anonymous_gs_mapping_out+".gz"))
-            else:
-                shutil.move(file_path_anonymous_reads_tmp, file_path_anonymous_reads_out)
-
-        if not self._phase_gsa and not self._phase_pooled_gsa:
-            return
-
-        samtools = SamtoolsWrapper(
-            file_path_samtools=self._executable_samtools,
-            max_processes=self._max_processors,
-            tmp_dir=self._project_file_folder_handler.get_tmp_wd(),
-            logfile=self._logfile,
-            verbose=self._verbose,
-            debug=self._debug
-            )
-
-        if self._phase_gsa:
-            for sample_index in range(self._number_of_samples):
-                file_path_output_anonymous_gsa, file_path_anonymous_mapping_tmp = self._anonymize_gsa(
-                    list_of_output_gsa[sample_index],
-                    "S{}C".format(sample_index))
-                sample_id = str(sample_index)
-                file_path_output_anonymous_gsa_out = self._project_file_folder_handler.get_anonymous_gsa_file_path(sample_id)
-                file_path_anonymous_gsa_mapping_out = self._project_file_folder_handler.get_anonymous_gsa_map_file_path(sample_id)
-                if self._phase_compress:
-                    file_path_anonymous_gsa_mapping = tempfile.mktemp(
-                        dir=self._project_file_folder_handler.get_tmp_wd(),
-                        prefix="anonymous_gsa_mapping")
-                else:
-                    file_path_anonymous_gsa_mapping = self._project_file_folder_handler.get_anonymous_gsa_map_file_path(sample_id)
-
-                list_file_paths_read_positions = [
-                    samtools.read_start_positions_from_dir_of_bam(self._project_file_folder_handler.get_bam_dir(sample_id))
-                    ]
-                with open(file_path_anonymous_gsa_mapping, 'w') as stream_output:
-                    gs_mapping.gs_contig_mapping(
-                        file_path_genome_locations, file_path_metadata, file_path_anonymous_mapping_tmp,
-                        list_file_paths_read_positions, stream_output
-                    )
-                if self._phase_compress:
-                    self._list_tuple_archive_files.append(
-                        (file_path_output_anonymous_gsa, file_path_output_anonymous_gsa_out+".gz"))
-                    self._list_tuple_archive_files.append(
-                        (file_path_anonymous_gsa_mapping, file_path_anonymous_gsa_mapping_out+".gz"))
-                else:
-                    shutil.move(file_path_output_anonymous_gsa, file_path_output_anonymous_gsa_out)
-        if self._phase_pooled_gsa:
-            file_path_output_anonymous, file_path_anonymous_mapping_tmp = self._anonymize_pooled_gsa(
-                file_path_output_gsa_pooled,
-                "PC")
-            file_path_output_anonymous_out = self._project_file_folder_handler.get_anonymous_gsa_pooled_file_path()
-            file_path_anonymous_gsa_mapping_out = self._project_file_folder_handler.get_anonymous_gsa_pooled_map_file_path()
-            if self._phase_compress:
-                file_path_anonymous_gsa_mapping = tempfile.mktemp(
-                    dir=self._project_file_folder_handler.get_tmp_wd(),
-                    prefix="anonymous_gsa_pooled_mapping")
-            else:
-                file_path_anonymous_gsa_mapping = self._project_file_folder_handler.get_anonymous_gsa_pooled_map_file_path()
-
-            list_file_paths_read_positions = [
-                samtools.read_start_positions_from_dir_of_bam(self._project_file_folder_handler.get_bam_dir(str(sample_index)))
-                for sample_index in range(self._number_of_samples)
-                ]
-            with open(file_path_anonymous_gsa_mapping, 'w') as stream_output:
-                gs_mapping.gs_contig_mapping(
-                    file_path_genome_locations, file_path_metadata, file_path_anonymous_mapping_tmp,
-                    list_file_paths_read_positions, stream_output
-                )
-            if self._phase_compress:
-                self._list_tuple_archive_files.append(
-                    (file_path_output_anonymous, file_path_output_anonymous_out+".gz"))
-                self._list_tuple_archive_files.append(
-                    (file_path_anonymous_gsa_mapping, file_path_anonymous_gsa_mapping_out+".gz"))
-            else:
-                shutil.move(file_path_output_anonymous, file_path_output_anonymous_out)
-
-    def _anonymize_reads(self, directory_fastq, sequence_prefix, paired_end):
-        """
-        Anonymize simulated reads.
-
-        @param directory_fastq: fastq directory of a sample
-        @type directory_fastq: str | unicode
-        @param sequence_prefix: Prefix for anonymous sequence names
-        @type sequence_prefix: str | unicode
-        @param paired_end: True if reads are paired
-        @type paired_end: bool
-
-        @return: File path of anonymized reads and file path of a sequence name mapping
-        @rtype: tuple[str|unicode, str|unicode]
-        """
-        fastaanonymizer = FastaAnonymizer(
+        file_path_metadata = self._project_file_folder_handler.get_genome_metadata_file_path()
+        gs_mapping = GoldStandardFileFormat(
+            column_name_gid=self._column_name_genome_id,
+            column_name_ncbi=self._column_name_ncbi,
+            separator=self._separator,
             logfile=self._logfile,
             verbose=self._verbose,
-            debug=self._debug,
-            seed=None,
             tmp_dir=self._project_file_folder_handler.get_tmp_wd()
         )
+        read_gold_standard = gs_mapping.get_dict_sequence_to_read_gold_standard(
+            file_path_genome_locations, file_path_metadata, self._get_genome_statistics())
+        options = {
+            "paired_end": paired_end,
+            "anonymize_gsa": self._phase_gsa,
+            "compress": self._phase_compress,
+            "tmp_dir": self._project_file_folder_handler.get_tmp_wd(),
+            "max_memory": max_memory,
+            "column_name_gid": self._column_name_genome_id,
+            "column_name_ncbi": self._column_name_ncbi,
+            "separator": self._separator,
+            "file_path_genome_locations": file_path_genome_locations,
+            "file_path_metadata": file_path_metadata,
+            "read_gold_standard": read_gold_standard,
+            "verbose": self._verbose,
+            "debug": self._debug,
+            }
+
+        # seeds are drawn here in sample order, output does not depend on which process anonymizes a sample
+        seeds_reads = [random.randint(0, sys.maxsize) for _ in range(self._number_of_samples)]
+        seeds_gsa = [random.randint(0, sys.maxsize) for _ in range(self._number_of_samples)]
+        tasks = []
+        for sample_index in range(self._number_of_samples):
+            sample_id = str(sample_index)
+            file_paths = {
+                "log": self._project_file_folder_handler.get_anonymization_log_file_path(sample_id),
+                "reads": self._project_file_folder_handler.get_reads_dir(True, sample_id),
+                "bam": self._project_file_folder_handler.get_bam_dir(sample_id),
+                "gsa": list_of_output_gsa[sample_index] if self._phase_gsa else None,
+                "reads_out": self._project_file_folder_handler.get_anonymous_reads_file_path(sample_id),
+                "reads_map_out": self._project_file_folder_handler.get_anonymous_reads_map_file_path(sample_id),
+                "gsa_out": self._project_file_folder_handler.get_anonymous_gsa_file_path(sample_id),
+                "gsa_map_out": self._project_file_folder_handler.get_anonymous_gsa_map_file_path(sample_id),
+                }
+            cost = sum(
+                os.path.getsize(os.path.join(file_paths["reads"], file_name))
+                for file_name in os.listdir(file_paths["reads"]))
+            args = (sample_index, (seeds_reads[sample_index], seeds_gsa[sample_index]), file_paths, options)
+            tasks.append(TaskThread(_anonymize_sample, args, cost=cost, memory=int(max_memory * 2**30)))
+
+        list_of_return_values, busy_fraction = runThreadScheduled(
+            tasks, maxThreads=number_of_processes, maxMemory=memory_budget)
+        self._logger.info("Anonymization of {} samples kept {:.0%} of {} processes busy".format(
+            len(tasks), busy_fraction, number_of_processes))
+        list_of_errors = [
+            "Anonymization of sample {} failed: {}".format(sample_index, return_value)
+            for sample_index, return_value in enumerate(list_of_return_values)
+            if isinstance(return_value, TaskFailure)]
+        list_of_errors.extend(return_value for return_value in list_of_return_values if isinstance(return_value, str))
+        if len(list_of_errors) > 0:
+            for error in list_of_errors:
+                self._logger.error(error)
+            msg = "Anonymization of {} samples failed!".format(len(list_of_errors))
+            self._logger.error(msg)
+            raise OSError(msg)
+        # return values are in sample order
+        for list_tuple_archive_files in list_of_return_values:
+            self._list_tuple_archive_files.extend(list_tuple_archive_files)
+
+        if not self._phase_pooled_gsa:
+            return
 
-        if paired_end:
-            file_path_output_anonymous_reads, file_path_anonymous_mapping = fastaanonymizer.interweave_shuffle_anonymize(
-                directory_fastq,
-                prefix=sequence_prefix,
-                file_format="fastq",
-                file_extension="fq")
+        file_path_output_anonymous, file_path_anonymous_mapping_tmp = self._anonymize_pooled_gsa(
+            file_path_output_gsa_pooled,
+            "PC")
+        file_path_output_anonymous_out = self._project_file_folder_handler.get_anonymous_gsa_pooled_file_path()
+        file_path_anonymous_gsa_mapping_out = self._project_file_folder_handler.get_anonymous_gsa_pooled_map_file_path()
+        if self._phase_compress:
+            file_path_anonymous_gsa_mapping = tempfile.mktemp(
+                dir=self._project_file_folder_handler.get_tmp_wd(),
+                prefix="anonymous_gsa_pooled_mapping")
         else:
-            file_path_output_anonymous_reads, file_path_anonymous_mapping = fastaanonymizer.shuffle_anonymize(
-                directory_fastq,
-                prefix=sequence_prefix,
-                file_format="fastq",
-                file_extension="fq")
-        return file_path_output_anonymous_reads, file_path_anonymous_mapping
-
-    def _anonymize_gsa(self, file_path_gsa, sequence_prefix):
-        """
-        Anonymize assembly of a sample.
+            file_path_anonymous_gsa_mapping = self._project_file_folder_handler.get_anonymous_gsa_pooled_map_file_path()
 
-        @param file_path_gsa: file paths of assembly from all samples
-        @type file_path_gsa: str | unicode
-        @param sequence_prefix: Prefix for anonymous sequence names
-        @type sequence_prefix: str | unicode
-
-        @return: File path of anonymized assembly and file path of a sequence name mapping
-        @rtype: tuple[str|unicode, str|unicode]
-        """
-        fastaanonymizer = FastaAnonymizer(
-            logfile=self._logfile,
-            verbose=self._verbose,
-            debug=self._debug,
-            seed=None,
-            tmp_dir=self._project_file_folder_handler.get_tmp_wd()
-        )
-
-        file_path_output_anonymous_gs, file_path_anonymous_mapping = fastaanonymizer.shuffle_anonymize(
-            path_input=file_path_gsa,
-            prefix=sequence_prefix,
-            file_format="fasta")
-        return file_path_output_anonymous_gs, file_path_anonymous_mapping
+        list_of_directory_bam = [
+            self._project_file_folder_handler.get_bam_dir(str(sample_index))
+            for sample_index in range(self._number_of_samples)]
+        with open(file_path_anonymous_gsa_mapping, 'w') as stream_output:
+            gs_mapping.gs_contig_mapping(
+                file_path_genome_locations, file_path_metadata, file_path_anonymous_mapping_tmp,
+                list_of_directory_bam, stream_output, max_processes=self._max_processors
+            )
+        if self._phase_compress:
+            self._list_tuple_archive_files.append(
+                (file_path_output_anonymous, file_path_output_anonymous_out+".gz"))
+            self._list_tuple_archive_files.append(
+                (file_path_anonymous_gsa_mapping, file_path_anonymous_gsa_mapping_out+".gz"))
+        else:
+            shutil.move(file_path_output_anonymous, file_path_output_anonymous_out)
 
     def _anonymize_pooled_gsa(
         self, file_path_output_pooled_anonymous, sequence_prefix):
@@ -810,7 +910,8 @@ class MetagenomeSimulation(ArgumentHandler):
             verbose=self._verbose,
             debug=self._debug,
             seed=None,
-            tmp_dir=self._project_file_folder_handler.get_tmp_wd()
+            tmp_dir=self._project_file_folder_handler.get_tmp_wd(),
+            max_memory=self._memory_budget or 1
         )
 
         file_path_output_anonymous, file_path_anonymous_mapping = fastaanonymizer.shuffle_anonymize(
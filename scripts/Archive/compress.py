@@ -5,6 +5,8 @@ import os
 import io
 import time
 import datetime
+import collections
+import multiprocessing as mp
 from scripts.Validator.validator import Validator
 import gzip
 import bz2
@@ -12,6 +14,12 @@ import zipfile
 from scripts.parallel import TaskThread, runThreadParallel
 
 
+# gzip files are written as one gzip member per block of the input, each deflated on its own,
+# so that the blocks of a large file can be compressed by several processes.
+# Concatenated members are a valid gzip file, decompressed as a whole by 'gzip -d' or gzip.open.
+_block_size = 2**24
+
+
 class Compress(Validator):
     """Reading and writing compressed files"""
 
@@ -34,6 +42,8 @@ class Compress(Validator):
 
     _modes = ['r', 'w']
 
+    _block_size = _block_size
+
     def __init__(self, default_compression="gz", label="Compress", logfile=None, verbose=True, debug=False):
         """
         Constructor
@@ -119,11 +129,51 @@ class Compress(Validator):
             assert self.validate_number(compresslevel, minimum=0, maximum=8)
             return self._open[compression_type](file_path, mode='w', compression=compresslevel)
 
-    def compress_file(self, src, dst='./', compresslevel=5, compression_type=None, overwrite=False):
+    def _write_gzip_members(self, src, dst, compresslevel=5, max_processors=1):
+        """
+        Write a file as gzip file of members deflated block by block, blocks are deflated by a pool of processes
+
+        @attention: processes inside of a process pool deflate serially, they can not start processes of their own
+
+        @param src: Path to file
+        @type src: str | unicode
+        @param dst: Destination file path
+        @type dst: str | unicode
+        @param compresslevel: Higher level is slower but likely smaller. 0-9
+        @type compresslevel: int
+        @param max_processors: Maximum number of blocks deflated at the same time
+        @type max_processors: int
+
+        @rtype: None
+        """
+        assert self.validate_number(compresslevel, minimum=0, maximum=9)
+        assert isinstance(max_processors, int) and max_processors > 0
+        file_size = os.path.getsize(src)
+        tasks = [
+            (src, offset, min(self._block_size, file_size - offset), compresslevel)
+            for offset in range(0, max(file_size, 1), self._block_size)]
+        with open(dst, 'wb') as write_handler:
+            if max_processors < 2 or len(tasks) < 2 or mp.current_process().daemon:
+                for task in tasks:
+                    write_handler.write(_deflate_block(*task))
+                return
+            # blocks in flight are limited, members are written in order of the input
+            with mp.Pool(processes=min(max_processors, len(tasks))) as pool:
+                pending = collections.deque()
+                for task in tasks:
+                    if len(pending) == 2 * max_processors:
+                        write_handler.write(pending.popleft().get())
+                    pending.append(pool.apply_async(_deflate_block, task))
+                while len(pending) > 0:
+                    write_handler.write(pending.popleft().get())
+
+    def compress_file(
+        self, src, dst='./', compresslevel=5, compression_type=None, overwrite=False, max_processors=1):
         """
         Compress a file
 
         @attention: When reading file and compression_type None, type will be guessed.
+        gzip files are written as members of blocks, deflated by up to 'max_processors' processes.
 
         @param src: Path to file
         @type src: str | unicode
@@ -135,6 +185,8 @@ class Compress(Validator):
         @type compression_type: str | unicode
         @param overwrite: If false, a path will renamed if not available
         @type overwrite: bool
+        @param max_processors: Maximum number processors used for compressing blocks of a gzip file simultaneously
+        @type max_processors: int
 
         @return: True if stream
         @rtype: None
@@ -163,8 +215,11 @@ class Compress(Validator):
         if not overwrite:
             dst = self.get_available_file_path(dst)
 
-        with open(src, 'rb') as read_handler, self.open(dst, 'w', compresslevel, compression_type) as write_handler:
-            write_handler.writelines(read_handler)
+        if compression_type == "gz":
+            self._write_gzip_members(src, dst, compresslevel, max_processors)
+        else:
+            with open(src, 'rb') as read_handler, self.open(dst, 'w', compresslevel, compression_type) as write_handler:
+                write_handler.writelines(read_handler)
 
         time_end = time.time()
         time_elapsed = str(datetime.timedelta(seconds=round(time_end - time_start)))
@@ -216,6 +271,8 @@ class Compress(Validator):
         Compress list of files
 
         @attention: When reading file and compression_type None, type will be guessed.
+        Files to be gzipped larger than a block are compressed one after the other, each by up to 'max_processors'
+        processes, after the others have been compressed simultaneously.
 
         @param list_of_tuples: Path to file and destination folder
         @type list_of_tuples: list[tuple[str|unicode, str|unicode]]
@@ -232,20 +289,50 @@ class Compress(Validator):
         @rtype: None
         """
         task_list = []
+        list_of_tuples_in_parallel = []
+        list_of_tuples_by_blocks = []
         for file_path, dst in list_of_tuples:
             self._logger.debug("Compressing '{file}' to '{dst}'".format(file=file_path, dst=dst))
             if not self.validate_dir(dst, silent=True):
                 assert self.validate_dir(dst, only_parent=True), "Bad destination: '{}'.".format(dst)
             if self.validate_file(file_path):
+                file_compression_type = compression_type or self.get_compression_type(dst) or self._default_compression
+                if file_compression_type.lower() == "gz" and os.path.getsize(file_path) > self._block_size:
+                    list_of_tuples_by_blocks.append((file_path, dst))
+                    continue
                 args = (file_path, dst, compresslevel, compression_type, overwrite)
                 task_list.append(TaskThread(_compress_file, args))
+                list_of_tuples_in_parallel.append((file_path, dst))
             else:
                 msg = "File not found '{}'".format(file_path)
                 self._logger.error(msg)
                 raise IOError(msg)
         list_of_return_values = runThreadParallel(task_list, maxThreads=max_processors)
         for index, return_value in enumerate(list_of_return_values):
-            assert return_value is None, "Compressing of '{}' failed. '{}'".format(list_of_tuples[index][0], return_value)
+            assert return_value is None, "Compressing of '{}' failed. '{}'".format(
+                list_of_tuples_in_parallel[index][0], return_value)
+        for file_path, dst in list_of_tuples_by_blocks:
+            self.compress_file(file_path, dst, compresslevel, compression_type, overwrite, max_processors)
+
+
+def _deflate_block(file_path, offset, size, compresslevel):
+    """
+    Deflate a block of a file into a gzip member of its own
+
+    @param file_path: Path to file
+    @type file_path: str | unicode
+    @param offset: Offset of the block
+    @type offset: int
+    @param size: Size of the block
+    @type size: int
+    @param compresslevel: Higher level is slower but likely smaller. 0-9
+    @type compresslevel: int
+
+    @rtype: bytes
+    """
+    with open(file_path, 'rb') as read_handler:
+        read_handler.seek(offset)
+        return gzip.compress(read_handler.read(size), compresslevel=compresslevel, mtime=0)
 
 
 def _compress_file(src, dst='./', compresslevel=5, compression_type=None, overwrite=False):
@@ -6,6 +6,8 @@ import os
 from Bio import SeqIO
 from scripts.Validator.sequencevalidator import SequenceValidator
 from scripts.MetaDataTable.metadatatable import MetadataTable
+from scripts.GenomePreparation.genomestore import GenomeStore
+from scripts import sequencerecords
 
 
 # ##################################
@@ -18,6 +20,8 @@ from scripts.MetaDataTable.metadatatable import MetadataTable
 class GenomePreparation(SequenceValidator):
 
 	_filename_seq_map = "sequence_id_map.txt"
+	# final sequence ids of the moved genomes and their genome ids, sorted by sequence id
+	_filename_sequence_to_genome_id = "sequence_to_genome_id.tsv"
 
 	def __init__(self, label="GenomePreparation", logfile=None, verbose=False, debug=False):
 		super(GenomePreparation, self).__init__(label=label, logfile=logfile, verbose=verbose, debug=debug)
@@ -70,7 +74,8 @@ class GenomePreparation(SequenceValidator):
 
 	def _move_genome_file(
 		self, file_path_input, file_path_output,
-		stream_map, genome_id, sequence_min_length=1, set_of_sequence_names=None, file_format="fasta"):
+		stream_map, genome_id, sequence_min_length=1, set_of_sequence_names=None, file_format="fasta",
+		sequence_id_to_genome_id=None):
 		"""
 		Move genomes into project folder, cleaning it up in the process.
 		Makes sure sequence ids are unique and descriptions/comments are removed
@@ -88,6 +93,8 @@ class GenomePreparation(SequenceValidator):
 		@type set_of_sequence_names: set[str|unicode]
 		@param file_format: 'fasta' format by default.
 		@type file_format: str | unicode
+		@param sequence_id_to_genome_id: If given, the final sequence ids are added to it
+		@type sequence_id_to_genome_id: dict[str|unicode, str|unicode] | None
 
 		@raise Exception:
 		"""
@@ -100,43 +107,51 @@ class GenomePreparation(SequenceValidator):
 		
 		if (self.validate_file(file_path_output, silent=True)):
 			self._logger.warning("File %s existing, skipping" % file_path_output)
-			with open(file_path_input, 'r') as stream_input:
-				self._add_sequences_to_map(stream_input, stream_map, genome_id, sequence_min_length, set_of_sequence_names)
+			with open(file_path_input, 'rb', sequencerecords.buffer_size) as stream_input:
+				self._add_sequences_to_map(
+					stream_input, stream_map, genome_id, sequence_min_length, set_of_sequence_names,
+					sequence_id_to_genome_id=sequence_id_to_genome_id)
 			return
-		with open(file_path_input, 'r') as stream_input, open(file_path_output, 'w') as stream_output:
+		with open(file_path_input, 'rb', sequencerecords.buffer_size) as stream_input, \
+			open(file_path_output, 'wb', sequencerecords.buffer_size) as stream_output:
 			total_base_pairs = self._cleanup_and_filter_sequences(
-				stream_input, stream_output, stream_map, genome_id, sequence_min_length, set_of_sequence_names, file_format)
+				stream_input, stream_output, stream_map, genome_id, sequence_min_length, set_of_sequence_names, file_format,
+				sequence_id_to_genome_id)
 		if total_base_pairs == 0:
 			msg = "No valid sequences in '{}'".format(stream_input.name)
 			self._logger.error(msg)
 			raise Exception(msg)
 	
-	def _add_sequences_to_map(self, stream_input, stream_map, genome_id, sequence_min_length, set_of_sequence_names, file_format="fasta"):
-		for seq_record in SeqIO.parse(stream_input, file_format):
-			# remove description, else art illumina messes up sam format
-			seq_record.description = ''
-			if len(seq_record.seq) < sequence_min_length:
+	def _add_sequences_to_map(
+		self, stream_input, stream_map, genome_id, sequence_min_length, set_of_sequence_names, file_format="fasta",
+		sequence_id_to_genome_id=None):
+		for record in sequencerecords.read_records(stream_input, file_format):
+			sequence_id = sequencerecords.get_id(record).decode()
+			sequence_length = sequencerecords.get_sequence_length(record, file_format)
+			if sequence_length < sequence_min_length:
 				self._logger.debug("'{}', Removing short sequence '{}', length: {}".format(
-					os.path.basename(stream_input.name), seq_record.id, len(seq_record.seq)))
+					os.path.basename(stream_input.name), sequence_id, sequence_length))
 				continue
-			if seq_record.id in set_of_sequence_names:
-				new_id = self._get_new_name(seq_record.id, set_of_sequence_names)
-				stream_map.write("{}\t{}\t{}\n".format(genome_id, seq_record.id, new_id))
-				seq_record.id = new_id
-			set_of_sequence_names.add(seq_record.id)
+			if sequence_id in set_of_sequence_names:
+				new_id = self._get_new_name(sequence_id, set_of_sequence_names)
+				stream_map.write("{}\t{}\t{}\n".format(genome_id, sequence_id, new_id))
+				sequence_id = new_id
+			set_of_sequence_names.add(sequence_id)
+			if sequence_id_to_genome_id is not None:
+				sequence_id_to_genome_id[sequence_id] = genome_id
 
 	def _cleanup_and_filter_sequences(
 		self, stream_input, stream_output, stream_map,
-		genome_id, sequence_min_length, set_of_sequence_names, file_format="fasta"):
+		genome_id, sequence_min_length, set_of_sequence_names, file_format="fasta", sequence_id_to_genome_id=None):
 		"""
 		Rename ids that are not unique and remove sequences that are shorter than a given minimum
 
 		@attention file_format: Anything but 'fasta' is not supported, yet
 
-		@param stream_input: input stream of sequence file
-		@type stream_input: file | FileIO | StringIO
-		@param stream_output: Output stream
-		@type stream_output: file | FileIO | StringIO
+		@param stream_input: Binary input stream of sequence file
+		@type stream_input: io.BufferedReader
+		@param stream_output: Binary output stream
+		@type stream_output: io.BufferedWriter
 		@param stream_output: Output stream mapping
 		@type stream_output: file | FileIO | StringIO
 		@param sequence_min_length: Minimum length of sequences
@@ -145,27 +160,30 @@ class GenomePreparation(SequenceValidator):
 		@type set_of_sequence_names: set[str|unicode]
 		@param file_format: 'fasta' format by default.
 		@type file_format: str | unicode
+		@param sequence_id_to_genome_id: If given, the final sequence ids are added to it
+		@type sequence_id_to_genome_id: dict[str|unicode, str|unicode] | None
 
 		@return: Total length of all sequences (base pairs)
 		@rtype: int | long
 		"""
 		total_base_pairs = 0
-		for seq_record in SeqIO.parse(stream_input, file_format):
-			# remove description, else art illumina messes up sam format
-			seq_record.description = ''
-			if len(seq_record.seq) < sequence_min_length:
+		for record in sequencerecords.read_records(stream_input, file_format):
+			sequence_id = sequencerecords.get_id(record).decode()
+			sequence_length = sequencerecords.get_sequence_length(record, file_format)
+			if sequence_length < sequence_min_length:
 				self._logger.debug("'{}', Removing short sequence '{}', length: {}".format(
-					os.path.basename(stream_input.name), seq_record.id, len(seq_record.seq)))
+					os.path.basename(stream_input.name), sequence_id, sequence_length))
 				continue
-			if seq_record.id in set_of_sequence_names:
-				new_id = self._get_new_name(seq_record.id, set_of_sequence_names)
-				stream_map.write("{}\t{}\t{}\n".format(genome_id, seq_record.id, new_id))
-				seq_record.id = new_id
-			set_of_sequence_names.add(seq_record.id)
-			# file_handler.write(">{}\n".format(sequence_id))
-			# file_handler.writelines("{}\n".format(seq_record.seq))
-			stream_output.write(seq_record.format(file_format))
-			total_base_pairs += len(seq_record.seq)
+			if sequence_id in set_of_sequence_names:
+				new_id = self._get_new_name(sequence_id, set_of_sequence_names)
+				stream_map.write("{}\t{}\t{}\n".format(genome_id, sequence_id, new_id))
+				sequence_id = new_id
+			set_of_sequence_names.add(sequence_id)
+			if sequence_id_to_genome_id is not None:
+				sequence_id_to_genome_id[sequence_id] = genome_id
+			# remove description, else art illumina messes up sam format
+			stream_output.write(sequencerecords.rename(record, sequence_id.encode(), file_format))
+			total_base_pairs += sequence_length
 		return total_base_pairs
 
 	def _stream_sequences_of_min_length(
@@ -175,12 +193,10 @@ class GenomePreparation(SequenceValidator):
 
 		@attention file_format: Anything but 'fasta' is not supported, yet
 
-		@param stream_input: input stream of sequence file
-		@type stream_input: file | FileIO | StringIO
-		@param stream_output: Output stream
-		@type stream_output: file | FileIO | StringIO
-		@param stream_output: Output stream mapping
-		@type stream_output: file | FileIO | StringIO
+		@param stream_input: Binary input stream of sequence file
+		@type stream_input: io.BufferedReader
+		@param stream_output: Binary output stream
+		@type stream_output: io.BufferedWriter
 		@param sequence_min_length: Minimum length of sequences
 		@type sequence_min_length: int | long
 		@param file_format: 'fasta' format by default.
@@ -190,21 +206,23 @@ class GenomePreparation(SequenceValidator):
 		@rtype: int | long
 		"""
 		total_base_pairs = 0
-		for seq_record in SeqIO.parse(stream_input, file_format):
-			# remove description, else art illumina messes up sam format
-			seq_record.description = ''
-			if len(seq_record.seq) < sequence_min_length:
+		for record in sequencerecords.read_records(stream_input, file_format):
+			sequence_length = sequencerecords.get_sequence_length(record, file_format)
+			if sequence_length < sequence_min_length:
 				self._logger.debug("'{}', Removing short sequence '{}', length: {}".format(
-					os.path.basename(stream_input.name), seq_record.id, len(seq_record.seq)))
+					os.path.basename(stream_input.name), sequencerecords.get_id(record).decode(), sequence_length))
 				continue
-			stream_output.write(seq_record.format(file_format))
-			total_base_pairs += len(seq_record.seq)
+			# remove description, else art illumina messes up sam format
+			stream_output.write(sequencerecords.rename(record, sequencerecords.get_id(record), file_format))
+			total_base_pairs += sequence_length
 		return total_base_pairs
 
 	def move_genome_files(
-		self, genome_id_to_path_map, directory_output, sequence_min_length=0, set_of_sequence_names=None):
+		self, genome_id_to_path_map, directory_output, sequence_min_length=0, set_of_sequence_names=None,
+		genome_store=None):
 		"""
-		Move and clean up a list of genomes
+		Move and clean up a list of genomes.
+		The genome id of each final sequence id is written to a table in the output directory, sorted by sequence id.
 
 		@param genome_id_to_path_map: Dictionary with file path by genome ids
 		@type genome_id_to_path_map: dict[str|unicode, str|unicode]
@@ -214,19 +232,52 @@ class GenomePreparation(SequenceValidator):
 		@type sequence_min_length: int | long
 		@param set_of_sequence_names: Set of all previously used sequence names, making sure all will be unique
 		@type set_of_sequence_names: set[str|unicode]
+		@param genome_store: If given, the moved genomes are packed into this store
+		@type genome_store: GenomeStore | None
 		"""
 		directory_output = self.get_full_path(directory_output)
 		assert isinstance(genome_id_to_path_map, dict)
+		assert genome_store is None or isinstance(genome_store, GenomeStore)
 		if set_of_sequence_names is None:
 			set_of_sequence_names = set()
 		file_path_sequence_map = os.path.join(directory_output, self._filename_seq_map)
+		sequence_id_to_genome_id = {}
 		with open(file_path_sequence_map, 'w') as stream_map:
 			for genome_id, genome_file_path in genome_id_to_path_map.items():
 				file_name = os.path.basename(genome_file_path)
 				new_genome_file_path = os.path.join(directory_output, file_name)
 				self._move_genome_file(
-					genome_file_path, new_genome_file_path, stream_map, genome_id, sequence_min_length, set_of_sequence_names)
+					genome_file_path, new_genome_file_path, stream_map, genome_id, sequence_min_length, set_of_sequence_names,
+					sequence_id_to_genome_id=sequence_id_to_genome_id)
 				genome_id_to_path_map[genome_id] = new_genome_file_path
+		file_path_table = os.path.join(directory_output, self._filename_sequence_to_genome_id)
+		with open(file_path_table, 'w') as stream_table:
+			stream_table.write("".join(
+				"{}\t{}\n".format(sequence_id, sequence_id_to_genome_id[sequence_id])
+				for sequence_id in sorted(sequence_id_to_genome_id)))
+		if genome_store is not None:
+			genome_store.build(list(genome_id_to_path_map.values()))
+
+	@staticmethod
+	def read_sequence_to_genome_id(directory_genomes):
+		"""
+		Read the table of sequence ids and their genome ids written when genomes were moved into a directory
+
+		@param directory_genomes: Directory of moved genomes
+		@type directory_genomes: str | unicode
+
+		@return: Genome id by sequence id, or None if the genomes were moved without a table
+		@rtype: dict[str|unicode, str|unicode] | None
+		"""
+		file_path_table = os.path.join(directory_genomes, GenomePreparation._filename_sequence_to_genome_id)
+		if not os.path.isfile(file_path_table):
+			return None
+		sequence_id_to_genome_id = {}
+		with open(file_path_table) as stream_table:
+			for line in stream_table:
+				sequence_id, genome_id = line.rstrip("\n").split("\t")
+				sequence_id_to_genome_id[sequence_id] = genome_id
+		return sequence_id_to_genome_id
 
 	@staticmethod
 	def _get_new_name(name, set_of_sequence_names):
@@ -0,0 +1,231 @@
+__author__ = 'hofmann'
+__version__ = '0.0.1'
+
+import os
+import json
+import hashlib
+from Bio import SeqIO
+from scripts.Validator.sequencevalidator import SequenceValidator
+
+
+# ##################################
+#
+#          GenomeStatisticsIndex
+#
+# ##################################
+
+
+class GenomeStatisticsIndex(SequenceValidator):
+	"""
+	Sidecar index of genome statistics: sequence lengths, minimum and total length, N-content and checksum.
+	A genome is parsed and validated only once, as long as its path, size and modification time do not change.
+	"""
+
+	_label = "GenomeStatisticsIndex"
+
+	_file_extension = ".json"
+	_block_size = 2**20
+
+	def __init__(self, directory_index=None, logfile=None, verbose=False, debug=False):
+		"""
+		Constructor
+
+		@param directory_index: Directory the sidecar files are stored in, if None statistics are kept in memory only
+		@type directory_index: str | unicode | None
+		@param logfile: file handler or file path to a log file
+		@type logfile: file | FileIO | StringIO | str
+		@param verbose: Not verbose means that only warnings and errors will be past to stream
+		@type verbose: bool
+		@param debug: Display debug messages
+		@type debug: bool
+		"""
+		super(GenomeStatisticsIndex, self).__init__(label=self._label, logfile=logfile, verbose=verbose, debug=debug)
+		assert directory_index is None or isinstance(directory_index, str)
+		if directory_index is not None:
+			directory_index = self.get_full_path(directory_index)
+			if not os.path.isdir(directory_index):
+				os.makedirs(directory_index)
+		self._directory_index = directory_index
+		self._statistics = {}
+
+	def _get_sidecar_file_path(self, file_path):
+		"""
+		Get the location of the sidecar file of a genome
+
+		@param file_path: Absolute path to genome file
+		@type file_path: str | unicode
+
+		@rtype: str | unicode
+		"""
+		file_name = hashlib.md5(file_path.encode()).hexdigest() + self._file_extension
+		return os.path.join(self._directory_index, file_name)
+
+	@staticmethod
+	def _get_key(file_path, file_format, sequence_type, ambiguous):
+		"""
+		Get the key statistics are valid for, a changed file or different validation makes them obsolete
+
+		@rtype: list
+		"""
+		stat = os.stat(file_path)
+		return [file_path, stat.st_size, stat.st_mtime, file_format, sequence_type, ambiguous]
+
+	def get_statistics(self, file_path, file_format="fasta", sequence_type="dna", ambiguous=True, key=None):
+		"""
+		Get statistics of a sequence file, from the index if up to date, else the file is validated and indexed
+
+		@param file_path: Path to file containing sequences
+		@type file_path: str | unicode
+		@param file_format: Format of the file at the file_path provided. Valid: 'fasta', 'fastq'
+		@type file_format: str | unicode
+		@param sequence_type: Are the sequences DNA or RNA? Valid: 'rna', 'dna', 'protein'
+		@type sequence_type: str | unicode
+		@param ambiguous: True or False, DNA example for strict 'GATC',  ambiguous example 'GATCRYWSMKHBVDN'
+		@type ambiguous: bool
+		@param key: Used as prefix of error messages
+		@type key: str | None
+
+		@return: 'sequence_lengths' as list of id and length, 'min_length', 'total_length', 'n_count' and 'md5'
+		@rtype: dict
+
+		@raises: IOError
+		"""
+		assert self.validate_file(file_path)
+		assert isinstance(file_format, str)
+		file_format = file_format.lower()
+		assert file_format in self._formats
+		assert isinstance(sequence_type, str)
+		sequence_type = sequence_type.lower()
+		assert sequence_type in self._alphabets
+		file_path = self.get_full_path(file_path)
+
+		index_key = self._get_key(file_path, file_format, sequence_type, ambiguous)
+		statistics = self._statistics.get(file_path)
+		if statistics is None and self._directory_index is not None:
+			statistics = self._read_sidecar(file_path)
+		if statistics is not None and statistics["key"] == index_key:
+			self._statistics[file_path] = statistics
+			return statistics
+
+		statistics = self._scan(file_path, file_format, key)
+		statistics["key"] = index_key
+		self._statistics[file_path] = statistics
+		if self._directory_index is not None:
+			self._write_sidecar(file_path, statistics)
+		return statistics
+
+	def get_sequence_lengths(self, file_path, file_format="fasta", sequence_type="dna", ambiguous=True, key=None):
+		"""
+		Get minimum and total sequence length of a sequence file
+
+		@return: minimum and total sequence length
+		@rtype: tuple[int|long, int|long]
+
+		@raises: IOError
+		"""
+		statistics = self.get_statistics(file_path, file_format, sequence_type, ambiguous, key)
+		return statistics["min_length"], statistics["total_length"]
+
+	def validate_format(self, list_of_file_paths, file_format="fasta", sequence_type="dna", ambiguous=True):
+		"""
+		Validate file format of a list of sequence files, indexing them on the way
+
+		@param list_of_file_paths: List of fasta file paths
+		@type list_of_file_paths: list[str|unicode]
+		@param file_format: 'fasta' or 'fastq'
+		@type file_format: str | unicode
+		@param sequence_type: 'dna' or 'rna' or 'protein'
+		@type sequence_type: str | unicode
+		@param ambiguous: If true ambiguous characters are valid
+		@type ambiguous: bool
+
+		@return: True if all valid
+		@rtype: bool
+		"""
+		result = True
+		for file_path in list_of_file_paths:
+			try:
+				self.get_statistics(file_path, file_format, sequence_type, ambiguous)
+			except IOError:
+				result = False
+		return result
+
+	def _read_sidecar(self, file_path):
+		"""
+		Read statistics from the sidecar file of a genome
+
+		@rtype: dict | None
+		"""
+		file_path_sidecar = self._get_sidecar_file_path(file_path)
+		if not os.path.isfile(file_path_sidecar):
+			return None
+		try:
+			with open(file_path_sidecar) as stream_input:
+				return json.load(stream_input)
+		except ValueError:
+			self._logger.warning("Ignoring corrupt index file '{}'".format(file_path_sidecar))
+			return None
+
+	def _write_sidecar(self, file_path, statistics):
+		"""
+		Write statistics to the sidecar file of a genome, replacing it at once
+		"""
+		file_path_sidecar = self._get_sidecar_file_path(file_path)
+		file_path_tmp = file_path_sidecar + ".tmp"
+		with open(file_path_tmp, 'w') as stream_output:
+			json.dump(statistics, stream_output)
+		os.rename(file_path_tmp, file_path_sidecar)
+
+	def _get_md5(self, file_path):
+		"""
+		Get checksum of a file
+
+		@rtype: str
+		"""
+		md5 = hashlib.md5()
+		with open(file_path, 'rb') as stream_input:
+			for block in iter(lambda: stream_input.read(self._block_size), b""):
+				md5.update(block)
+		return md5.hexdigest()
+
+	def _scan(self, file_path, file_format, key=None):
+		"""
+		Validate a sequence file and collect its statistics
+
+		@rtype: dict
+
+		@raises: IOError
+		"""
+		prefix = ""
+		if key:
+			prefix = "'{}' ".format(key)
+		self._logger.debug("Indexing '{}'".format(file_path))
+
+		set_of_seq_id = set()
+		sequence_lengths = []
+		n_count = 0
+		with open(file_path) as file_handle:
+			if not self._validate_file_start(file_handle, file_format):
+				msg = "{}Invalid beginning of file '{}'.".format(prefix, os.path.basename(file_path))
+				self._logger.error(msg)
+				raise IOError(msg)
+			try:
+				for seq_record in SeqIO.parse(file_handle, file_format):
+					if not self._validate_sequence_record(seq_record, set_of_seq_id, file_format, key=None, silent=False):
+						raise ValueError("{}. sequence '{}' is invalid.".format(len(sequence_lengths) + 1, seq_record.id))
+					sequence = str(seq_record.seq)
+					sequence_lengths.append([seq_record.id, len(sequence)])
+					n_count += sequence.count('N') + sequence.count('n')
+			except Exception as e:
+				msg = "{}Corrupt sequence in file '{}'.\nException: {}".format(prefix, os.path.basename(file_path), e)
+				self._logger.error(msg)
+				raise IOError(msg)
+
+		lengths = [length for sequence_id, length in sequence_lengths]
+		return {
+			"sequence_lengths": sequence_lengths,
+			"min_length": min(lengths) if lengths else 0,
+			"total_length": sum(lengths),
+			"n_count": n_count,
+			"md5": self._get_md5(file_path),
+			}
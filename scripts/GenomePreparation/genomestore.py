@@ -0,0 +1,251 @@
+__author__ = 'hofmann'
+__version__ = '0.0.1'
+
+import os
+import json
+import uuid
+import numpy as np
+from scripts.Validator.validator import Validator
+from scripts import sequencerecords
+
+
+_code_to_base = np.frombuffer(b"ACGT", dtype=np.uint8)
+
+# any other character is stored as 'A' and masked as 'N'
+_base_to_code = np.full(256, 4, dtype=np.uint8)
+for _code, _base in enumerate(b"ACGT"):
+	_base_to_code[_base] = _code
+	_base_to_code[_base + 32] = _code
+
+
+def pack_sequence(sequence):
+	"""
+	Pack a sequence into 2 bit per base, four bases per byte with the first base in the highest bits
+
+	@param sequence: Sequence as ascii codes
+	@type sequence: numpy.ndarray
+
+	@return: packed bases and the start and end of each run of bases other than 'ACGT'
+	@rtype: (numpy.ndarray, list[list[int]])
+	"""
+	codes = _base_to_code[sequence]
+	is_masked = codes == 4
+	codes[is_masked] = 0
+	edges = np.flatnonzero(np.diff(np.concatenate(([0], is_masked.view(np.int8), [0]))))
+	n_intervals = edges.reshape(-1, 2).tolist()
+	codes = np.concatenate((codes, np.zeros(-len(codes) % 4, dtype=np.uint8)))
+	packed = (codes[0::4] << 6) | (codes[1::4] << 4) | (codes[2::4] << 2) | codes[3::4]
+	return packed, n_intervals
+
+
+class PackedSequence(object):
+	"""
+	Read-only view of a 2 bit packed sequence, bases are decoded only at the positions requested.
+	Indexing by an integer array or a slice returns ascii codes like indexing an array of the whole sequence.
+	"""
+
+	def __init__(self, packed, length, n_intervals):
+		"""
+		Constructor
+
+		@param packed: Packed bases, usually part of a memory map
+		@type packed: numpy.ndarray
+		@param length: Number of bases
+		@type length: int
+		@param n_intervals: Start and end of each run of bases other than 'ACGT'
+		@type n_intervals: list[list[int]]
+		"""
+		self._packed = packed
+		self._length = length
+		n_intervals = np.array(n_intervals, dtype=np.int64).reshape(-1, 2)
+		self._n_starts = n_intervals[:, 0]
+		self._n_ends = n_intervals[:, 1]
+
+	def __len__(self):
+		return self._length
+
+	def __getitem__(self, positions):
+		"""
+		Get bases at positions
+
+		@param positions: Positions as integer array of any shape, or a slice
+		@type positions: numpy.ndarray | slice
+
+		@return: ascii codes of the same shape
+		@rtype: numpy.ndarray
+		"""
+		if isinstance(positions, slice):
+			positions = np.arange(*positions.indices(self._length))
+		positions = np.asarray(positions, dtype=np.int64)
+		shifts = (6 - 2 * (positions & 3)).astype(np.uint8)
+		bases = _code_to_base[(self._packed[positions >> 2] >> shifts) & 3]
+		if len(self._n_starts) > 0:
+			index = np.searchsorted(self._n_starts, positions, side='right') - 1
+			is_masked = (index >= 0) & (positions < self._n_ends[np.maximum(index, 0)])
+			bases[is_masked] = ord('N')
+		return bases
+
+
+class PackedGenome(object):
+	"""
+	Sequences of one genome in a genome store.
+	Can be passed to other processes, each one memory maps the store on first access,
+	so all of them share the same pages.
+	"""
+
+	def __init__(self, file_path_data, list_of_sequences):
+		"""
+		Constructor
+
+		@param file_path_data: Packed bases of the genome store
+		@type file_path_data: str | unicode
+		@param list_of_sequences: Id, length, byte offset and intervals of bases other than 'ACGT' of each sequence
+		@type list_of_sequences: list[list]
+		"""
+		self._file_path_data = file_path_data
+		self._list_of_sequences = list_of_sequences
+		self._data = None
+
+	def __getstate__(self):
+		# memory maps are not passed to other processes
+		return {"_file_path_data": self._file_path_data, "_list_of_sequences": self._list_of_sequences, "_data": None}
+
+	def get_sequence_lengths(self):
+		"""
+		Get id and length of each sequence
+
+		@rtype: list[(str|unicode, int)]
+		"""
+		return [(sequence_id, length) for sequence_id, length, offset, n_intervals in self._list_of_sequences]
+
+	def get_sequences(self):
+		"""
+		Get id and bases of each sequence
+
+		@rtype: list[(str|unicode, PackedSequence)]
+		"""
+		if self._data is None:
+			self._data = np.memmap(self._file_path_data, dtype=np.uint8, mode='r')
+		return [
+			(sequence_id, PackedSequence(self._data[offset:offset + (length + 3) // 4], length, n_intervals))
+			for sequence_id, length, offset, n_intervals in self._list_of_sequences]
+
+
+# ##################################
+#
+#          GenomeStore
+#
+# ##################################
+
+
+class GenomeStore(Validator):
+	"""
+	Genomes packed into a single file of 2 bit per base, plus an index of sequence offsets, lengths and masked bases.
+	Built once while genomes are moved into a project, read by memory mapping it instead of parsing fasta files.
+	A genome is found only as long as its file path, size and modification time do not change.
+	"""
+
+	_label = "GenomeStore"
+
+	_file_name_index = "index.json"
+	_file_extension_data = ".2bit"
+
+	def __init__(self, directory, logfile=None, verbose=False, debug=False):
+		"""
+		Constructor
+
+		@param directory: Directory of the store, created if not existing
+		@type directory: str | unicode
+		@param logfile: file handler or file path to a log file
+		@type logfile: file | FileIO | StringIO | str
+		@param verbose: Not verbose means that only warnings and errors will be past to stream
+		@type verbose: bool
+		@param debug: Display debug messages
+		@type debug: bool
+		"""
+		super(GenomeStore, self).__init__(label=self._label, logfile=logfile, verbose=verbose, debug=debug)
+		assert isinstance(directory, str)
+		directory = self.get_full_path(directory)
+		if not os.path.isdir(directory):
+			os.makedirs(directory)
+		self._directory = directory
+		self._file_path_index = os.path.join(directory, self._file_name_index)
+		self._index = {"data": None, "genomes": {}}
+		if os.path.isfile(self._file_path_index):
+			self._read_index()
+
+	def _read_index(self):
+		"""
+		Read the index of the store
+		"""
+		try:
+			with open(self._file_path_index) as stream_input:
+				self._index = json.load(stream_input)
+		except ValueError:
+			self._logger.warning("Ignoring corrupt index file '{}'".format(self._file_path_index))
+
+	@staticmethod
+	def _get_key(file_path):
+		"""
+		Get the key a stored genome is valid for, a changed file makes it obsolete
+
+		@rtype: list
+		"""
+		stat = os.stat(file_path)
+		return [stat.st_size, stat.st_mtime]
+
+	def build(self, list_of_file_paths, file_format="fasta"):
+		"""
+		Pack genomes into the store, replacing its previous content
+
+		@param list_of_file_paths: Genome files
+		@type list_of_file_paths: list[str|unicode]
+		@param file_format: 'fasta' format by default.
+		@type file_format: str | unicode
+		"""
+		assert file_format == "fasta", "'{}' is not supported, yet.".format(file_format)
+		file_name_data = uuid.uuid4().hex + self._file_extension_data
+		file_path_data = os.path.join(self._directory, file_name_data)
+		genomes = {}
+		offset = 0
+		with open(file_path_data, 'wb') as stream_output:
+			for file_path in list_of_file_paths:
+				assert self.validate_file(file_path)
+				file_path = self.get_full_path(file_path)
+				list_of_sequences = []
+				for record in sequencerecords.read_file_records(file_path, file_format):
+					sequence = np.frombuffer(sequencerecords.get_sequence(record, file_format), dtype=np.uint8)
+					packed, n_intervals = pack_sequence(sequence)
+					stream_output.write(packed.tobytes())
+					list_of_sequences.append([sequencerecords.get_id(record).decode(), len(sequence), offset, n_intervals])
+					offset += len(packed)
+				genomes[file_path] = {"key": self._get_key(file_path), "sequences": list_of_sequences}
+		self._logger.info("Packed {} genomes into {} bytes".format(len(genomes), offset))
+
+		file_name_data_previous = self._index["data"]
+		self._index = {"data": file_name_data, "genomes": genomes}
+		# the index is replaced at once, processes still mapping the previous data keep it until they are done
+		file_path_tmp = self._file_path_index + ".tmp"
+		with open(file_path_tmp, 'w') as stream_output:
+			json.dump(self._index, stream_output)
+		os.rename(file_path_tmp, self._file_path_index)
+		if file_name_data_previous is not None and file_name_data_previous != file_name_data:
+			file_path_data_previous = os.path.join(self._directory, file_name_data_previous)
+			if os.path.isfile(file_path_data_previous):
+				os.remove(file_path_data_previous)
+
+	def get_genome(self, file_path):
+		"""
+		Get a stored genome
+
+		@param file_path: Genome file
+		@type file_path: str | unicode
+
+		@return: Stored genome, None if not stored or changed since
+		@rtype: PackedGenome | None
+		"""
+		file_path = self.get_full_path(file_path)
+		entry = self._index["genomes"].get(file_path)
+		if entry is None or not os.path.isfile(file_path) or entry["key"] != self._get_key(file_path):
+			return None
+		return PackedGenome(os.path.join(self._directory, self._index["data"]), entry["sequences"])
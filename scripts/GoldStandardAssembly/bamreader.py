@@ -0,0 +1,335 @@
+__author__ = 'hofmann'
+__version__ = '0.0.1'
+
+import os
+import zlib
+import struct
+import multiprocessing as mp
+import numpy as np
+
+
+# Bam files are read without samtools: bgzf blocks are inflated chunk by chunk
+# and the fixed size cores of the records are gathered into numpy arrays.
+# Records span blocks and are found by following their sizes, so a file is read by one process,
+# the files of a sample are read in parallel processes.
+
+_bgzf_magic = b"\x1f\x8b\x08\x04"
+_bgzf_header = struct.Struct("<4BI2BH")
+_bgzf_footer = struct.Struct("<II")
+_bgzf_subfield = struct.Struct("<2BH")
+_int32 = struct.Struct("<i")
+
+# compressed bytes of the blocks inflated at a time
+_chunk_size = 2**22
+
+# offsets of fields of the record core, after its block size
+_offset_reference_id = 4
+_offset_position = 8
+_offset_l_read_name = 12
+_offset_n_cigar_op = 16
+_offset_flag = 18
+_offset_read_name = 36
+
+# operations consuming the reference
+_cigar_reference_codes = (0, 2, 3, 7, 8)
+
+
+def _get_block_size(stream, offset):
+	"""
+	Get the size of the bgzf block at an offset of a file, from the 'BC' subfield of its header
+
+	@type stream: io.BufferedReader
+	@type offset: int
+
+	@return: Size of the block, 0 at the end of the file
+	@rtype: int
+
+	@raises: OSError
+	"""
+	stream.seek(offset)
+	header = stream.read(_bgzf_header.size)
+	if len(header) == 0:
+		return 0
+	if len(header) < _bgzf_header.size or not header.startswith(_bgzf_magic):
+		raise OSError("No bgzf block at offset {} of '{}'".format(offset, stream.name))
+	extra = stream.read(_bgzf_header.unpack(header)[-1])
+	index = 0
+	while index + _bgzf_subfield.size <= len(extra):
+		subfield_1, subfield_2, length = _bgzf_subfield.unpack_from(extra, index)
+		if (subfield_1, subfield_2) == (66, 67):
+			return struct.unpack_from("<H", extra, index + _bgzf_subfield.size)[0] + 1
+		index += _bgzf_subfield.size + length
+	raise OSError("Bgzf block at offset {} of '{}' has no size".format(offset, stream.name))
+
+
+def _get_chunks(file_path_bam, chunk_size=_chunk_size):
+	"""
+	Split a bgzf file into chunks of whole blocks
+
+	@type file_path_bam: str | unicode
+	@type chunk_size: int
+
+	@return: Offset and size of each chunk
+	@rtype: list[(int, int)]
+
+	@raises: OSError
+	"""
+	chunks = []
+	with open(file_path_bam, 'rb') as stream:
+		file_size = os.fstat(stream.fileno()).st_size
+		offset_chunk = 0
+		offset = 0
+		while True:
+			block_size = _get_block_size(stream, offset)
+			if block_size == 0:
+				break
+			offset += block_size
+			if offset > file_size:
+				raise OSError("Bgzf file '{}' is truncated".format(file_path_bam))
+			if offset - offset_chunk >= chunk_size:
+				chunks.append((offset_chunk, offset - offset_chunk))
+				offset_chunk = offset
+	if offset > offset_chunk:
+		chunks.append((offset_chunk, offset - offset_chunk))
+	return chunks
+
+
+def _inflate_chunk(file_path_bam, offset, size):
+	"""
+	Inflate the bgzf blocks of a chunk of a file
+
+	@type file_path_bam: str | unicode
+	@type offset: int
+	@type size: int
+
+	@rtype: bytes
+
+	@raises: OSError
+	"""
+	with open(file_path_bam, 'rb') as stream:
+		stream.seek(offset)
+		chunk = stream.read(size)
+	blocks = []
+	index = 0
+	while index < len(chunk):
+		extra_length = _bgzf_header.unpack_from(chunk, index)[-1]
+		block_size = 0
+		index_subfield = index + _bgzf_header.size
+		while index_subfield < index + _bgzf_header.size + extra_length:
+			subfield_1, subfield_2, length = _bgzf_subfield.unpack_from(chunk, index_subfield)
+			if (subfield_1, subfield_2) == (66, 67):
+				block_size = struct.unpack_from("<H", chunk, index_subfield + _bgzf_subfield.size)[0] + 1
+			index_subfield += _bgzf_subfield.size + length
+		crc, input_size = _bgzf_footer.unpack_from(chunk, index + block_size - _bgzf_footer.size)
+		data = zlib.decompress(
+			chunk[index + _bgzf_header.size + extra_length:index + block_size - _bgzf_footer.size], -15)
+		if len(data) != input_size or zlib.crc32(data) & 0xffffffff != crc:
+			raise OSError("Corrupt bgzf block at offset {} of '{}'".format(offset + index, file_path_bam))
+		blocks.append(data)
+		index += block_size
+	return b"".join(blocks)
+
+
+def _iter_data(file_path_bam):
+	"""
+	Inflated data of a bgzf file, chunk by chunk in order of the file
+
+	@type file_path_bam: str | unicode
+
+	@rtype: collections.Iterable[bytes]
+
+	@raises: OSError
+	"""
+	for offset, size in _get_chunks(file_path_bam):
+		yield _inflate_chunk(file_path_bam, offset, size)
+
+
+def _read_header(data):
+	"""
+	Read the header of a bam file, if complete
+
+	@type data: bytes
+
+	@return: Names and lengths of the references and size of the header, or None if incomplete
+	@rtype: (list[(str, int)], int) | None
+
+	@raises: OSError
+	"""
+	if len(data) < 12:
+		return None
+	if not data.startswith(b"BAM\1"):
+		raise OSError("Not a bam file")
+	index = 8 + _int32.unpack_from(data, 4)[0]
+	if len(data) < index + 4:
+		return None
+	number_of_references = _int32.unpack_from(data, index)[0]
+	index += 4
+	references = []
+	for _ in range(number_of_references):
+		if len(data) < index + 4:
+			return None
+		length_name = _int32.unpack_from(data, index)[0]
+		if len(data) < index + 8 + length_name:
+			return None
+		name = data[index + 4:index + 3 + length_name].decode()
+		references.append((name, _int32.unpack_from(data, index + 4 + length_name)[0]))
+		index += 8 + length_name
+	return references, index
+
+
+def _get_record_offsets(data, start):
+	"""
+	Get the offsets of complete records in inflated data
+
+	@type data: bytes
+	@type start: int
+
+	@return: Offsets of records and the offset past the last complete record
+	@rtype: (numpy.ndarray, int)
+	"""
+	unpack_from = _int32.unpack_from
+	offsets = []
+	index = start
+	end = len(data) - 4
+	while index <= end:
+		next_index = index + 4 + unpack_from(data, index)[0]
+		if next_index > len(data):
+			break
+		offsets.append(index)
+		index = next_index
+	return np.array(offsets, dtype=np.int64), index
+
+
+def _gather(array, offsets, dtype):
+	"""
+	Gather a little endian field of each record
+
+	@type array: numpy.ndarray
+	@type offsets: numpy.ndarray
+	@type dtype: str
+
+	@rtype: numpy.ndarray
+	"""
+	size = np.dtype(dtype).itemsize
+	return array[offsets[:, None] + np.arange(size)].view(dtype).ravel()
+
+
+def _get_fields(data, offsets, read_names):
+	"""
+	Get the fields of records
+
+	@type data: bytes
+	@type offsets: numpy.ndarray
+	@type read_names: bool
+
+	@rtype: dict[str, numpy.ndarray | list[bytes]]
+	"""
+	array = np.frombuffer(data, dtype=np.uint8)
+	position = _gather(array, offsets + _offset_position, '<i4')
+	l_read_name = array[offsets + _offset_l_read_name].astype(np.int64)
+	n_cigar_op = _gather(array, offsets + _offset_n_cigar_op, '<u2').astype(np.int64)
+
+	# reference length of each record summed over its cigar operations
+	number_of_operations = int(n_cigar_op.sum())
+	first_operation = np.cumsum(n_cigar_op) - n_cigar_op
+	record_index = np.repeat(np.arange(len(offsets)), n_cigar_op)
+	offsets_operations = np.repeat(offsets + _offset_read_name + l_read_name, n_cigar_op) + 4 * (
+		np.arange(number_of_operations) - np.repeat(first_operation, n_cigar_op))
+	operations = _gather(array, offsets_operations, '<u4')
+	lengths = np.where(np.isin(operations & 0xf, _cigar_reference_codes), operations >> 4, 0)
+	reference_length = np.bincount(record_index, weights=lengths, minlength=len(offsets)).astype(np.int64)
+
+	fields = {
+		"reference_id": _gather(array, offsets + _offset_reference_id, '<i4'),
+		"position": position,
+		"end": position + reference_length,
+		"flag": _gather(array, offsets + _offset_flag, '<u2'),
+		"n_cigar_op": n_cigar_op,
+		}
+	if read_names:
+		fields["read_name"] = [
+			data[offset + _offset_read_name:offset + _offset_read_name + length - 1]
+			for offset, length in zip(offsets.tolist(), l_read_name.tolist())]
+	return fields
+
+
+def read_alignments(file_path_bam, read_names=False):
+	"""
+	Read the location of each record of a bam file, in order of the file
+
+	Fields of records:
+		- reference_id: index of its reference, -1 if none
+		- position: 0-based start on its reference, -1 if none
+		- end: exclusive end on its reference, by the operations of the cigar consuming the reference
+		- flag: bitwise flag
+		- n_cigar_op: number of cigar operations, 0 for no cigar
+		- read_name: name of the read, only if asked for
+
+	@param file_path_bam: Bam file
+	@type file_path_bam: str | unicode
+	@param read_names: Read the names of reads
+	@type read_names: bool
+
+	@return: Names and lengths of the references, fields of the records
+	@rtype: (list[(str, int)], dict[str, numpy.ndarray | list[bytes]])
+
+	@raises: OSError
+	"""
+	assert isinstance(file_path_bam, str)
+	references = None
+	list_of_fields = []
+	remainder = b""
+	for data in _iter_data(file_path_bam):
+		data = remainder + data
+		start = 0
+		if references is None:
+			header = _read_header(data)
+			if header is None:
+				remainder = data
+				continue
+			references, start = header
+		offsets, end = _get_record_offsets(data, start)
+		if len(offsets) > 0:
+			list_of_fields.append(_get_fields(data, offsets, read_names))
+		remainder = data[end:]
+	if references is None or len(remainder) > 0:
+		raise OSError("Bam file '{}' is truncated".format(file_path_bam))
+
+	fields = {}
+	for key, dtype in (("reference_id", np.int32), ("position", np.int32), ("end", np.int64), ("flag", np.uint16),
+			("n_cigar_op", np.int64)):
+		fields[key] = np.concatenate([np.empty(0, dtype=dtype)] + [item[key] for item in list_of_fields])
+	if read_names:
+		fields["read_name"] = [read_name for item in list_of_fields for read_name in item["read_name"]]
+	return references, fields
+
+
+def _read_alignments_task(args):
+	return read_alignments(*args)
+
+
+def read_list_of_alignments(list_of_file_paths_bam, read_names=False, max_processes=1):
+	"""
+	Read the location of each record of bam files, each file in a process of its own
+
+	@attention: processes inside of a process pool read serially, they can not start processes of their own
+
+	@param list_of_file_paths_bam: Bam files
+	@type list_of_file_paths_bam: list[str|unicode]
+	@param read_names: Read the names of reads
+	@type read_names: bool
+	@param max_processes: Maximum number of files read at the same time
+	@type max_processes: int
+
+	@return: Names and lengths of the references and fields of the records of each file, in the given order
+	@rtype: list[(list[(str, int)], dict[str, numpy.ndarray | list[bytes]])]
+
+	@raises: OSError
+	"""
+	assert isinstance(list_of_file_paths_bam, list)
+	assert isinstance(max_processes, int) and max_processes > 0
+	tasks = [(file_path_bam, read_names) for file_path_bam in list_of_file_paths_bam]
+	if max_processes < 2 or len(tasks) < 2 or mp.current_process().daemon:
+		return [read_alignments(*task) for task in tasks]
+	with mp.Pool(processes=min(max_processes, len(tasks))) as pool:
+		return pool.map(_read_alignments_task, tasks)
@@ -0,0 +1,706 @@
+__author__ = 'hofmann'
+__version__ = '0.0.1'
+
+import os
+import re
+import zlib
+import struct
+import tempfile
+import functools
+import numpy as np
+
+
+# bgzf blocks hold at most this much uncompressed data, like in samtools
+_bgzf_block_size = 0xff00
+_bgzf_header = struct.Struct("<4BI2BH2BHH")
+_bgzf_footer = struct.Struct("<II")
+# empty block terminating a bgzf file
+bgzf_eof_marker = bytes.fromhex("1f8b08040000000000ff0600424302001b0003000000000000000000")
+
+_record_core = struct.Struct("<iiiBBHHHiiii")
+_record_core_dtype = np.dtype([
+	("block_size", "<i4"), ("reference_id", "<i4"), ("position", "<i4"), ("l_read_name", "u1"), ("mapq", "u1"),
+	("bin", "<u2"), ("n_cigar_op", "<u2"), ("flag", "<u2"), ("l_seq", "<i4"), ("next_reference_id", "<i4"),
+	("next_position", "<i4"), ("template_length", "<i4")])
+_int32 = struct.Struct("<i")
+
+_cigar_operations = {character: code for code, character in enumerate("MIDNSHP=X")}
+_cigar_pattern = re.compile(r"(\d+)([MIDNSHP=X])")
+# operations consuming the reference
+_cigar_reference_codes = (0, 2, 3, 7, 8)
+
+_base_to_code = np.full(256, 15, dtype=np.uint8)
+for _code, _base in enumerate(b"=ACMGRSVTWYHKDBN"):
+	_base_to_code[_base] = _code
+	_base_to_code[_base + 32 if _base >= 65 else _base] = _code
+_base_to_code_table = _base_to_code.tobytes()
+
+# type of optional integer fields, its struct format and range
+_integer_types = (
+	(b'c', '<b', -2**7, 2**7), (b'C', '<B', 0, 2**8), (b's', '<h', -2**15, 2**15), (b'S', '<H', 0, 2**16),
+	(b'i', '<i', -2**31, 0), (b'I', '<I', 0, 2**32))
+
+_quality_to_phred = bytes(max(value - 33, 0) for value in range(256))
+_quality_to_phred_array = np.frombuffer(_quality_to_phred, dtype=np.uint8)
+
+# bins of the bai index are 16 kbp windows at the finest level
+_linear_index_shift = 14
+# bin holding reference start, end and read counts
+_pseudo_bin = 37450
+_unplaced_order = 2**31
+# memory of a buffered record besides its bytes: the bytes object, its list entry and its sort keys
+_record_overhead = 120
+# records merged from spilled runs at a time
+_merge_batch_size = 2**16
+
+
+def reg2bin(begin, end):
+	"""
+	Smallest bin of the bai index containing 0-based, half-open intervals, as given by the sam specification
+
+	@type begin: numpy.ndarray
+	@type end: numpy.ndarray
+
+	@rtype: numpy.ndarray
+	"""
+	end = end - 1
+	bins = np.zeros(len(begin), dtype=np.int64)
+	is_set = np.zeros(len(begin), dtype=bool)
+	for shift, first_bin in ((14, 4681), (17, 585), (20, 73), (23, 9), (26, 1)):
+		is_in_bin = ~is_set & (begin >> shift == end >> shift)
+		bins[is_in_bin] = first_bin + (begin[is_in_bin] >> shift)
+		is_set |= is_in_bin
+	return bins
+
+
+@functools.lru_cache(maxsize=2**12)
+def _encode_cigar(cigar):
+	"""
+	Encode the operations of a cigar string and get the length of reference they consume
+
+	@type cigar: str
+
+	@return: Encoded operations, their number and the reference length
+	@rtype: (bytes, int, int)
+	"""
+	cigar_codes = []
+	reference_length = 0
+	if cigar == '*':
+		return b"", 0, 0
+	for number, character in _cigar_pattern.findall(cigar):
+		code = _cigar_operations[character]
+		cigar_codes.append(int(number) << 4 | code)
+		if code in _cigar_reference_codes:
+			reference_length += int(number)
+	return struct.pack("<{}I".format(len(cigar_codes)), *cigar_codes), len(cigar_codes), reference_length
+
+
+def _pack_sequences(bases):
+	"""
+	Pack rows of ascii bases into 4-bit codes, two bases per byte
+
+	@param bases: Sequences of equal length as rows of ascii codes
+	@type bases: numpy.ndarray
+
+	@rtype: numpy.ndarray
+	"""
+	codes = _base_to_code[bases]
+	if codes.shape[1] % 2 == 1:
+		codes = np.concatenate([codes, np.zeros((codes.shape[0], 1), dtype=np.uint8)], axis=1)
+	return (codes[:, 0::2] << 4) | codes[:, 1::2]
+
+
+def _pack_sequence_list(sequences):
+	"""
+	Pack sequences of any length into 4-bit codes, two bases per byte, all of them at once
+
+	@param sequences: Sequences as ascii bytes
+	@type sequences: list[bytes]
+
+	@rtype: list[bytes]
+	"""
+	# odd sequences are padded by '=', code 0
+	padded = b"".join(sequence + b"=" if len(sequence) % 2 == 1 else sequence for sequence in sequences)
+	codes = np.frombuffer(padded.translate(_base_to_code_table), dtype=np.uint8)
+	packed = ((codes[0::2] << 4) | codes[1::2]).tobytes()
+	packed_sequences = []
+	offset = 0
+	for sequence in sequences:
+		size = (len(sequence) + 1) // 2
+		packed_sequences.append(packed[offset:offset + size])
+		offset += size
+	return packed_sequences
+
+
+def _encode_tag(field):
+	"""
+	Encode an optional field 'TAG:TYPE:VALUE' of a sam record
+
+	@rtype: bytes
+	"""
+	tag, value_type, value = field.split(':', 2)
+	tag = tag.encode()
+	if value_type == 'A':
+		return tag + b'A' + value.encode()
+	if value_type == 'i':
+		value = int(value)
+		# smallest fitting integer type, like samtools
+		for type_code, format_code, minimum, maximum in _integer_types:
+			if minimum <= value < maximum:
+				return tag + type_code + struct.pack(format_code, value)
+		raise ValueError("Integer out of range in optional field '{}'".format(field))
+	if value_type == 'f':
+		return tag + b'f' + struct.pack('<f', float(value))
+	if value_type in 'ZH':
+		return tag + value_type.encode() + value.encode() + b'\0'
+	if value_type == 'B':
+		subtype, _, values = value.partition(',')
+		values = values.split(',') if values else []
+		format_code = {'c': 'b', 'C': 'B', 's': 'h', 'S': 'H', 'i': 'i', 'I': 'I', 'f': 'f'}[subtype]
+		convert = float if subtype == 'f' else int
+		return tag + b'B' + subtype.encode() + struct.pack(
+			'<I{}{}'.format(len(values), format_code), len(values), *[convert(element) for element in values])
+	raise ValueError("Unknown type of optional field '{}'".format(field))
+
+
+def _get_column(data, offsets, column):
+	"""
+	Get a little-endian 16 bit field of each record in a buffer of records
+
+	@param data: Records, concatenated
+	@type data: numpy.ndarray
+	@param offsets: Offset of each record in the buffer
+	@type offsets: numpy.ndarray
+	@param column: Offset of the field in a record
+	@type column: int
+
+	@rtype: numpy.ndarray
+	"""
+	return data[offsets + column].astype(np.int64) | (data[offsets + column + 1].astype(np.int64) << 8)
+
+
+class _BgzfStream(object):
+	"""
+	Bgzf compressed output keeping track of its blocks, to map offsets of the uncompressed data to virtual offsets
+	"""
+
+	def __init__(self, file_path, compression_level):
+		self._stream = open(file_path, 'wb')
+		self._compression_level = compression_level
+		self._buffer = bytearray()
+		self._position = 0
+		self._position_block = 0
+		self._offset_block = 0
+		# uncompressed and file offset of each block written
+		self._block_positions = []
+		self._block_offsets = []
+
+	def get_position(self):
+		"""
+		Offset of the next byte written in the uncompressed data
+
+		@rtype: int
+		"""
+		return self._position
+
+	def get_virtual_offsets(self, positions):
+		"""
+		Virtual offsets of offsets in the uncompressed data: offset of their block in the file and offset within the block
+
+		@attention: blocks are known once written, offsets of all data are known after closing the stream
+
+		@type positions: numpy.ndarray
+
+		@rtype: numpy.ndarray
+		"""
+		block_positions = np.array(self._block_positions, dtype=np.int64)
+		block_offsets = np.array(self._block_offsets, dtype=np.int64)
+		index = np.searchsorted(block_positions, positions, side='right') - 1
+		return (block_offsets[index] << 16) | (positions - block_positions[index])
+
+	def write(self, data):
+		self._buffer += data
+		self._position += len(data)
+		while len(self._buffer) >= _bgzf_block_size:
+			self._write_block(bytes(self._buffer[:_bgzf_block_size]))
+			del self._buffer[:_bgzf_block_size]
+
+	def flush(self):
+		if len(self._buffer) > 0:
+			self._write_block(bytes(self._buffer))
+			self._buffer = bytearray()
+
+	def _write_block(self, data):
+		compressor = zlib.compressobj(self._compression_level, zlib.DEFLATED, -15)
+		compressed = compressor.compress(data) + compressor.flush()
+		block_size = _bgzf_header.size + len(compressed) + _bgzf_footer.size
+		self._stream.write(_bgzf_header.pack(31, 139, 8, 4, 0, 0, 255, 6, 66, 67, 2, block_size - 1))
+		self._stream.write(compressed)
+		self._stream.write(_bgzf_footer.pack(zlib.crc32(data) & 0xffffffff, len(data)))
+		self._block_positions.append(self._position_block)
+		self._block_offsets.append(self._offset_block)
+		self._position_block += len(data)
+		self._offset_block += block_size
+
+	def close(self):
+		if len(self._buffer) == 0:
+			# data ending with a full block ends at the start of the eof marker, else within its last block
+			self._block_positions.append(self._position_block)
+			self._block_offsets.append(self._offset_block)
+		self.flush()
+		self._stream.write(bgzf_eof_marker)
+		self._stream.close()
+
+
+class _BaiIndex(object):
+	"""
+	Bai index of a coordinate sorted bam file, built from the locations and offsets of its records on close
+	"""
+
+	def __init__(self, number_of_references):
+		self._number_of_references = number_of_references
+		self._columns = []
+
+	def add(self, reference_ids, positions, ends, bins, is_unmapped, offsets_begin, offsets_end):
+		"""
+		Add records in order of the file by their location and offsets in the uncompressed bam file
+		"""
+		self._columns.append((reference_ids, positions, ends, bins, is_unmapped, offsets_begin, offsets_end))
+
+	def _get_columns(self):
+		if len(self._columns) == 0:
+			return [np.zeros(0, dtype=np.int64) for _ in range(7)]
+		return [np.concatenate(column) for column in zip(*self._columns)]
+
+	@staticmethod
+	def _get_linear_index(positions, ends, offsets_begin):
+		"""
+		Offset of the first record overlapping each 16 kbp window of a reference
+
+		@rtype: numpy.ndarray
+		"""
+		windows_first = np.maximum(positions, 0) >> _linear_index_shift
+		windows_last = np.maximum(ends - 1, 0) >> _linear_index_shift
+		spans = windows_last - windows_first + 1
+		record_indices = np.repeat(np.arange(len(positions)), spans)
+		windows = windows_first[record_indices] + np.arange(len(record_indices)) - np.repeat(np.cumsum(spans) - spans, spans)
+		first_records = np.full(int(windows_last.max()) + 1, len(positions))
+		np.minimum.at(first_records, windows, record_indices)
+		# records are sorted by position, so windows without reads start at the first record of the next window with reads
+		first_records = np.minimum.accumulate(first_records[::-1])[::-1]
+		return offsets_begin[first_records]
+
+	def write(self, file_path, get_virtual_offsets):
+		"""
+		Write the index in bai format
+
+		@param file_path: Output file path
+		@type file_path: str | unicode
+		@param get_virtual_offsets: Maps offsets in the uncompressed bam file to virtual offsets
+		@type get_virtual_offsets: (numpy.ndarray) -> numpy.ndarray
+		"""
+		reference_ids, positions, ends, bins, is_unmapped, offsets_begin, offsets_end = self._get_columns()
+		is_placed = reference_ids >= 0
+		number_unplaced = len(reference_ids) - int(np.count_nonzero(is_placed))
+		reference_ids, positions, ends, bins, is_unmapped = [
+			column[is_placed] for column in (reference_ids, positions, ends, bins, is_unmapped)]
+		offsets_begin = get_virtual_offsets(offsets_begin[is_placed])
+		offsets_end = get_virtual_offsets(offsets_end[is_placed])
+		bounds = np.searchsorted(reference_ids, np.arange(self._number_of_references + 1)).tolist()
+
+		output = [b"BAI\1", struct.pack("<i", self._number_of_references)]
+		for begin, end in zip(bounds[:-1], bounds[1:]):
+			if begin == end:
+				output.append(struct.pack("<ii", 0, 0))
+				continue
+			# records of a bin following each other in the file are one chunk
+			bins_of_reference = bins[begin:end]
+			starts = np.flatnonzero(np.diff(bins_of_reference, prepend=-1) != 0)
+			stops = np.append(starts[1:], len(bins_of_reference)) - 1
+			chunk_bins = bins_of_reference[starts]
+			order = np.argsort(chunk_bins, kind='stable')
+			chunk_bins = chunk_bins[order].tolist()
+			chunk_begins = offsets_begin[begin + starts[order]].tolist()
+			chunk_ends = offsets_end[begin + stops[order]].tolist()
+			number_of_bins = len(set(chunk_bins))
+			output.append(struct.pack("<i", number_of_bins + 1))
+			index_chunk = 0
+			while index_chunk < len(chunk_bins):
+				bin_id = chunk_bins[index_chunk]
+				index_next = index_chunk
+				while index_next < len(chunk_bins) and chunk_bins[index_next] == bin_id:
+					index_next += 1
+				output.append(struct.pack("<Ii", bin_id, index_next - index_chunk))
+				output.extend(
+					struct.pack("<QQ", chunk_begins[index], chunk_ends[index]) for index in range(index_chunk, index_next))
+				index_chunk = index_next
+			# reference start and end offsets, mapped and unmapped reads
+			number_unmapped = int(np.count_nonzero(is_unmapped[begin:end]))
+			output.append(struct.pack("<Ii", _pseudo_bin, 2))
+			output.append(struct.pack(
+				"<QQQQ", int(offsets_begin[begin]), int(offsets_end[end - 1]), end - begin - number_unmapped, number_unmapped))
+			linear_index = self._get_linear_index(positions[begin:end], ends[begin:end], offsets_begin[begin:end])
+			output.append(struct.pack("<i", len(linear_index)))
+			output.append(linear_index.astype("<u8").tobytes())
+		output.append(struct.pack("<Q", number_unplaced))
+		with open(file_path, 'wb') as stream_output:
+			stream_output.write(b"".join(output))
+
+
+class BamWriter(object):
+	"""
+	Writable stream of sam lines, written as a coordinate sorted, bgzf compressed bam file with a bai index on close.
+	Records are encoded as they are written, either line by line or batch-wise from arrays of reads,
+	records exceeding the memory limit are sorted and spilled into temporary runs, merged on close.
+
+	@attention: nothing is opened before the first write, so a writer can be passed to another process
+	"""
+
+	def __init__(self, file_path_bam, compression_level=5, max_memory=2**30, tmp_dir=None):
+		"""
+		Constructor
+
+		@param file_path_bam: Bam output, the index is written to '<file_path_bam>.bai'
+		@type file_path_bam: str | unicode
+		@param compression_level: Compression level used. 0-9 (0 means no compression)
+		@type compression_level: int
+		@param max_memory: Memory in bytes of the records kept before they are spilled to disk
+		@type max_memory: int
+		@param tmp_dir: Directory for spilled runs of records
+		@type tmp_dir: str | unicode | None
+		"""
+		assert isinstance(file_path_bam, str)
+		assert isinstance(compression_level, int) and 0 <= compression_level <= 9
+		assert isinstance(max_memory, int) and max_memory > 0
+		self._file_path_bam = file_path_bam
+		self._compression_level = compression_level
+		self._max_memory = max_memory
+		self._tmp_dir = tmp_dir
+		self._header_lines = []
+		self._references = []
+		self._dict_reference_to_id = None
+		self._remainder = ""
+		# buffered records, and their reference order, position and end in arrays
+		self._records = []
+		self._keys = []
+		self._line_keys = []
+		self._memory = 0
+		self._file_paths_runs = []
+		self._closed = False
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		if exc_type is None:
+			self.close()
+		else:
+			self._remove_runs()
+		return False
+
+	def write(self, data):
+		"""
+		@param data: sam lines, the header before any record
+		@type data: str | bytes
+		"""
+		if isinstance(data, bytes):
+			data = data.decode()
+		lines = (self._remainder + data).split("\n")
+		self._remainder = lines.pop()
+		self._add_lines(lines)
+
+	def write_alignments(
+			self, reference, read_names, flags, positions, mapq, cigar, next_positions, template_lengths, bases,
+			qualities):
+		"""
+		Add reads of equal length aligned to one reference, their mates aligned to it as well.
+		Records are encoded from the arrays at once, as they would be from the sam lines of the reads.
+
+		@attention: the sam header must be written before
+
+		@param reference: Name of the reference of the reads and their mates
+		@type reference: str | unicode
+		@param read_names: Name of each read
+		@type read_names: list[bytes]
+		@param flags: Flag of each read
+		@type flags: numpy.ndarray
+		@param positions: 0-based position of each read
+		@type positions: numpy.ndarray
+		@param mapq: Mapping quality of all reads
+		@type mapq: int
+		@param cigar: Cigar of all reads
+		@type cigar: str | unicode
+		@param next_positions: 0-based position of the mate of each read
+		@type next_positions: numpy.ndarray
+		@param template_lengths: Template length of each read
+		@type template_lengths: numpy.ndarray
+		@param bases: Sequences of the reads, as rows of ascii codes
+		@type bases: numpy.ndarray
+		@param qualities: Phred+33 encoded qualities of the reads, as rows of ascii codes
+		@type qualities: numpy.ndarray
+		"""
+		assert len(self._remainder) == 0, "Incomplete sam line before records"
+		number_of_records, read_length = bases.shape
+		if number_of_records == 0:
+			return
+		reference_id = self._get_dict_reference_to_id()[reference]
+		cigar_codes, number_of_operations, reference_length = _encode_cigar(cigar)
+		positions = np.asarray(positions, dtype=np.int64)
+		ends = positions + max(reference_length, 1)
+		name_lengths = np.fromiter(map(len, read_names), dtype=np.int64, count=number_of_records) + 1
+		data = np.concatenate([
+			np.tile(np.frombuffer(cigar_codes, dtype=np.uint8), (number_of_records, 1)),
+			_pack_sequences(bases),
+			_quality_to_phred_array[qualities]], axis=1)
+
+		core = np.zeros(number_of_records, dtype=_record_core_dtype)
+		core["block_size"] = _record_core.size - 4 + name_lengths + data.shape[1]
+		core["reference_id"] = reference_id
+		core["position"] = positions
+		core["l_read_name"] = name_lengths
+		core["mapq"] = mapq
+		core["bin"] = reg2bin(positions, ends)
+		core["n_cigar_op"] = number_of_operations
+		core["flag"] = flags
+		core["l_seq"] = read_length
+		core["next_reference_id"] = reference_id
+		core["next_position"] = next_positions
+		core["template_length"] = template_lengths
+		core = core.view(np.uint8).reshape(number_of_records, _record_core.size)
+
+		# records of names of equal length are rows of one array
+		records = [None] * number_of_records
+		for name_length in np.unique(name_lengths).tolist():
+			indices = np.flatnonzero(name_lengths == name_length)
+			names = np.array([read_names[index] for index in indices.tolist()], dtype="S{}".format(name_length))
+			rows = np.concatenate([core[indices], names.view(np.uint8).reshape(-1, name_length), data[indices]], axis=1)
+			for index, record in zip(indices.tolist(), rows.view("V{}".format(rows.shape[1])).ravel().tolist()):
+				records[index] = record
+
+		self._flush_line_keys()
+		self._records.extend(records)
+		self._keys.append(np.column_stack([np.full(number_of_records, reference_id), positions, ends]))
+		self._memory += int(core.size + name_lengths.sum() + data.size) + _record_overhead * number_of_records
+		if self._memory > self._max_memory:
+			self._spill()
+
+	def _get_dict_reference_to_id(self):
+		if self._dict_reference_to_id is None:
+			self._dict_reference_to_id = {name: index for index, (name, length) in enumerate(self._references)}
+		return self._dict_reference_to_id
+
+	def _add_lines(self, lines):
+		records = []
+		for line in lines:
+			if len(line) == 0:
+				continue
+			if line.startswith('@'):
+				assert self._dict_reference_to_id is None and len(records) == 0, "Sam header after first record"
+				self._add_header_line(line)
+				continue
+			records.append(line)
+		if len(records) == 0:
+			return
+		reference_ids, positions, ends, records = self._encode(records)
+		orders = np.where(reference_ids >= 0, reference_ids, _unplaced_order)
+		memory = sum(map(len, records)) + _record_overhead * len(records)
+		if self._memory + memory <= self._max_memory:
+			self._flush_line_keys()
+			self._records.extend(records)
+			self._keys.append(np.column_stack([orders, positions, ends]))
+			self._memory += memory
+			return
+		for key, record in zip(zip(orders.tolist(), positions.tolist(), ends.tolist()), records):
+			self._records.append(record)
+			self._line_keys.append(key)
+			self._memory += len(record) + _record_overhead
+			if self._memory > self._max_memory:
+				self._spill()
+
+	def _add_header_line(self, line):
+		if line.startswith("@HD"):
+			fields = [field for field in line.split("\t") if not field.startswith("SO:")]
+			line = "\t".join(fields + ["SO:coordinate"])
+		elif line.startswith("@SQ"):
+			fields = dict(field.split(':', 1) for field in line.split("\t")[1:] if ':' in field)
+			self._references.append((fields["SN"], int(fields["LN"])))
+		self._header_lines.append(line)
+
+	def _encode(self, lines):
+		"""
+		Encode sam lines as bam records, the fields of all lines at once
+
+		@return: Reference id, 0-based position and end on the reference of each line, and its record
+		@rtype: (numpy.ndarray, numpy.ndarray, numpy.ndarray, list[bytes])
+		"""
+		dict_reference_to_id = self._get_dict_reference_to_id()
+		list_of_fields = [line.rstrip("\r").split("\t") for line in lines]
+		read_names, flags, references, positions, mapqs, cigars, next_references, next_positions, template_lengths, \
+			sequences, qualities = zip(*[fields[:11] for fields in list_of_fields])
+		reference_ids = [dict_reference_to_id[reference] if reference != '*' else -1 for reference in references]
+		next_reference_ids = [
+			reference_id if next_reference == '=' else -1 if next_reference == '*' else dict_reference_to_id[next_reference]
+			for reference_id, next_reference in zip(reference_ids, next_references)]
+		read_names = [read_name.encode() + b"\0" for read_name in read_names]
+		cigars = [_encode_cigar(cigar) for cigar in cigars]
+		sequences = [sequence.encode() if sequence != '*' else b"" for sequence in sequences]
+		qualities = [
+			quality.encode().translate(_quality_to_phred) if quality != '*' else b"\xff" * len(sequence)
+			for quality, sequence in zip(qualities, sequences)]
+		tags = [b"".join([_encode_tag(field) for field in fields[11:]]) for fields in list_of_fields]
+		packed_sequences = _pack_sequence_list(sequences)
+
+		number_of_records = len(lines)
+		lengths_of_sequences = np.fromiter(map(len, sequences), dtype=np.int64, count=number_of_records)
+		cigar_codes, numbers_of_operations, reference_lengths = zip(*cigars)
+		core = np.zeros(number_of_records, dtype=_record_core_dtype)
+		core["reference_id"] = reference_ids
+		core["position"] = np.fromiter(map(int, positions), dtype=np.int64, count=number_of_records) - 1
+		core["l_read_name"] = np.fromiter(map(len, read_names), dtype=np.int64, count=number_of_records)
+		core["mapq"] = np.fromiter(map(int, mapqs), dtype=np.int64, count=number_of_records)
+		core["n_cigar_op"] = numbers_of_operations
+		core["flag"] = np.fromiter(map(int, flags), dtype=np.int64, count=number_of_records)
+		core["l_seq"] = lengths_of_sequences
+		core["next_reference_id"] = next_reference_ids
+		core["next_position"] = np.fromiter(map(int, next_positions), dtype=np.int64, count=number_of_records) - 1
+		core["template_length"] = np.fromiter(map(int, template_lengths), dtype=np.int64, count=number_of_records)
+		positions = core["position"].astype(np.int64)
+		ends = positions + np.maximum(reference_lengths, 1)
+		core["bin"] = reg2bin(positions, ends)
+		core["block_size"] = _record_core.size - 4 + core["l_read_name"] + 4 * core["n_cigar_op"] + \
+			(lengths_of_sequences + 1) // 2 + lengths_of_sequences + np.fromiter(
+				map(len, tags), dtype=np.int64, count=number_of_records)
+		cores = core.view(np.uint8).reshape(number_of_records, _record_core.size).view(
+			"V{}".format(_record_core.size)).ravel().tolist()
+		records = [
+			b"".join(parts) for parts in zip(cores, read_names, cigar_codes, packed_sequences, qualities, tags)]
+		return core["reference_id"].astype(np.int64), positions, ends, records
+
+	def _flush_line_keys(self):
+		if len(self._line_keys) > 0:
+			self._keys.append(np.array(self._line_keys, dtype=np.int64))
+			self._line_keys = []
+
+	def _sort(self):
+		"""
+		Take the buffered records sorted by coordinate, records of the same coordinate in order of writing
+
+		@return: Records and their reference order, position and end
+		@rtype: (list[bytes], numpy.ndarray)
+		"""
+		self._flush_line_keys()
+		records, self._records = self._records, []
+		keys = np.concatenate(self._keys) if len(self._keys) > 0 else np.zeros((0, 3), dtype=np.int64)
+		self._keys = []
+		self._memory = 0
+		order = np.lexsort((keys[:, 1], keys[:, 0]))
+		return [records[index] for index in order.tolist()], keys[order]
+
+	def _spill(self):
+		"""
+		Write the buffered records sorted into a temporary run, their keys and sizes into '<run>.npy'
+		"""
+		records, keys = self._sort()
+		file_descriptor, file_path = tempfile.mkstemp(dir=self._tmp_dir, prefix="temp_bam_writer_run")
+		self._file_paths_runs.append(file_path)
+		with os.fdopen(file_descriptor, 'wb') as stream_output:
+			stream_output.write(b"".join(records))
+		sizes = np.fromiter(map(len, records), dtype=np.int64, count=len(records))
+		np.save(file_path + ".npy", np.column_stack([keys, sizes]))
+
+	def _iter_sorted(self):
+		"""
+		All records in coordinate order, batch by batch, merged from the spilled runs if there are any
+
+		@attention: the keys of all records are loaded to merge the runs
+
+		@return: Records and their reference order, position and end
+		@rtype: collections.Iterable[(list[bytes], numpy.ndarray)]
+		"""
+		if len(self._file_paths_runs) == 0:
+			yield self._sort()
+			return
+		if len(self._records) > 0:
+			self._spill()
+		keys_of_runs = [np.load(file_path + ".npy") for file_path in self._file_paths_runs]
+		keys = np.concatenate(keys_of_runs)
+		runs = np.repeat(np.arange(len(keys_of_runs)), [len(keys_of_run) for keys_of_run in keys_of_runs])
+		# records of the same coordinate stay in order of the runs, as written
+		order = np.lexsort((keys[:, 1], keys[:, 0]))
+		streams = [open(file_path, 'rb') for file_path in self._file_paths_runs]
+		try:
+			for index_batch in range(0, len(order), _merge_batch_size):
+				batch = order[index_batch:index_batch + _merge_batch_size]
+				runs_of_batch = runs[batch]
+				records = [None] * len(batch)
+				# each run is read in order, its records are sorted
+				for run in np.unique(runs_of_batch).tolist():
+					indices = np.flatnonzero(runs_of_batch == run)
+					ends = np.cumsum(keys[batch[indices], 3])
+					data = streams[run].read(int(ends[-1]))
+					for index, begin, end in zip(indices.tolist(), np.append(0, ends[:-1]).tolist(), ends.tolist()):
+						records[index] = data[begin:end]
+				yield records, keys[batch, :3]
+		finally:
+			for stream in streams:
+				stream.close()
+
+	def _remove_runs(self):
+		while len(self._file_paths_runs) > 0:
+			file_path = self._file_paths_runs.pop()
+			for file_path_run in (file_path, file_path + ".npy"):
+				if os.path.isfile(file_path_run):
+					os.remove(file_path_run)
+
+	def _get_header(self):
+		"""
+		Get the bam header
+
+		@rtype: bytes
+		"""
+		text = "".join(line + "\n" for line in self._header_lines).encode()
+		header = [b"BAM\1", _int32.pack(len(text)), text, _int32.pack(len(self._references))]
+		for name, length in self._references:
+			name = name.encode() + b"\0"
+			header += [_int32.pack(len(name)), name, _int32.pack(length)]
+		return b"".join(header)
+
+	def close(self):
+		"""
+		Sort the records and write the bam file and its index
+
+		@raises: OSError
+		"""
+		if self._closed:
+			return
+		self._closed = True
+		if len(self._remainder) > 0:
+			self._add_lines([self._remainder])
+			self._remainder = ""
+		try:
+			index = _BaiIndex(len(self._references))
+			stream_bam = _BgzfStream(self._file_path_bam, self._compression_level)
+			stream_bam.write(self._get_header())
+			stream_bam.flush()
+			for records, keys in self._iter_sorted():
+				if len(records) == 0:
+					continue
+				data = b"".join(records)
+				sizes = np.fromiter(map(len, records), dtype=np.int64, count=len(records))
+				offsets_end = np.cumsum(sizes)
+				offsets_begin = offsets_end - sizes
+				array = np.frombuffer(data, dtype=np.uint8)
+				is_unmapped = _get_column(array, offsets_begin, 18) & 4 != 0
+				reference_ids = np.where(keys[:, 0] == _unplaced_order, -1, keys[:, 0])
+				position = stream_bam.get_position()
+				index.add(
+					reference_ids, keys[:, 1], keys[:, 2], _get_column(array, offsets_begin, 14), is_unmapped,
+					offsets_begin + position, offsets_end + position)
+				stream_bam.write(data)
+			stream_bam.close()
+			index.write(self._file_path_bam + ".bai", stream_bam.get_virtual_offsets)
+		finally:
+			self._records = []
+			self._keys = []
+			self._line_keys = []
+			self._remove_runs()
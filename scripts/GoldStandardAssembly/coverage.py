@@ -0,0 +1,204 @@
+__author__ = 'hofmann'
+__version__ = '0.0.1'
+
+import numpy as np
+from scripts import sequencerecords
+from scripts.GoldStandardAssembly import bamreader
+
+# Gold standard contigs are runs of positions covered by reads, called from coverage computed out of alignment intervals.
+# Alignments are filtered like 'samtools mpileup' does by default,
+# which the contigs of 'bamToGold.pl' were built from.
+
+# unmapped, secondary, qc fail and duplicate reads
+_flags_skipped = 0x4 | 0x100 | 0x200 | 0x400
+_flag_paired = 0x1
+_flag_proper_pair = 0x2
+
+
+def read_alignment_intervals(file_path_bam):
+    """
+    Read the intervals of alignments that are counted by 'samtools mpileup':
+    mapped primary reads, no duplicates or reads failing quality checks, and only properly paired reads of pairs.
+
+    @param file_path_bam: Bam file
+    @type file_path_bam: str | unicode
+
+    @return: 0-based starts and exclusive ends of alignments by reference name, in order of the bam file
+    @rtype: dict[str, (numpy.ndarray, numpy.ndarray)]
+
+    @raises: OSError
+    """
+    references, fields = bamreader.read_alignments(file_path_bam)
+    flag = fields["flag"]
+    is_counted = (flag & _flags_skipped == 0) & ((flag & _flag_paired == 0) | (flag & _flag_proper_pair != 0)) & (
+        fields["n_cigar_op"] > 0) & (fields["reference_id"] >= 0)
+    reference_id = fields["reference_id"][is_counted]
+    # alignments grouped by reference, in order of the bam file within each group
+    order = np.argsort(reference_id, kind='stable')
+    starts = fields["position"][is_counted].astype(np.int64)[order]
+    ends = fields["end"][is_counted][order]
+    unique_reference_ids, index_first, counts = np.unique(reference_id, return_index=True, return_counts=True)
+    boundaries = np.concatenate(([0], np.cumsum(counts)))
+    intervals = {}
+    for index in np.argsort(index_first):
+        begin, end = boundaries[index], boundaries[index + 1]
+        intervals[references[unique_reference_ids[index]][0]] = (starts[begin:end], ends[begin:end])
+    return intervals
+
+
+def get_coverage(starts, ends, length):
+    """
+    Get the coverage at each position of a reference by summing a difference array
+
+    @param starts: 0-based starts of alignments
+    @type starts: numpy.ndarray
+    @param ends: Exclusive ends of alignments
+    @type ends: numpy.ndarray
+    @param length: Length of the reference, extended by alignments reaching past its end
+    @type length: int
+
+    @rtype: numpy.ndarray
+    """
+    if len(ends) > 0:
+        length = max(length, int(ends.max()))
+    difference = np.bincount(starts, minlength=length + 1) - np.bincount(ends, minlength=length + 1)
+    return np.cumsum(difference[:length])
+
+
+def read_coverage(list_of_file_paths_bam, sequence_lengths):
+    """
+    Get the coverage of references summed over the alignments of several bam files, like those of a merged bam file
+
+    @param list_of_file_paths_bam: Bam files
+    @type list_of_file_paths_bam: list[str|unicode]
+    @param sequence_lengths: Length of each reference sequence by id
+    @type sequence_lengths: dict[str, int]
+    @return: Coverage by reference name, in order of first appearance
+    @rtype: dict[str, numpy.ndarray]
+
+    @raises: OSError, KeyError
+    """
+    pooled_coverage = {}
+    for file_path_bam in list_of_file_paths_bam:
+        for sequence_id, (starts, ends) in read_alignment_intervals(file_path_bam).items():
+            if sequence_id not in sequence_lengths:
+                raise KeyError("Sequence '{}' of '{}' not found in reference".format(sequence_id, file_path_bam))
+            coverage = get_coverage(starts, ends, sequence_lengths[sequence_id])
+            if sequence_id in pooled_coverage:
+                previous_coverage = pooled_coverage[sequence_id]
+                # alignments reaching past the end of a reference may differ between bam files
+                if len(previous_coverage) > len(coverage):
+                    coverage, previous_coverage = previous_coverage, coverage
+                coverage[:len(previous_coverage)] += previous_coverage
+            pooled_coverage[sequence_id] = coverage
+    return pooled_coverage
+
+
+def write_contigs(stream_output, sequence_id, sequence, coverage, min_length=1, min_coverage=1):
+    """
+    Write each run of covered positions as contig named '<sequence_id>_from_<start>_to_<end>_total_<length>',
+    with 1-based inclusive start and end. Positions of a run covered less than the minimum coverage are left out.
+
+    @param stream_output: Binary output stream
+    @type stream_output: io.BufferedWriter
+    @param sequence_id: Id of the reference sequence
+    @type sequence_id: str | unicode
+    @param sequence: Reference sequence, of a genome store only covered positions are decoded
+    @type sequence: bytes | PackedSequence
+    @param coverage: Coverage at each position
+    @type coverage: numpy.ndarray
+    @param min_length: Minimum length of contigs
+    @type min_length: int
+    @param min_coverage: Minimum coverage of a position
+    @type min_coverage: int
+
+    @return: Number of contigs written
+    @rtype: int
+    """
+    if isinstance(sequence, bytes):
+        sequence = np.frombuffer(sequence, dtype=np.uint8)
+    length = len(sequence)
+    is_covered = np.concatenate(([0], coverage > 0, [0])).astype(np.int8)
+    edges = np.flatnonzero(np.diff(is_covered))
+    sequence_id = sequence_id.encode()
+    number_of_contigs = 0
+    for start, end in edges.reshape(-1, 2):
+        bases = sequence[min(start, length):min(end, length)]
+        if end > length:
+            # like in pileups, positions past the end of the reference are 'N'
+            bases = np.concatenate((bases, np.full(end - max(start, length), ord('N'), dtype=np.uint8)))
+        contig = bases[coverage[start:end] >= min_coverage].tobytes()
+        if len(contig) < min_length:
+            continue
+        stream_output.write(b">%s_from_%d_to_%d_total_%d\n%s\n" % (sequence_id, start + 1, end, len(contig), contig))
+        number_of_contigs += 1
+    return number_of_contigs
+
+
+def bam_reads_to_contigs(
+        list_of_file_paths_bam, file_path_fasta_ref, stream_output, min_length=1, min_coverage=1, genome=None):
+    """
+    Write the gold standard contigs of the reads of bam files, pooled if several.
+    References of a genome store are not parsed, their sequences are upper case with bases other than 'ACGT' as 'N'.
+
+    @param list_of_file_paths_bam: Sorted bam files, of several samples to pool their reads
+    @type list_of_file_paths_bam: list[str|unicode]
+    @param file_path_fasta_ref: Reference fasta file
+    @type file_path_fasta_ref: str | unicode
+    @param stream_output: Binary output stream
+    @type stream_output: io.BufferedWriter
+    @param min_length: Minimum length of contigs
+    @type min_length: int
+    @param min_coverage: Minimum coverage of a position
+    @type min_coverage: int
+    @param genome: The reference in a genome store, read instead of the fasta file if given
+    @type genome: PackedGenome | None
+
+    @return: Number of contigs written
+    @rtype: int
+
+    @raises: OSError, KeyError
+    """
+    if genome is not None:
+        sequences = dict(genome.get_sequences())
+    else:
+        sequences = dict(
+            (sequencerecords.get_id(record).decode(), sequencerecords.get_sequence(record, "fasta"))
+            for record in sequencerecords.read_file_records(file_path_fasta_ref, "fasta"))
+    sequence_lengths = dict((sequence_id, len(sequence)) for sequence_id, sequence in sequences.items())
+    pooled_coverage = read_coverage(list_of_file_paths_bam, sequence_lengths)
+    number_of_contigs = 0
+    for sequence_id, coverage in pooled_coverage.items():
+        number_of_contigs += write_contigs(
+            stream_output, sequence_id, sequences[sequence_id], coverage, min_length, min_coverage)
+    return number_of_contigs
+
+
+def write_contig_file(
+        list_of_file_paths_bam, file_path_fasta_ref, file_path_output, min_length=1, min_coverage=1, genome=None):
+    """
+    Write the gold standard contigs of bam files into a file of their own, run in a process of its own
+
+    @param list_of_file_paths_bam: Sorted bam files, of several samples to pool their reads
+    @type list_of_file_paths_bam: list[str|unicode]
+    @param file_path_fasta_ref: Reference fasta file
+    @type file_path_fasta_ref: str | unicode
+    @param file_path_output: Output fasta file
+    @type file_path_output: str | unicode
+    @param min_length: Minimum length of contigs
+    @type min_length: int
+    @param min_coverage: Minimum coverage of a position
+    @type min_coverage: int
+    @param genome: The reference in a genome store, read instead of the fasta file if given
+    @type genome: PackedGenome | None
+
+    @return: None, or an error message
+    @rtype: None | str
+    """
+    try:
+        with open(file_path_output, 'wb') as stream_output:
+            bam_reads_to_contigs(
+                list_of_file_paths_bam, file_path_fasta_ref, stream_output, min_length, min_coverage, genome)
+    except (IOError, OSError, KeyError, ValueError) as e:
+        return "Gold standard assembly of '{}' failed: {}".format("', '".join(list_of_file_paths_bam), e)
+    return None
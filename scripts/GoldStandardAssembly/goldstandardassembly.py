@@ -6,8 +6,10 @@ import os
 # import time
 import tempfile
 import shutil
-import scripts
+from scripts.parallel import TaskThread, runThreadScheduled
+from scripts.GenomePreparation.genomestore import GenomeStore
 from .samtoolswrapper import SamtoolsWrapper
+from . import coverage
 
 
 class GoldStandardAssembly(SamtoolsWrapper):
@@ -17,7 +19,8 @@ class GoldStandardAssembly(SamtoolsWrapper):
     _list_of_reference_file_extension = [".fna", ".fasta"]
 
     def __init__(
-        self, file_path_samtools="samtools", max_processes=1, tmp_dir=None, logfile=None, verbose=True, debug=False):
+        self, file_path_samtools="samtools", max_processes=1, tmp_dir=None, logfile=None, verbose=True, debug=False,
+        genome_store=None):
         """
             Collection of Methods related to gold standard assemblies
 
@@ -35,6 +38,8 @@ class GoldStandardAssembly(SamtoolsWrapper):
             @type verbose: bool
             @param debug: Display debug messages
             @type debug: bool
+            @param genome_store: 2 bit packed genomes, read instead of parsing the reference fasta files
+            @type genome_store: GenomeStore | None
 
             @return: None
             @rtype: None
@@ -45,22 +50,31 @@ class GoldStandardAssembly(SamtoolsWrapper):
             tmp_dir=tmp_dir,
             logfile=logfile, verbose=verbose, debug=debug
         )
-        self._temp_merges_bam_directory = tempfile.mkdtemp(dir=self._tmp_dir)
-        self._bamToGold = os.path.join(os.path.dirname(scripts.__file__), "bamToGold.pl")
-        assert self.validate_file(self._bamToGold)
+        assert genome_store is None or isinstance(genome_store, GenomeStore)
+        self._genome_store = genome_store
 
-    def _close(self):
-        if self.validate_dir(self._temp_merges_bam_directory, silent=True):
-            shutil.rmtree(self._temp_merges_bam_directory)
-        self._logger = None
+    def _get_genome(self, file_path_fasta_ref):
+        """
+            Get a reference from the genome store
+
+            @param file_path_fasta_ref: path to reference fasta file
+            @type file_path_fasta_ref: str | unicode
+
+            @return: Stored reference, None if there is no store or the reference is not stored
+            @rtype: PackedGenome | None
+        """
+        if self._genome_store is None:
+            return None
+        return self._genome_store.get_genome(file_path_fasta_ref)
 
     def bam_reads_to_contigs(
         self, file_path_bam, file_path_fasta_ref, file_path_output,
-        min_length=1, min_coverage=1, file_path_log=None):
+        min_length=1, min_coverage=1):
         """
             Convert a bam file to a gold standard assembly.
+            Contigs are runs of covered positions, sliced from the reference, as 'bamToGold.pl' made them from pileups.
 
-            @attention:
+            @attention: contigs are appended to the output file
 
             @param file_path_fasta_ref: path to reference fasta file
             @type file_path_fasta_ref: str | unicode
@@ -72,8 +86,6 @@ class GoldStandardAssembly(SamtoolsWrapper):
             @type min_length: int
             @param min_coverage: Minimum coverage at a site of a sequence.
             @type min_coverage: int
-            @param file_path_log: output path for a log file
-            @type file_path_log: str | unicode
 
             @return: None
             @rtype: None
@@ -81,26 +93,16 @@ class GoldStandardAssembly(SamtoolsWrapper):
         assert self.validate_file(file_path_fasta_ref)
         assert self.validate_file(file_path_bam)
         assert self.validate_dir(file_path_output, only_parent=True)
-        if file_path_log is None:
-            file_path_log = os.path.splitext(file_path_output)[0] + ".log"
-        assert self.validate_dir(file_path_log, only_parent=True)
-        cmd = "{exe} -st '{samtools}' -r '{ref}' -b '{bam}' -l '{min_length}' -c '{min_coverage}' >> '{output}' 2>> '{logfile}'".format(
-            exe=self._bamToGold,
-            samtools=self._file_path_samtools,
-            ref=file_path_fasta_ref,
-            bam=file_path_bam,
-            min_length=min_length,
-            min_coverage=min_coverage,
-            output=file_path_output,
-            logfile=file_path_log,
-            )
-        if self._debug:
-            self._logger.debug(cmd)
-        exit_status = os.system(cmd)
-        if not exit_status == 0:
-            msg = "Error occurred converting '{}'\n{}".format(os.path.basename(file_path_bam), cmd)
+        try:
+            with open(file_path_output, 'ab') as stream_output:
+                number_of_contigs = coverage.bam_reads_to_contigs(
+                    [file_path_bam], file_path_fasta_ref, stream_output,
+                    min_length=min_length, min_coverage=min_coverage, genome=self._get_genome(file_path_fasta_ref))
+        except (OSError, KeyError) as e:
+            msg = "Error occurred converting '{}'\n{}".format(os.path.basename(file_path_bam), e)
             self._logger.error(msg)
             raise OSError(msg)
+        self._logger.debug("'{}': {} contigs".format(os.path.basename(file_path_bam), number_of_contigs))
 
     def get_dict_id_to_file_path_bam_from_dir(self, directory):
         """
@@ -152,16 +154,22 @@ class GoldStandardAssembly(SamtoolsWrapper):
 
         return dict_id_to_filepath_bam
 
-    def pooled_gold_standard_by_dir(self, list_of_directory_bam, dict_id_to_file_path_fasta, file_path_output=None):
+    def pooled_gold_standard_by_dir(
+        self, list_of_directory_bam, dict_id_to_file_path_fasta, file_path_output=None, directory_merged_bam=None):
         """
-            Make a gold standard assembly merging bam files of several samples
+            Make a gold standard assembly pooling the reads of bam files of several samples
 
-            @attention: bam files must have same name to be merged
+            @attention: bam files must have same name to be pooled,
+            their coverage is summed without merging them, unless merged bam files are asked for
 
             @param list_of_directory_bam: list of directories containing bam files
             @type list_of_directory_bam: list[str|unicode]
             @param dict_id_to_file_path_fasta: path to reference files by key
             @type dict_id_to_file_path_fasta: dict[str|unicode, str|unicode]
+            @param file_path_output: output fasta file path
+            @type file_path_output: str | unicode
+            @param directory_merged_bam: directory merged bam files are written to, None for no merged bam files
+            @type directory_merged_bam: str | unicode | None
 
             @return: output file path
             @rtype: str | unicode
@@ -169,18 +177,25 @@ class GoldStandardAssembly(SamtoolsWrapper):
         if file_path_output is None:
             file_path_output = tempfile.mktemp(dir=self._tmp_dir)
         self._logger.info("Creating pooled gold standard")
-        self.merge_bam_files_by_list_of_dir(list_of_directory_bam, output_dir=self._temp_merges_bam_directory)
-        dict_id_to_file_path_bam = self.get_dict_id_to_file_path_bam_from_dir(self._temp_merges_bam_directory)
-        return self.gold_standard_assembly(dict_id_to_file_path_bam, dict_id_to_file_path_fasta, file_path_output)
+        if directory_merged_bam is not None:
+            self.merge_bam_files_by_list_of_dir(list_of_directory_bam, output_dir=directory_merged_bam)
+        dict_id_to_list_of_file_paths_bam = {}
+        for directory_bam in list_of_directory_bam:
+            for key, file_path_bam in self.get_dict_id_to_file_path_bam_from_dir(directory_bam).items():
+                if key not in dict_id_to_list_of_file_paths_bam:
+                    dict_id_to_list_of_file_paths_bam[key] = []
+                dict_id_to_list_of_file_paths_bam[key].append(file_path_bam)
+        return self.gold_standard_assembly(
+            dict_id_to_list_of_file_paths_bam, dict_id_to_file_path_fasta, file_path_output)
 
     def gold_standard_assembly(self, dict_id_to_file_path_bam, dict_id_to_file_path_fasta, file_path_output=None):
         """
             Make a gold standard assembly using bam files of a samples
 
-            @attention:
+            @attention: genomes are assembled in parallel, their contigs are concatenated in order of their ids
 
-            @param dict_id_to_file_path_bam: path to reference fasta files by key
-            @type dict_id_to_file_path_bam: dict[str|unicode, str|unicode]
+            @param dict_id_to_file_path_bam: path to bam files by key, reads of several bam files of a key are pooled
+            @type dict_id_to_file_path_bam: dict[str|unicode, str|unicode | list[str|unicode]]
             @param dict_id_to_file_path_fasta: path to reference files by key
             @type dict_id_to_file_path_fasta: dict[str|unicode, str|unicode]
             @param file_path_output: output fasta file path
@@ -188,6 +203,8 @@ class GoldStandardAssembly(SamtoolsWrapper):
 
             @return: output file path
             @rtype: str | unicode
+
+            @raises: OSError
         """
         if file_path_output is None:
             file_path_output = tempfile.mktemp(dir=self._tmp_dir)
@@ -203,11 +220,43 @@ class GoldStandardAssembly(SamtoolsWrapper):
         file_path_output = self.get_full_path(file_path_output)
         file_path_output = self.get_available_file_path(file_path_output)
 
-        # create all contigs
-        for key, file_path_bam in dict_id_to_file_path_bam.items():
+        # create contigs of each genome
+        directory_contigs = tempfile.mkdtemp(dir=self._tmp_dir)
+        list_of_keys = sorted(dict_id_to_file_path_bam)
+        list_of_file_paths_contigs = []
+        tasks = []
+        for index, key in enumerate(list_of_keys):
+            list_of_file_paths_bam = dict_id_to_file_path_bam[key]
+            if isinstance(list_of_file_paths_bam, str):
+                list_of_file_paths_bam = [list_of_file_paths_bam]
             file_path_fasta_ref = dict_id_to_file_path_fasta[key]
-            self.bam_reads_to_contigs(
-                file_path_fasta_ref=file_path_fasta_ref,
-                file_path_bam=file_path_bam,
-                file_path_output=file_path_output)
+            assert self.validate_file(file_path_fasta_ref)
+            for file_path_bam in list_of_file_paths_bam:
+                assert self.validate_file(file_path_bam)
+            file_path_contigs = os.path.join(directory_contigs, "{}.fasta".format(index))
+            list_of_file_paths_contigs.append(file_path_contigs)
+            args = (
+                list_of_file_paths_bam, file_path_fasta_ref, file_path_contigs, 1, 1,
+                self._get_genome(file_path_fasta_ref))
+            cost = sum(os.path.getsize(file_path_bam) for file_path_bam in list_of_file_paths_bam)
+            tasks.append(TaskThread(coverage.write_contig_file, args, cost=cost))
+        list_of_return_values, busy_fraction = runThreadScheduled(tasks, maxThreads=self._max_processes)
+        self._logger.info("Assembly of {} genomes kept {:.0%} of {} processes busy".format(
+            len(tasks), busy_fraction, self._max_processes))
+        list_of_errors = [
+            "Genome '{}': {}".format(key, return_value)
+            for key, return_value in zip(list_of_keys, list_of_return_values) if return_value is not None]
+        if len(list_of_errors) > 0:
+            for error in list_of_errors:
+                self._logger.error(error)
+            msg = "Gold standard assembly of {} genomes failed!".format(len(list_of_errors))
+            self._logger.error(msg)
+            raise OSError(msg)
+
+        with open(file_path_output, 'wb') as stream_output:
+            for file_path_contigs in list_of_file_paths_contigs:
+                with open(file_path_contigs, 'rb') as stream_input:
+                    shutil.copyfileobj(stream_input, stream_output)
+        if not self._debug:
+            shutil.rmtree(directory_contigs)
         return file_path_output
@@ -2,11 +2,14 @@ __author__ = 'hofmann'
 __version__ = '0.0.3.1'
 
 import os
+import shlex
 import subprocess
 import shutil
 import tempfile
-from scripts.parallel import TaskCmd, runCmdParallel, reportFailedCmd
+from scripts.parallel import TaskCmd, runCmdParallel, runCmdScheduled, reportFailedCmd, reportMemoryUsage
 from scripts.Validator.validator import Validator
+from scripts.GoldStandardAssembly.bamwriter import BamWriter
+from scripts.GoldStandardAssembly import bamreader
 
 
 class SamtoolsWrapper(Validator):
@@ -16,7 +19,7 @@ class SamtoolsWrapper(Validator):
 	_sam_file_extension = ".sam"
 	_bam_file_extension = ".bam"
 
-	def __init__(self, file_path_samtools="samtools", max_processes=1, max_memory=1, compression_level=5,tmp_dir=None, logfile=None, verbose=True, debug=False):
+	def __init__(self, file_path_samtools="samtools", max_processes=1, max_memory=1, compression_level=5,tmp_dir=None, logfile=None, verbose=True, debug=False, memory_budget=None):
 		"""
 			Collection of Methods to accomplish samtools tasks
 
@@ -38,6 +41,8 @@ class SamtoolsWrapper(Validator):
 			@type verbose: bool
 			@param debug: Display debug messages
 			@type debug: bool
+			@param memory_budget: Memory (RAM) in gigabyte available to all processes run in parallel, None for no limit
+			@type memory_budget: int | float | None
 
 			@return: None
 			@rtype: None
@@ -55,6 +60,7 @@ class SamtoolsWrapper(Validator):
 		self.validate_number(max_processes, zero=False, minimum=1)
 		self.validate_number(max_memory, zero=False, minimum=1)
 		self.validate_number(compression_level, zero=False, minimum=0, maximum=9)
+		assert memory_budget is None or self.validate_number(memory_budget, zero=False, minimum=0)
 		assert self.validate_dir(tmp_dir)
 		assert self.validate_file(file_path=file_path_samtools, executable=True)
 
@@ -63,6 +69,27 @@ class SamtoolsWrapper(Validator):
 		self._max_processes = max_processes
 		self._max_memory = max_memory
 		self._compression_level = compression_level
+		self._memory_budget = memory_budget
+
+	def get_memory_estimate(self):
+		"""
+			Estimated memory of a conversion into a sorted bam file, 'samtools sort' keeps up to 'max_memory' in memory
+
+			@return: memory in bytes
+			@rtype: int
+		"""
+		return self._max_memory * 2**30
+
+	def get_memory_budget(self):
+		"""
+			Memory available to all processes run in parallel
+
+			@return: memory in bytes, None for no limit
+			@rtype: int | None
+		"""
+		if self._memory_budget is None:
+			return None
+		return int(self._memory_budget * 2**30)
 
 	# #######################################################
 	#
@@ -108,7 +135,78 @@ class SamtoolsWrapper(Validator):
 			prefix=prefix_temp_files
 			)
 
-	def convert_sam_to_bam(self, directory_sam, output_dir="./"):
+	def get_fifo_to_bam_cmd(self, cmd_simulator, file_path_sam, output_dir):
+		"""
+			Return system command as string.
+			A named pipe replaces the sam file written by a read simulator,
+			its content is converted into a sorted and indexed bam file while the simulator is running.
+
+			@attention: the simulator must write the sam file sequentially, the fifo is removed afterwards.
+			The command is run by bash, a failure of any part of the conversion fails it and removes the bam file.
+
+			@param cmd_simulator: system command of the read simulator, writing to 'file_path_sam'
+			@type cmd_simulator: str | unicode
+			@param file_path_sam: sam file path used by the read simulator
+			@type file_path_sam: str | unicode
+			@param output_dir: output directory
+			@type output_dir: str | unicode
+
+			@return: system command
+			@rtype: str
+		"""
+		assert isinstance(cmd_simulator, str)
+		assert isinstance(file_path_sam, str)
+		assert self.validate_dir(output_dir)
+		file_name = os.path.splitext(os.path.basename(file_path_sam))[0]
+		file_path_bam = os.path.join(self.get_full_path(output_dir), file_name)
+		prefix_temp_files = tempfile.mktemp(dir=self._tmp_dir, prefix="temp_sam_to_sorted_bam")
+
+		# file descriptor 3 keeps the fifo open, so the converter only gets EOF once the simulator is done
+		cmd_create_fifo = "rm -f '{fifo}' && mkfifo '{fifo}' || exit 1; exec 3<>'{fifo}'"
+		cmd_stream_sam_file = "{samtools} view -bS - < '{fifo}' 3>&-"
+		cmd_sort_bam_file = "{samtools} sort -l {compression} -m {memory}G -o {output}.bam -O bam -T {prefix} 3>&-"
+		cmd_simulate = "{simulator}; status=$?; exec 3>&-; wait $! || status=1; rm -f '{fifo}'"
+		cmd_index_bam_file = "[ $status -eq 0 ] && {samtools} index {output}.bam || {{ status=1; rm -f {output}.bam; }}"
+
+		# conversion runs in the background while the simulator writes into the fifo,
+		# without pipefail a failed 'samtools view' would leave a truncated bam file sorted by 'samtools sort'
+		cmd = "set -o pipefail; " + cmd_create_fifo + "; " + cmd_stream_sam_file + " | " + cmd_sort_bam_file + " & "
+		cmd += cmd_simulate + "; " + cmd_index_bam_file + "; exit $status"
+		return "bash -c " + shlex.quote(cmd.format(
+			samtools=self._file_path_samtools,
+			simulator=cmd_simulator,
+			fifo=file_path_sam,
+			compression=self._compression_level,
+			memory=self._max_memory,
+			output=file_path_bam,
+			prefix=prefix_temp_files
+			))
+
+	def open_sam_stream(self, file_name, output_dir):
+		"""
+			Open a stream, sam records written to it end up in a sorted and indexed bam file.
+			Records are sorted in-process while written, no 'samtools sort' is run.
+
+			@attention: the stream must be closed to finish the bam file
+
+			@param file_name: name of the bam file without extension
+			@type file_name: str | unicode
+			@param output_dir: output directory
+			@type output_dir: str | unicode
+
+			@return: writable stream
+			@rtype: BamWriter
+		"""
+		assert isinstance(file_name, str)
+		assert self.validate_dir(output_dir)
+		file_path_bam = os.path.join(self.get_full_path(output_dir), file_name + self._bam_file_extension)
+		return BamWriter(
+			file_path_bam,
+			compression_level=self._compression_level,
+			max_memory=self.get_memory_estimate(),
+			tmp_dir=self._tmp_dir)
+
+	def convert_sam_to_bam(self, directory_sam, output_dir="./", manifest=None):
 		"""
 			Converts all SAM-files in current directory to BAM-Format
 
@@ -118,6 +216,8 @@ class SamtoolsWrapper(Validator):
 			@type directory_sam: str | unicode
 			@param output_dir: output directory
 			@type output_dir: str | unicode
+			@param manifest: Record of completed conversions, unchanged sam files already converted are skipped
+			@type manifest: JobManifest | None
 
 			@return: None
 			@rtype: None
@@ -136,9 +236,9 @@ class SamtoolsWrapper(Validator):
 		if sam_is_folder:
 			sam_argument = self.get_files_in_directory(directory_sam, self._sam_file_extension)
 
-		self.convert_sam_to_bam_by_list(sam_argument, output_dir)
+		self.convert_sam_to_bam_by_list(sam_argument, output_dir, manifest=manifest)
 
-	def convert_sam_to_bam_by_list(self, list_of_sam_files, output_dir="./"):
+	def convert_sam_to_bam_by_list(self, list_of_sam_files, output_dir="./", manifest=None):
 		"""
 			Converts all SAM-files in current directory to BAM-Format
 
@@ -148,6 +248,8 @@ class SamtoolsWrapper(Validator):
 			@type list_of_sam_files: list[str|unicode]
 			@param output_dir: output directory
 			@type output_dir: str | unicode
+			@param manifest: Record of completed conversions, unchanged sam files already converted are skipped
+			@type manifest: JobManifest | None
 
 			@return: None
 			@rtype: None
@@ -159,12 +261,33 @@ class SamtoolsWrapper(Validator):
 		assert bam_is_folder, "Invalid file or directory: '{}'".format(output_dir)
 		# add commands to a list of tasks to run them in parallel
 		tasks = []
+		dict_task_to_job = {}
 		# cmd = "{exe} {sam} {name}"
 		for sam_file_path in list_of_sam_files:
+			file_name = os.path.splitext(os.path.basename(sam_file_path))[0]
+			file_path_bam = os.path.join(output_dir, file_name + self._bam_file_extension)
+			# a sam file is identified by size and modification time, instead of reading it for a checksum
+			parameters = [
+				sam_file_path, os.path.getsize(sam_file_path), os.path.getmtime(sam_file_path), self._compression_level]
+			if manifest is not None and manifest.is_complete(file_path_bam, parameters):
+				self._logger.info("'{}' is complete, skipping".format(file_path_bam))
+				continue
 			cmd = self._get_sam_to_bam_cmd(sam_file_path, output_dir)
-			tasks.append(TaskCmd(cmd))
-
-		fail_list = runCmdParallel(tasks, maxProc=self._max_processes)
+			# large files first
+			task = TaskCmd(cmd, cost=parameters[1], memory=self.get_memory_estimate())
+			dict_task_to_job[id(task)] = (file_path_bam, parameters)
+			tasks.append(task)
+
+		def record_job(task, process):
+			if manifest is None or process.returncode != 0:
+				return
+			file_path_bam, parameters = dict_task_to_job[id(task)]
+			manifest.add(file_path_bam, parameters, [file_path_bam, file_path_bam + ".bai"])
+
+		fail_list, busy_fraction = runCmdScheduled(
+			tasks, maxProc=self._max_processes, callback=record_job, maxMemory=self.get_memory_budget())
+		for message in reportMemoryUsage(tasks):
+			self._logger.debug(message)
 		if fail_list is not None:
 			for message in reportFailedCmd(fail_list):
 				self._logger.error(message)
@@ -335,7 +458,7 @@ class SamtoolsWrapper(Validator):
 
 	def read_start_positions_from_list_of_bam(self, list_of_file_paths, output_file=None):
 		"""
-			Parse 'read' start positions from bam files.
+			Parse 'read' start positions from bam files, read without samtools.
 
 			@attention:
 
@@ -357,17 +480,17 @@ class SamtoolsWrapper(Validator):
 		for file_path in list_of_file_paths:
 			assert self.validate_file(file_path)
 
-		cmd = "set -o pipefail; {samtools} view '{bamfile}' | awk '{{print $1 \"\\t\" $4}}' >> '{output}'"
-		for file_path in list_of_file_paths:
-			# exit_status = os.system(
-			exit_status = subprocess.call(
-				cmd.format(samtools=self._file_path_samtools, bamfile=file_path, output=output_file),
-				shell=True,
-				executable="bash")
-			if exit_status != 0:
-				msg = "Error occurred parsing '{}'".format(file_path)
-				self._logger.error(msg)
-				raise OSError(msg)
+		with open(output_file, 'ab') as file_handle_write:
+			for file_path in list_of_file_paths:
+				try:
+					references, fields = bamreader.read_alignments(file_path, read_names=True)
+				except OSError as e:
+					msg = "Error occurred parsing '{}'\n{}".format(file_path, e)
+					self._logger.error(msg)
+					raise OSError(msg)
+				# 1-based positions, like in sam files
+				for read_name, position in zip(fields["read_name"], (fields["position"] + 1).tolist()):
+					file_handle_write.write(b"%s\t%d\n" % (read_name, position))
 		return output_file
 
 	def read_start_positions_from_dir_of_sam(self, directory, output_file=None):
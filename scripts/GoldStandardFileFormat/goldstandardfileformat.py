@@ -3,8 +3,15 @@ __author__ = 'hofmann'
 __version__ = '0.0.2'
 
 
+import os
 import re
+import hashlib
+import zipfile
+import tempfile
+import numpy as np
 from Bio import SeqIO
+from scripts.GoldStandardAssembly import bamreader
+from scripts.GenomePreparation.genomepreparation import GenomePreparation
 from scripts.MetaDataTable.metadatatable import MetadataTable
 from scripts.Validator.validator import Validator
 
@@ -13,8 +20,14 @@ class GoldStandardFileFormat(Validator):
 
     _label = "GoldStandardFileFormat"
 
+    read_mapping_header = "#anonymous_read_id\tgenome_id\ttax_id\tread_id\n"
+
+    # prefix of the tables of read start positions of a sample, stored in the temporary directory
+    _prefix_read_positions = "read_start_positions_"
+
     def __init__(
-        self, column_name_gid="genome_ID", column_name_ncbi="NCBI_ID", separator='\t', logfile=None, verbose=True):
+        self, column_name_gid="genome_ID", column_name_ncbi="NCBI_ID", separator='\t', logfile=None, verbose=True,
+        tmp_dir=None):
         """
             Constructor
 
@@ -30,11 +43,19 @@ class GoldStandardFileFormat(Validator):
             @type logfile: file | io.FileIO | StringIO.StringIO | str | unicode
             @param verbose: Not verbose means that only warnings and errors will be past to stream
             @type verbose: bool
+            @param tmp_dir: directory for temporary files, like the tables of read start positions of a sample
+            @type tmp_dir: str | unicode
 
             @return: None
             @rtype: None
         """
         super(GoldStandardFileFormat, self).__init__(logfile=logfile, verbose=verbose)
+        assert tmp_dir is None or isinstance(tmp_dir, str)
+        if tmp_dir is not None:
+            assert self.validate_dir(tmp_dir)
+        else:
+            tmp_dir = tempfile.gettempdir()
+        self._tmp_dir = tmp_dir
         self._column_name_gid = column_name_gid
         self._column_name_ncbi = column_name_ncbi
         self._separator = separator
@@ -43,9 +64,11 @@ class GoldStandardFileFormat(Validator):
     # genome location
     # ###############
 
-    def get_dict_sequence_to_genome_id(self, file_path_genome_locations, set_of_genome_id=None):
+    def get_dict_sequence_to_genome_id(self, file_path_genome_locations, set_of_genome_id=None, genome_statistics=None):
         """
             Get a map, sequence id to genome id from an abundance file.
+            Sequence ids are taken from the table written when the genomes were moved, if there is one,
+            else from the genome statistics or the genomes themselves.
 
             @attention: Assuming genome id in first column, sequence id in second column
 
@@ -53,6 +76,8 @@ class GoldStandardFileFormat(Validator):
             @type file_path_genome_locations: str | unicode
             @param set_of_genome_id: Limit sequences to this set of genome id
             @type set_of_genome_id: set[str | unicode]
+            @param genome_statistics: Index the sequence ids are taken from, instead of parsing the genomes
+            @type genome_statistics: GenomeStatisticsIndex | None
 
             @return: Mapping of sequence id to genome id
             @rtype: dict[str | unicode, str | unicode]
@@ -66,13 +91,53 @@ class GoldStandardFileFormat(Validator):
             assert set(unique_id_to_genome_file_path.keys()).issuperset(set_of_genome_id)
 
         sequence_id_to_genome_id = {}
+        genome_id_to_directory = dict(
+            (genome_id, os.path.dirname(unique_id_to_genome_file_path[genome_id])) for genome_id in set_of_genome_id)
+        set_of_genome_id_in_tables = set()
+        for directory_genomes in set(genome_id_to_directory.values()):
+            table = GenomePreparation.read_sequence_to_genome_id(directory_genomes)
+            if table is None:
+                continue
+            for sequence_id, genome_id in table.items():
+                if genome_id_to_directory.get(genome_id) == directory_genomes:
+                    sequence_id_to_genome_id[sequence_id] = genome_id
+                    set_of_genome_id_in_tables.add(genome_id)
         for genome_id in set_of_genome_id:
+            if genome_id in set_of_genome_id_in_tables:
+                continue
             file_path_genome = unique_id_to_genome_file_path[genome_id]
             assert self.validate_file(file_path_genome)
+            if genome_statistics is not None:
+                for sequence_id, length in genome_statistics.get_statistics(file_path_genome)["sequence_lengths"]:
+                    sequence_id_to_genome_id[sequence_id] = genome_id
+                continue
             for seq_record in SeqIO.parse(file_path_genome, "fasta"):
                 sequence_id_to_genome_id[seq_record.id] = genome_id
         return sequence_id_to_genome_id
 
+    def get_dict_sequence_to_read_gold_standard(
+        self, file_path_genome_locations, file_path_metadata, genome_statistics=None):
+        """
+            Get a map, sequence id to genome id and taxonomic id, as written into the read gold standard.
+            Used to write the gold standard while reads are anonymized.
+
+            @param file_path_genome_locations: File path of genome locations
+            @type file_path_genome_locations: str | unicode
+            @param file_path_metadata: Metadata file path, "genome_ID" and "NCBI_ID" assumed default column names.
+            @type file_path_metadata: str | unicode
+            @param genome_statistics: Index the sequence ids are taken from, instead of parsing the genomes
+            @type genome_statistics: GenomeStatisticsIndex | None
+
+            @return: Mapping of sequence id to tab separated genome id and taxonomic id
+            @rtype: dict[bytes, bytes]
+        """
+        dict_sequence_to_genome_id = self.get_dict_sequence_to_genome_id(
+            file_path_genome_locations, genome_statistics=genome_statistics)
+        dict_genome_id_to_tax_id = self.get_dict_genome_id_to_tax_id(file_path_metadata)
+        return dict(
+            (sequence_id.encode(), "{}\t{}".format(genome_id, dict_genome_id_to_tax_id[genome_id]).encode())
+            for sequence_id, genome_id in dict_sequence_to_genome_id.items())
+
     def get_dict_unique_id_to_genome_file_path(self, file_path_mapping):
         """
             Get a map, original sequence name to anonymous sequence name from a mapping file.
@@ -196,6 +261,128 @@ class GoldStandardFileFormat(Validator):
                 dict_original_seq_pos[seq_without_index].append(value)
         return dict_original_seq_pos
 
+    def get_dict_sequence_name_to_positions_from_bam(self, list_of_file_paths_bam, max_processes=1):
+        """
+            Get a map, sequence name to starting positions of its reads, read from bam files without samtools.
+
+            @attention: Sequence name is the read name up to the first '-', positions are 1-based like in sam files
+
+            @param list_of_file_paths_bam: List of bam files
+            @type list_of_file_paths_bam: list[str|unicode]
+            @param max_processes: Maximum number of bam files read at the same time
+            @type max_processes: int
+
+            @return: Mapping of sequence name to starting positions, in order of the first read of each sequence
+            @rtype: dict[str | unicode, numpy.ndarray]
+        """
+        assert isinstance(list_of_file_paths_bam, list)
+        for file_path_bam in list_of_file_paths_bam:
+            assert self.validate_file(file_path_bam)
+
+        list_of_sequence_names = []
+        list_of_positions = []
+        for references, fields in bamreader.read_list_of_alignments(
+                list_of_file_paths_bam, read_names=True, max_processes=max_processes):
+            list_of_sequence_names.extend(read_name.split(b"-", 1)[0] for read_name in fields["read_name"])
+            list_of_positions.append(fields["position"].astype(np.int64) + 1)
+        if len(list_of_sequence_names) == 0:
+            return {}
+        positions = np.concatenate(list_of_positions)
+        sequence_names, index_first, inverse = np.unique(
+            np.array(list_of_sequence_names), return_index=True, return_inverse=True)
+        # reads grouped by sequence, in order of the bam files within each group
+        positions = positions[np.argsort(inverse, kind='stable')]
+        positions_of_sequences = np.split(positions, np.cumsum(np.bincount(inverse))[:-1])
+        dict_original_seq_pos = {}
+        for index in np.argsort(index_first):
+            dict_original_seq_pos[sequence_names[index].decode()] = positions_of_sequences[index]
+        return dict_original_seq_pos
+
+    def get_dict_sequence_name_to_positions_from_dir_of_bam(self, list_of_directory_bam, max_processes=1):
+        """
+            Get a map, sequence name to starting positions of its reads, from the bam files of one or more samples.
+
+            @attention: Positions of a sample are stored in a table in the temporary directory,
+            which is read instead of the bam files as long as their sizes and modification times do not change
+
+            @param list_of_directory_bam: Directories of bam files of a sample each, pooled in the given order
+            @type list_of_directory_bam: list[str|unicode]
+            @param max_processes: Maximum number of bam files read at the same time
+            @type max_processes: int
+
+            @return: Mapping of sequence name to 1-based starting positions, in order of the first read of each sequence
+            @rtype: dict[str | unicode, numpy.ndarray]
+        """
+        assert isinstance(list_of_directory_bam, list)
+        if len(list_of_directory_bam) == 1:
+            return self._get_read_positions_of_sample(list_of_directory_bam[0], max_processes)
+        dict_sequence_name_to_list_of_positions = {}
+        for directory_bam in list_of_directory_bam:
+            for sequence_name, positions in self._get_read_positions_of_sample(directory_bam, max_processes).items():
+                if sequence_name not in dict_sequence_name_to_list_of_positions:
+                    dict_sequence_name_to_list_of_positions[sequence_name] = []
+                dict_sequence_name_to_list_of_positions[sequence_name].append(positions)
+        return dict(
+            (sequence_name, np.concatenate(list_of_positions))
+            for sequence_name, list_of_positions in dict_sequence_name_to_list_of_positions.items())
+
+    def _get_read_positions_of_sample(self, directory_bam, max_processes=1):
+        """
+            Get the read start positions of the bam files of a sample, from its table if up to date
+
+            @type directory_bam: str | unicode
+            @type max_processes: int
+
+            @rtype: dict[str | unicode, numpy.ndarray]
+        """
+        assert self.validate_dir(directory_bam)
+        list_of_file_paths_bam = self.get_files_in_directory(directory_bam, ".bam")
+        file_names = [os.path.basename(file_path_bam) for file_path_bam in list_of_file_paths_bam]
+        list_of_stats = [os.stat(file_path_bam) for file_path_bam in list_of_file_paths_bam]
+        sizes = [stat.st_size for stat in list_of_stats]
+        mtimes = [stat.st_mtime for stat in list_of_stats]
+        file_path_table = self._get_file_path_read_positions(directory_bam)
+        if os.path.isfile(file_path_table):
+            try:
+                with np.load(file_path_table, allow_pickle=False) as table:
+                    if table["file_names"].tolist() == file_names and table["sizes"].tolist() == sizes \
+                            and table["mtimes"].tolist() == mtimes:
+                        sequence_names = table["sequence_names"].tolist()
+                        positions = np.split(table["positions"], np.cumsum(table["counts"])[:-1])
+                        return dict(zip(sequence_names, positions))
+            except (OSError, ValueError, KeyError, zipfile.BadZipFile) as e:
+                self._logger.warning("Ignoring unreadable '{}': {}".format(file_path_table, e))
+            self._logger.info("Bam files of '{}' changed, reading read start positions".format(directory_bam))
+
+        dict_original_seq_pos = self.get_dict_sequence_name_to_positions_from_bam(
+            list_of_file_paths_bam, max_processes)
+        file_path_tmp = file_path_table + ".tmp"
+        try:
+            with open(file_path_tmp, 'wb') as stream_output:
+                np.savez(
+                    stream_output,
+                    file_names=np.array(file_names, dtype=str),
+                    sizes=np.array(sizes, dtype=np.int64),
+                    mtimes=np.array(mtimes, dtype=np.float64),
+                    sequence_names=np.array(list(dict_original_seq_pos), dtype=str),
+                    counts=np.array([len(positions) for positions in dict_original_seq_pos.values()], dtype=np.int64),
+                    positions=np.concatenate([np.empty(0, dtype=np.int64)] + list(dict_original_seq_pos.values())))
+            os.rename(file_path_tmp, file_path_table)
+        except OSError as e:
+            self._logger.warning("Read start positions not stored in '{}': {}".format(file_path_table, e))
+        return dict_original_seq_pos
+
+    def _get_file_path_read_positions(self, directory_bam):
+        """
+            Get location of the table of read start positions of the bam files of a sample
+
+            @type directory_bam: str | unicode
+
+            @rtype: str | unicode
+        """
+        file_name = hashlib.md5(os.path.abspath(directory_bam).encode()).hexdigest() + ".npz"
+        return os.path.join(self._tmp_dir, self._prefix_read_positions + file_name)
+
     # ###############
     # write gold standard assembly mapping
     # ###############
@@ -225,12 +412,7 @@ class GoldStandardFileFormat(Validator):
         assert isinstance(dict_genome_id_to_tax_id, dict)
 
         row_format = "{aid}\t{gid}\t{tid}\t{sid}\n"
-        line = '#' + row_format.format(
-            aid="anonymous_read_id",
-            gid="genome_id",
-            tid="tax_id",
-            sid="read_id")
-        stream_output.write(line)
+        stream_output.write(self.read_mapping_header)
         for anonymous_id in sorted(dict_anonymous_to_read_id):
             read_id = dict_anonymous_to_read_id[anonymous_id]
             if '-' not in read_id:
@@ -266,7 +448,7 @@ class GoldStandardFileFormat(Validator):
             @param dict_sequence_name_to_anonymous:
             @type dict_sequence_name_to_anonymous: dict[str | unicode, str | unicode]
             @param dict_original_seq_pos: Mapping of sequence name to list of starting position
-            @type dict_original_seq_pos: dict[str | unicode, list[long]]
+            @type dict_original_seq_pos: dict[str | unicode, list[long] | numpy.ndarray]
             @param dict_sequence_to_genome_id: Mapping of sequence id to genome id
             @type dict_sequence_to_genome_id: dict[str | unicode, str | unicode]
             @param dict_genome_id_to_tax_id: Mapping of  genome id to taxonomic id
@@ -283,6 +465,9 @@ class GoldStandardFileFormat(Validator):
         row_format = "{name}\t{genome_id}\t{tax_id}\t{seq_id}\t{count}\t{position_0}\t{position_1}\n"
 
         stream_output.write("#anonymous_contig_id\tgenome_id\ttax_id\tcontig_id\tnumber_reads\tstart_position\tend_position\n")
+        # read start positions of a sequence are sorted once, reads of each contig are counted by binary search
+        dict_sequence_to_sorted_positions = {}
+        rows = []
 
         for original_contig_id, anonymous_contig_id in dict_sequence_name_to_anonymous.items():
             seq_info = original_contig_id.strip().rsplit("_from_", 1)
@@ -292,11 +477,13 @@ class GoldStandardFileFormat(Validator):
             pos_start = int(seq_info[1].split("_", 1)[0])
             pos_end = int(seq_info[1].split("_to_", 1)[1].split("_", 1)[0])
 
-            # check if read is in contig
-            count = 0
-            for number in dict_original_seq_pos[sequence_id]:
-                if pos_start <= int(number) <= pos_end:
-                    count += 1
+            # count reads starting in contig
+            if sequence_id not in dict_sequence_to_sorted_positions:
+                dict_sequence_to_sorted_positions[sequence_id] = np.sort(
+                    np.asarray(dict_original_seq_pos[sequence_id], dtype=np.int64))
+            positions = dict_sequence_to_sorted_positions[sequence_id]
+            count = int(
+                np.searchsorted(positions, pos_end, side='right') - np.searchsorted(positions, pos_start, side='left'))
 
             # write output
             if sequence_id not in dict_sequence_to_genome_id:
@@ -305,7 +492,7 @@ class GoldStandardFileFormat(Validator):
                 raise KeyError(msg)
             genome_id = dict_sequence_to_genome_id[sequence_id]
             tax_id = dict_genome_id_to_tax_id[genome_id]
-            stream_output.write(row_format.format(
+            rows.append(row_format.format(
                 name=anonymous_contig_id,
                 genome_id=genome_id,
                 tax_id=tax_id,
@@ -314,10 +501,11 @@ class GoldStandardFileFormat(Validator):
                 position_0=pos_start,
                 position_1=pos_end)
                 )
+        stream_output.write("".join(rows))
 
     def gs_contig_mapping(
-        self, file_path_genome_locations, file_path_metadata, file_path_id_map, list_file_paths_read_positions,
-        stream_output):
+        self, file_path_genome_locations, file_path_metadata, file_path_id_map, list_of_directory_bam,
+        stream_output, max_processes=1):
         """
             Write the gold standard for every read
 
@@ -331,15 +519,18 @@ class GoldStandardFileFormat(Validator):
             @type file_path_metadata: str | unicode
             @param file_path_id_map:
             @type file_path_id_map: str | unicode
-            @param list_file_paths_read_positions:
-            @type list_file_paths_read_positions: list[str | unicode]
+            @param list_of_directory_bam: Directories of bam files of the samples the contigs were assembled from
+            @type list_of_directory_bam: list[str | unicode]
+            @param max_processes: Maximum number of bam files read at the same time
+            @type max_processes: int
 
             @return: Nothing
             @rtype: None
         """
         dict_sequence_to_genome_id = self.get_dict_sequence_to_genome_id(file_path_genome_locations)
         dict_genome_id_to_tax_id = self.get_dict_genome_id_to_tax_id(file_path_metadata)
-        dict_original_seq_pos = self.get_dict_sequence_name_to_positions(list_file_paths_read_positions)
+        dict_original_seq_pos = self.get_dict_sequence_name_to_positions_from_dir_of_bam(
+            list_of_directory_bam, max_processes)
         dict_sequence_name_to_anonymous = self.get_dict_sequence_name_to_anonymous(file_path_id_map)
         self.write_gsa_contig_mapping(
             stream_output, dict_sequence_name_to_anonymous, dict_original_seq_pos,
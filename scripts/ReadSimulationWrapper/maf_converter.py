@@ -2,77 +2,134 @@ __author__ = 'majda'
 
 import glob
 import os
-from Bio import SeqIO
+import numpy as np
 
+# pbsim writes the alignments of the maf file and the reads of the fastq file in the same order,
+# so both are walked in lockstep and neither reads nor alignments are kept in memory.
 
-def main(directory="./"):
-	dict_sequence_mapping = write_sam(directory)
-	merge_fastq(directory, dict_sequence_mapping)
-	return dict_sequence_mapping
+_buffer_size = 2**20
+_gap = ord('-')
+_cigar_operations = "MID"
 
 
-def merge_fastq(directory, dict_sequence_mapping):
-	fastq = os.path.join(directory, "*.fq")
-	file_list = sorted(glob.glob(fastq))
-	for file_path in file_list:
-		orig_file_prefix = os.path.basename(file_path).rsplit("_",1)[0]
-		file_path = os.path.join(directory, orig_file_prefix + ".fq")
-		with open(file_path, 'a+') as write_handler:
-			for record in SeqIO.parse(file_path, "fastq-sanger"):
-				record.id = dict_sequence_mapping[orig_file_prefix][record.id]
-				record.description = ""
-				write_handler.write(record.format("fastq-sanger"))
+def main(directory="./", open_sam=None):
+	write_sam(directory, open_sam)
+
 
+def write_sam(directory, open_sam=None):
+	"""
+	Convert pbsim output in a single pass into one sam output per genome.
+	Renamed reads are written into a '<prefix>.fq' file next to each '<prefix>.fastq' file
+	and pbsim read ids are mapped to new read ids in a '<genome_id>_read_ids.tsv' file.
 
-def write_sam(directory):
+	@param directory: Directory containing the pbsim output
+	@type directory: str | unicode
+	@param open_sam: Returns a writable stream for a genome id, by default '<genome_id>.sam' is written into directory
+	@type open_sam: callable | None
+	"""
+	if open_sam is None:
+		def open_sam(orig_file_prefix):
+			return open(os.path.join(directory, orig_file_prefix + ".sam"), "w")
 	maf = os.path.join(directory, "*.maf")
-	list_of_maf_file_path = glob.glob(maf)
-	dict_sequence_mapping = {}
+	list_of_maf_file_path = sorted(glob.glob(maf))
+	dict_prefix_to_maf_file_paths = {}
 	for file_path in list_of_maf_file_path:
-		# write sam header
 		orig_file_prefix = os.path.basename(file_path).rsplit("_",1)[0]
-		sam_file = os.path.join(directory, orig_file_prefix + ".sam")
-		with open(sam_file, "w") as samfile:
+		if orig_file_prefix not in dict_prefix_to_maf_file_paths:
+			dict_prefix_to_maf_file_paths[orig_file_prefix] = []
+		dict_prefix_to_maf_file_paths[orig_file_prefix].append(file_path)
+	for orig_file_prefix, list_of_file_paths in dict_prefix_to_maf_file_paths.items():
+		file_path_read_ids = os.path.join(directory, orig_file_prefix + "_read_ids.tsv")
+		with open_sam(orig_file_prefix) as samfile, open(file_path_read_ids, "w", _buffer_size) as read_ids:
+			# write sam header
 			samfile.write("@HD\tVN:1.4\tSQ:unsorted\n")
-	prefix_to_true_sid = {}
-	for file_path in list_of_maf_file_path:
-		# get seq_ID
-		orig_file_prefix = os.path.basename(file_path).rsplit("_",1)[0]
-		prefix = file_path.rsplit(".", 1)[0]
-		record = SeqIO.read(prefix + ".ref", "fasta")
-		sequence_id = record.id
-		prefix_to_true_sid[prefix] = record.id
-		sam_file = os.path.join(directory, orig_file_prefix + ".sam")
-		# write sam sequence header
-		with open(sam_file, "a") as samfile:
-			samfile.write("@SQ\tSN:{name}\tLN:{len}\n".format(name=sequence_id, len=len(record.seq)))
-	for file_path in list_of_maf_file_path:
-		# get seq_ID
-		prefix = file_path.rsplit(".", 1)[0]
-		# read fastq
-		dict_seq = {}
-		dict_seq_quality = {}
-		fname = prefix + ".fastq"
-		if not os.path.isfile(fname):
-			fname = prefix + ".fq" # only allow fastq and fq ending
-		for record in SeqIO.parse(fname, "fastq-sanger"):
-			dict_seq[record.id] = str(record.seq)
-			dict_seq_quality[record.id] = SeqIO.QualityIO._get_sanger_quality_str(record)
-		sequence_id = prefix_to_true_sid[prefix]
-		# write sam sequences
-		orig_file_prefix = os.path.basename(file_path).rsplit("_",1)[0]
-		sam_file = os.path.join(directory, orig_file_prefix + ".sam")
-		with open(sam_file, "a") as samfile:
-			dict_of_maf_sid = read_maf(samfile, sequence_id, dict_seq, dict_seq_quality, file_path)
-			if orig_file_prefix not in dict_sequence_mapping:
-				dict_sequence_mapping[orig_file_prefix] = {}
-			for maf_sid in dict_of_maf_sid:
-				dict_sequence_mapping[orig_file_prefix][maf_sid] = dict_of_maf_sid[maf_sid]
-	return dict_sequence_mapping
-
-
-def read_maf(samfile, sequence_id, dict_seq, dict_seq_quality, file_path):
-	dict_of_maf_sid = {}
+			prefix_to_true_sid = {}
+			for file_path in list_of_file_paths:
+				# get seq_ID
+				prefix = file_path.rsplit(".", 1)[0]
+				sequence_id, sequence_length = read_reference(prefix + ".ref")
+				prefix_to_true_sid[prefix] = sequence_id
+				# write sam sequence header
+				samfile.write("@SQ\tSN:{name}\tLN:{len}\n".format(name=sequence_id, len=sequence_length))
+			for file_path in list_of_file_paths:
+				prefix = file_path.rsplit(".", 1)[0]
+				file_path_fastq = prefix + ".fastq"
+				if not os.path.isfile(file_path_fastq):
+					file_path_fastq = prefix + ".fq" # only allow fastq and fq ending
+				file_path_fq = prefix + ".fq"
+				if file_path_fastq == file_path_fq:
+					file_path_fq += ".tmp"
+				with open(file_path_fastq) as fastq, open(file_path_fq, "w", _buffer_size) as fq:
+					read_maf(samfile, fq, read_ids, prefix_to_true_sid[prefix], fastq, file_path)
+				if file_path_fq != prefix + ".fq":
+					os.rename(file_path_fq, prefix + ".fq")
+
+
+def read_reference(file_path):
+	"""
+	Get id and length of the single sequence of a fasta file, without loading it
+
+	@param file_path: Reference written by pbsim
+	@type file_path: str | unicode
+
+	@return: Sequence id and length
+	@rtype: tuple[str|unicode, int]
+	"""
+	sequence_id = None
+	sequence_length = 0
+	with open(file_path) as reference:
+		for line in reference:
+			if line.startswith(">"):
+				if sequence_id is not None:
+					raise ValueError("More than one sequence in '{}'".format(file_path))
+				sequence_id = line[1:].split(None, 1)[0]
+			else:
+				sequence_length += len(line.rstrip())
+	if sequence_id is None:
+		raise ValueError("No sequence in '{}'".format(file_path))
+	return sequence_id, sequence_length
+
+
+def read_fastq(fastq):
+	"""
+	Iterate over the reads of a fastq file written by pbsim, with sequence and quality on a single line each
+
+	@param fastq: Fastq file handle
+	@type fastq: file
+
+	@return: Read id, sequence and quality of each read
+	@rtype: collections.Iterable[tuple[str|unicode, str|unicode, str|unicode]]
+	"""
+	while True:
+		header = fastq.readline()
+		if not header:
+			return
+		sequence = fastq.readline().rstrip("\n")
+		fastq.readline()
+		quality = fastq.readline().rstrip("\n")
+		if not header.startswith("@") or len(sequence) != len(quality):
+			raise ValueError("Corrupt fastq record '{}'".format(header.rstrip()))
+		yield header[1:].split(None, 1)[0], sequence, quality
+
+
+def read_maf(samfile, fq, read_ids, sequence_id, fastq, file_path):
+	"""
+	Write a sam line, a renamed fastq record and a read id mapping for each alignment of a maf file
+
+	@param samfile: Sam output
+	@type samfile: file | BamWriter
+	@param fq: Fastq output of renamed reads
+	@type fq: file
+	@param read_ids: Output of pbsim read ids and new read ids
+	@type read_ids: file
+	@param sequence_id: Id of the reference sequence the reads are simulated from
+	@type sequence_id: str | unicode
+	@param fastq: Fastq file of the reads, in the order of the alignments
+	@type fastq: file
+	@param file_path: Maf file
+	@type file_path: str | unicode
+	"""
+	reads = read_fastq(fastq)
 	with open(file_path, "r") as maffile:
 		n = 0
 		index = 0
@@ -85,62 +142,64 @@ def read_maf(samfile, sequence_id, dict_seq, dict_seq_quality, file_path):
 			elif line.startswith("s"):
 				# sequence lines begin
 				n += 1
-				maf_s = line.strip().split()
-				# maf_s = line.strip().split(" ")
+				maf_s = line.split()
 				if n % 2 == 1:
 					POS = maf_s[2]
 					SEQ_ref = maf_s[6]
+					continue
+				SEQ_read = maf_s[6]
+				index += 1
+				maf_sid = maf_s[1]
+				read_id, SEQ, QUAL = next(reads, (None, None, None))
+				if read_id != maf_sid:
+					raise ValueError("Read '{}' of '{}' not found in fastq file, found '{}'".format(
+						maf_sid, file_path, read_id))
+				if maf_s[4] == "+":
+					FLAG = "0"
 				else:
-					SEQ_read = maf_s[6]
-					index += 1
-					maf_sid = maf_s[1]
-					if maf_s[4] == "+":
-						FLAG = str(0)
-					else:
-						FLAG = str(16)
-					# if n == 2:
-					MAPQ = str(255)
-					CIGAR = cigar_code_creation(SEQ_ref, SEQ_read)
-					RNEXT = "*"
-					PNEXT = "0"
-					SEQ = dict_seq[maf_sid]
-					QUAL = dict_seq_quality[maf_sid]
-					TLEN = str(len(SEQ))
-					QNAME = "{sid}-{index}".format(sid=sequence_id, index=index)
-					RNAME = sequence_id
-					dict_of_maf_sid[maf_sid] = QNAME
-
-					sam_parameter = [QNAME, FLAG, RNAME, POS, MAPQ, CIGAR, RNEXT, PNEXT, TLEN, SEQ, QUAL]
-					samfile.write("\t".join(sam_parameter)+"\n")
-	return dict_of_maf_sid
+					FLAG = "16"
+				MAPQ = "255"
+				CIGAR = cigar_code_creation(SEQ_ref, SEQ_read)
+				RNEXT = "*"
+				PNEXT = "0"
+				TLEN = str(len(SEQ))
+				QNAME = "{sid}-{index}".format(sid=sequence_id, index=index)
+				RNAME = sequence_id
+
+				sam_parameter = [QNAME, FLAG, RNAME, POS, MAPQ, CIGAR, RNEXT, PNEXT, TLEN, SEQ, QUAL]
+				samfile.write("\t".join(sam_parameter)+"\n")
+				fq.write("@{}\n{}\n+\n{}\n".format(QNAME, SEQ, QUAL))
+				read_ids.write("{}\t{}\n".format(maf_sid, QNAME))
+	if next(reads, None) is not None:
+		raise ValueError("More reads than alignments in fastq file of '{}'".format(file_path))
+
 
 # does not count mismatches (X)
 def cigar_code_creation(char_ref, char_read):
-	cigar = ""
-	debug = False
-	i = 0
-	while (i < len(char_ref) and i < len(char_read)):
-		length = 0
-		while (i < len(char_ref) and char_ref[i] == '-'):
-			i += 1
-			length += 1
-		if length > 0:
-			cigar += "%sI" % length
-			continue
-		length = 0
-		while (i < len(char_read) and char_read[i] == '-'):
-			i += 1
-			length += 1
-		if length > 0:
-			cigar += "%sD" % length
-			continue
-		length = 0
-		while (i < len(char_ref) and i < len(char_read) and char_read[i] != '-' and char_ref[i] != '-'):
-			i += 1
-			length += 1
-		if length > 0:
-			cigar += "%sM" % length
-	return cigar
+	"""
+	Run-length encode the columns of an alignment, gaps in the reference are insertions, gaps in the read deletions
+
+	@param char_ref: Aligned reference, with '-' as gap
+	@type char_ref: str | unicode
+	@param char_read: Aligned read, with '-' as gap
+	@type char_read: str | unicode
+
+	@rtype: str | unicode
+	"""
+	length = min(len(char_ref), len(char_read))
+	if length == 0:
+		return ""
+	ref = np.frombuffer(char_ref[:length].encode(), dtype=np.uint8)
+	read = np.frombuffer(char_read[:length].encode(), dtype=np.uint8)
+	# 0: match, 1: insertion, 2: deletion
+	operations = np.where(ref == _gap, 1, np.where(read == _gap, 2, 0))
+	starts = np.flatnonzero(np.diff(operations)) + 1
+	starts = np.concatenate(([0], starts))
+	lengths = np.diff(np.append(starts, length))
+	return "".join(
+		"{}{}".format(run_length, _cigar_operations[operation])
+		for run_length, operation in zip(lengths.tolist(), operations[starts].tolist()))
+
 
 if __name__ == "__main__":
 	main()
@@ -0,0 +1,283 @@
+__author__ = 'hofmann'
+__version__ = '0.0.1'
+
+import numpy as np
+from Bio import SeqIO
+from scripts.GoldStandardAssembly.bamwriter import BamWriter
+
+# In-process paired-end read simulator, a stand-in for art illumina without external binaries.
+# Fragments are drawn uniformly along each sequence with normally distributed lengths,
+# reads are their ends with substitutions only, at an error rate rising linearly along the read.
+# Output mirrors art illumina: two fastq files and a sam file, or records added to a bam writer.
+
+# paired-end sam flags: paired, proper pair, read reverse, mate reverse, first/second in pair
+_FLAG_FIRST_FORWARD = 99
+_FLAG_SECOND_REVERSE = 147
+_FLAG_FIRST_REVERSE = 83
+_FLAG_SECOND_FORWARD = 163
+
+_MAPQ = 99
+_MAX_QUALITY = 41
+_MIN_QUALITY = 2
+
+_fastq_format = b"@%s/%d\n%s\n+\n%s\n"
+_sam_format = b"%s\t%d\t%s\t%d\t%d\t%s\t=\t%d\t%d\t%s\t%s\n"
+
+_code_to_base = np.frombuffer(b"ACGTN", dtype=np.uint8)
+
+_base_to_code = np.full(256, 4, dtype=np.uint8)
+for _code, _base in enumerate(b"ACGT"):
+    _base_to_code[_base] = _code
+
+_complement = np.full(256, ord('N'), dtype=np.uint8)
+for _base, _base_complement in zip(b"ACGTN", b"TGCAN"):
+    _complement[_base] = _base_complement
+
+
+def get_error_rates(read_length, error_rate_start, error_rate_end):
+    """
+    Substitution error rate of each read position, increasing linearly along the read
+
+    @param read_length: Length of a read
+    @type read_length: int
+    @param error_rate_start: Error rate of the first base of a read
+    @type error_rate_start: float
+    @param error_rate_end: Error rate of the last base of a read
+    @type error_rate_end: float
+
+    @return: Error rate of each read position
+    @rtype: numpy.ndarray
+    """
+    assert isinstance(read_length, int) and read_length > 0
+    assert 0 <= error_rate_start <= 1 and 0 <= error_rate_end <= 1
+    return np.linspace(error_rate_start, error_rate_end, read_length)
+
+
+def get_quality_string(error_rates):
+    """
+    Phred+33 encoded quality string reflecting the error rate of each read position
+
+    @param error_rates: Error rate of each read position
+    @type error_rates: numpy.ndarray
+
+    @return: Quality string
+    @rtype: bytes
+    """
+    with np.errstate(divide='ignore'):
+        phred = np.rint(-10 * np.log10(error_rates))
+    phred = np.clip(np.nan_to_num(phred, posinf=_MAX_QUALITY), _MIN_QUALITY, _MAX_QUALITY)
+    return (phred.astype(np.uint8) + 33).tobytes()
+
+
+def _add_substitutions(bases, error_rates, random_generator):
+    """
+    Replace bases by one of the three other nucleotides, with a position specific probability
+
+    @param bases: Reads as rows of ascii codes, in reference orientation
+    @type bases: numpy.ndarray
+    @param error_rates: Error rate of each column
+    @type error_rates: numpy.ndarray
+    @type random_generator: numpy.random.Generator
+
+    @return: Reads with substitutions
+    @rtype: numpy.ndarray
+    """
+    mask = random_generator.random(bases.shape) < error_rates
+    codes = _base_to_code[bases]
+    mask &= codes < 4  # ambiguous bases stay untouched
+    number_of_errors = int(np.count_nonzero(mask))
+    if number_of_errors == 0:
+        return bases
+    shift = random_generator.integers(1, 4, size=number_of_errors, dtype=np.uint8)
+    bases = bases.copy()
+    bases[mask] = _code_to_base[(codes[mask] + shift) % 4]
+    return bases
+
+
+def _to_rows(bases):
+    """
+    Convert a two dimensional array of ascii codes into a list of byte strings, one per row
+
+    @type bases: numpy.ndarray
+
+    @rtype: list[bytes]
+    """
+    bases = np.ascontiguousarray(bases)
+    return bases.view("S{}".format(bases.shape[1])).ravel().tolist()
+
+
+def _interleave(first, second):
+    """
+    Interleave the rows of two arrays of equal shape, starting with the first one
+
+    @type first: numpy.ndarray
+    @type second: numpy.ndarray
+
+    @rtype: numpy.ndarray
+    """
+    interleaved = np.empty((2 * len(first), ) + first.shape[1:], dtype=first.dtype)
+    interleaved[0::2] = first
+    interleaved[1::2] = second
+    return interleaved
+
+
+def _simulate_sequence(
+    stream_fq1, stream_fq2, stream_sam, sequence_id, sequence, fold_coverage, read_length,
+    fragment_size_mean, fragment_size_standard_deviation, error_rates, random_generator, batch_size):
+    """
+    Simulate read pairs of a single sequence, batch by batch.
+    Alignments are written as sam lines, or added to a bam writer straight from the arrays of a batch.
+
+    @return: Number of simulated read pairs
+    @rtype: int
+    """
+    sequence_length = len(sequence)
+    if sequence_length < read_length:
+        return 0
+    number_of_pairs = int(round(sequence_length * fold_coverage / (2. * read_length)))
+    is_bam = isinstance(stream_sam, BamWriter)
+
+    name = sequence_id.encode()
+    quality = get_quality_string(error_rates)
+    quality_reverse = quality[::-1]
+    qualities = np.frombuffer(quality + quality_reverse, dtype=np.uint8).reshape(2, read_length)
+    error_rates_reverse = error_rates[::-1]
+    offsets = np.arange(read_length)
+    cigar = "{}M".format(read_length).encode()
+
+    read_index = 0
+    for batch_start in range(0, number_of_pairs, batch_size):
+        size = min(batch_size, number_of_pairs - batch_start)
+        fragment_lengths = np.rint(random_generator.normal(
+            fragment_size_mean, fragment_size_standard_deviation, size)).astype(np.int64)
+        np.clip(fragment_lengths, read_length, sequence_length, out=fragment_lengths)
+        starts = random_generator.integers(0, sequence_length - fragment_lengths + 1)
+        starts_right = starts + fragment_lengths - read_length
+        is_flipped = random_generator.random(size) < 0.5
+
+        # both reads in reference orientation, the right one is sequenced from the reverse strand
+        left = _add_substitutions(sequence[starts[:, None] + offsets], error_rates, random_generator)
+        right = _add_substitutions(sequence[starts_right[:, None] + offsets], error_rates_reverse, random_generator)
+        right_reverse_complement = _complement[right[:, ::-1]]
+
+        rows_left = _to_rows(left)
+        rows_right = _to_rows(right)
+        rows_right_reverse_complement = _to_rows(right_reverse_complement)
+
+        read_names = [b"%s-%d" % (name, read_index + index) for index in range(1, size + 1)]
+        read_index += size
+        lines_fq1 = []
+        lines_fq2 = []
+        lines_sam = []
+        for index in range(size):
+            read_name = read_names[index]
+            if is_flipped[index]:
+                lines_fq1.append(_fastq_format % (read_name, 1, rows_right_reverse_complement[index], quality))
+                lines_fq2.append(_fastq_format % (read_name, 2, rows_left[index], quality))
+            else:
+                lines_fq1.append(_fastq_format % (read_name, 1, rows_left[index], quality))
+                lines_fq2.append(_fastq_format % (read_name, 2, rows_right_reverse_complement[index], quality))
+            if is_bam:
+                continue
+            position_left = int(starts[index]) + 1
+            position_right = int(starts_right[index]) + 1
+            fragment_length = int(fragment_lengths[index])
+            if is_flipped[index]:
+                flag_left, flag_right = _FLAG_SECOND_FORWARD, _FLAG_FIRST_REVERSE
+            else:
+                flag_left, flag_right = _FLAG_FIRST_FORWARD, _FLAG_SECOND_REVERSE
+            lines_sam.append(_sam_format % (
+                read_name, flag_left, name, position_left, _MAPQ, cigar,
+                position_right, fragment_length, rows_left[index], quality))
+            lines_sam.append(_sam_format % (
+                read_name, flag_right, name, position_right, _MAPQ, cigar,
+                position_left, -fragment_length, rows_right[index], quality_reverse))
+        stream_fq1.write(b"".join(lines_fq1))
+        stream_fq2.write(b"".join(lines_fq2))
+        if not is_bam:
+            stream_sam.write(b"".join(lines_sam))
+            continue
+        # each pair as its two sam lines, left read first
+        stream_sam.write_alignments(
+            sequence_id, [read_name for read_name in read_names for _ in range(2)],
+            _interleave(
+                np.where(is_flipped, _FLAG_SECOND_FORWARD, _FLAG_FIRST_FORWARD),
+                np.where(is_flipped, _FLAG_FIRST_REVERSE, _FLAG_SECOND_REVERSE)),
+            _interleave(starts, starts_right), _MAPQ, cigar.decode(), _interleave(starts_right, starts),
+            _interleave(fragment_lengths, -fragment_lengths), _interleave(left, right),
+            np.tile(qualities, (size, 1)))
+    return number_of_pairs
+
+
+def _open_sam(file_path_output_prefix, bam_writer):
+    """
+    Open the sam output, either '<prefix>.sam' or a writer of a sorted bam file
+
+    @rtype: file | BamWriter
+    """
+    if bam_writer is None:
+        return open(file_path_output_prefix + '.sam', 'wb')
+    return bam_writer
+
+
+def simulate_paired_reads(
+    file_path_input, fold_coverage, file_path_output_prefix, read_length,
+    fragment_size_mean, fragment_size_standard_deviation, error_rate_start, error_rate_end, seed,
+    batch_size=100000, bam_writer=None, genome=None):
+    """
+    Simulate paired-end reads of a genome, writing '<prefix>1.fq', '<prefix>2.fq' and '<prefix>.sam' like art illumina
+
+    @attention: Fragment positions, lengths, strands and substitutions are drawn in batches.
+        Read names follow the '<sequence_id>-<index>/<1|2>' scheme expected by the gold standard.
+
+    @param file_path_input: Path to genome fasta file
+    @type file_path_input: str | unicode
+    @param fold_coverage: coverage of a genome
+    @type fold_coverage: int | float
+    @param file_path_output_prefix: Output prefix of the fastq and sam files
+    @type file_path_output_prefix: str | unicode
+    @param read_length: Length of each read of a pair
+    @type read_length: int
+    @param fragment_size_mean: Mean size of the fragment of which the ends are used as reads in base pairs
+    @type fragment_size_mean: int
+    @param fragment_size_standard_deviation: Standard deviation of the fragment size in base pairs.
+    @type fragment_size_standard_deviation: int
+    @param error_rate_start: Substitution rate of the first base of a read
+    @type error_rate_start: float
+    @param error_rate_end: Substitution rate of the last base of a read
+    @type error_rate_end: float
+    @param seed: Seed of the random generator
+    @type seed: int
+    @param batch_size: Number of read pairs drawn at once
+    @type batch_size: int
+    @param bam_writer: Writer of a sorted bam file, replaces the sam file if given
+    @type bam_writer: BamWriter | None
+    @param genome: Genome of the fasta file from a genome store, read instead of parsing the fasta file
+    @type genome: PackedGenome | None
+
+    @return: None if successful, else an error message
+    @rtype: None | str
+    """
+    try:
+        random_generator = np.random.default_rng(seed)
+        error_rates = get_error_rates(read_length, error_rate_start, error_rate_end)
+        if genome is not None:
+            sequences = genome.get_sequences()
+        else:
+            with open(file_path_input) as stream_input:
+                sequences = [
+                    (seq_record.id, np.frombuffer(str(seq_record.seq).upper().encode(), dtype=np.uint8))
+                    for seq_record in SeqIO.parse(stream_input, "fasta")]
+        with open(file_path_output_prefix + '1.fq', 'wb') as stream_fq1, \
+                open(file_path_output_prefix + '2.fq', 'wb') as stream_fq2, \
+                _open_sam(file_path_output_prefix, bam_writer) as stream_sam:
+            stream_sam.write(b"@HD\tVN:1.4\tSO:unsorted\n")
+            for sequence_id, sequence in sequences:
+                stream_sam.write(b"@SQ\tSN:%s\tLN:%d\n" % (sequence_id.encode(), len(sequence)))
+            for sequence_id, sequence in sequences:
+                _simulate_sequence(
+                    stream_fq1, stream_fq2, stream_sam, sequence_id, sequence, fold_coverage, read_length,
+                    fragment_size_mean, fragment_size_standard_deviation, error_rates, random_generator, batch_size)
+    except (AssertionError, IOError, OSError, ValueError) as e:
+        return "Simulating reads of '{}' failed: {}".format(file_path_input, e)
+    return None
@@ -0,0 +1,132 @@
+import os
+import string
+
+# Reads of a genome simulated by several seeded sub-jobs ('parts') are merged into the output of a single job.
+# Read names follow the '<sequence_id>-<index>' scheme and each part counts its indices from the start,
+# so the number of the part is appended to the index, zero padded to the same width for all parts.
+# Indices are decimal (art, numpy) or hexadecimal (wgsim).
+_index_characters = string.hexdigits
+
+
+def get_part_prefix(file_path_output_prefix, part):
+    """
+    Output prefix of a part of a split job
+
+    @param file_path_output_prefix: Output prefix of the unsplit job
+    @type file_path_output_prefix: str | unicode
+    @param part: Index of the part
+    @type part: int
+
+    @rtype: str | unicode
+    """
+    return "{}_part{}_".format(file_path_output_prefix, part)
+
+
+def _split_read_name(read_name):
+    """
+    Split a read name into sequence id, index and the suffix following the index
+
+    @param read_name: Read name as '<sequence_id>-<index>' with optional suffixes
+    @type read_name: str | unicode
+
+    @rtype: (str|unicode, str|unicode, str|unicode)
+    """
+    sequence_id, index = read_name.rsplit('-', 1)
+    length = len(index) - len(index.lstrip(_index_characters))
+    return sequence_id, index[:length], index[length:]
+
+
+def get_pair_name(read_name):
+    """
+    Name shared by both reads of a pair, in fastq and sam files, without suffixes like '/1' or wgsim details
+
+    @param read_name: Read name as '<sequence_id>-<index>' with optional suffixes
+    @type read_name: str | unicode
+
+    @rtype: str | unicode
+    """
+    sequence_id, index, suffix = _split_read_name(read_name)
+    return "{}-{}".format(sequence_id, index)
+
+
+def rename_read(read_name, part, number_of_parts):
+    """
+    Make the name of a read unique among all parts, a '/1' or '/2' suffix is kept
+    as well as details appended to the index, like wgsim does with '_<start>_<end>_...'.
+
+    @param read_name: Read name as '<sequence_id>-<index>' with optional suffixes
+    @type read_name: str | unicode
+    @param part: Index of the part the read was simulated by
+    @type part: int
+    @param number_of_parts: Number of parts of the job
+    @type number_of_parts: int
+
+    @rtype: str | unicode
+    """
+    sequence_id, index, suffix = _split_read_name(read_name)
+    width = len(str(number_of_parts - 1))
+    return "{}-{}{:0{}d}{}".format(sequence_id, index, part, width, suffix)
+
+
+def _merge_fastq(list_of_file_paths, stream_output):
+    """
+    Concatenate fastq files of all parts, renaming the reads
+
+    @param list_of_file_paths: Fastq file of each part, in order of the parts
+    @type list_of_file_paths: list[str|unicode]
+    @param stream_output: Merged fastq output
+    @type stream_output: file
+    """
+    number_of_parts = len(list_of_file_paths)
+    for part, file_path in enumerate(list_of_file_paths):
+        with open(file_path) as stream_input:
+            for line_number, line in enumerate(stream_input):
+                # records consist of four lines, the first is the header
+                if line_number % 4 == 0:
+                    line = "@{}\n".format(rename_read(line[1:].rstrip('\n'), part, number_of_parts))
+                stream_output.write(line)
+
+
+def _merge_sam(list_of_file_paths, stream_output):
+    """
+    Concatenate sam files of all parts, renaming the reads.
+    All parts share the same references, so only the header of the first part is kept.
+
+    @param list_of_file_paths: Sam file of each part, in order of the parts
+    @type list_of_file_paths: list[str|unicode]
+    @param stream_output: Merged sam output
+    @type stream_output: file | BamWriter
+    """
+    number_of_parts = len(list_of_file_paths)
+    for part, file_path in enumerate(list_of_file_paths):
+        with open(file_path) as stream_input:
+            for line in stream_input:
+                if line.startswith('@'):
+                    if part == 0:
+                        stream_output.write(line)
+                    continue
+                read_name, remainder = line.split('\t', 1)
+                stream_output.write("{}\t{}".format(rename_read(read_name, part, number_of_parts), remainder))
+
+
+def merge_paired_parts(file_path_output_prefix, number_of_parts, stream_sam):
+    """
+    Merge the '<part_prefix>1.fq', '<part_prefix>2.fq' and '<part_prefix>.sam' files of all parts
+    into '<prefix>1.fq', '<prefix>2.fq' and the given sam output. The part files are removed.
+
+    @param file_path_output_prefix: Output prefix of the unsplit job
+    @type file_path_output_prefix: str | unicode
+    @param number_of_parts: Number of parts of the job
+    @type number_of_parts: int
+    @param stream_sam: Merged sam output, a file or a stream into a bam file
+    @type stream_sam: file | BamWriter
+    """
+    assert isinstance(number_of_parts, int) and number_of_parts > 0
+    list_of_prefixes = [get_part_prefix(file_path_output_prefix, part) for part in range(number_of_parts)]
+    for extension in ['1.fq', '2.fq']:
+        with open(file_path_output_prefix + extension, 'w') as stream_output:
+            _merge_fastq([prefix + extension for prefix in list_of_prefixes], stream_output)
+    _merge_sam([prefix + '.sam' for prefix in list_of_prefixes], stream_sam)
+    for prefix in list_of_prefixes:
+        for extension in ['1.fq', '2.fq', '.sam']:
+            os.remove(prefix + extension)
@@ -0,0 +1,148 @@
+import os
+import json
+import shutil
+import hashlib
+import threading
+from scripts.Validator.validator import Validator
+from scripts.jobmanifest import JobManifest
+
+
+class ReadCache(Validator):
+    """
+    Cache of simulated reads across runs, addressed by a checksum of everything the reads depend on.
+    Each entry is a folder of output files, hard linked if possible, otherwise copied.
+    The least recently used entries are removed while the cache exceeds its size.
+    """
+
+    _label = "ReadCache"
+    _temporary_suffix = ".tmp"
+
+    def __init__(self, directory, max_size, logfile=None, verbose=True, debug=False):
+        """
+        Constructor
+
+        @param directory: Cache directory, created if not existing
+        @type directory: str | unicode
+        @param max_size: Maximum size of all cached files in bytes
+        @type max_size: int
+        @param logfile: file handler or file path to a log file
+        @type logfile: file | FileIO | StringIO | str
+        @param verbose: Not verbose means that only warnings and errors will be past to stream
+        @type verbose: bool
+        @param debug: Display debug messages
+        @type debug: bool
+        """
+        super(ReadCache, self).__init__(label=self._label, logfile=logfile, verbose=verbose, debug=debug)
+        assert isinstance(directory, str)
+        assert isinstance(max_size, int) and max_size > 0
+        self._directory = self.get_full_path(directory)
+        if not os.path.isdir(self._directory):
+            os.makedirs(self._directory)
+        self._max_size = max_size
+        # entries may be added by several threads
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def get_key(parameters):
+        """
+        Get the address of an entry
+
+        @param parameters: Everything the cached files depend on, like genome checksum, simulator settings and seed
+        @type parameters: list | dict
+
+        @rtype: str
+        """
+        return hashlib.sha1(json.dumps(parameters, sort_keys=True).encode()).hexdigest()
+
+    def get_file_names(self, key):
+        """
+        Get the names of the files of an entry, the entry is marked as used
+
+        @param key: Address of an entry
+        @type key: str
+
+        @return: File names, None if the entry does not exist
+        @rtype: list[str] | None
+        """
+        directory_entry = os.path.join(self._directory, key)
+        if not os.path.isdir(directory_entry):
+            return None
+        os.utime(directory_entry)
+        return sorted(os.listdir(directory_entry))
+
+    def restore(self, key, dict_name_to_file_path):
+        """
+        Link or copy the files of an entry to their destinations
+
+        @param key: Address of an entry
+        @type key: str
+        @param dict_name_to_file_path: Destination of each file of the entry
+        @type dict_name_to_file_path: dict[str, str]
+        """
+        directory_entry = os.path.join(self._directory, key)
+        for name, file_path in dict_name_to_file_path.items():
+            self._link(os.path.join(directory_entry, name), file_path)
+
+    def add(self, key, dict_name_to_file_path):
+        """
+        Add complete output files as an entry, if they fit into the cache
+
+        @param key: Address of an entry
+        @type key: str
+        @param dict_name_to_file_path: Output file of each name of the entry
+        @type dict_name_to_file_path: dict[str, str]
+
+        @return: True if added
+        @rtype: bool
+        """
+        for file_path in dict_name_to_file_path.values():
+            if not JobManifest.is_complete_file(file_path):
+                self._logger.warning("Not caching incomplete file '{}'".format(file_path))
+                return False
+        size = sum(os.path.getsize(file_path) for file_path in dict_name_to_file_path.values())
+        if size > self._max_size:
+            self._logger.info("Output of size {} exceeds cache size".format(size))
+            return False
+        directory_entry = os.path.join(self._directory, key)
+        # an entry is complete once renamed
+        directory_temporary = directory_entry + self._temporary_suffix + str(threading.get_ident())
+        with self._lock:
+            if os.path.isdir(directory_entry):
+                return True
+            os.mkdir(directory_temporary)
+            for name, file_path in dict_name_to_file_path.items():
+                self._link(file_path, os.path.join(directory_temporary, name))
+            os.rename(directory_temporary, directory_entry)
+            self._evict()
+        return True
+
+    @staticmethod
+    def _link(file_path_source, file_path_destination):
+        """
+        Hard link a file, or copy it to another file system
+        """
+        try:
+            os.link(file_path_source, file_path_destination)
+        except OSError:
+            shutil.copyfile(file_path_source, file_path_destination)
+
+    def _evict(self):
+        """
+        Remove the least recently used entries, until the cache fits its size
+        """
+        list_of_entries = []
+        total_size = 0
+        for key in os.listdir(self._directory):
+            directory_entry = os.path.join(self._directory, key)
+            if self._temporary_suffix in key or not os.path.isdir(directory_entry):
+                continue
+            size = sum(
+                os.path.getsize(os.path.join(directory_entry, name)) for name in os.listdir(directory_entry))
+            list_of_entries.append((os.path.getmtime(directory_entry), size, directory_entry))
+            total_size += size
+        list_of_entries.sort()
+        while total_size > self._max_size and len(list_of_entries) > 0:
+            last_used, size, directory_entry = list_of_entries.pop(0)
+            self._logger.debug("Evicting '{}'".format(directory_entry))
+            shutil.rmtree(directory_entry)
+            total_size -= size
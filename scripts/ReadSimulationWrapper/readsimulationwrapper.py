@@ -9,12 +9,24 @@ import sys
 import os
 import random
 import argparse
+import math
+import glob
+import shutil
 import tempfile
-from scripts.parallel import TaskCmd, runCmdParallel, reportFailedCmd
+import functools
+from scripts.parallel import TaskCmd, TaskThread, runCmdScheduled, runThreadScheduled, reportFailedCmd, reportMemoryUsage
 from scripts.MetaDataTable.metadatatable import MetadataTable
 from scripts.GenomePreparation.genomepreparation import GenomePreparation
+from scripts.GenomePreparation.genomestatistics import GenomeStatisticsIndex
+from scripts.GenomePreparation.genomestore import GenomeStore
+from scripts.jobmanifest import JobManifest
+from scripts.ReadSimulationWrapper.readcache import ReadCache
 from scripts.ReadSimulationWrapper import sam_from_reads
 from scripts.ReadSimulationWrapper import maf_converter
+from scripts.ReadSimulationWrapper import numpy_simulator
+from scripts.ReadSimulationWrapper import part_merger
+from scripts.ReadSimulationWrapper import subsampler
+from scripts import sequencerecords
 
 
 class ReadSimulationWrapper(GenomePreparation):
@@ -24,15 +36,27 @@ class ReadSimulationWrapper(GenomePreparation):
     # TODO: validate genome: description still a problem for art illumina?
     """
     _label = "ReadSimulationWrapper"
+    # the simulator executable writes a '<prefix>.sam' file, which can be replaced by a fifo
+    _simulator_writes_sam = False
+    # jobs of large genomes can be split into parts, whose paired-end outputs are merged afterwards
+    _can_split_jobs = False
+    # output files are complete only after '_post_process', not when the tasks of a genome are done
+    _has_post_processing = False
+    # paired-end output of a genome can be subsampled for several samples
+    _can_subsample = False
+    # estimated memory of a task in bytes: constant and per base pair of the genome
+    _memory_usage = (50 * 2**20, 2)
 
     def __init__(
         self, file_path_executable,
-        separator='\t', max_processes=1, logfile=None, verbose=True, debug=False, seed=None, tmp_dir=None):
+        separator='\t', max_processes=1, logfile=None, verbose=True, debug=False, seed=None, tmp_dir=None,
+        samtools=None, directory_bam=None, genome_statistics=None, manifest=None, memory_budget=None,
+        read_cache=None, genome_store=None):
         """
         Constructor
 
-        @param file_path_executable:
-        @type file_path_executable: str | unicode
+        @param file_path_executable: Read simulator executable, None for simulators running in-process
+        @type file_path_executable: str | unicode | None
         @param separator: separator to be expected in metadata files
         @type separator: str | unicode
         @param max_processes: Maximum number of processors simulating reads at the same time
@@ -47,8 +71,28 @@ class ReadSimulationWrapper(GenomePreparation):
         @type seed: object
         @param tmp_dir: Directory for storage of temporary files
         @type tmp_dir: int 
+        @param samtools: If given, sam output is streamed into sorted bam files instead of written to disk
+        @type samtools: SamtoolsWrapper | None
+        @param directory_bam: Output directory of the bam files, required if sam output is streamed
+        @type directory_bam: str | unicode | None
+        @param genome_statistics: Index of genome statistics, by default genomes are indexed in memory
+        @type genome_statistics: GenomeStatisticsIndex | None
+        @param manifest: Record of completed jobs, finished jobs are skipped and new ones recorded
+        @type manifest: JobManifest | None
+        @param memory_budget: Memory (RAM) in gigabyte available to all tasks run in parallel, None for no limit
+        @type memory_budget: int | float | None
+        @param read_cache: Cache of simulated reads across runs, reads of jobs found are not simulated again
+        @type read_cache: ReadCache | None
+        @param genome_store: 2 bit packed genomes, read by in-process simulators instead of parsing fasta files
+        @type genome_store: GenomeStore | None
         """
-        assert self.validate_file(file_path_executable, executable=True)
+        assert file_path_executable is None or self.validate_file(file_path_executable, executable=True)
+        assert directory_bam is None or self.validate_dir(directory_bam)
+        assert genome_statistics is None or isinstance(genome_statistics, GenomeStatisticsIndex)
+        assert manifest is None or isinstance(manifest, JobManifest)
+        assert memory_budget is None or isinstance(memory_budget, (int, float))
+        assert read_cache is None or isinstance(read_cache, ReadCache)
+        assert genome_store is None or isinstance(genome_store, GenomeStore)
         assert isinstance(separator, str)
         assert isinstance(max_processes, int)
         assert isinstance(verbose, bool)
@@ -68,6 +112,32 @@ class ReadSimulationWrapper(GenomePreparation):
         self._file_path_executable = file_path_executable
         self._read_length = 150
         self._temporary_files = set()
+        self._samtools = samtools
+        self._directory_bam = directory_bam
+        self._dict_id_genome_length = {}
+        if genome_statistics is None:
+            genome_statistics = GenomeStatisticsIndex(logfile=logfile, verbose=verbose, debug=debug)
+        self._genome_statistics = genome_statistics
+        # filtered copies of genomes, by original file path and minimum sequence length
+        self._filtered_genomes = {}
+        # jobs of several samples, collected to be split and run at once
+        self._deferred_jobs = None
+        # genomes simulated in several parts, by output directory
+        self._split_jobs = {}
+        # jobs of all samples, if reads are simulated once and subsampled
+        self._subsampled_jobs = None
+        self._manifest = manifest
+        self._memory_budget = None
+        if memory_budget is not None:
+            self._memory_budget = int(memory_budget * 2**30)
+        self._read_cache = read_cache
+        self._genome_store = genome_store
+        # seeds of tasks are drawn from a generator seeded by their job
+        self._random = random
+        # jobs to be recorded once the output of a sample is post processed, by output directory
+        self._pending_jobs = {}
+        # jobs to be recorded once their single task is done, by id of the task
+        self._task_jobs = {}
 
     def _close(self):
         """
@@ -77,9 +147,47 @@ class ReadSimulationWrapper(GenomePreparation):
         # delete temporary files
         self._remove_temporary_files()
 
-    @staticmethod
-    def _get_seed():
-        return random.randint(0, sys.maxsize)
+    def _get_seed(self):
+        """
+        Draw the seed of a task, from the random number generator of its job
+
+        @rtype: int
+        """
+        return self._random.randint(0, sys.maxsize)
+
+    def _get_profile(self):
+        """
+        Get the error profile, as far as the simulated reads depend on it
+
+        @rtype: str | unicode | float | None
+        """
+        return getattr(self, "_profile", None)
+
+    def set_directory_bam(self, directory_bam):
+        """
+        Set the output directory of the bam files of following 'simulate' calls, if sam output is streamed
+
+        @param directory_bam: Output directory of the bam files
+        @type directory_bam: str | unicode
+        """
+        assert self.validate_dir(directory_bam)
+        self._directory_bam = directory_bam
+
+    def _open_sam(self, directory_output, file_name):
+        """
+        Open the sam output of a genome, a stream into its sorted bam file if sam output is streamed
+
+        @param directory_output: Directory for the sam and fastq files output
+        @type directory_output: str | unicode
+        @param file_name: Name of the sam file without extension
+        @type file_name: str | unicode
+
+        @return: writable stream
+        @rtype: file | BamWriter
+        """
+        if self._samtools is None:
+            return open(os.path.join(directory_output, file_name + ".sam"), 'w')
+        return self._samtools.open_sam_stream(file_name, self._directory_bam)
 
     def _remove_temporary_files(self):
         if self._debug:
@@ -151,7 +259,7 @@ class ReadSimulationWrapper(GenomePreparation):
         """
         A factor is calculated based on total size of a sample to calculate the required covered
         # coverage = abundance * factor
-        Files will be validated while the length of sequences are determined.
+        Files will be validated while the length of sequences are determined, once as long as they are indexed.
 
         @attention min_sequence_length: Sequences that are shorter than the expected fragment size are removed
 
@@ -184,32 +292,30 @@ class ReadSimulationWrapper(GenomePreparation):
         relative_size_total = 0
         for genome_id, abundance in dict_id_abundance.items():
             try:
-                min_seq_length, genome_length = self.get_sequence_lengths(
+                min_seq_length, genome_length = self._genome_statistics.get_sequence_lengths(
                     file_path=dict_id_file_path[genome_id],
                     file_format=file_format,
                     sequence_type=sequence_type,
                     ambiguous=ambiguous,
-                    key=None,
-                    silent=False)
+                    key=None)
 
                 if min_seq_length < min_sequence_length:
-                    self._logger.info("Genome '{}' has sequences below minimum, creating filtered copy.".format(genome_id))
                     new_file_path = self._remove_short_sequences(
                         dict_id_file_path[genome_id], min_sequence_length, file_format="fasta")
                     dict_id_file_path[genome_id] = new_file_path
-                    self._temporary_files.add(new_file_path)
 
             except IOError as e:
                 self._remove_temporary_files()
                 raise e
 
+            self._dict_id_genome_length[genome_id] = genome_length
             relative_size = abundance * genome_length
             relative_size_total += relative_size
         return total_size / float(relative_size_total)
 
     def _remove_short_sequences(self, file_path, min_sequence_length, file_format="fasta"):
         """
-        Copies a genome with sequences shorter than a minimum removed.
+        Copies a genome with sequences shorter than a minimum removed, a copy is reused while it exists.
 
         @param file_path: File genome id associated with the abundance of a genome
         @type file_path: str | unicode
@@ -225,17 +331,29 @@ class ReadSimulationWrapper(GenomePreparation):
         assert isinstance(min_sequence_length, int), "Expected natural digit"
         assert isinstance(file_format, str), "Expected file format 'fasta'"
 
+        file_path_output = self._filtered_genomes.get((file_path, min_sequence_length))
+        if file_path_output is not None and os.path.isfile(file_path_output):
+            return file_path_output
+
+        statistics = self._genome_statistics.get_statistics(file_path, file_format=file_format)
+        total_base_pairs = sum(
+            length for sequence_id, length in statistics["sequence_lengths"] if length >= min_sequence_length)
+        if total_base_pairs == 0:
+            msg = "No valid sequences > {} found!".format(min_sequence_length)
+            self._logger.error(msg)
+            raise IOError(msg)
+
+        self._logger.info("'{}' has sequences below minimum, creating filtered copy.".format(file_path))
         file_path_output = tempfile.mktemp(dir=self._tmp_dir)
-        with open(file_path) as stream_input, open(file_path_output, 'w') as stream_output:
-            total_base_pairs = self._stream_sequences_of_min_length(
+        with open(file_path, 'rb', sequencerecords.buffer_size) as stream_input, \
+                open(file_path_output, 'wb', sequencerecords.buffer_size) as stream_output:
+            self._stream_sequences_of_min_length(
                 stream_input, stream_output,
                 sequence_min_length=min_sequence_length,
                 file_format=file_format
                 )
-            if total_base_pairs == 0:
-                msg = "No valid sequences > {} found!".format(min_sequence_length)
-                self._logger.error(msg)
-                raise IOError(msg)
+        self._temporary_files.add(file_path_output)
+        self._filtered_genomes[(file_path, min_sequence_length)] = file_path_output
         return file_path_output
     
     def _simulate_reads(self, dict_id_abundance, dict_id_file_path, factor, directory_output):
@@ -257,33 +375,489 @@ class ReadSimulationWrapper(GenomePreparation):
         assert isinstance(factor, (int, float)), "Factor must be numerical"
         assert self.validate_dir(directory_output)
 
-        # add commands to a list of tasks to run them in parallel instead of calling them sequentially
-        tasks = []
+        jobs = []
         for genome_id in dict_id_abundance.keys():
-            file_path_input = dict_id_file_path[genome_id]
             abundance = dict_id_abundance[genome_id]
             if abundance == 0:
                 continue
+            # the cost of a task is predicted by the number of base pairs to be simulated
             if self._label == "ReadSimulationWgsim" or "ReadSimulationNanosim" in self._label:
                 # name "fold_coverage" is misleading for wgsim/nanosim, which use number of reads as input
                 fold_coverage = int(round(abundance * factor / self._fragment_size_mean))
+                cost = fold_coverage * self._fragment_size_mean
             else:
                 fold_coverage = abundance * factor
+                cost = fold_coverage * self._dict_id_genome_length[genome_id]
+            # one seed is drawn per job, whether it is simulated or not, so the seeds of other jobs are unchanged
+            job = self._get_job(
+                directory_output, genome_id, fold_coverage, dict_id_file_path[genome_id],
+                random.randint(0, sys.maxsize))
+            if self._subsampled_jobs is not None:
+                # simulated once for all samples, once all samples are known
+                self._subsampled_jobs.append((genome_id, fold_coverage, cost, dict_id_file_path[genome_id], job))
+                continue
+            if self._is_job_complete(job):
+                continue
+            jobs.append((genome_id, fold_coverage, cost, job))
+
+        if self._deferred_jobs is not None:
+            self._deferred_jobs.append((jobs, directory_output, dict_id_file_path, self._directory_bam))
+            return
+        self._run_tasks(self._get_tasks(jobs, dict_id_file_path, directory_output))
+        self._post_process(directory_output, dict_id_file_path)
+        self._record_pending_jobs(directory_output)
+        self._logger.info("Simulating reads finished")
+
+    def _is_job_complete(self, job):
+        """
+        Test if the output of a job is complete from an earlier run, or restore it from the cache
+
+        @param job: Job as described by '_get_job'
+        @type job: dict
+
+        @rtype: bool
+        """
+        if self._manifest is not None and self._manifest.is_complete(job["job"], job["parameters"]):
+            self._logger.info("Reads of {} are complete, skipping".format(job["genome_id"]))
+            return True
+        if self._restore_cached_job(job):
+            self._logger.info("Reads of {} restored from cache".format(job["genome_id"]))
+            return True
+        return False
+
+    def _get_tasks(self, jobs, dict_id_file_path, directory_output, fair_share=None):
+        """
+        Build the tasks of the jobs of a sample.
+        A job costing more than a fair share of all processes is split into parts with their own seeds.
+
+        @param jobs: Genome id, coverage, cost and description of each job
+        @type jobs: list[(str|unicode, int|float, float, dict)]
+        @param dict_id_file_path: Dictionary of genome id to file path
+        @type dict_id_file_path: dict[str|unicode, str|unicode]
+        @param directory_output: Directory for the sam and fastq files output
+        @type directory_output: str | unicode
+        @param fair_share: Cost per process of all jobs run at once, by default of the given jobs
+        @type fair_share: float | None
+
+        @rtype: list[TaskCmd | TaskThread]
+        """
+        if fair_share is None:
+            fair_share = self._get_fair_share(jobs)
+        dict_id_number_of_parts = {}
+        pending_jobs = []
+
+        # add commands to a list of tasks to run them in parallel instead of calling them sequentially
+        tasks = []
+        for genome_id, fold_coverage, cost, job in jobs:
+            file_path_input = dict_id_file_path[genome_id]
             file_path_output_prefix = os.path.join(directory_output, str(genome_id))
             self._logger.debug("{id}\t{fold_coverage}".format(id=genome_id, fold_coverage=fold_coverage))
-            system_command = self._get_sys_cmd(
-                file_path_input=file_path_input,
-                fold_coverage=fold_coverage,
-                file_path_output_prefix=file_path_output_prefix)
-            self._logger.debug("SysCmd: '{}'".format(system_command))
             self._logger.info("Simulating reads from {}: '{}'".format(genome_id, file_path_input))
-            tasks.append(TaskCmd(system_command))
-        list_of_fails = runCmdParallel(tasks, maxProc=self._max_processes)
+            self._random = random.Random(job["seed"])
+            number_of_parts = 1
+            if self._can_split_jobs and self._max_processes > 1 and cost > fair_share:
+                number_of_parts = min(self._max_processes, int(math.ceil(cost / fair_share)))
+            if number_of_parts == 1:
+                task = self._get_task(
+                    file_path_input=file_path_input,
+                    fold_coverage=fold_coverage,
+                    file_path_output_prefix=file_path_output_prefix)
+                task.cost = cost
+                tasks.append(task)
+                if self._has_post_processing:
+                    pending_jobs.append(job)
+                else:
+                    self._task_jobs[id(task)] = job
+                continue
+            self._logger.info("Splitting simulation of {} into {} parts".format(genome_id, number_of_parts))
+            dict_id_number_of_parts[genome_id] = number_of_parts
+            for part, part_fold_coverage in enumerate(self._split_fold_coverage(fold_coverage, number_of_parts)):
+                # parts write sam files, the merged sam output is streamed into the bam stage if enabled
+                task = self._get_task(
+                    file_path_input=file_path_input,
+                    fold_coverage=part_fold_coverage,
+                    file_path_output_prefix=part_merger.get_part_prefix(file_path_output_prefix, part),
+                    stream_sam=False)
+                task.cost = cost / float(number_of_parts)
+                tasks.append(task)
+            pending_jobs.append(job)
+        self._random = random
+        if len(dict_id_number_of_parts) > 0:
+            self._split_jobs[directory_output] = dict_id_number_of_parts
+        if len(pending_jobs) > 0:
+            self._pending_jobs[directory_output] = pending_jobs
+        return tasks
+
+    def _get_fair_share(self, jobs):
+        """
+        Cost per process of jobs run at once
+
+        @param jobs: Genome id, coverage, cost and description of each job
+        @type jobs: list[(str|unicode, int|float, float, dict)]
+
+        @rtype: float
+        """
+        return sum(cost for genome_id, fold_coverage, cost, job in jobs) / float(self._max_processes)
+
+    def _get_job(self, directory_output, genome_id, fold_coverage, file_path_input, seed):
+        """
+        Describe the simulation of the reads of a genome, to test and record its completion.
+        The seed is recorded, but not part of the parameters of the manifest, since it differs between runs without seed.
+        Reads are cached by genome content, simulator settings and seed.
+
+        @param directory_output: Directory for the sam and fastq files output
+        @type directory_output: str | unicode
+        @param genome_id: Genome id
+        @type genome_id: str | unicode
+        @param fold_coverage: coverage of a genome, number of reads for wgsim/nanosim
+        @type fold_coverage: int  | float
+        @param file_path_input: Path to genome fasta file
+        @type file_path_input: str | unicode
+        @param seed: Seed of the random number generator of the job
+        @type seed: int
+
+        @rtype: dict
+        """
+        parameters = [
+            self._label, fold_coverage, self._read_length,
+            self._get_profile(),
+            getattr(self, "_fragment_size_mean", None),
+            getattr(self, "_fragment_size_standard_deviation", None),
+            self._samtools is not None]
+        key = None
+        if self._read_cache is not None:
+            checksum = self._genome_statistics.get_statistics(file_path_input)["md5"]
+            key = self._read_cache.get_key(parameters + [checksum, seed])
+        return {
+            "job": os.path.join(directory_output, str(genome_id)),
+            "parameters": parameters,
+            "seed": seed,
+            "key": key,
+            "directory_output": directory_output,
+            "genome_id": str(genome_id),
+            "directory_bam": self._directory_bam}
+
+    def _get_output_file_paths(self, directory_output, genome_id, directory_bam):
+        """
+        Output files of the reads of a genome, paired-end fastq files and a sam or bam file by default
+
+        @param directory_output: Directory for the sam and fastq files output
+        @type directory_output: str | unicode
+        @param genome_id: Genome id
+        @type genome_id: str | unicode
+        @param directory_bam: Output directory of the bam files, if sam output is streamed
+        @type directory_bam: str | unicode | None
+
+        @rtype: list[str|unicode]
+        """
+        file_path_output_prefix = os.path.join(directory_output, genome_id)
+        return [file_path_output_prefix + '1.fq', file_path_output_prefix + '2.fq'] + self._get_sam_output_file_paths(
+            directory_output, genome_id, directory_bam)
+
+    def _get_sam_output_file_paths(self, directory_output, genome_id, directory_bam):
+        """
+        Sam file of a genome, or its bam file and index if sam output is streamed
+
+        @rtype: list[str|unicode]
+        """
+        if self._samtools is None:
+            return [os.path.join(directory_output, genome_id + ".sam")]
+        file_path_bam = os.path.join(directory_bam, genome_id + ".bam")
+        return [file_path_bam, file_path_bam + ".bai"]
+
+    def _record_job(self, job, cache=True):
+        """
+        Record a job as complete in the manifest and add its output to the cache, if its output files are complete
+
+        @param job: Job as described by '_get_job'
+        @type job: dict
+        @param cache: If false, the output is not added to the cache
+        @type cache: bool
+        """
+        list_of_file_paths = self._get_output_file_paths(job["directory_output"], job["genome_id"], job["directory_bam"])
+        if self._manifest is not None:
+            self._manifest.add(job["job"], job["parameters"], list_of_file_paths, seed=job["seed"])
+        if self._read_cache is not None and cache:
+            # files are cached by their names without the genome id
+            self._read_cache.add(job["key"], {
+                os.path.basename(file_path)[len(job["genome_id"]):]: file_path for file_path in list_of_file_paths})
+
+    def _restore_cached_job(self, job):
+        """
+        Restore the output of a job from the cache
+
+        @param job: Job as described by '_get_job'
+        @type job: dict
+
+        @return: True if the job was found
+        @rtype: bool
+        """
+        if self._read_cache is None:
+            return False
+        list_of_names = self._read_cache.get_file_names(job["key"])
+        if list_of_names is None:
+            return False
+        dict_name_to_file_path = {}
+        for name in list_of_names:
+            directory = job["directory_output"]
+            if name.startswith(".bam"):
+                directory = job["directory_bam"]
+            dict_name_to_file_path[name] = os.path.join(directory, job["genome_id"] + name)
+        self._read_cache.restore(job["key"], dict_name_to_file_path)
+        self._record_job(job, cache=False)
+        return True
+
+    def _record_pending_jobs(self, directory_output, cache=True):
+        """
+        Record the jobs of a sample, whose output was completed by '_post_process'
+
+        @param directory_output: Directory for the sam and fastq files output
+        @type directory_output: str | unicode
+        @param cache: If false, the output is not added to the cache
+        @type cache: bool
+        """
+        for job in self._pending_jobs.pop(directory_output, []):
+            self._record_job(job, cache=cache)
+
+    def _task_done(self, task, succeeded):
+        """
+        Record the job of a task as soon as the task is done, if the task is all of the job
+
+        @param task: Task as build by '_get_task'
+        @type task: TaskCmd | TaskThread
+        @param succeeded: True if the task did not fail
+        @type succeeded: bool
+        """
+        job = self._task_jobs.pop(id(task), None)
+        if job is not None and succeeded:
+            self._record_job(job)
+
+    def defer_tasks(self, subsample=False):
+        """
+        Collect the tasks of following 'simulate' calls, instead of running them sample by sample.
+        All of them are run at once by 'run_deferred_tasks', so no processor idles while a sample finishes.
+
+        @param subsample: If true, the reads of a genome are simulated once at the highest coverage of all samples
+            and each sample gets a seeded subsample of the read pairs, for samples of the same genomes
+        @type subsample: bool
+        """
+        self._deferred_jobs = []
+        self._subsampled_jobs = None
+        if subsample and not self._can_subsample:
+            self._logger.warning("Reads of {} can not be subsampled, simulating each sample".format(self._label))
+        elif subsample:
+            self._subsampled_jobs = []
+
+    def run_deferred_tasks(self):
+        """
+        Run all tasks collected since 'defer_tasks' was called, the most costly ones first.
+        Jobs are split by a fair share of the jobs of all samples.
+        """
+        assert self._deferred_jobs is not None, "Tasks are not deferred"
+        if self._subsampled_jobs is not None:
+            self._run_subsampled_jobs()
+            return
+        deferred_jobs = self._deferred_jobs
+        self._deferred_jobs = None
+        fair_share = self._get_fair_share([
+            job for jobs, directory_output, dict_id_file_path, directory_bam in deferred_jobs for job in jobs])
+        tasks = []
+        for jobs, directory_output, dict_id_file_path, self._directory_bam in deferred_jobs:
+            tasks.extend(self._get_tasks(jobs, dict_id_file_path, directory_output, fair_share))
+        self._logger.info("Simulating reads of {} samples...".format(len(deferred_jobs)))
+        self._run_tasks(tasks)
+        for jobs, directory_output, dict_id_file_path, self._directory_bam in deferred_jobs:
+            self._post_process(directory_output, dict_id_file_path)
+            self._record_pending_jobs(directory_output)
+        self._logger.info("Simulating reads finished")
+
+    def _run_subsampled_jobs(self):
+        """
+        Simulate the reads of each genome once at the highest coverage of all samples into a temporary directory,
+        then write a subsample of the read pairs of each sample at its own coverage ratio, one task per genome and sample
+        """
+        subsampled_jobs = self._subsampled_jobs
+        self._subsampled_jobs = None
+        self._deferred_jobs = None
+        dict_id_jobs = {}
+        dict_id_file_path = {}
+        for genome_id, fold_coverage, cost, file_path_input, job in subsampled_jobs:
+            dict_id_jobs.setdefault(genome_id, []).append((fold_coverage, cost, job))
+            dict_id_file_path[genome_id] = file_path_input
+        directory_pool = tempfile.mkdtemp(dir=self._tmp_dir, prefix="subsampled_reads_")
+
+        pool_jobs = []
+        dict_id_remaining_jobs = {}
+        for genome_id, list_of_jobs in dict_id_jobs.items():
+            max_fold_coverage = max(fold_coverage for fold_coverage, cost, job in list_of_jobs)
+            max_cost = max(cost for fold_coverage, cost, job in list_of_jobs)
+            seed = random.randint(0, sys.maxsize)
+            for fold_coverage, cost, job in list_of_jobs:
+                # the subsample depends on the reads simulated for all samples
+                job["parameters"] += ["subsample", max_fold_coverage]
+                job["seed"] = [seed, job["seed"]]
+                if self._read_cache is not None:
+                    job["key"] = self._read_cache.get_key(job["parameters"] + [job["key"], seed])
+                if self._is_job_complete(job):
+                    continue
+                fraction = fold_coverage / float(max_fold_coverage) if max_fold_coverage > 0 else 0.
+                dict_id_remaining_jobs.setdefault(genome_id, []).append((fraction, job))
+            if genome_id not in dict_id_remaining_jobs:
+                continue
+            pool_jobs.append((genome_id, max_fold_coverage, max_cost, self._get_job(
+                directory_pool, genome_id, max_fold_coverage, dict_id_file_path[genome_id], seed)))
+
+        self._logger.info("Simulating reads of {} genomes once for all samples...".format(len(pool_jobs)))
+        # simulated reads are kept as sam files to be subsampled, and not recorded as output of a sample
+        samtools, manifest = self._samtools, self._manifest
+        self._samtools, self._manifest = None, None
+        try:
+            tasks = self._get_tasks(pool_jobs, dict_id_file_path, directory_pool)
+            # the temporary pool output is recorded once complete, but never cached
+            self._pending_jobs.setdefault(directory_pool, []).extend(
+                self._task_jobs.pop(id(task)) for task in tasks if id(task) in self._task_jobs)
+            self._run_tasks(tasks)
+            self._post_process(directory_pool, dict_id_file_path)
+            self._record_pending_jobs(directory_pool, cache=False)
+        finally:
+            self._samtools, self._manifest = samtools, manifest
+
+        dict_id_max_cost = {genome_id: max_cost for genome_id, max_fold_coverage, max_cost, job in pool_jobs}
+        tasks = []
+        for genome_id, list_of_jobs in dict_id_remaining_jobs.items():
+            file_path_input_prefix = os.path.join(directory_pool, genome_id)
+            for fraction, job in list_of_jobs:
+                self._logger.info("Subsampling {:.1%} of the reads of {} into '{}'".format(
+                    fraction, genome_id, job["directory_output"]))
+                bam_writer = None
+                memory = 0
+                if self._samtools is not None:
+                    bam_writer = self._samtools.open_sam_stream(genome_id, job["directory_bam"])
+                    memory = self._samtools.get_memory_estimate()
+                # each task reads all reads simulated for the genome
+                task = TaskThread(subsampler.subsample_genome, (
+                    file_path_input_prefix, os.path.join(job["directory_output"], genome_id),
+                    fraction, job["seed"][1], bam_writer), cost=dict_id_max_cost[genome_id], memory=memory)
+                self._task_jobs[id(task)] = job
+                tasks.append(task)
+        list_of_return_values, busy_fraction = runThreadScheduled(
+            tasks, maxThreads=self._max_processes,
+            callback=lambda task, return_value: self._task_done(task, return_value is None),
+            maxMemory=self._memory_budget)
+        self._logger.info("{} subsampling tasks kept {:.0%} of {} processes busy".format(
+            len(tasks), busy_fraction, self._max_processes))
+        list_of_errors = [str(return_value) for return_value in list_of_return_values if return_value is not None]
+        if not self._debug:
+            shutil.rmtree(directory_pool)
+        if len(list_of_errors) > 0:
+            for error in list_of_errors:
+                self._logger.error(error)
+            msg = "{} subsampling tasks failed!".format(len(list_of_errors))
+            self._logger.error(msg)
+            raise OSError(msg)
+        self._logger.info("Simulating reads finished")
+
+    def _post_process(self, directory_output, dict_id_file_path):
+        """
+        Process the output of the read simulator once all its tasks of a sample are done.
+        By default the parts of split jobs are merged.
+
+        @param directory_output: Directory for the sam and fastq files output
+        @type directory_output: str | unicode
+        @param dict_id_file_path: Dictionary of genome id to file path
+        @type dict_id_file_path: dict[str|unicode, str|unicode]
+        """
+        dict_id_number_of_parts = self._split_jobs.pop(directory_output, {})
+        for genome_id, number_of_parts in dict_id_number_of_parts.items():
+            self._logger.info("Merging {} parts of {}".format(number_of_parts, genome_id))
+            file_path_output_prefix = os.path.join(directory_output, str(genome_id))
+            with self._open_sam(directory_output, str(genome_id)) as stream_sam:
+                part_merger.merge_paired_parts(file_path_output_prefix, number_of_parts, stream_sam)
+
+    @staticmethod
+    def _split_fold_coverage(fold_coverage, number_of_parts):
+        """
+        Split the coverage of a genome, or its number of reads, among parts
+
+        @param fold_coverage: coverage of a genome, number of reads if integer
+        @type fold_coverage: int  | float
+        @param number_of_parts: Number of parts
+        @type number_of_parts: int
+
+        @return: coverage or number of reads of each part
+        @rtype: list[int|float]
+        """
+        if isinstance(fold_coverage, int):
+            quotient, remainder = divmod(fold_coverage, number_of_parts)
+            return [quotient + 1 if part < remainder else quotient for part in range(number_of_parts)]
+        return [fold_coverage / float(number_of_parts)] * number_of_parts
+
+    def _get_task(self, file_path_input, fold_coverage, file_path_output_prefix, stream_sam=True):
+        """
+        Build the task simulating the reads of one genome, a system command by default.
+
+        @param file_path_input: Path to genome fasta file
+        @type file_path_input: str | unicode
+        @param fold_coverage: coverage of a genome
+        @type fold_coverage: int  | float
+        @param file_path_output_prefix: Output prefix used by the read simulator
+        @type file_path_output_prefix: str | unicode
+        @param stream_sam: If false a sam file is written even though sam output is streamed
+        @type stream_sam: bool
+
+        @return: Task to be run in parallel
+        @rtype: TaskCmd | TaskThread
+        """
+        system_command = self._get_sys_cmd(
+            file_path_input=file_path_input,
+            fold_coverage=fold_coverage,
+            file_path_output_prefix=file_path_output_prefix)
+        stream_sam = self._samtools is not None and self._simulator_writes_sam and stream_sam
+        if stream_sam:
+            system_command = self._samtools.get_fifo_to_bam_cmd(
+                system_command, file_path_output_prefix + '.sam', self._directory_bam)
+        self._logger.debug("SysCmd: '{}'".format(system_command))
+        return TaskCmd(system_command, memory=self._get_memory_estimate(file_path_input, stream_sam))
+
+    def _get_memory_estimate(self, file_path_input, stream_sam):
+        """
+        Estimate the memory of a task from the size of its genome.
+        A sam output streamed by the task adds the memory of sorting it into a bam file.
+
+        @param file_path_input: Path to genome fasta file
+        @type file_path_input: str | unicode
+        @param stream_sam: If true, the task streams its sam output into a bam file
+        @type stream_sam: bool
+
+        @return: memory in bytes
+        @rtype: int
+        """
+        constant, per_base_pair = self._memory_usage
+        genome_length = self._genome_statistics.get_statistics(file_path_input)["total_length"]
+        memory = constant + per_base_pair * genome_length
+        if stream_sam:
+            memory += self._samtools.get_memory_estimate()
+        return int(memory)
+
+    def _run_tasks(self, tasks):
+        """
+        Run read simulation tasks in parallel
+
+        @param tasks: Tasks as build by '_get_task'
+        @type tasks: list[TaskCmd]
+        """
+        list_of_fails, busy_fraction = runCmdScheduled(
+            tasks, maxProc=self._max_processes,
+            callback=lambda task, process: self._task_done(task, process.returncode == 0),
+            maxMemory=self._memory_budget)
+        self._logger.info("{} simulation tasks kept {:.0%} of {} processes busy".format(
+            len(tasks), busy_fraction, self._max_processes))
+        for message in reportMemoryUsage(tasks):
+            self._logger.debug(message)
 
         if list_of_fails is not None:
             self._logger.error("{} commands returned errors!".format(len(list_of_fails)))
             reportFailedCmd(list_of_fails)
-        self._logger.info("Simulating reads finished")
 
     def _get_sys_cmd(file_path_input, fold_coverage, file_path_output_prefix):
         """
@@ -297,6 +871,8 @@ class ReadSimulationPBsim(ReadSimulationWrapper):
     """
 
     _label = "ReadSimulationPBsim"
+    _has_post_processing = True
+    _memory_usage = (50 * 2**20, 3)
 
 
     def __init__(self, file_path_executable, directory_error_profiles, **kwargs):
@@ -353,27 +929,15 @@ class ReadSimulationPBsim(ReadSimulationWrapper):
 
         self._logger.debug("Multiplication factor: {}".format(factor))
         self._simulate_reads(dict_id_abundance, dict_id_file_path, factor, directory_output)
-        sequence_map = maf_converter.main(directory_output)
-        self._fix_extensions(directory_output, sequence_map)
 
-    def _fix_extensions(self, directory_output, sequence_map): # rename fastq to fq
-        files = os.listdir(directory_output)
-        for f in files:
-            if (f.endswith("fastq")):
-                oldname = "%s/%s" % (directory_output,f)
-                prefix = f.rsplit('_',1)[0] # original name
-                with open(oldname,'r') as reads:
-                    newname = "%s/%s.fq" % (directory_output,"".join(f.split(".")[:-1]))
-                    with open(newname, 'w') as fq: # rename file to fq and rename sequence names
-                        for line in reads:
-                            if len(line) < 1:
-                                continue
-                            seq_name = line[1:].strip()
-                            if seq_name in sequence_map[prefix]:
-                                newline = line[0] + sequence_map[prefix][seq_name] + '\n'
-                                fq.write(newline)
-                            else:
-                                fq.write(line)
+    def _post_process(self, directory_output, dict_id_file_path):
+        # sam output and renamed fq files are written in a single pass over the maf and fastq files
+        maf_converter.main(directory_output, open_sam=functools.partial(self._open_sam, directory_output))
+
+    def _get_output_file_paths(self, directory_output, genome_id, directory_bam):
+        # pbsim writes a fastq file per sequence, numbered with four digits
+        pattern = os.path.join(glob.escape(directory_output), glob.escape(genome_id) + "_[0-9][0-9][0-9][0-9].fq")
+        return sorted(glob.glob(pattern)) + self._get_sam_output_file_paths(directory_output, genome_id, directory_bam)
     
     def _get_sys_cmd(self, file_path_input, fold_coverage, file_path_output_prefix):
         """
@@ -427,6 +991,9 @@ class ReadSimulationNanosim3(ReadSimulationWrapper):
     """
 
     _label = "ReadSimulationNanosim"
+    _has_post_processing = True
+    # python process loading the trained error models
+    _memory_usage = (2 * 2**30, 10)
 
     def __init__(self, file_path_executable, directory_error_profiles, **kwargs):
         super(ReadSimulationNanosim3, self).__init__(file_path_executable, **kwargs)
@@ -474,25 +1041,31 @@ class ReadSimulationNanosim3(ReadSimulationWrapper):
 
         self._logger.debug("Multiplication factor: {}".format(factor))
         self._simulate_reads(dict_id_abundance, dict_id_file_path, factor, directory_output)
+
+    def _post_process(self, directory_output, dict_id_file_path):
         self._sam_from_reads(directory_output, dict_id_file_path)
 
+    def _get_output_file_paths(self, directory_output, genome_id, directory_bam):
+        return [os.path.join(directory_output, genome_id + ".fq")] + self._get_sam_output_file_paths(
+            directory_output, genome_id, directory_bam)
+
     def _sam_from_reads(self, directory_output, dict_id_file_path):
         files = os.listdir(directory_output)
-        id_to_cigar_map = {}
-        for f in files:
-            if f.endswith("_error_profile"): # these are the introduced errors by Nanosim
-                prefix = f.rsplit("_",3)[0] # get basename (changed in NanoSim3)
-                id_to_cigar_map[prefix] = sam_from_reads.get_cigars_nanosim(os.path.join(directory_output,f))
-                #os.remove(os.path.join(directory_output,f)) # error_profile files are huge (TODO temporary requirement is still high)
+        dict_prefix_to_read_files = {}
         for f in files:
             if f.endswith("_reads.fasta"):
                 prefix = f.rsplit(".",1)[0].rsplit("_",2)[0] #_aligned
-                read_file = os.path.join(directory_output,f)
-                cigars = id_to_cigar_map[prefix]
-                reference_path = dict_id_file_path[prefix]
-                sam_from_reads.write_sam(read_file, cigars, reference_path, prefix)
-                sam_from_reads.convert_fasta(read_file, reference_path)
-                #os.remove(os.path.join(directory_output,f)) # do not store read file twice
+                dict_prefix_to_read_files.setdefault(prefix, []).append(os.path.join(directory_output,f))
+        for prefix, read_files in dict_prefix_to_read_files.items():
+            # names and lengths of reference sequences are taken from the genome index
+            references = self._genome_statistics.get_statistics(dict_id_file_path[prefix])["sequence_lengths"]
+            # aligned and unaligned reads of a genome go into the same sam and fastq output
+            with self._open_sam(directory_output, prefix) as samfile, \
+                    sam_from_reads.open_fastq(directory_output, prefix) as fastq:
+                sam_from_reads.write_header(samfile, references)
+                for read_file in read_files:
+                    sam_from_reads.write_sam(read_file, references, samfile, fastq)
+                    #os.remove(read_file) # do not store read file twice
 
     def _get_sys_cmd(self, file_path_input, fold_coverage, file_path_output_prefix):
         """
@@ -534,6 +1107,9 @@ class ReadSimulationNanosim(ReadSimulationWrapper):
     """
 
     _label = "ReadSimulationNanosim"
+    _has_post_processing = True
+    # python process loading the trained error models
+    _memory_usage = (2 * 2**30, 10)
 
     def __init__(self, file_path_executable, directory_error_profiles, **kwargs):
         super(ReadSimulationNanosim, self).__init__(file_path_executable, **kwargs)
@@ -581,25 +1157,34 @@ class ReadSimulationNanosim(ReadSimulationWrapper):
 
         self._logger.debug("Multiplication factor: {}".format(factor))
         self._simulate_reads(dict_id_abundance, dict_id_file_path, factor, directory_output)
+
+    def _post_process(self, directory_output, dict_id_file_path):
         self._sam_from_reads(directory_output, dict_id_file_path)
 
+    def _get_output_file_paths(self, directory_output, genome_id, directory_bam):
+        return [os.path.join(directory_output, genome_id + ".fq")] + self._get_sam_output_file_paths(
+            directory_output, genome_id, directory_bam)
+
     def _sam_from_reads(self, directory_output, dict_id_file_path):
         files = os.listdir(directory_output)
-        id_to_cigar_map = {}
         for f in files:
-            if f.endswith("_error_profile"): # these are the introduced errors by Nanosim
-                prefix = f.rsplit("_",2)[0] # get basename
-                id_to_cigar_map[prefix] = sam_from_reads.get_cigars_nanosim(os.path.join(directory_output,f))
-                os.remove(os.path.join(directory_output,f)) # error_profile files are huge (TODO temporary requirement is still high)
+            if f.endswith("_error_profile"): # these are the introduced errors by Nanosim, not used in sam output
+                os.remove(os.path.join(directory_output,f)) # error_profile files are huge
+        dict_prefix_to_read_files = {}
         for f in files:
             if f.endswith("_reads.fasta"):
                 prefix = f.rsplit(".",1)[0].rsplit("_",1)[0]
-                read_file = os.path.join(directory_output,f)
-                cigars = id_to_cigar_map[prefix]
-                reference_path = dict_id_file_path[prefix]
-                sam_from_reads.write_sam(read_file, cigars, reference_path, prefix)
-                sam_from_reads.convert_fasta(read_file, reference_path)
-                os.remove(os.path.join(directory_output,f)) # do not store read file twice
+                dict_prefix_to_read_files.setdefault(prefix, []).append(os.path.join(directory_output,f))
+        for prefix, read_files in dict_prefix_to_read_files.items():
+            # names and lengths of reference sequences are taken from the genome index
+            references = self._genome_statistics.get_statistics(dict_id_file_path[prefix])["sequence_lengths"]
+            # aligned and unaligned reads of a genome go into the same sam and fastq output
+            with self._open_sam(directory_output, prefix) as samfile, \
+                    sam_from_reads.open_fastq(directory_output, prefix) as fastq:
+                sam_from_reads.write_header(samfile, references)
+                for read_file in read_files:
+                    sam_from_reads.write_sam(read_file, references, samfile, fastq)
+                    os.remove(read_file) # do not store read file twice
 
     def _get_sys_cmd(self, file_path_input, fold_coverage, file_path_output_prefix):
         """
@@ -643,6 +1228,10 @@ class ReadSimulationWgsim(ReadSimulationWrapper):
     Simulate reads using wgsim
     """
     _label = "ReadSimulationWgsim"
+    _simulator_writes_sam = True
+    _can_split_jobs = True
+    _can_subsample = True
+    _memory_usage = (10 * 2**20, 1)
     
     def __init__(self, file_path_executable, directory_error_profiles, **kwargs):
         super(ReadSimulationWgsim, self).__init__(file_path_executable, **kwargs)
@@ -727,7 +1316,7 @@ class ReadSimulationWgsim(ReadSimulationWrapper):
             '-N', str(fold_coverage),  # rename this, because its not the fold_coverage for wgsim
             '-1', str(self._read_length),
             '-2', str(self._read_length),
-            '-S', str(self._get_seed()),
+            '-S', str(1 + self._get_seed() % (2**31 - 1)),  # wgsim seed must be a positive int, else time is used
             ]
         # errors
         arguments.extend([
@@ -762,6 +1351,11 @@ class ReadSimulationArt(ReadSimulationWrapper):
     Currently pair-end reads only!
     """
     _label = "ReadSimulationArtIllumina"
+    _simulator_writes_sam = True
+    _can_split_jobs = True
+    _can_subsample = True
+    # sequence and its reverse complement, quality profiles
+    _memory_usage = (200 * 2**20, 2)
 
     _art_error_profiles = {
         "mi": "EmpMiSeq250R",
@@ -789,6 +1383,10 @@ class ReadSimulationArt(ReadSimulationWrapper):
         self._read_length = self._art_read_length["mbarc"]
         self._directory_error_profiles = directory_error_profiles
 
+    def _get_profile(self):
+        # an own profile is identified by its files
+        return self._art_error_profiles[self._profile]
+
     def simulate(
         self, file_path_distribution, file_path_genome_locations, directory_output,
         total_size, profile, fragment_size_mean, fragment_size_standard_deviation,
@@ -915,6 +1513,153 @@ class ReadSimulationArt(ReadSimulationWrapper):
         return cmd
 
 
+# #################
+# ReadSimulationNumpy - in-process illumina-like paired-end simulator
+# #################
+
+
+class ReadSimulationNumpy(ReadSimulationWrapper):
+    """
+    Simulate paired-end reads in-process with numpy, output is compatible to art illumina
+    Substitution errors only, with an error rate increasing along the read
+    """
+    _label = "ReadSimulationNumpy"
+    _can_split_jobs = True
+    _can_subsample = True
+    # read pairs drawn at once per task
+    _batch_size = 100000
+    # genome and its reverse complement as arrays
+    _memory_usage = (100 * 2**20, 2)
+    # arrays of a batch of read pairs, in bytes per base pair of a read
+    _batch_memory_per_base_pair = 40
+
+    # profile: read length, error rate of first base, error rate of last base
+    _numpy_error_profiles = {
+        "errorfree": (150, 0., 0.),
+        "mi": (250, 0.001, 0.02),
+        "hi": (100, 0.001, 0.01),
+        "hi150": (150, 0.001, 0.01),
+        "mbarc": (150, 0.001, 0.015)}
+
+    def __init__(self, file_path_executable, directory_error_profiles, **kwargs):
+        # no executable or error profile files required
+        super(ReadSimulationNumpy, self).__init__(None, **kwargs)
+        self._profile = "mbarc"
+        self._read_length = self._numpy_error_profiles["mbarc"][0]
+
+    def simulate(
+        self, file_path_distribution, file_path_genome_locations, directory_output,
+        total_size, profile, fragment_size_mean, fragment_size_standard_deviation):
+        """
+        Simulate reads based on a given sample distribution
+
+        @param file_path_distribution: File genome id associated with the abundance of a genome
+        @type file_path_distribution: str | unicode
+        @param file_path_genome_locations: File genome id associated with the file path of a genome
+        @type file_path_genome_locations: str | unicode
+        @param directory_output: Directory for the sam and fastq files output
+        @type directory_output: str | unicode
+        @param total_size: Size of sample in base pairs
+        @type total_size: int
+        @param profile: Error profile: 'errorfree', 'mi', 'hi', 'hi150', 'mbarc'
+        @type profile: str | unicode
+        @param fragment_size_mean: Size of the fragment of which the ends are used as reads in base pairs
+        @type fragment_size_mean: int
+        @param fragment_size_standard_deviation: Standard deviation of the fragment size in base pairs.
+        @type fragment_size_standard_deviation: int
+        """
+        assert isinstance(total_size, (float, int)), "Expected natural digit"
+        assert isinstance(fragment_size_mean, int), "Expected natural digit"
+        assert isinstance(fragment_size_standard_deviation, int), "Expected natural digit"
+        assert total_size > 0, "Total size needs to be a positive number"
+        assert fragment_size_mean > 0, "Mean fragments size needs to be a positive number"
+        assert fragment_size_standard_deviation > 0, "Fragment size standard deviation needs to be a positive number"
+        assert self.validate_dir(directory_output)
+        if profile is not None:
+            assert profile in self._numpy_error_profiles, "Unknown numpy error profile: '{}'".format(profile)
+            self._profile = profile
+        self._read_length = self._numpy_error_profiles[self._profile][0]
+        assert self.validate_number(fragment_size_mean, minimum=self._read_length)
+        assert self.validate_number(fragment_size_standard_deviation, minimum=0)
+        self._fragment_size_mean = fragment_size_mean
+        self._fragment_size_standard_deviation = fragment_size_standard_deviation
+        self._logger.info("Using '{}' error profile.".format(self._profile))
+
+        dict_id_abundance = self._read_distribution_file(file_path_distribution)
+        dict_id_file_path = self._read_genome_location_file(file_path_genome_locations)
+        locs = set(dict_id_abundance.keys()) - set(dict_id_file_path.keys())
+        assert set(dict_id_file_path.keys()).issuperset(dict_id_abundance.keys()), "Some ids do not have a genome location %s" % locs
+
+        min_sequence_length = self._fragment_size_mean - self._fragment_size_standard_deviation
+        factor = self.get_multiplication_factor(
+            dict_id_file_path, dict_id_abundance, total_size, min_sequence_length,
+            file_format="fasta", sequence_type="dna", ambiguous=True)
+
+        self._logger.debug("Multiplication factor: {}".format(factor))
+        self._simulate_reads(dict_id_abundance, dict_id_file_path, factor, directory_output)
+
+    def _get_task(self, file_path_input, fold_coverage, file_path_output_prefix, stream_sam=True):
+        """
+        Build the task simulating the reads of one genome.
+
+        @param file_path_input: Path to genome fasta file
+        @type file_path_input: str | unicode
+        @param fold_coverage: coverage of a genome
+        @type fold_coverage: int  | float
+        @param file_path_output_prefix: Output prefix of the fastq and sam files
+        @type file_path_output_prefix: str | unicode
+        @param stream_sam: If false a sam file is written even though sam output is streamed
+        @type stream_sam: bool
+
+        @return: Task to be run in parallel
+        @rtype: TaskThread
+        """
+        assert self.validate_file(file_path_input)
+        assert isinstance(fold_coverage, (int, float))
+        assert self.validate_dir(file_path_output_prefix, only_parent=True)
+
+        read_length, error_rate_start, error_rate_end = self._numpy_error_profiles[self._profile]
+        bam_writer = None
+        if self._samtools is not None and stream_sam:
+            bam_writer = self._samtools.open_sam_stream(os.path.basename(file_path_output_prefix), self._directory_bam)
+        # genomes filtered by sequence length are not stored
+        genome = None
+        if self._genome_store is not None:
+            genome = self._genome_store.get_genome(file_path_input)
+        args = (
+            file_path_input, fold_coverage, file_path_output_prefix, read_length,
+            self._fragment_size_mean, self._fragment_size_standard_deviation,
+            error_rate_start, error_rate_end, self._get_seed(), self._batch_size, bam_writer, genome)
+        memory = self._get_memory_estimate(file_path_input, bam_writer is not None)
+        if genome is not None:
+            # the memory mapped store is shared by all tasks
+            constant, per_base_pair = self._memory_usage
+            memory -= per_base_pair * self._genome_statistics.get_statistics(file_path_input)["total_length"]
+        memory += self._batch_size * self._batch_memory_per_base_pair * read_length
+        return TaskThread(numpy_simulator.simulate_paired_reads, args, memory=memory)
+
+    def _run_tasks(self, tasks):
+        """
+        Run read simulation tasks in parallel
+
+        @param tasks: Tasks as build by '_get_task'
+        @type tasks: list[TaskThread]
+        """
+        list_of_return_values, busy_fraction = runThreadScheduled(
+            tasks, maxThreads=self._max_processes,
+            callback=lambda task, return_value: self._task_done(task, return_value is None),
+            maxMemory=self._memory_budget)
+        self._logger.info("{} simulation tasks kept {:.0%} of {} processes busy".format(
+            len(tasks), busy_fraction, self._max_processes))
+        list_of_errors = [str(return_value) for return_value in list_of_return_values if return_value is not None]
+        if len(list_of_errors) > 0:
+            for error in list_of_errors:
+                self._logger.error(error)
+            msg = "{} read simulation tasks failed!".format(len(list_of_errors))
+            self._logger.error(msg)
+            raise OSError(msg)
+
+
 # #################
 # #################
 #
@@ -1051,5 +1796,6 @@ dict_of_read_simulators = {
     "wgsim": ReadSimulationWgsim,
     "nanosim": ReadSimulationNanosim,
     "nanosim3": ReadSimulationNanosim3,
-    "pbsim": ReadSimulationPBsim
+    "pbsim": ReadSimulationPBsim,
+    "numpy": ReadSimulationNumpy
 }
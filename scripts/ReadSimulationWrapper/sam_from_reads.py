@@ -1,121 +1,83 @@
 import os
-import re
-from Bio import SeqIO
 
-def write_header(sam_file, sequence_ids):
-        with open(sam_file, "w") as samfile:
-            samfile.write("@HD\tVN:1.4\tSQ:unsorted\n")
-            for prefix in sequence_ids:
-                samfile.write("@SQ\tSN:{name}\tLN:{len}\n".format(name=prefix, len=len(sequence_ids[prefix])))
+# size of the write buffer of fastq output
+buffer_size = 2**20
 
-def write_sam(read_file, id_to_cigar_map, reference_path, orig_prefix):
-    references = SeqIO.to_dict(SeqIO.parse(reference_path, "fasta"))
-    fixed_names = {x.split('.',1)[0].replace("_","-"):x for x in references}
-    write_sam = os.path.join(read_file.rsplit("/",1)[0], orig_prefix) + ".sam"
-    if (not os.path.exists(write_sam)):
-        write_header(write_sam, references)
-    with open(read_file, 'r') as reads:
+
+def write_header(samfile, references):
+    """
+    Write sam header of a genome
+
+    @param samfile: Sam output
+    @type samfile: file | BamWriter
+    @param references: Id and length of each sequence of the genome, like the first columns of a '.fai' index
+    @type references: list[(str|unicode, int)]
+
+    @return: references
+    @rtype: list[(str|unicode, int)]
+    """
+    samfile.write("@HD\tVN:1.4\tSQ:unsorted\n")
+    for name, length in references:
+        samfile.write("@SQ\tSN:{name}\tLN:{len}\n".format(name=name, len=length))
+    return references
+
+
+def write_sam(read_file, references, samfile, fastq):
+    """
+    Convert a nanosim '_reads.fasta' file in a single pass into sam lines and fastq records.
+    Nanosim writes each read on a single line, read names are replaced by '<sequence_id>-<index>'.
+
+    @param read_file: Reads simulated by nanosim
+    @type read_file: str | unicode
+    @param references: Id and length of each sequence of the genome, like the first columns of a '.fai' index
+    @type references: list[(str|unicode, int)]
+    @param samfile: Sam output
+    @type samfile: file | BamWriter
+    @param fastq: Fastq output
+    @type fastq: file
+    """
+    # nanosim cuts sequence ids at the first '.' and replaces '_' by '-'
+    fixed_names = {name.split('.', 1)[0].replace("_", "-"): name for name, length in references}
+    MAPQ = "255"
+    RNEXT = '*'
+    PNEXT = '0'
+    QUAL = '*'  # no quality for nanosim
+    with open(read_file, 'r', buffer_size) as reads:
         for line in reads:
             if line.startswith('>'):
-                name, start, align_status, index, strand, soffset, align_length, eoffset = line.strip().replace(';','_').split('_')
-                ref_name = name[1:] # first sign of name is ">"
-                ref_name_fixed = fixed_names[ref_name]
-                query = ref_name + "-" + start 
-                QNAME = ref_name_fixed + "-" + index 
-                if strand == 'R':
-                    FLAG = str(16)
-                else:
-                    FLAG = str(0)
-                if align_status == "unaligned": #special cigar/no pos for non-mapping reads
-                    POS = str(0)
-                    CIGAR = "*"
-                    RNAME = "*" # treated as unmapped
-                    FLAG = str(4)
-                else:
+                name, start, align_status, index, strand, soffset, align_length, eoffset = line.strip().replace(';', '_').split('_')
+                ref_name_fixed = fixed_names[name[1:]]  # first sign of name is ">"
+                QNAME = ref_name_fixed + "-" + index
+                if align_status == "unaligned":  # special cigar/no pos for non-mapping reads
+                    FLAG = "4"
+                    RNAME = "*"  # treated as unmapped
+                    POS = "0"
+                elif strand == 'R':
+                    FLAG = "16"
+                    RNAME = ref_name_fixed
                     POS = start
-                    try:
-                        CIGAR, pos = id_to_cigar_map[query]
-                    except KeyError: #sequence did not have any errors
-                        CIGAR, pos = "%sM" % align_length, align_length
+                else:
+                    FLAG = "0"
                     RNAME = ref_name_fixed
-                MAPQ = str(255)
-                RNEXT = '*'
-                PNEXT = '0'
-                QUAL = '*'  # no quality for nanosim
-            else:
-                SEQ = line.strip()
-                TLEN = str(len(SEQ)) 
-                if CIGAR != '*': # unmapped bases counted as insertions in read
-                    CIGAR = str(len(SEQ)) + "M"
-                #    CIGAR = soffset + "I" + CIGAR + str(int(align_length) - int(pos)) + "M" + eoffset + "I"
-                #    ###temporarily disabled###
-                sam_line = [QNAME, FLAG, RNAME, POS, MAPQ, CIGAR, RNEXT, PNEXT, TLEN, SEQ, QUAL]
-                clen = get_cigar_length(CIGAR)
-                with open(write_sam, 'a+') as samfile:
-                    samfile.write("\t".join(sam_line) + "\n")
-    return references
+                    POS = start
+                continue
+            SEQ = line.strip()
+            TLEN = str(len(SEQ))
+            # unmapped bases are counted as matches, indels of the error profile are not used
+            CIGAR = "*" if RNAME == "*" else TLEN + "M"
+            samfile.write("\t".join([QNAME, FLAG, RNAME, POS, MAPQ, CIGAR, RNEXT, PNEXT, TLEN, SEQ, QUAL]) + "\n")
+            fastq.write("@{}\n{}\n+\n{}\n".format(QNAME, SEQ, "I" * len(SEQ)))  # phred quality 40
+
 
-def get_cigars_nanosim(error_profile):
-    errors = {}
-    slen = {}
-    with open(error_profile, 'r') as ep:
-        for line in ep:
-            if line.startswith("Seq"):
-                continue # header
-            name, pos, error_type, length, refseq, qseq = re.split(r'\t|\s{2,}',line) # split at tab and multiple whitespace
-            if error_type == "mis":
-                continue # this version ignores mismatches
-            seqname = name.split("_")
-            seqname = seqname[0] + "-" + seqname[-1] # later on used as sequence name
-            if seqname in errors:
-                errors[seqname].append((int(pos),error_type,int(length)))
-            else:
-                errors[seqname] = [(int(pos),error_type,int(length))]
-    cigars = {}
-    # if ins at pos x with length y, then that ins started at x-y! (see test_error_profile)
-    for sequence in errors:
-        sorted_errors = sorted(errors[sequence],key=lambda x: x[0])
-        ref_len = 0
-        CIGAR = ""
-        for pos, etype, length in sorted_errors:
-            if etype == 'ins':
-                if (int(pos) - ref_len > 0):
-                    CIGAR += str(int(pos) - ref_len) + "M"
-                CIGAR += str(length) + "I"
-                ref_len = int(pos)
-                length = 0 # only relevant if insertion at the end
-            elif etype == 'del':
-                if (int(pos) - ref_len > 0):
-                    CIGAR += str(int(pos) - ref_len) + "M"
-                CIGAR += str(length) + "D"
-                ref_len = int(pos) + int(length)
-        # if deletion at the end, the number of matches has to be reduces
-        cigars[sequence] = (CIGAR, int(pos) + int(length)) 
-    return cigars
+def open_fastq(directory_output, prefix):
+    """
+    Open the fastq output of a genome with a large write buffer
 
-def get_cigar_length(cigar):
-    length = 0
-    decimals = []
-    for char in cigar:
-        try:
-            x = int(char)
-            decimals.append(x)
-        except:
-            if char != "D":
-                for i in range(len(decimals)):
-                    length += 10**(len(decimals) - i - 1) * decimals[i]
-            decimals = []
-    return length
+    @param directory_output: Directory for the sam and fastq files output
+    @type directory_output: str | unicode
+    @param prefix: Genome id
+    @type prefix: str | unicode
 
-def convert_fasta(read_file, reference_path):
-    references = SeqIO.to_dict(SeqIO.parse(reference_path, "fasta"))
-    fixed_names = {x.split('.',1)[0].replace("_","-"):x for x in references}
-    out_name = read_file.rsplit("_",2)[0] + ".fq" # /path/to/genomeid_reads.fasta
-    records = SeqIO.parse(read_file, "fasta")
-    with open(out_name, 'a+') as fastq:
-        for record in records:
-            record.letter_annotations["phred_quality"] = [40] * len(record)
-            record.id = record.id.replace(";","_")
-            record.id = fixed_names[record.id.split("_")[0]] + "-" + record.id.split("_")[3] # this is the index of the read
-            record.description = fixed_names[record.description.split("_")[0]] + "-" + record.description.split("_")[3]
-            SeqIO.write(record, fastq, "fastq")
+    @rtype: file
+    """
+    return open(os.path.join(directory_output, prefix + ".fq"), 'w', buffer_size)
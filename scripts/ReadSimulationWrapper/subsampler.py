@@ -0,0 +1,109 @@
+import numpy as np
+from scripts.ReadSimulationWrapper import part_merger
+
+# Read pairs simulated once for several samples are subsampled for each sample.
+# A pair is selected by its position in the fastq files, its sam records by the name of the pair,
+# so fastq and sam output of a sample keep the same read names.
+
+
+def _count_reads(file_path):
+    """
+    Count the records of a fastq file
+
+    @param file_path: Fastq file
+    @type file_path: str | unicode
+
+    @rtype: int
+    """
+    with open(file_path) as stream_input:
+        return sum(1 for line in stream_input) // 4
+
+
+def _subsample_fastq(file_path_input, file_path_output, selected):
+    """
+    Write the selected records of a fastq file
+
+    @param file_path_input: Fastq file
+    @type file_path_input: str | unicode
+    @param file_path_output: Fastq output
+    @type file_path_output: str | unicode
+    @param selected: True for each selected record
+    @type selected: numpy.ndarray
+
+    @return: names of the selected read pairs
+    @rtype: set[str|unicode]
+    """
+    pair_names = set()
+    with open(file_path_input) as stream_input, open(file_path_output, 'w') as stream_output:
+        for line_number, line in enumerate(stream_input):
+            if not selected[line_number // 4]:
+                continue
+            if line_number % 4 == 0:
+                pair_names.add(part_merger.get_pair_name(line[1:].split(None, 1)[0]))
+            stream_output.write(line)
+    return pair_names
+
+
+def subsample_paired_reads(file_path_input_prefix, file_path_output_prefix, fraction, seed, stream_sam):
+    """
+    Write a random subsample of the read pairs of '<input_prefix>1.fq', '<input_prefix>2.fq' and '<input_prefix>.sam'
+    into '<output_prefix>1.fq', '<output_prefix>2.fq' and the given sam output.
+
+    @param file_path_input_prefix: Prefix of the simulated reads
+    @type file_path_input_prefix: str | unicode
+    @param file_path_output_prefix: Prefix of the subsampled reads
+    @type file_path_output_prefix: str | unicode
+    @param fraction: Fraction of read pairs to be drawn
+    @type fraction: float
+    @param seed: Seed of the drawing
+    @type seed: int
+    @param stream_sam: Sam output, a file or a stream into a bam file
+    @type stream_sam: file | BamWriter
+
+    @return: number of selected read pairs
+    @rtype: int
+    """
+    assert 0 <= fraction <= 1
+    number_of_pairs = _count_reads(file_path_input_prefix + '1.fq')
+    number_of_selected_pairs = int(round(number_of_pairs * fraction))
+    # numpy seeds are limited to 32 bit
+    random_state = np.random.RandomState(seed % 2**32)
+    selected = np.zeros(number_of_pairs, dtype=bool)
+    selected[random_state.choice(number_of_pairs, number_of_selected_pairs, replace=False)] = True
+
+    pair_names = _subsample_fastq(file_path_input_prefix + '1.fq', file_path_output_prefix + '1.fq', selected)
+    _subsample_fastq(file_path_input_prefix + '2.fq', file_path_output_prefix + '2.fq', selected)
+    with open(file_path_input_prefix + '.sam') as stream_input:
+        for line in stream_input:
+            if line.startswith('@') or part_merger.get_pair_name(line.split('\t', 1)[0]) in pair_names:
+                stream_sam.write(line)
+    return number_of_selected_pairs
+
+
+def subsample_genome(file_path_input_prefix, file_path_output_prefix, fraction, seed, bam_writer=None):
+    """
+    Subsample the read pairs of a genome into '<output_prefix>.sam' or a sorted bam file, run as task of a worker
+
+    @param file_path_input_prefix: Prefix of the simulated reads
+    @type file_path_input_prefix: str | unicode
+    @param file_path_output_prefix: Prefix of the subsampled reads
+    @type file_path_output_prefix: str | unicode
+    @param fraction: Fraction of read pairs to be drawn
+    @type fraction: float
+    @param seed: Seed of the drawing
+    @type seed: int
+    @param bam_writer: Writer of a sorted bam file, replaces the sam file if given
+    @type bam_writer: BamWriter | None
+
+    @return: None if successful, else an error message
+    @rtype: None | str
+    """
+    try:
+        stream_sam = bam_writer
+        if bam_writer is None:
+            stream_sam = open(file_path_output_prefix + '.sam', 'w')
+        with stream_sam:
+            subsample_paired_reads(file_path_input_prefix, file_path_output_prefix, fraction, seed, stream_sam)
+    except (AssertionError, IOError, OSError, ValueError) as e:
+        return "Subsampling reads of '{}' failed: {}".format(file_path_input_prefix, e)
+    return None
@@ -416,15 +416,19 @@ view={view}
             self._logger.error("'-rs' No read simulator declared!")
             self._valid_arguments = False
         elif self._read_simulator_type in self._valid_read_simulators:
-            if self._directory_error_profiles is None and self._read_simulator_type != 'wgsim': # wgsim does not need an error_profile folder
+            if self._read_simulator_type in ('wgsim', 'numpy'): # wgsim and numpy do not need an error_profile folder
+                pass
+            elif self._directory_error_profiles is None:
                 self._logger.error("For %s an error profile directory is required!" % self._read_simulator_type)
                 self._valid_arguments = False
-            elif not self._validator.validate_dir(self._directory_error_profiles) and self._read_simulator_type != 'wgsim':
+            elif not self._validator.validate_dir(self._directory_error_profiles):
                 self._valid_arguments = False
-            elif self._read_simulator_type != 'wgsim':
+            else:
                 self._directory_error_profiles = self._validator.get_full_path(self._directory_error_profiles)
 
-            if self._executable_readsim is None:
+            if self._read_simulator_type == 'numpy': # numpy simulates in-process, no executable
+                pass
+            elif self._executable_readsim is None:
                 self._logger.error("Read simulator executable is required!")
                 self._valid_arguments = False
             elif not self._validator.validate_file(self._executable_readsim, executable=True):
@@ -48,6 +48,9 @@ class ConfigFileHandler(DefaultValues):
         if self._max_processors is None:
             self._max_processors = self._config.get_value("max_processors", is_digit=True, silent=True)
 
+        if self._memory_budget is None:
+            self._memory_budget = self._config.get_value("memory_budget", is_digit=True, silent=True)
+
         if self._dataset_id is None:
             self._dataset_id = self._config.get_value("dataset_id", silent=True)
 
@@ -105,6 +108,16 @@ class ConfigFileHandler(DefaultValues):
         if self._fragments_size_mean_in_bp is None:
             self._fragments_size_mean_in_bp = self._config.get_value("fragments_size_mean", is_digit=True, silent=True)
 
+        self._stream_bam = self._config.get_value("stream_bam", is_boolean=True, silent=True)
+
+        if self._directory_read_cache is None:
+            self._directory_read_cache = self._config.get_value("read_cache", is_path=True, silent=True)
+
+        if self._read_cache_size is None:
+            self._read_cache_size = self._config.get_value("read_cache_size", is_digit=True, silent=True)
+
+        self._subsample_reads = self._config.get_value("subsample_reads", is_boolean=True, silent=True)
+
         # ##########
         # [CommunityDesign]
         # ##########
@@ -196,6 +209,7 @@ class ConfigFileHandler(DefaultValues):
         output_stream.write("seed={}\n".format(self._seed or ""))
         output_stream.write("phase={}\n".format(self._phase))
         output_stream.write("max_processors={}\n".format(self._max_processors))
+        output_stream.write("memory_budget={}\n".format(self._memory_budget or ""))
         output_stream.write("dataset_id={}\n".format(self._dataset_id))
         output_stream.write("output_directory={}\n".format(self._directory_output or ""))
         output_stream.write("temp_directory={}\n".format(self._tmp_dir or ""))
@@ -220,6 +234,10 @@ class ConfigFileHandler(DefaultValues):
         output_stream.write("type={}\n".format(self._read_simulator_type))
         output_stream.write("fragments_size_mean={}\n".format(self._fragments_size_mean_in_bp))
         output_stream.write("fragment_size_standard_deviation={}\n".format(self._fragment_size_standard_deviation_in_bp))
+        output_stream.write("stream_bam={}\n".format(self._stream_bam))
+        output_stream.write("read_cache={}\n".format(self._directory_read_cache or ""))
+        output_stream.write("read_cache_size={}\n".format(self._read_cache_size or ""))
+        output_stream.write("subsample_reads={}\n".format(self._subsample_reads))
 
     def _stream_community_design(self, output_stream=sys.stdout):
         """
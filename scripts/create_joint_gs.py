@@ -182,12 +182,25 @@ def merge_bam_files(bams_per_genome, out, threads):
         subprocess.call([cmd],shell=True) # this runs a single command at a time (but that one multi threaded)
     return out_path
 
-def name_to_genome(metadata):
+def name_to_genome(metadata, root_paths):
     """
     Maps internal genome names to external genome names for gsa_mapping
+    Names are read from the sequence to genome id table each run writes next to its genomes, genomes of runs without one are scanned
     """
     name_to_genome = {}
+    for root_path in root_paths:
+        table_path = os.path.join(root_path, "source_genomes", "sequence_to_genome_id.tsv")
+        if not os.path.exists(table_path):
+            continue
+        with open(table_path,'r') as table:
+            for line in table:
+                name, genome = line.rstrip("\n").split('\t')
+                if genome in metadata:
+                    name_to_genome[name] = genome
+    genomes_in_tables = set(name_to_genome.values())
     for genome in metadata:
+        if genome in genomes_in_tables:
+            continue
         path = metadata[genome][-1]
         with open(path,'r') as gen:
             for line in gen:
@@ -242,11 +255,10 @@ def shuffle_anonymize(fasta_stream, path, to_genome, metadata, sample_name, coun
                 continue
     return gsa_temp
 
-def create_gsa_mapping(path, metadata, sample_name, shuffle):
+def create_gsa_mapping(path, metadata, to_genome, sample_name, shuffle):
     """
     Creates the binning gold standard/gsa mapping
     """
-    to_genome = name_to_genome(metadata)
     gsa_path = os.path.join(path, "anonymous_gsa.fasta") #
     count = 0
     if not os.path.exists(gsa_path):
@@ -282,7 +294,7 @@ def add_to_bam_per_genome(bam_per_genome, runs):
                 bam_per_genome[genome] = [os.path.join(run,"bam",bam_file)]
     return bam_per_genome
 
-def create_gold_standards(bamtogold, used_samples, metadata, out, threads, shuffle, name="S"):
+def create_gold_standards(bamtogold, used_samples, metadata, to_genome, out, threads, shuffle, name="S"):
     """
     Creation of the gold standards per sample. Uses the helper script bamToGold and merges all bam files of the same genome per sample across runs
     """
@@ -294,9 +306,9 @@ def create_gold_standards(bamtogold, used_samples, metadata, out, threads, shuff
         os.mkdir(sample_path)
         merged = merge_bam_files(bam_per_genome, sample_path, threads)
         bamToGold(bamtogold, merged, sample_path, metadata, threads)
-        create_gsa_mapping(sample_path, metadata, contig_name, shuffle)
+        create_gsa_mapping(sample_path, metadata, to_genome, contig_name, shuffle)
 
-def create_pooled_gold_standard(bamtogold, used_samples, metadata, out, threads, shuffle, name="PC"):
+def create_pooled_gold_standard(bamtogold, used_samples, metadata, to_genome, out, threads, shuffle, name="PC"):
     bam_per_genome = {}
     for sample in used_samples:
         runs = used_samples[sample]
@@ -305,7 +317,7 @@ def create_pooled_gold_standard(bamtogold, used_samples, metadata, out, threads,
     os.mkdir(bam_pooled)
     merged = merge_bam_files(bam_per_genome, bam_pooled, threads)
     bamToGold(bamtogold, merged, bam_pooled, metadata, threads)
-    create_gsa_mapping(bam_pooled, metadata, name, shuffle)
+    create_gsa_mapping(bam_pooled, metadata, to_genome, name, shuffle)
 
 def compress(path):
     """
@@ -327,6 +339,7 @@ if __name__ == "__main__":
         shuffle = args.shuffle_anonymize # shuffle + anonymize
         used_samples = get_samples(root_paths, samples)
         metadata = read_metadata(root_paths)
+        to_genome = name_to_genome(metadata, root_paths) # once for all gold standards
         if len(root_paths) > 1: # do create individual gold standards per sample
-            create_gold_standards(bamtogold, used_samples, metadata, out, threads, shuffle)
-        create_pooled_gold_standard(bamtogold, used_samples, metadata, out, threads, shuffle) # in any case, create pooled gold standard
+            create_gold_standards(bamtogold, used_samples, metadata, to_genome, out, threads, shuffle)
+        create_pooled_gold_standard(bamtogold, used_samples, metadata, to_genome, out, threads, shuffle) # in any case, create pooled gold standard
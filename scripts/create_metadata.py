@@ -73,6 +73,7 @@ def get_sequencing_technology(read_simulator):
     dict_of_simulators = {
         "art" : "Illumina HiSeq2500",
         "wgsim" : "Illumina",
+        "numpy" : "Illumina",
         "pbsim" : "Pacific Biosciences",
         "nanosim" : "Oxford Nanopore",
         "nanosim" : "Oxford Nanopore, R9 chemistry"
@@ -131,7 +132,7 @@ def create_json(path, metadata, config, name):
     json["Total_size_bp"] = float(size) * int(samples)
     simulator = config.get('ReadSimulator', 'type')
     json["Sequencing_technology"] = get_sequencing_technology(simulator)
-    if simulator != "art" and simulator != "wgsim": # these use insert sizes
+    if simulator not in ("art", "wgsim", "numpy"): # these use insert sizes
         json["Average_read_length_in_bp"] = 150
         json["Read_length_standard_deviation_in_bp"] = 0
         json["Average_insert_size_in_bp"] = config.get('ReadSimulator', 'fragments_size_mean')
@@ -141,7 +142,7 @@ def create_json(path, metadata, config, name):
         json["Read_length_standard_deviation_in_bp"] = config.get('ReadSimulator', 'fragment_size_standard_deviation')
         json["Average_insert_size_in_bp"] = config.get('ReadSimulator', 'fragments_size_mean')
         json["Insert_size_standard_deviation_in_bp"] = config.get('ReadSimulator', 'fragment_size_standard_deviation')
-    if simulator == "art":
+    if simulator in ("art", "numpy"):
        json["Paired-end"] = True
     else:
        json["Paired-end"] = False
@@ -49,12 +49,13 @@ class DefaultValues(DefaultLogging):
     _directory_output = None
     _directory_pipeline = None
     _max_processors = 1
+    _memory_budget = None
     _dataset_id = ''
 
     # ############
     # [read_simulator]
     # ############
-    _valid_read_simulators = ['art','wgsim','pbsim','nanosim','nanosim3']
+    _valid_read_simulators = ['art','wgsim','pbsim','nanosim','nanosim3','numpy']
     _sample_size_in_base_pairs = None
 
     _read_simulator_type = None
@@ -63,6 +64,10 @@ class DefaultValues(DefaultLogging):
     _custom_readlength = None
     _fragment_size_standard_deviation_in_bp = None
     _fragments_size_mean_in_bp = None
+    _stream_bam = False
+    _directory_read_cache = None
+    _read_cache_size = None
+    _subsample_reads = False
 
     # ############
     # [sampledesign]
@@ -128,6 +133,7 @@ class DefaultValues(DefaultLogging):
         # ############
         # self._DEFAULT_directory_output = tempfile.mkdtemp(prefix="Output", dir=pipeline_dir)
         self._DEFAULT_max_processors = 1
+        self._DEFAULT_memory_budget = None
         self._DEFAULT_dataset_id = 'default'
 
         # ############
@@ -139,6 +145,10 @@ class DefaultValues(DefaultLogging):
         self._DEFAULT_error_profile = 'mbarc'
         self._DEFAULT_fragment_size_standard_deviation_in_bp = 27
         self._DEFAULT_fragments_size_mean_in_bp = 270
+        self._DEFAULT_stream_bam = False
+        self._DEFAULT_directory_read_cache = None
+        self._DEFAULT_read_cache_size = 100
+        self._DEFAULT_subsample_reads = False
 
         # ############
         # [sampledesign]
@@ -202,6 +212,7 @@ class DefaultValues(DefaultLogging):
         # ############
         # self._DEFAULT_directory_output = tempfile.mkdtemp(prefix="Output", dir=pipeline_dir)
         self._DEFAULT_max_processors = config.get_value("max_processors", is_digit=True, silent=True)
+        self._DEFAULT_memory_budget = config.get_value("memory_budget", is_digit=True, silent=True)
         self._DEFAULT_dataset_id = config.get_value("dataset_id", silent=True)
 
         # ############
@@ -215,6 +226,10 @@ class DefaultValues(DefaultLogging):
         self._DEFAULT_fragment_size_standard_deviation_in_bp = config.get_value(
             "fragment_size_standard_deviation", is_digit=True, silent=True)
         self._DEFAULT_fragments_size_mean_in_bp = config.get_value("fragments_size_mean", is_digit=True, silent=True)
+        self._DEFAULT_stream_bam = config.get_value("stream_bam", is_boolean=True, silent=True)
+        self._DEFAULT_directory_read_cache = config.get_value("read_cache", is_path=True, silent=True)
+        self._DEFAULT_read_cache_size = config.get_value("read_cache_size", is_digit=True, silent=True)
+        self._DEFAULT_subsample_reads = config.get_value("subsample_reads", is_boolean=True, silent=True)
 
         # ############
         # [sampledesign]
@@ -275,6 +290,7 @@ class DefaultValues(DefaultLogging):
         if self._directory_output is None:
             self._directory_output = tempfile.mkdtemp(prefix="Output", dir=self._directory_pipeline)
         self._max_processors = self._max_processors or self._DEFAULT_max_processors
+        self._memory_budget = self._memory_budget or self._DEFAULT_memory_budget
         self._dataset_id = self._dataset_id or self._DEFAULT_dataset_id
 
         # ############
@@ -286,6 +302,10 @@ class DefaultValues(DefaultLogging):
         self._error_profile = self._error_profile or self._DEFAULT_error_profile
         self._fragment_size_standard_deviation_in_bp = self._fragment_size_standard_deviation_in_bp or self._DEFAULT_fragment_size_standard_deviation_in_bp
         self._fragments_size_mean_in_bp = self._fragments_size_mean_in_bp or self._DEFAULT_fragments_size_mean_in_bp
+        self._stream_bam = self._stream_bam or self._DEFAULT_stream_bam
+        self._directory_read_cache = self._directory_read_cache or self._DEFAULT_directory_read_cache
+        self._read_cache_size = self._read_cache_size or self._DEFAULT_read_cache_size
+        self._subsample_reads = self._subsample_reads or self._DEFAULT_subsample_reads
 
         # ############
         # [sampledesign]
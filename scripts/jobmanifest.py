@@ -0,0 +1,148 @@
+__author__ = 'hofmann'
+__version__ = '0.0.1'
+
+import os
+import json
+import hashlib
+import threading
+from scripts.Validator.validator import Validator
+
+
+class JobManifest(Validator):
+	"""
+	Append-only record of completed jobs and their validated output files.
+	A job is complete as long as its parameters are unchanged and its output files still have the recorded sizes,
+	so an interrupted run can skip finished jobs and resume the missing ones.
+	"""
+
+	_label = "JobManifest"
+
+	# empty bgzf block terminating every complete bam file
+	_bam_eof_marker = bytes.fromhex("1f8b08040000000000ff0600424302001b0003000000000000000000")
+	_text_file_extensions = (".fq", ".fastq", ".sam")
+
+	def __init__(self, file_path, logfile=None, verbose=True, debug=False):
+		"""
+		Constructor
+
+		@param file_path: Manifest file, created if not existing
+		@type file_path: str | unicode
+		@param logfile: file handler or file path to a log file
+		@type logfile: file | FileIO | StringIO | str
+		@param verbose: Not verbose means that only warnings and errors will be past to stream
+		@type verbose: bool
+		@param debug: Display debug messages
+		@type debug: bool
+		"""
+		super(JobManifest, self).__init__(label=self._label, logfile=logfile, verbose=verbose, debug=debug)
+		assert isinstance(file_path, str)
+		assert self.validate_dir(file_path, only_parent=True)
+		self._file_path = self.get_full_path(file_path)
+		self._lock = threading.Lock()
+		self._jobs = {}
+		if os.path.isfile(self._file_path):
+			self._read()
+
+	def _read(self):
+		"""
+		Read completed jobs, later entries replace earlier ones of the same job
+		"""
+		with open(self._file_path) as stream_input:
+			for line in stream_input:
+				try:
+					entry = json.loads(line)
+				except ValueError:
+					# last line of an interrupted run
+					self._logger.warning("Ignoring incomplete entry in '{}'".format(self._file_path))
+					continue
+				self._jobs[entry["job"]] = entry
+
+	@staticmethod
+	def _get_hash(parameters):
+		"""
+		Get checksum of the parameters of a job
+
+		@rtype: str
+		"""
+		return hashlib.md5(json.dumps(parameters, sort_keys=True).encode()).hexdigest()
+
+	def is_complete(self, job_id, parameters):
+		"""
+		Test if a job with the same parameters is complete and its output files are unchanged
+
+		@param job_id: Unique id of a job, like its output prefix
+		@type job_id: str | unicode
+		@param parameters: Everything the output of the job depends on
+		@type parameters: list | dict
+
+		@rtype: bool
+		"""
+		entry = self._jobs.get(job_id)
+		if entry is None or entry["parameters"] != self._get_hash(parameters):
+			return False
+		for file_path, size in entry["files"].items():
+			if not os.path.isfile(file_path) or os.path.getsize(file_path) != size:
+				return False
+		return True
+
+	def add(self, job_id, parameters, list_of_file_paths, seed=None):
+		"""
+		Record a job as complete, if all its output files are complete
+
+		@param job_id: Unique id of a job, like its output prefix
+		@type job_id: str | unicode
+		@param parameters: Everything the output of the job depends on
+		@type parameters: list | dict
+		@param list_of_file_paths: Output files of the job
+		@type list_of_file_paths: list[str|unicode]
+		@param seed: Seed or seeds the job was run with
+		@type seed: object
+
+		@return: True if recorded
+		@rtype: bool
+		"""
+		for file_path in list_of_file_paths:
+			if not self.is_complete_file(file_path):
+				self._logger.warning("Output of '{}' incomplete: '{}'".format(job_id, file_path))
+				return False
+		entry = {
+			"job": job_id,
+			"parameters": self._get_hash(parameters),
+			"seed": seed,
+			"files": {file_path: os.path.getsize(file_path) for file_path in list_of_file_paths},
+			}
+		# jobs may be completed by several threads
+		with self._lock:
+			with open(self._file_path, 'a') as stream_output:
+				stream_output.write(json.dumps(entry) + "\n")
+				stream_output.flush()
+				os.fsync(stream_output.fileno())
+			self._jobs[job_id] = entry
+		return True
+
+	@classmethod
+	def is_complete_file(cls, file_path):
+		"""
+		Test if a file was written completely.
+		Bam files end with an empty bgzf block, text files like fastq or sam with a newline.
+
+		@param file_path: Output file
+		@type file_path: str | unicode
+
+		@rtype: bool
+		"""
+		if not os.path.isfile(file_path):
+			return False
+		size = os.path.getsize(file_path)
+		if file_path.endswith(".bam"):
+			tail_size = len(cls._bam_eof_marker)
+			if size < tail_size:
+				return False
+			with open(file_path, 'rb') as stream_input:
+				stream_input.seek(size - tail_size)
+				return stream_input.read() == cls._bam_eof_marker
+		if file_path.endswith(cls._text_file_extensions) and size > 0:
+			with open(file_path, 'rb') as stream_input:
+				stream_input.seek(size - 1)
+				return stream_input.read() == b"\n"
+		return True
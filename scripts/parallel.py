@@ -22,13 +22,15 @@
 import os
 import sys
 import time
+import functools
 import multiprocessing as mp
 import subprocess
 import tempfile
+import threading
 
 
 class TaskThread:
-    def __init__(self, fun, args):
+    def __init__(self, fun, args, cost=0, memory=0):
         """
             Defines one function and its arguments to be executed in one thread.
 
@@ -36,13 +38,33 @@ class TaskThread:
             @type fun: function
             @param args: arguments of the function
             @type args: tuple
+            @param cost: predicted cost of the task, used to run the most costly tasks first
+            @type cost: int | float
+            @param memory: estimated memory of the task in bytes, used to keep within a memory budget
+            @type memory: int | float
         """
         self.fun = fun
         self.args = args
+        self.cost = cost
+        self.memory = memory
+
+
+class TaskFailure:
+    def __init__(self, error):
+        """
+            Placeholder for the return value of a task that raised an exception.
+
+            @param error: the exception raised by the task
+            @type error: BaseException
+        """
+        self.error = error
+
+    def __str__(self):
+        return '%s: %s' % (type(self.error).__name__, self.error)
 
 
 class TaskCmd:
-    def __init__(self, cmd, cwd='.', stdin=None, stdout=None, stderr=None):
+    def __init__(self, cmd, cwd='.', stdin=None, stdout=None, stderr=None, cost=0, memory=0):
         """
             Defines one task to be executed as a command line command.
 
@@ -51,12 +73,18 @@ class TaskCmd:
             @param stdin: process standard input
             @param stdout: process standard output
             @param stderr: process standard err
+            @param cost: predicted cost of the task, used to run the most costly tasks first
+            @param memory: estimated memory of the task in bytes, used to keep within a memory budget
         """
         self.cmd = cmd
         self.cwd = cwd
         self.stdin = stdin
         self.stdout = stdout
         self.stderr = stderr
+        self.cost = cost
+        self.memory = memory
+        # measured peak resident memory in bytes of the largest process of the command, once run
+        self.peakMemory = None
 
 
 class AsyncParallel:
@@ -201,6 +229,218 @@ def runThreadParallel(threadTaskList, maxThreads=mp.cpu_count()):
     return retValList
 
 
+def _runTimed(fun, args):
+    """
+        Executes a function and measures when it started and ended.
+
+        @return: a tuple (return value, start time, end time)
+    """
+    start = time.time()
+    retVal = fun(*args)
+    return retVal, start, time.time()
+
+
+def _callbackTimed(callback, task, result):
+    """
+        Hands the return value of a timed function to a callback.
+    """
+    retVal, start, end = result
+    # an exception would stop the pool from handling results
+    try:
+        callback(task, retVal)
+    except Exception as e:
+        sys.stderr.write('Callback of task failed: %s\n' % e)
+        sys.stderr.flush()
+
+
+class _MemoryBudget:
+    """
+        Admits tasks while the sum of their estimated memory fits into a budget.
+    """
+    def __init__(self, maxMemory, maxTasks):
+        """
+            @param maxMemory: memory budget in bytes, None for no limit
+            @param maxTasks: maximum number of tasks admitted at the same time
+        """
+        self.maxMemory = maxMemory
+        self.maxTasks = maxTasks
+        self.memory = 0
+        self.tasks = 0
+        self.condition = threading.Condition()
+
+    def _fits(self, task):
+        # a task exceeding the budget on its own is admitted once no other task is running
+        if self.tasks == 0:
+            return True
+        if self.tasks >= self.maxTasks:
+            return False
+        return self.maxMemory is None or self.memory + task.memory <= self.maxMemory
+
+    def admit(self, taskList):
+        """
+            Wait until one of the tasks fits, the first fitting one is removed from the list.
+
+            @type taskList: list of TaskThread
+            @return: the admitted task
+        """
+        with self.condition:
+            while True:
+                for task in taskList:
+                    if self._fits(task):
+                        taskList.remove(task)
+                        self.memory += task.memory
+                        self.tasks += 1
+                        return task
+                self.condition.wait()
+
+    def release(self, task, *args):
+        with self.condition:
+            self.memory -= task.memory
+            self.tasks -= 1
+            self.condition.notify()
+
+
+def _callbackReleased(budget, callback, task, result):
+    """
+        Releases the memory of a finished task, before its return value is handed to a callback.
+    """
+    budget.release(task)
+    if callback is not None:
+        callback(result)
+
+
+def runThreadScheduled(threadTaskList, maxThreads=mp.cpu_count(), callback=None, maxMemory=None):
+    """
+        Execute several functions (threads, processes) in parallel, the tasks with the highest cost first.
+        Starting with the longest tasks keeps all workers busy until the end, as long as the costs are predictive.
+        With a memory budget, a task is started only while the estimated memory of all running tasks fits into it,
+        smaller tasks may be started ahead of a larger one that does not fit.
+
+        @type threadTaskList: list of TaskThread
+        @param maxThreads: maximum number of tasks that will be run in parallel at the same time
+        @param callback: called with a task and its return value as soon as the task finished, in a thread of this process
+        @type callback: callable | None
+        @param maxMemory: memory budget in bytes for the estimated memory of running tasks, None for no limit
+        @type maxMemory: int | float | None
+        @return: a list of respective return values, in the order of the given list, and the fraction of time the workers were busy.
+            The return value of a task that raised an exception is a TaskFailure.
+    """
+    assert isinstance(threadTaskList, list)
+    assert isinstance(maxThreads, int)
+    assert maxMemory is None or maxMemory > 0
+
+    # longest processing time first
+    pendingTaskList = sorted(threadTaskList, key=lambda task: task.cost, reverse=True)
+    indexDict = dict((id(task), index) for index, task in enumerate(threadTaskList))
+    budget = _MemoryBudget(maxMemory, maxThreads)
+
+    # creates a pool of workers, tasks are handed to workers as soon as they are admitted
+    pool = mp.Pool(processes=maxThreads)
+    startTime = time.time()
+    taskHandlerDict = {}
+    while len(pendingTaskList) > 0:
+        task = budget.admit(pendingTaskList)
+        assert isinstance(task, TaskThread)
+        taskCallback = None
+        if callback is not None:
+            taskCallback = functools.partial(_callbackTimed, callback, task)
+        taskHandlerDict[indexDict[id(task)]] = pool.apply_async(
+            _runTimed, (task.fun, task.args),
+            callback=functools.partial(_callbackReleased, budget, taskCallback, task),
+            error_callback=functools.partial(budget.release, task))
+
+    # finish all tasks
+    pool.close()
+    pool.join()
+    wallTime = time.time() - startTime
+
+    # retrieve the return values
+    retValList = []
+    busyTime = 0.
+    for index in range(len(threadTaskList)):
+        taskHandler = taskHandlerDict[index]
+        taskHandler.wait()
+        try:
+            retVal, start, end = taskHandler.get()
+        except Exception as e:
+            retValList.append(TaskFailure(e))
+            continue
+        busyTime += end - start
+        retValList.append(retVal)
+
+    busyFraction = 1.
+    if wallTime > 0:
+        busyFraction = min(1., busyTime / (wallTime * maxThreads))
+    return retValList, busyFraction
+
+
+def runCmdScheduled(
+        cmdTaskList, maxProc=mp.cpu_count(), stdInErrLock=mp.Manager().Lock(), callback=None, maxMemory=None):
+    """
+        Run several command line commands in parallel, the tasks with the highest cost first.
+        The measured peak memory of each finished command is set as 'peakMemory' of its task.
+
+        @attention: use the Manager to get the lock as in this function definition !!!
+
+        @param cmdTaskList: list of command line tasks
+        @type cmdTaskList: list of TaskCmd
+        @param maxProc: maximum number of tasks that will be run in parallel at the same time
+        @param stdInErrLock: acquiring the lock enables writing to the stdout and stderr
+        @param callback: called with a task and its finished process as soon as the task finished
+        @type callback: callable | None
+        @param maxMemory: memory budget in bytes for the estimated memory of running tasks, None for no limit
+        @type maxMemory: int | float | None
+
+        @return: list of failed commands, dictionary (cmd, task process), and the fraction of time the workers were busy
+    """
+    assert isinstance(cmdTaskList, list)
+    assert isinstance(maxProc, int)
+
+    threadTaskList = []
+    dictThreadToCmdTask = {}
+    for cmdTask in cmdTaskList:
+        assert isinstance(cmdTask, TaskCmd)
+
+        threadTask = TaskThread(_runCmdReturnCode, (cmdTask, stdInErrLock), cost=cmdTask.cost, memory=cmdTask.memory)
+        dictThreadToCmdTask[id(threadTask)] = cmdTask
+        threadTaskList.append(threadTask)
+
+    def threadCallback(threadTask, retVal):
+        process, task = retVal
+        cmdTask = dictThreadToCmdTask[id(threadTask)]
+        cmdTask.peakMemory = task.peakMemory
+        if callback is not None:
+            callback(cmdTask, process)
+
+    returnValueList, busyFraction = runThreadScheduled(threadTaskList, maxProc, threadCallback, maxMemory)
+
+    failList = []
+    for cmdTask, returnValue in zip(cmdTaskList, returnValueList):
+        # tasks without return value terminated unexpectedly
+        if isinstance(returnValue, TaskFailure):
+            failList.append(dict(process=subprocess.CompletedProcess(cmdTask.cmd, None), task=cmdTask))
+            continue
+        process, task = returnValue
+        if process.returncode != 0:
+            failList.append(dict(process=process, task=task))
+    if len(failList) > 0:
+        return failList, busyFraction
+    else:
+        return None, busyFraction
+
+
+def _runCmdReturnCode(taskCmd, stdInErrLock=None):
+    """
+        Executes a command line task, the process itself can not be send back by a worker of a pool.
+
+        @type taskCmd: TaskCmd
+
+        @return: a tuple (finished process, TaskCmd)
+    """
+    process, taskCmd = _runCmd(taskCmd, stdInErrLock)
+    return subprocess.CompletedProcess(taskCmd.cmd, process.returncode), taskCmd
+
+
 def _runCmd(taskCmd, stdInErrLock=None):
     """
         Executes a command line task.
@@ -231,6 +471,12 @@ def _runCmd(taskCmd, stdInErrLock=None):
         process = subprocess.Popen(
             taskCmd.cmd, shell=True, bufsize=-1, cwd=taskCmd.cwd,
             stdin=taskCmd.stdin, stdout=stdoutP, stderr=stderrP)
+        if hasattr(os, 'wait4'):
+            # the resource usage of a process is only available to the call waiting for it,
+            # its peak memory is the one of its largest process, including the processes it waited for
+            pid, status, usage = os.wait4(process.pid, 0)
+            process.returncode = os.waitstatus_to_exitcode(status)
+            taskCmd.peakMemory = usage.ru_maxrss * 1024
         process.wait()
     finally:
         # exclusive writing to the stdin or stderr (empty the buffers containing stdin or stdout of the run)
@@ -344,6 +590,23 @@ def reportFailedCmd(failList):
         return None
 
 
+def reportMemoryUsage(cmdTaskList):
+    """
+        Report on the estimated and the measured peak memory of finished commands, to recalibrate estimates.
+
+        @type cmdTaskList: list of TaskCmd
+        @return: list of messages
+    """
+    assert isinstance(cmdTaskList, list)
+    msgList = []
+    for task in cmdTaskList:
+        if task.peakMemory is None:
+            continue
+        msgList.append('Task peak memory: %.1f MB, estimated: %.1f MB, task: %s' % (
+            task.peakMemory / 2.**20, task.memory / 2.**20, task.cmd))
+    return msgList
+
+
 # Deprecated implementation!
 
 
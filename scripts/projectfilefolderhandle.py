@@ -50,6 +50,9 @@ class ProjectFileFolderHandle(Validator):
 	# ###################
 
 	_folder_name_internal = "internal"
+	_folder_name_genome_statistics = "genome_statistics"
+	_folder_name_genome_store = "genome_store"
+	_folder_name_read_simulation = "read_simulation"
 	# _folder_name_comunity_design = "comunity_design"
 	_folder_name_distribution = "distributions"
 	_folder_name_genomes = "source_genomes"
@@ -90,6 +93,7 @@ class ProjectFileFolderHandle(Validator):
 	_filename_pooled_gsa_mapping = "gsa_pooled_mapping.tsv"
 
 	_filename_log = "pipeline.log"
+	_filename_log_anonymization = "anonymization_sample_{id}.log"
 	_filename_metadata = "meta_data.tsv"
 
 	def __init__(self, tmp_dir, output_dir, time_stamp=None, logfile=None, verbose=True, debug=False):
@@ -298,6 +302,50 @@ class ProjectFileFolderHandle(Validator):
 		root_dir = self._directory_output
 		return os.path.join(root_dir, self._folder_name_internal)
 
+	def get_genome_statistics_dir(self):
+		"""
+		Get directory where the index of genome statistics is located.
+
+		@return: genome statistics directory
+		@rtype: str | unicode
+		"""
+		root_dir = self._directory_output
+		return os.path.join(root_dir, self._folder_name_internal, self._folder_name_genome_statistics)
+
+	def get_genome_store_dir(self):
+		"""
+		Get directory where the 2 bit packed genomes are located.
+
+		@return: genome store directory
+		@rtype: str | unicode
+		"""
+		root_dir = self._directory_output
+		return os.path.join(root_dir, self._folder_name_internal, self._folder_name_genome_store)
+
+	def get_read_simulation_dir(self, sample_id=None):
+		"""
+		Get directory where read simulation output is kept until it is complete, it is not time stamped to resume a run.
+
+		@type sample_id: str | unicode | None
+
+		@return: read simulation directory of a sample, or of all samples
+		@rtype: str | unicode
+		"""
+		root_dir = self._directory_output
+		directory = os.path.join(root_dir, self._folder_name_internal, self._folder_name_read_simulation)
+		if sample_id is None:
+			return directory
+		return os.path.join(directory, self._folder_name_sample.format(id=sample_id))
+
+	def get_read_simulation_manifest_file_path(self):
+		"""
+		Get file path of the record of completed read simulation jobs
+
+		@return: file path
+		@rtype: str | unicode
+		"""
+		return os.path.join(self.get_read_simulation_dir(), "manifest.jsonl")
+
 	def get_bam_dir(self, sample_id):
 		"""
 		Get directory where bam files are located.
@@ -532,6 +580,21 @@ class ProjectFileFolderHandle(Validator):
 		return os.path.join(
 			root_dir, self._folder_name_internal, self._filename_log)
 
+	def get_anonymization_log_file_path(self, sample_id):
+		"""
+		Get logfile location of the anonymization of a sample, run in a process of its own.
+
+		@param sample_id: sample id of a sample
+		@type sample_id: str | unicode
+
+		@return: logfile location.
+		@rtype: str | unicode
+		"""
+		assert isinstance(sample_id, str)
+		root_dir = self._directory_output
+		return os.path.join(
+			root_dir, self._folder_name_internal, self._filename_log_anonymization.format(id=sample_id))
+
 	def get_genome_metadata_file_path(self):
 		"""
 		Get metadata file location.
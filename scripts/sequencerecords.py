@@ -0,0 +1,175 @@
+__author__ = 'hofmann'
+__version__ = '0.0.1'
+
+import io
+from Bio import SeqIO
+
+# Fasta and fastq records as raw bytes, each one ending with a newline.
+# Records are not parsed into sequence objects, ids can be replaced without touching sequence or quality.
+# Fastq records are expected on four lines, files with wrapped fastq records are read with SeqIO from there on.
+
+buffer_size = 2**22
+
+_header_characters = {"fasta": b">", "fastq": b"@"}
+
+# renamed fasta records are wrapped like SeqIO writes them
+_fasta_line_width = 60
+
+
+def _read_fastq_records(stream):
+	"""
+	Iterate over four line fastq records, falling back to SeqIO at the first record spanning more lines
+
+	@type stream: io.BufferedReader
+
+	@rtype: collections.Iterable[bytes]
+	"""
+	while True:
+		offset = stream.tell() if stream.seekable() else None
+		header = stream.readline()
+		if not header:
+			return
+		sequence = stream.readline()
+		separator = stream.readline()
+		quality = stream.readline()
+		if not quality.endswith(b"\n"):
+			quality += b"\n"
+		if header.startswith(b"@") and separator.startswith(b"+") and len(sequence) == len(quality):
+			yield header + sequence + separator + quality
+			continue
+		if offset is None or not header.startswith(b"@"):
+			raise ValueError("Corrupt fastq record '{}'".format(header.rstrip().decode(errors="replace")))
+		stream.seek(offset)
+		stream_text = io.TextIOWrapper(stream)
+		try:
+			for seq_record in SeqIO.parse(stream_text, "fastq"):
+				yield seq_record.format("fastq").encode()
+		finally:
+			# the binary stream stays open
+			stream_text.detach()
+		return
+
+
+def _read_fasta_records(stream):
+	"""
+	Iterate over fasta records, sequences may span any number of lines
+
+	@type stream: io.BufferedReader
+
+	@rtype: collections.Iterable[bytes]
+	"""
+	lines = []
+	for line in stream:
+		if line.startswith(b">"):
+			if len(lines) > 0:
+				yield b"".join(lines)
+			lines = [line]
+		elif len(lines) > 0:
+			lines.append(line)
+		elif line.strip():
+			raise ValueError("Fasta file does not start with a header: '{}'".format(line.rstrip().decode(errors="replace")))
+	if len(lines) > 0:
+		if not lines[-1].endswith(b"\n"):
+			lines[-1] += b"\n"
+		yield b"".join(lines)
+
+
+def read_records(stream, file_format):
+	"""
+	Iterate over the raw records of a binary stream
+
+	@param stream: Binary stream, fastq files can be read with SeqIO only if it is seekable
+	@type stream: io.BufferedReader
+	@param file_format: Either 'fasta' or 'fastq'.
+	@type file_format: str | unicode
+
+	@rtype: collections.Iterable[bytes]
+
+	@raises: ValueError
+	"""
+	assert file_format in _header_characters, "'{}' is not supported".format(file_format)
+	if file_format == "fastq":
+		return _read_fastq_records(stream)
+	return _read_fasta_records(stream)
+
+
+def read_file_records(file_path, file_format):
+	"""
+	Iterate over the raw records of a file, read with a large buffer
+
+	@param file_path: fasta or fastq file
+	@type file_path: str | unicode
+	@param file_format: Either 'fasta' or 'fastq'.
+	@type file_format: str | unicode
+
+	@rtype: collections.Iterable[bytes]
+
+	@raises: ValueError
+	"""
+	with open(file_path, 'rb', buffer_size) as stream_input:
+		for record in read_records(stream_input, file_format):
+			yield record
+
+
+def get_id(record):
+	"""
+	Get the id of a record, the header up to the first white space
+
+	@type record: bytes
+
+	@rtype: bytes
+	"""
+	header = record[1:record.index(b"\n")].split(None, 1)
+	if len(header) == 0:
+		return b""
+	return header[0]
+
+
+def get_sequence(record, file_format):
+	"""
+	Get the sequence of a record, without line breaks or other white space
+
+	@type record: bytes
+	@type file_format: str | unicode
+
+	@rtype: bytes
+	"""
+	body = record[record.index(b"\n") + 1:]
+	if file_format == "fastq":
+		return body[:body.index(b"\n")].strip()
+	return b"".join(body.split())
+
+
+def get_sequence_length(record, file_format):
+	"""
+	Get the length of the sequence of a record
+
+	@type record: bytes
+	@type file_format: str | unicode
+
+	@rtype: int
+	"""
+	return len(get_sequence(record, file_format))
+
+
+def rename(record, new_id, file_format):
+	"""
+	Replace the header of a record by a new id, dropping its description.
+	The repeated id of a fastq separator line is dropped as well, fasta sequences are wrapped at 60 columns.
+
+	@type record: bytes
+	@param new_id: New id, the old one to only drop the description
+	@type new_id: bytes
+	@type file_format: str | unicode
+
+	@rtype: bytes
+	"""
+	body = record[record.index(b"\n") + 1:]
+	if file_format == "fasta":
+		sequence = b"".join(body.split())
+		body = b"".join(
+			sequence[index:index + _fasta_line_width] + b"\n" for index in range(0, len(sequence), _fasta_line_width))
+	elif not body.startswith(b"+\n", body.index(b"\n") + 1):
+		sequence, separator, quality = body.split(b"\n", 2)
+		body = sequence + b"\n+\n" + quality
+	return _header_characters[file_format] + new_id + b"\n" + body
@@ -8,7 +8,18 @@ __author__ = "Ettore Rocchi"
 
 import pytest
 import csv
+import gzip
+import hashlib
+import io
+import itertools
 import math
+import os
+import re
+import shutil
+import struct
+import subprocess
+import time
+import zlib
 import numpy as np
 import pathlib
 from configparser import ConfigParser
@@ -395,3 +406,1774 @@ def test_genomes_info_file_keys():
 
 	genomes_info_file = pathlib.Path(genomes_info_path)
 	genomes_info_file.unlink()
+
+
+     ###############################
+     #    Gold standard assembly   #
+     ###############################
+
+bam_to_gold_path = "../bamToGold.pl"
+# output of bamToGold.pl for the reads of write_gsa_input, by minimum contig length and coverage
+bam_to_gold_output_path = "./input_gold_standard_assembly/bam_to_gold_l{}_c{}.fasta"
+
+def get_random_sequences(sequence_lengths, seed=0, prefix="seq"):
+	"""
+		Draw random sequences of the given lengths, by id '<prefix><number>' counting from 1
+	"""
+	random_state = np.random.RandomState(seed)
+	return dict(
+		("{}{}".format(prefix, index + 1), "".join(random_state.choice(list("ACGT"), length)))
+		for index, length in enumerate(sequence_lengths))
+
+def write_fasta(file_path, sequences, description=""):
+	"""
+		Write sequences by id to a fasta file, 60 bases per line
+	"""
+	with open(file_path, 'w') as fasta_file:
+		for sequence_id, sequence in sequences.items():
+			fasta_file.write(">{}{}\n{}\n".format(sequence_id, description, "\n".join(
+				sequence[index:index + 60] for index in range(0, len(sequence), 60))))
+
+def write_bam(bam_path, sequence_lengths, alignments):
+	"""
+		Write a bam file of reads of 'A's given as name, flag, reference, 1-based position and cigar,
+		unmapped reads are 50 bases long
+	"""
+	from scripts.GoldStandardAssembly.bamwriter import BamWriter
+
+	with BamWriter(bam_path, tmp_dir=os.path.dirname(bam_path)) as bam_writer:
+		bam_writer.write("@HD\tVN:1.4\tSO:coordinate\n" + "".join(
+			"@SQ\tSN:{}\tLN:{}\n".format(sequence_id, length) for sequence_id, length in sequence_lengths.items()))
+		for read_name, flag, sequence_id, position, cigar in alignments:
+			read_length = sum(int(length) for length, operation in re.findall(r"(\d+)([MIS])", cigar)) or 50
+			bam_writer.write("{}\t{}\t{}\t{}\t60\t{}\t*\t0\t0\t{}\t{}\n".format(
+				read_name, flag, sequence_id, position, cigar, "A" * read_length, "I" * read_length))
+
+def write_gsa_input(directory):
+	"""
+		Write a small reference and reads aligned to it, with gaps in coverage, deletions, insertions,
+		clipped and overhanging reads, and reads samtools mpileup leaves out
+	"""
+	sequences = get_random_sequences((400, 120), prefix="ref")
+	reference_path = str(directory / "reference.fasta")
+	write_fasta(reference_path, sequences)
+
+	# reference, 1-based position, cigar and flag of each read
+	alignments = [
+		("ref1", 1, "50M", 0), ("ref1", 31, "20M5D30M", 16), ("ref1", 41, "10S40M", 0), ("ref1", 61, "25M", 99),
+		("ref1", 101, "30M", 0), ("ref1", 121, "5M3I30M", 0), ("ref1", 150, "40M", 4), ("ref1", 200, "40M", 1024),
+		("ref1", 210, "40M", 256), ("ref1", 220, "40M", 65), ("ref1", 260, "30M", 0), ("ref1", 291, "20M", 0),
+		("ref1", 380, "40M", 0), ("ref2", 5, "30M", 0), ("ref2", 20, "30M", 0), ("ref2", 90, "5M", 0)]
+	bam_path = str(directory / "reads.bam")
+	write_bam(
+		bam_path, {sequence_id: len(sequence) for sequence_id, sequence in sequences.items()},
+		[("r{}".format(index), flag, sequence_id, position, cigar)
+			for index, (sequence_id, position, cigar, flag) in enumerate(alignments)])
+	return reference_path, bam_path
+
+def test_gsa_contigs_are_runs_of_covered_reference():
+	"""
+		This function tests if the gold standard assembly slices runs of covered positions from the reference
+	"""
+	from scripts.GoldStandardAssembly import coverage
+
+	sequence = b"ACGTACGTAC"
+	starts = np.array([0, 2, 7])
+	ends = np.array([4, 5, 12])
+	assert coverage.get_coverage(starts, ends, len(sequence)).tolist() == [1, 1, 2, 2, 1, 0, 0, 1, 1, 1, 1, 1]
+
+	stream_output = io.BytesIO()
+	number_of_contigs = coverage.write_contigs(
+		stream_output, "s", sequence, coverage.get_coverage(starts, ends, len(sequence)), min_length=2, min_coverage=1)
+	assert number_of_contigs == 2
+	assert stream_output.getvalue() == b">s_from_1_to_5_total_5\nACGTA\n>s_from_8_to_12_total_5\nTACNN\n"
+
+	stream_output = io.BytesIO()
+	coverage.write_contigs(
+		stream_output, "s", sequence, coverage.get_coverage(starts, ends, len(sequence)), min_length=1, min_coverage=2)
+	assert stream_output.getvalue() == b">s_from_1_to_5_total_2\nGT\n"
+
+@pytest.mark.parametrize("min_length, min_coverage", [(1, 1), (20, 1), (1, 2)])
+def test_gsa_is_identical_to_stored_bam_to_gold_output(tmp_path, min_length, min_coverage):
+	"""
+		This function tests if the gold standard assembly is byte by byte identical to the stored output of bamToGold.pl
+	"""
+	from scripts.GoldStandardAssembly.goldstandardassembly import GoldStandardAssembly
+
+	reference_path, bam_path = write_gsa_input(tmp_path)
+	with open(bam_to_gold_output_path.format(min_length, min_coverage), 'rb') as stored_output:
+		expected = stored_output.read()
+
+	# contigs are built in-process, samtools is never run
+	file_path_samtools = tmp_path / "samtools"
+	file_path_samtools.write_text("#!/bin/sh\nexit 1\n")
+	file_path_samtools.chmod(0o755)
+	output_path = str(tmp_path / "gsa.fasta")
+	gold_standard_assembly = GoldStandardAssembly(
+		file_path_samtools=str(file_path_samtools), tmp_dir=str(tmp_path), verbose=False)
+	gold_standard_assembly.bam_reads_to_contigs(
+		bam_path, reference_path, output_path, min_length=min_length, min_coverage=min_coverage)
+	with open(output_path, 'rb') as output:
+		assert output.read() == expected
+
+@pytest.mark.skipif(
+	shutil.which("samtools") is None or shutil.which("perl") is None, reason="samtools and perl are required")
+@pytest.mark.parametrize("min_length, min_coverage", [(1, 1), (20, 1), (1, 2)])
+def test_gsa_is_identical_to_bam_to_gold(tmp_path, min_length, min_coverage):
+	"""
+		This function tests if the gold standard assembly is byte by byte identical to the one of bamToGold.pl,
+		run on the spot, and if the stored output of bamToGold.pl is still up to date
+	"""
+	from scripts.GoldStandardAssembly.goldstandardassembly import GoldStandardAssembly
+
+	reference_path, bam_path = write_gsa_input(tmp_path)
+	expected = subprocess.check_output(
+		["perl", bam_to_gold_path, "-r", reference_path, "-b", bam_path, "-l", str(min_length), "-c", str(min_coverage)],
+		stderr=subprocess.DEVNULL)
+	with open(bam_to_gold_output_path.format(min_length, min_coverage), 'rb') as stored_output:
+		assert stored_output.read() == expected
+
+	output_path = str(tmp_path / "gsa.fasta")
+	gold_standard_assembly = GoldStandardAssembly(tmp_dir=str(tmp_path), verbose=False)
+	gold_standard_assembly.bam_reads_to_contigs(
+		bam_path, reference_path, output_path, min_length=min_length, min_coverage=min_coverage)
+	with open(output_path, 'rb') as output:
+		assert output.read() == expected
+
+def get_sam_lines(number_of_reads=2000):
+	"""
+		Get sam header lines and records of reads on references spanning several bins of the bai index,
+		with spliced, clipped, unmapped and unplaced reads, reads sharing positions and optional fields of all types
+	"""
+	random_state = np.random.RandomState(0)
+	references = [("chr1", 300000), ("chr2", 50000), ("chr3", 1000)]
+	header = ["@HD\tVN:1.4\tSO:unsorted"] + ["@SQ\tSN:{}\tLN:{}".format(name, length) for name, length in references]
+	header.append("@PG\tID:test\tPN:test")
+	cigars = [("60M", 60), ("10S50M", 60), ("25M2D35M", 60), ("20M5I35M", 60), ("30M40000N30M", 60)]
+	tags = [
+		"NM:i:{}".format, "XS:i:-{}".format, "AS:i:7000{}".format, "MD:Z:{}A5".format, "XA:A:{}".format,
+		lambda value: "ZF:f:{}.5".format(value), lambda value: "ZB:B:s,{},-2,3".format(value)]
+	records = []
+	for index in range(number_of_reads):
+		read_name = "r{}".format(index)
+		flag = int(random_state.choice([0, 16, 99, 147, 1024]))
+		reference, length = references[random_state.randint(len(references))]
+		position = int(random_state.randint(1, length - 100)) if index % 7 != 0 else 101
+		cigar, read_length = cigars[random_state.randint(len(cigars))]
+		if index % 50 == 1:
+			# unmapped read placed at its mate
+			flag, cigar = 4 | 1 | 8, "*"
+		elif index % 50 == 2:
+			flag, reference, position, cigar = 4, "*", 0, "*"
+		sequence = "".join(random_state.choice(list("ACGTN"), read_length))
+		quality = "*" if index % 3 == 0 else "".join(chr(33 + value) for value in random_state.randint(0, 41, read_length))
+		next_reference = random_state.choice(["=", "*"]) if reference != "*" else "*"
+		optional_fields = [tags[value](random_state.randint(1, 9)) for value in range(index % len(tags))]
+		records.append("\t".join([
+			read_name, str(flag), reference, str(position), "60", cigar, next_reference,
+			str(position if next_reference == "=" else 0), "0", sequence, quality] + optional_fields))
+	return header, records
+
+def inflate_bgzf_blocks(bam_path):
+	"""
+		Inflate the bgzf blocks of a file, return the inflated data and the inflated offset of each block by its offset
+	"""
+	with open(bam_path, 'rb') as bam_file:
+		data = bam_file.read()
+	blocks = []
+	block_offsets = {}
+	inflated_size = 0
+	index = 0
+	while index < len(data):
+		extra_length = struct.unpack_from("<H", data, index + 10)[0]
+		assert data[index + 12:index + 14] == b"BC"
+		block_size = struct.unpack_from("<H", data, index + 16)[0] + 1
+		block = zlib.decompress(data[index + 12 + extra_length:index + block_size - 8], -15)
+		block_offsets[index] = inflated_size
+		blocks.append(block)
+		inflated_size += len(block)
+		index += block_size
+	return b"".join(blocks), block_offsets
+
+def decode_bam(bam_path):
+	"""
+		Decode a bam file back into sam header lines and records,
+		each record with its inflated offset, reference id, 0-based position and end
+	"""
+	data, block_offsets = inflate_bgzf_blocks(bam_path)
+	assert data[:4] == b"BAM\1"
+	length_text = struct.unpack_from("<i", data, 4)[0]
+	header = data[8:8 + length_text].decode().splitlines()
+	index = 8 + length_text
+	number_of_references = struct.unpack_from("<i", data, index)[0]
+	index += 4
+	reference_names = []
+	for _ in range(number_of_references):
+		length_name = struct.unpack_from("<i", data, index)[0]
+		reference_names.append(data[index + 4:index + 3 + length_name].decode())
+		index += 8 + length_name
+	integer_formats = {"c": "<b", "C": "<B", "s": "<h", "S": "<H", "i": "<i", "I": "<I", "f": "<f"}
+	records = []
+	while index < len(data):
+		block_size, reference_id, position, l_read_name, mapq, bin_id, n_cigar_op, flag, l_seq, next_reference_id, \
+			next_position, template_length = struct.unpack_from("<iiiBBHHHiiii", data, index)
+		end_of_record = index + 4 + block_size
+		offset = index + 36
+		read_name = data[offset:offset + l_read_name - 1].decode()
+		offset += l_read_name
+		operations = struct.unpack_from("<{}I".format(n_cigar_op), data, offset)
+		offset += 4 * n_cigar_op
+		cigar = "".join("{}{}".format(operation >> 4, "MIDNSHP=X"[operation & 0xf]) for operation in operations) or "*"
+		reference_length = sum(operation >> 4 for operation in operations if operation & 0xf in (0, 2, 3, 7, 8))
+		sequence = "".join(
+			"=ACMGRSVTWYHKDBN"[(data[offset + index_base // 2] >> (4 * (1 - index_base % 2))) & 0xf]
+			for index_base in range(l_seq)) or "*"
+		offset += (l_seq + 1) // 2
+		quality = data[offset:offset + l_seq]
+		quality = "*" if all(value == 0xff for value in quality) else "".join(chr(33 + value) for value in quality)
+		offset += l_seq
+		optional_fields = []
+		while offset < end_of_record:
+			tag, value_type = data[offset:offset + 2].decode(), chr(data[offset + 2])
+			offset += 3
+			if value_type == "A":
+				optional_fields.append("{}:A:{}".format(tag, chr(data[offset])))
+				offset += 1
+			elif value_type in "ZH":
+				end_of_value = data.index(b"\0", offset)
+				optional_fields.append("{}:{}:{}".format(tag, value_type, data[offset:end_of_value].decode()))
+				offset = end_of_value + 1
+			elif value_type == "B":
+				subtype = chr(data[offset])
+				number_of_values = struct.unpack_from("<I", data, offset + 1)[0]
+				size = struct.calcsize(integer_formats[subtype])
+				values = struct.unpack_from("<{}{}".format(number_of_values, integer_formats[subtype][1]), data, offset + 5)
+				optional_fields.append("{}:B:{}".format(tag, ",".join([subtype] + [
+					"{:g}".format(value) if subtype == "f" else str(value) for value in values])))
+				offset += 5 + size * number_of_values
+			else:
+				value = struct.unpack_from(integer_formats[value_type], data, offset)[0]
+				if value_type == "f":
+					optional_fields.append("{}:f:{:g}".format(tag, value))
+				else:
+					optional_fields.append("{}:i:{}".format(tag, value))
+				offset += struct.calcsize(integer_formats[value_type])
+		if next_reference_id < 0:
+			next_reference = "*"
+		elif next_reference_id == reference_id:
+			next_reference = "="
+		else:
+			next_reference = reference_names[next_reference_id]
+		line = "\t".join([
+			read_name, str(flag), reference_names[reference_id] if reference_id >= 0 else "*", str(position + 1),
+			str(mapq), cigar, next_reference, str(next_position + 1), str(template_length), sequence, quality] + optional_fields)
+		records.append((index, reference_id, position, position + max(reference_length, 1), line))
+		index = end_of_record
+	return header, records, block_offsets
+
+def read_bai(bai_path):
+	"""
+		Read the chunks by bin and linear index of each reference, and the number of unplaced reads, from a bai index
+	"""
+	with open(bai_path, 'rb') as bai_file:
+		data = bai_file.read()
+	assert data[:4] == b"BAI\1"
+	number_of_references = struct.unpack_from("<i", data, 4)[0]
+	index = 8
+	references = []
+	for _ in range(number_of_references):
+		bins = {}
+		number_of_bins = struct.unpack_from("<i", data, index)[0]
+		index += 4
+		for _ in range(number_of_bins):
+			bin_id, number_of_chunks = struct.unpack_from("<Ii", data, index)
+			index += 8
+			bins[bin_id] = [struct.unpack_from("<QQ", data, index + 16 * chunk) for chunk in range(number_of_chunks)]
+			index += 16 * number_of_chunks
+		number_of_windows = struct.unpack_from("<i", data, index)[0]
+		linear_index = struct.unpack_from("<{}Q".format(number_of_windows), data, index + 4)
+		index += 4 + 8 * number_of_windows
+		references.append((bins, linear_index))
+	number_unplaced = struct.unpack_from("<Q", data, index)[0]
+	assert index + 8 == len(data)
+	return references, number_unplaced
+
+def test_bam_writer_round_trips_sorted_records(tmp_path):
+	"""
+		This function tests if sam records written through the bam writer are decoded back into the same records,
+		sorted by coordinate with records of the same position in order of writing, and unplaced reads last
+	"""
+	from scripts.GoldStandardAssembly import bamwriter
+
+	header, records = get_sam_lines()
+	bam_path = str(tmp_path / "reads.bam")
+	with bamwriter.BamWriter(bam_path, tmp_dir=str(tmp_path)) as bam_writer:
+		# lines may be split anywhere between writes
+		text = "".join(line + "\n" for line in header + records)
+		for index in range(0, len(text), 997):
+			bam_writer.write(text[index:index + 997].encode() if index % 2 == 0 else text[index:index + 997])
+
+	decoded_header, decoded_records, block_offsets = decode_bam(bam_path)
+	assert decoded_header[0] == "@HD\tVN:1.4\tSO:coordinate"
+	assert decoded_header[1:] == header[1:]
+	assert len(block_offsets) > 2
+	with open(bam_path, 'rb') as bam_file:
+		assert bam_file.read().endswith(bamwriter.bgzf_eof_marker)
+
+	reference_order = {"chr1": 0, "chr2": 1, "chr3": 2, "*": 3}
+	expected = sorted(records, key=lambda line: (reference_order[line.split("\t")[2]], int(line.split("\t")[3])))
+	assert [record[-1] for record in decoded_records] == expected
+
+def test_bam_writer_spills_records_to_disk(tmp_path):
+	"""
+		This function tests if a bam writer with a tiny memory limit spills its records into sorted runs,
+		merges them into the same bam file and index as in memory, and removes the runs
+	"""
+	from scripts.GoldStandardAssembly.bamwriter import BamWriter
+
+	header, records = get_sam_lines()
+	list_of_outputs = []
+	for name, max_memory in (("memory", 2**30), ("spilled", 20000)):
+		directory = tmp_path / name
+		directory.mkdir()
+		bam_path = str(directory / "reads.bam")
+		bam_writer = BamWriter(bam_path, max_memory=max_memory, tmp_dir=str(directory))
+		bam_writer.write("".join(line + "\n" for line in header + records))
+		number_of_runs = len(bam_writer._file_paths_runs)
+		bam_writer.close()
+		assert (number_of_runs > 10) == (name == "spilled")
+		assert sorted(os.listdir(str(directory))) == ["reads.bam", "reads.bam.bai"]
+		with open(bam_path, 'rb') as bam_file, open(bam_path + ".bai", 'rb') as bai_file:
+			list_of_outputs.append((bam_file.read(), bai_file.read()))
+	assert list_of_outputs[0] == list_of_outputs[1]
+
+def test_bam_writer_index_finds_reads_of_regions(tmp_path):
+	"""
+		This function tests if reads found by querying the bai index for regions are those overlapping the regions,
+		as found by scanning all records
+	"""
+	from scripts.GoldStandardAssembly.bamwriter import BamWriter
+
+	header, records = get_sam_lines()
+	bam_path = str(tmp_path / "reads.bam")
+	with BamWriter(bam_path, max_memory=50000, tmp_dir=str(tmp_path)) as bam_writer:
+		bam_writer.write("".join(line + "\n" for line in header + records))
+	decoded_header, decoded_records, block_offsets = decode_bam(bam_path)
+	references, number_unplaced = read_bai(bam_path + ".bai")
+	assert number_unplaced == sum(1 for record in decoded_records if record[1] < 0)
+
+	def to_inflated_offset(virtual_offset):
+		return block_offsets[virtual_offset >> 16] + (virtual_offset & 0xffff)
+
+	def get_bins(begin, end):
+		# bins overlapping a 0-based, half-open interval, as given by the sam specification
+		end -= 1
+		bins = [0]
+		for shift, first_bin in ((26, 1), (23, 9), (20, 73), (17, 585), (14, 4681)):
+			bins.extend(range(first_bin + (begin >> shift), first_bin + (end >> shift) + 1))
+		return bins
+
+	random_state = np.random.RandomState(1)
+	regions = [(0, 0, 300000), (0, 100, 101), (0, 16383, 16385), (1, 40000, 50000), (2, 0, 1000), (0, 299000, 300000)]
+	regions += [
+		(reference_id, begin, begin + int(random_state.randint(1, 70000)))
+		for reference_id, begin in zip(random_state.randint(0, 2, 30), random_state.randint(0, 50000, 30))]
+	for reference_id, begin, end in regions:
+		bins, linear_index = references[reference_id]
+		window = min(begin >> 14, len(linear_index) - 1)
+		min_offset = to_inflated_offset(linear_index[window]) if window >= 0 else 0
+		chunks = [
+			(to_inflated_offset(chunk_begin), to_inflated_offset(chunk_end))
+			for bin_id in get_bins(begin, end) if bin_id in bins for chunk_begin, chunk_end in bins[bin_id]]
+		found = set(
+			record[-1] for record in decoded_records
+			if any(chunk_begin <= record[0] < chunk_end and chunk_end > min_offset for chunk_begin, chunk_end in chunks)
+			and record[1] == reference_id and record[2] < end and record[3] > begin)
+		expected = set(
+			record[-1] for record in decoded_records if record[1] == reference_id and record[2] < end and record[3] > begin)
+		assert found == expected
+
+	# reference start and end offsets, mapped and unmapped reads of each reference
+	for reference_id, (bins, linear_index) in enumerate(references):
+		reads = [record for record in decoded_records if record[1] == reference_id]
+		flags = [int(record[-1].split("\t")[1]) for record in reads]
+		assert bins[37450][1] == (sum(1 for flag in flags if not flag & 4), sum(1 for flag in flags if flag & 4))
+		assert to_inflated_offset(bins[37450][0][0]) == reads[0][0]
+
+def write_random_bam(bam_path, sequence_id, number_of_reads, length=1000):
+	"""
+		Write reads named '<sequence_id>-<index>' at random positions, spanning several bgzf blocks, and an unmapped one;
+		return reference id, 0-based position, end, flag and name of the reads in order of the file
+	"""
+	random_state = np.random.RandomState(len(sequence_id) + number_of_reads)
+	cigars = [("100M", 100), ("20S80M", 80), ("50M3D50M", 103), ("40M2I58M", 98)]
+	flags = [0, 16, 99, 147, 1024]
+	alignments = []
+	records = []
+	for index, position in enumerate(random_state.randint(0, length - 110, number_of_reads)):
+		cigar, reference_length = cigars[index % len(cigars)]
+		read_name = "{}-{}".format(sequence_id, index)
+		alignments.append((read_name, flags[index % len(flags)], sequence_id, position + 1, cigar))
+		records.append((1, int(position), int(position) + reference_length, flags[index % len(flags)], read_name))
+	alignments.append(("{}-unmapped".format(sequence_id), 4, "*", 0, "*"))
+	write_bam(bam_path, {"other": length, sequence_id: length}, alignments)
+	records.sort(key=lambda record: record[1])
+	records.append((-1, -1, -1, 4, "{}-unmapped".format(sequence_id)))
+	return records
+
+def test_bam_reader_reads_records_of_bgzf_blocks(tmp_path):
+	"""
+		This function tests if the bam reader reads reference, position, end, flag and name of every record,
+		across bgzf blocks, and refuses truncated files
+	"""
+	from scripts.GoldStandardAssembly import bamreader
+
+	bam_path = str(tmp_path / "reads.bam")
+	expected_records = write_random_bam(bam_path, "seq1", 3000)
+	assert len(bamreader._get_chunks(bam_path, chunk_size=1)) > 2
+
+	references, fields = bamreader.read_alignments(bam_path, read_names=True)
+	assert references == [("other", 1000), ("seq1", 1000)]
+	records = list(zip(
+		fields["reference_id"].tolist(), fields["position"].tolist(), fields["end"].tolist(), fields["flag"].tolist(),
+		[read_name.decode() for read_name in fields["read_name"]]))
+	# records of the same position may be in any order
+	assert sorted(records) == sorted(expected_records)
+	assert [record[1] for record in records] == [record[1] for record in expected_records]
+
+	with open(bam_path, 'rb') as bam_file:
+		data = bam_file.read()
+	truncated_bam_path = str(tmp_path / "truncated.bam")
+	with open(truncated_bam_path, 'wb') as bam_file:
+		bam_file.write(data[:len(data) // 2])
+	with pytest.raises(OSError):
+		bamreader.read_alignments(truncated_bam_path)
+
+def test_read_start_positions_from_bam(tmp_path):
+	"""
+		This function tests if read start positions of bam files, read in parallel processes,
+		are grouped by sequence like those parsed from 'samtools view' output
+	"""
+	from scripts.GoldStandardFileFormat.goldstandardfileformat import GoldStandardFileFormat
+
+	list_of_bam_paths = []
+	expected = {}
+	for sequence_id, number_of_reads in (("seq2", 500), ("seq1", 300)):
+		bam_path = str(tmp_path / "{}.bam".format(sequence_id))
+		list_of_bam_paths.append(bam_path)
+		for reference_id, position, end, flag, read_name in write_random_bam(bam_path, sequence_id, number_of_reads):
+			expected.setdefault(read_name.split("-")[0], []).append(position + 1)
+
+	gold_standard_file_format = GoldStandardFileFormat(verbose=False)
+	for max_processes in (1, 2):
+		dict_original_seq_pos = gold_standard_file_format.get_dict_sequence_name_to_positions_from_bam(
+			list_of_bam_paths, max_processes=max_processes)
+		assert list(dict_original_seq_pos) == ["seq2", "seq1"]
+		assert dict((key, value.tolist()) for key, value in dict_original_seq_pos.items()) == expected
+
+def test_read_start_positions_table_of_sample(tmp_path, monkeypatch):
+	"""
+		This function tests if read start positions of a sample are stored in the temporary directory, not next to
+		its bam files, pooled over samples, and read again from bam files once their sizes or modification times change
+	"""
+	from scripts.GoldStandardAssembly import bamreader
+	from scripts.GoldStandardFileFormat.goldstandardfileformat import GoldStandardFileFormat
+
+	list_of_directory_bam = []
+	list_of_bam_paths = []
+	for sample_index, number_of_reads in enumerate((200, 300)):
+		directory_bam = tmp_path / "sample_{}".format(sample_index) / "bam"
+		directory_bam.mkdir(parents=True)
+		list_of_directory_bam.append(str(directory_bam))
+		for sequence_id in ("seq1", "seq2"):
+			list_of_bam_paths.append(str(directory_bam / "{}.bam".format(sequence_id)))
+			write_random_bam(list_of_bam_paths[-1], sequence_id, number_of_reads)
+
+	directory_tmp = tmp_path / "tmp"
+	directory_tmp.mkdir()
+	gold_standard_file_format = GoldStandardFileFormat(verbose=False, tmp_dir=str(directory_tmp))
+	pooled = gold_standard_file_format.get_dict_sequence_name_to_positions_from_dir_of_bam(list_of_directory_bam)
+	assert len(os.listdir(str(directory_tmp))) == 2
+	for directory_bam in list_of_directory_bam:
+		assert not any(file_name.endswith(".npz") for file_name in os.listdir(directory_bam))
+	list_of_bam_paths = [
+		file_path for directory_bam in list_of_directory_bam
+		for file_path in gold_standard_file_format.get_files_in_directory(directory_bam, ".bam")]
+	expected = gold_standard_file_format.get_dict_sequence_name_to_positions_from_bam(list_of_bam_paths)
+	assert list(pooled) == list(expected)
+	assert all(pooled[key].tolist() == expected[key].tolist() for key in expected)
+
+	# stored tables are read instead of the bam files
+	def read_list_of_alignments(*args, **kwargs):
+		raise AssertionError("bam files read again")
+	with monkeypatch.context() as patch:
+		patch.setattr(bamreader, "read_list_of_alignments", read_list_of_alignments)
+		sample = gold_standard_file_format.get_dict_sequence_name_to_positions_from_dir_of_bam(list_of_directory_bam[:1])
+	assert [len(sample[key]) for key in ("seq1", "seq2")] == [201, 201]
+
+	write_random_bam(os.path.join(list_of_directory_bam[0], "seq1.bam"), "seq1", 50)
+	sample = gold_standard_file_format.get_dict_sequence_name_to_positions_from_dir_of_bam(list_of_directory_bam[:1])
+	# the unmapped read is counted as well, at position 0
+	assert [len(sample[key]) for key in ("seq1", "seq2")] == [51, 201]
+
+	# a bam file of the same size written again is read again
+	file_path_bam = os.path.join(list_of_directory_bam[0], "seq2.bam")
+	stat = os.stat(file_path_bam)
+	os.utime(file_path_bam, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+	with monkeypatch.context() as patch:
+		patch.setattr(bamreader, "read_list_of_alignments", read_list_of_alignments)
+		with pytest.raises(AssertionError):
+			gold_standard_file_format.get_dict_sequence_name_to_positions_from_dir_of_bam(list_of_directory_bam[:1])
+
+def get_high_depth_sample(number_of_reads=10000, number_of_contigs=200, sequence_length=10**6):
+	"""
+		Get read start positions of two sequences, as read from bam files,
+		and contigs named like those of the gold standard assembly
+	"""
+	random_state = np.random.RandomState(0)
+	dict_original_seq_pos = {}
+	dict_sequence_name_to_anonymous = {}
+	for sequence_id in ("seq1", "seq2"):
+		positions = random_state.randint(1, sequence_length + 1, number_of_reads)
+		dict_original_seq_pos[sequence_id] = [str(position) for position in positions]
+		boundaries = np.sort(random_state.choice(np.arange(1, sequence_length + 1), 2 * number_of_contigs, replace=False))
+		for index, (start, end) in enumerate(boundaries.reshape(-1, 2)):
+			contig_id = "{}_from_{}_to_{}_total_{}".format(sequence_id, start, end, end - start + 1)
+			dict_sequence_name_to_anonymous[contig_id] = "{}C{}".format(sequence_id, index)
+	return dict_original_seq_pos, dict_sequence_name_to_anonymous
+
+def test_gsa_contig_mapping_counts_reads_by_binary_search():
+	"""
+		This function tests if reads per contig counted by binary search are the same as those counted
+		by scanning all read start positions of a sequence for every contig
+	"""
+	from scripts.GoldStandardFileFormat.goldstandardfileformat import GoldStandardFileFormat
+
+	dict_original_seq_pos, dict_sequence_name_to_anonymous = get_high_depth_sample()
+	dict_sequence_to_genome_id = {"seq1": "genome1", "seq2": "genome2"}
+	dict_genome_id_to_tax_id = {"genome1": "1", "genome2": "2"}
+
+	expected_counts = []
+	for contig_id in dict_sequence_name_to_anonymous:
+		sequence_id, positions = contig_id.rsplit("_from_", 1)
+		start, end = (int(position) for position in re.findall(r"\d+", positions)[:2])
+		expected_counts.append(sum(1 for number in dict_original_seq_pos[sequence_id] if start <= int(number) <= end))
+
+	stream_output = io.StringIO()
+	gold_standard_file_format = GoldStandardFileFormat(verbose=False)
+	gold_standard_file_format.write_gsa_contig_mapping(
+		stream_output, dict_sequence_name_to_anonymous, dict_original_seq_pos,
+		dict_sequence_to_genome_id, dict_genome_id_to_tax_id)
+
+	rows = [line.split("\t") for line in stream_output.getvalue().splitlines()[1:]]
+	assert [int(row[4]) for row in rows] == expected_counts
+	assert sum(expected_counts) > 0
+
+def test_sequence_to_genome_id_table_of_moved_genomes(tmp_path, monkeypatch):
+	"""
+		This function tests if moving genomes writes a sorted table of sequence ids and genome ids,
+		which gold standards take the genome of each sequence from without parsing the genomes
+	"""
+	from scripts.GenomePreparation.genomepreparation import GenomePreparation
+	from scripts.GoldStandardFileFormat import goldstandardfileformat
+
+	directory_input = tmp_path / "input"
+	directory_input.mkdir()
+	directory_output = tmp_path / "source_genomes"
+	directory_output.mkdir()
+	genome_id_to_path_map = {}
+	for genome_id, sequence_ids in (("genome_b", ("seq2", "seq1")), ("genome_a", ("seq1", "seq3"))):
+		file_path_genome = directory_input / "{}.fna".format(genome_id)
+		file_path_genome.write_text("".join(">{} description\nACGTACGT\n".format(sequence_id) for sequence_id in sequence_ids))
+		genome_id_to_path_map[genome_id] = str(file_path_genome)
+	GenomePreparation(verbose=False).move_genome_files(genome_id_to_path_map, str(directory_output))
+
+	expected = [("seq1", "genome_b"), ("seq1_0", "genome_a"), ("seq2", "genome_b"), ("seq3", "genome_a")]
+	with open(str(directory_output / "sequence_to_genome_id.tsv")) as table:
+		assert [tuple(line.rstrip("\n").split("\t")) for line in table] == expected
+
+	file_path_genome_locations = tmp_path / "genome_locations.tsv"
+	file_path_genome_locations.write_text("".join(
+		"{}\t{}\n".format(genome_id, file_path) for genome_id, file_path in genome_id_to_path_map.items()))
+	def parse(*args, **kwargs):
+		raise AssertionError("genomes parsed")
+	monkeypatch.setattr(goldstandardfileformat.SeqIO, "parse", parse)
+	gold_standard_file_format = goldstandardfileformat.GoldStandardFileFormat(verbose=False)
+	assert gold_standard_file_format.get_dict_sequence_to_genome_id(str(file_path_genome_locations)) == dict(expected)
+	assert gold_standard_file_format.get_dict_sequence_to_genome_id(
+		str(file_path_genome_locations), set_of_genome_id={"genome_a"}) == {"seq1_0": "genome_a", "seq3": "genome_a"}
+
+def test_gzip_blocks_compressed_in_parallel_are_one_gzip_file(tmp_path):
+	"""
+		This function tests if a file gzipped block by block in several processes decompresses to the file with stock gzip,
+		and is identical to the one gzipped by a single process
+	"""
+	from scripts.Archive.compress import Compress
+
+	file_path_input = tmp_path / "anonymous_reads.fq"
+	random_state = np.random.RandomState(0)
+	data = b"".join(
+		b"@read%d\n%s\n+\n%s\n" % (index, random_state.choice(list(b"ACGT"), 100).astype(np.uint8).tobytes(), b"I" * 100)
+		for index in range(2000))
+	file_path_input.write_bytes(data)
+
+	compressor = Compress(verbose=False)
+	compressor._block_size = 2**16
+	list_of_compressed = []
+	for max_processors in (1, 2):
+		directory_output = tmp_path / "processors_{}".format(max_processors)
+		directory_output.mkdir()
+		compressor.compress_file(str(file_path_input), str(directory_output), compression_type="gz", max_processors=max_processors)
+		list_of_compressed.append((directory_output / "anonymous_reads.fq.gz").read_bytes())
+	assert list_of_compressed[0] == list_of_compressed[1]
+	assert list_of_compressed[0].count(b"\x1f\x8b\x08") >= len(data) // 2**16
+	if shutil.which("gzip") is not None:
+		assert subprocess.check_output(["gzip", "-dc"], input=list_of_compressed[0]) == data
+	assert gzip.decompress(list_of_compressed[0]) == data
+
+def double_non_negative(value):
+	"""
+		Scheduled task failing for negative values
+	"""
+	if value < 0:
+		raise ValueError("negative value {}".format(value))
+	return value * 2
+
+def test_scheduled_tasks_return_failures_in_place():
+	"""
+		This function tests if the return values of scheduled tasks are in the order of the tasks,
+		with a placeholder for each task that raised an exception
+	"""
+	from scripts.parallel import TaskThread, TaskFailure, runThreadScheduled
+
+	values = [3, -1, 5, -2, 7]
+	tasks = [TaskThread(double_non_negative, (value,), cost=index) for index, value in enumerate(values)]
+	list_of_return_values, busy_fraction = runThreadScheduled(tasks, maxThreads=2)
+	assert len(list_of_return_values) == len(values)
+	assert [return_value for return_value in list_of_return_values if not isinstance(return_value, TaskFailure)] == [6, 10, 14]
+	for index in (1, 3):
+		assert isinstance(list_of_return_values[index], TaskFailure)
+		assert isinstance(list_of_return_values[index].error, ValueError)
+		assert str(list_of_return_values[index]) == "ValueError: negative value {}".format(values[index])
+	assert 0 <= busy_fraction <= 1
+
+def write_corrupt_contig_file(
+		list_of_file_paths_bam, file_path_fasta_ref, file_path_output, min_length, min_coverage, genome=None):
+	"""
+		Stand-in for writing the contigs of a genome, raising an error the contig writer does not catch
+	"""
+	raise IndexError("corrupt record")
+
+@pytest.mark.skipif(shutil.which("samtools") is None, reason="samtools is required")
+def test_gsa_reports_failed_genomes_by_key(tmp_path, monkeypatch):
+	"""
+		This function tests if a genome whose assembly task raised an error is reported by its key
+	"""
+	from scripts.GoldStandardAssembly import coverage
+	from scripts.GoldStandardAssembly.goldstandardassembly import GoldStandardAssembly
+
+	reference_path, bam_path = write_gsa_input(tmp_path)
+	monkeypatch.setattr(coverage, "write_contig_file", write_corrupt_contig_file)
+	log_path = str(tmp_path / "gsa.log")
+	gold_standard_assembly = GoldStandardAssembly(max_processes=2, tmp_dir=str(tmp_path), logfile=log_path, verbose=False)
+	with pytest.raises(OSError):
+		gold_standard_assembly.gold_standard_assembly(
+			{"genome_a": bam_path, "genome_b": bam_path}, {"genome_a": reference_path, "genome_b": reference_path})
+	with open(log_path) as log:
+		log_text = log.read()
+	for key in ("genome_a", "genome_b"):
+		assert "Genome '{}': IndexError: corrupt record".format(key) in log_text
+
+def test_pooled_gsa_of_samples_equals_that_of_merged_bam(tmp_path):
+	"""
+		This function tests if the pooled gold standard assembly, summing the coverage of the bam files of several samples,
+		equals the one of a single bam file holding the records of all of them,
+		with reads reaching past the end of a reference in one sample only
+	"""
+	from scripts.GoldStandardAssembly import coverage
+	from scripts.GoldStandardAssembly.goldstandardassembly import GoldStandardAssembly
+
+	sequences = get_random_sequences((400, 120), seed=2, prefix="ref")
+	reference_path = str(tmp_path / "genome_a.fasta")
+	write_fasta(reference_path, sequences)
+	# reference, 1-based position and cigar of the reads of each sample, overhanging reads in one sample each
+	alignments_of_samples = [
+		[("ref1", 1, "50M"), ("ref1", 31, "20M5D30M"), ("ref1", 150, "40M"), ("ref1", 371, "50M"), ("ref2", 5, "30M")],
+		[("ref1", 21, "50M"), ("ref1", 170, "10S40M"), ("ref1", 391, "5M"), ("ref2", 20, "30M"), ("ref2", 101, "40M")]]
+	sequence_lengths = {sequence_id: len(sequence) for sequence_id, sequence in sequences.items()}
+	list_of_alignments = [
+		[("r{}-{}".format(sample_index, index), 0, sequence_id, position, cigar)
+			for index, (sequence_id, position, cigar) in enumerate(alignments)]
+		for sample_index, alignments in enumerate(alignments_of_samples)]
+
+	list_of_directory_bam = []
+	for sample_index, alignments in enumerate(list_of_alignments):
+		directory_bam = tmp_path / "sample_{}".format(sample_index) / "bam"
+		directory_bam.mkdir(parents=True)
+		write_bam(str(directory_bam / "genome_a.bam"), sequence_lengths, alignments)
+		list_of_directory_bam.append(str(directory_bam))
+	merged_bam_path = str(tmp_path / "merged.bam")
+	write_bam(merged_bam_path, sequence_lengths, list_of_alignments[0] + list_of_alignments[1])
+
+	file_paths_bam = [os.path.join(directory_bam, "genome_a.bam") for directory_bam in list_of_directory_bam]
+	pooled_coverage = coverage.read_coverage(file_paths_bam, sequence_lengths)
+	merged_coverage = coverage.read_coverage([merged_bam_path], sequence_lengths)
+	assert list(pooled_coverage) == list(merged_coverage) == ["ref1", "ref2"]
+	for sequence_id in sequences:
+		assert np.array_equal(pooled_coverage[sequence_id], merged_coverage[sequence_id])
+	assert len(pooled_coverage["ref1"]) == 420 and len(pooled_coverage["ref2"]) == 140
+
+	# samtools is only run to merge bam files
+	file_path_samtools = tmp_path / "samtools"
+	file_path_samtools.write_text("#!/bin/sh\nexit 1\n")
+	file_path_samtools.chmod(0o755)
+	gold_standard_assembly = GoldStandardAssembly(
+		file_path_samtools=str(file_path_samtools), max_processes=2, tmp_dir=str(tmp_path), verbose=False)
+	file_path_pooled = gold_standard_assembly.pooled_gold_standard_by_dir(
+		list_of_directory_bam, {"genome_a": reference_path}, str(tmp_path / "pooled.fasta"))
+	file_path_merged = gold_standard_assembly.gold_standard_assembly(
+		{"genome_a": merged_bam_path}, {"genome_a": reference_path}, str(tmp_path / "merged.fasta"))
+	with open(file_path_pooled) as pooled, open(file_path_merged) as merged:
+		contigs = pooled.read()
+		assert contigs == merged.read()
+	assert ">ref1_from_371_to_420_total_50\n{}\n".format(sequences["ref1"][370:] + "N" * 20) in contigs
+	assert ">ref2_from_101_to_140_total_40\n{}\n".format(sequences["ref2"][100:] + "N" * 20) in contigs
+
+@pytest.mark.skipif(shutil.which("samtools") is None, reason="samtools is required")
+def test_streamed_sam_of_simulator_fails_on_bad_sam(tmp_path):
+	"""
+		This function tests if sam output streamed through a fifo into a sorted bam file fails the command
+		and leaves no bam file if the simulator writes malformed sam, and succeeds for valid sam
+	"""
+	from scripts.GoldStandardAssembly.samtoolswrapper import SamtoolsWrapper
+
+	samtools = SamtoolsWrapper(tmp_dir=str(tmp_path), verbose=False)
+	header = "@HD\tVN:1.4\n@SQ\tSN:seq1\tLN:1000\n"
+	for name, record, expected_returncode in (
+			("good", "r1\t0\tseq1\t10\t60\t4M\t*\t0\t0\tACGT\tIIII\n", 0),
+			("bad", "r1\t0\tseq1\t10\t60\t4M\t*\t0\t0\tACGT\tIIII\nr2\t0\tseq1\tnot_a_position\t60\t4M\t*\t0\t0\tACGT\tIIII\n", 1)):
+		file_path_sam_content = tmp_path / "{}.txt".format(name)
+		file_path_sam_content.write_text(header + record)
+		file_path_sam = str(tmp_path / "{}.sam".format(name))
+		cmd_simulator = "cat '{}' > '{}'".format(file_path_sam_content, file_path_sam)
+		cmd = samtools.get_fifo_to_bam_cmd(cmd_simulator, file_path_sam, str(tmp_path))
+		returncode = subprocess.call(cmd, shell=True, stderr=subprocess.DEVNULL)
+		assert returncode == expected_returncode
+		assert os.path.isfile(str(tmp_path / "{}.bam".format(name))) == (expected_returncode == 0)
+		assert not os.path.exists(file_path_sam)
+
+def write_paired_reads(directory, number_of_pairs=500):
+	"""
+		Write forward and reverse fastq files of reads of two sequences, named '<sequence_id>-<index>/<1|2>',
+		and return sequence and quality of each read by read id
+	"""
+	random_state = np.random.RandomState(0)
+	reads = {}
+	for sequence_id in ("seq1", "seq2"):
+		for direction in (1, 2):
+			with open(str(directory / "{}_{}.fq".format(sequence_id, direction)), 'w') as fastq_file:
+				for index in range(number_of_pairs):
+					read_id = "{}-{}/{}".format(sequence_id, index, direction)
+					sequence = "".join(random_state.choice(list("ACGT"), 50))
+					quality = "".join(chr(33 + value) for value in random_state.randint(0, 41, 50))
+					fastq_file.write("@{}\n{}\n+\n{}\n".format(read_id, sequence, quality))
+					reads[read_id] = (sequence, quality)
+	return reads
+
+def test_anonymized_reads_are_a_seeded_permutation_of_pairs(tmp_path):
+	"""
+		This function tests if shuffling and anonymizing read pairs in external memory outputs each read once,
+		keeps pairs together, maps anonymous ids to the original reads and their gold standard,
+		and gives the same output for the same seed
+	"""
+	from fastaanonymizer import FastaAnonymizer
+	from scripts.GoldStandardFileFormat.goldstandardfileformat import GoldStandardFileFormat
+
+	directory_reads = tmp_path / "reads"
+	directory_reads.mkdir()
+	reads = write_paired_reads(directory_reads)
+	gold_standard = {b"seq1": b"genome1\t1", b"seq2": b"genome2\t2"}
+
+	list_of_outputs = []
+	for name, seed in (("a", 7), ("b", 7), ("c", 8)):
+		directory = tmp_path / name
+		directory.mkdir()
+		# a tiny memory limit scatters the reads into many buckets
+		anonymizer = FastaAnonymizer(seed=seed, tmp_dir=str(directory), max_memory=2**-20, verbose=False)
+		assert anonymizer._get_number_of_buckets(anonymizer._get_file_paths(str(directory_reads), True, ".fq")) > 10
+		file_path_output, file_path_mapping = anonymizer.interweave_shuffle_anonymize(
+			str(directory_reads), str(directory / "anonymous_reads.fq"), str(directory / "reads_mapping.tsv"),
+			prefix="S0R", file_format="fastq", file_extension=".fq", gold_standard=gold_standard)
+		assert sorted(os.listdir(str(directory))) == ["anonymous_reads.fq", "reads_mapping.tsv"]
+		with open(file_path_output) as output_file, open(file_path_mapping) as mapping_file:
+			list_of_outputs.append((output_file.read(), mapping_file.read()))
+	assert list_of_outputs[0] == list_of_outputs[1]
+	assert list_of_outputs[0] != list_of_outputs[2]
+
+	for output, mapping in list_of_outputs:
+		lines = output.splitlines()
+		records = [(lines[index][1:], lines[index + 1], lines[index + 3]) for index in range(0, len(lines), 4)]
+		assert all(lines[index] == "+" for index in range(2, len(lines), 4))
+		mapping_lines = mapping.splitlines()
+		assert mapping_lines[0] + "\n" == GoldStandardFileFormat.read_mapping_header
+		rows = [line.split("\t") for line in mapping_lines[1:]]
+		assert len(rows) == len(records) == len(reads)
+		assert [row[0] for row in rows] == [anonymous_id for anonymous_id, sequence, quality in records]
+		# every read once, with its sequence and quality
+		assert sorted(row[3] for row in rows) == sorted(reads)
+		for (anonymous_id, sequence, quality), (row_anonymous_id, genome_id, tax_id, read_id) in zip(records, rows):
+			assert reads[read_id] == (sequence, quality)
+			assert (genome_id, tax_id) == (("genome1", "1") if read_id.startswith("seq1-") else ("genome2", "2"))
+		# pairs follow each other, named after the same anonymous id
+		for index in range(0, len(rows), 2):
+			assert rows[index][0] == "S0R{}/1".format(index // 2) and rows[index + 1][0] == "S0R{}/2".format(index // 2)
+			assert rows[index][3][:-2] == rows[index + 1][3][:-2]
+			assert rows[index][3].endswith("/1") and rows[index + 1][3].endswith("/2")
+		# shuffled across sequences
+		assert [row[3] for row in rows[::2]] != sorted(row[3] for row in rows[::2])
+
+def test_samples_anonymized_in_parallel_equal_those_anonymized_one_by_one(tmp_path):
+	"""
+		This function tests if anonymizing samples at the same time gives the output of anonymizing them one by one,
+		hands compressed output on to be archived and returns an error message instead of raising
+	"""
+	from metagenomesimulation import _anonymize_sample
+	from scripts.parallel import TaskThread, runThreadScheduled
+
+	directory_reads = tmp_path / "reads"
+	directory_reads.mkdir()
+	reads = write_paired_reads(directory_reads, number_of_pairs=200)
+	seeds = [(3, 0), (4, 0)]
+
+	def get_arguments(name, sample_index, compress=False, read_gold_standard=None, directory_input=directory_reads):
+		directory = tmp_path / name / str(sample_index)
+		directory.mkdir(parents=True)
+		file_paths = {
+			"log": str(directory / "anonymization.log"),
+			"reads": str(directory_input),
+			"bam": None,
+			"gsa": None,
+			"reads_out": str(directory / "anonymous_reads.fq"),
+			"reads_map_out": str(directory / "reads_mapping.tsv"),
+			"gsa_out": str(directory / "gsa_anonymous.fasta"),
+			"gsa_map_out": str(directory / "gsa_mapping.tsv"),
+			}
+		if read_gold_standard is None:
+			read_gold_standard = {b"seq1": b"genome1\t1", b"seq2": b"genome2\t2"}
+		options = {
+			"paired_end": True,
+			"anonymize_gsa": False,
+			"compress": compress,
+			"tmp_dir": str(directory),
+			"max_memory": 2**-20,
+			"column_name_gid": "genome_ID",
+			"column_name_ncbi": "NCBI_ID",
+			"separator": "\t",
+			"file_path_genome_locations": None,
+			"file_path_metadata": None,
+			"read_gold_standard": read_gold_standard,
+			"verbose": False,
+			"debug": False,
+			}
+		return sample_index, seeds[sample_index], file_paths, options
+
+	def read_output(file_path_reads, file_path_mapping):
+		with open(file_path_reads) as reads_file, open(file_path_mapping) as mapping_file:
+			return reads_file.read(), mapping_file.read()
+
+	list_of_outputs = []
+	for sample_index in range(len(seeds)):
+		arguments = get_arguments("serial", sample_index)
+		assert _anonymize_sample(*arguments) == []
+		list_of_outputs.append(read_output(arguments[2]["reads_out"], arguments[2]["reads_map_out"]))
+	assert list_of_outputs[0] != list_of_outputs[1]
+	for output, mapping in list_of_outputs:
+		assert len(output.splitlines()) == 4 * len(reads)
+		assert all(line.startswith("S") for line in mapping.splitlines()[1:])
+
+	list_of_arguments = [get_arguments("parallel", sample_index) for sample_index in range(len(seeds))]
+	list_of_return_values, busy_fraction = runThreadScheduled(
+		[TaskThread(_anonymize_sample, arguments) for arguments in list_of_arguments], maxThreads=2)
+	assert list_of_return_values == [[], []]
+	for sample_index, arguments in enumerate(list_of_arguments):
+		file_paths = arguments[2]
+		assert read_output(file_paths["reads_out"], file_paths["reads_map_out"]) == list_of_outputs[sample_index]
+		assert "S{}R0/1".format(sample_index) in list_of_outputs[sample_index][1]
+
+	# compressed output is left in the temporary directory, to be archived in sample order
+	sample_index, sample_seeds, file_paths, options = get_arguments("compressed", 1, compress=True)
+	list_tuple_archive_files = _anonymize_sample(sample_index, sample_seeds, file_paths, options)
+	assert [file_path_archive for file_path, file_path_archive in list_tuple_archive_files] == [
+		file_paths["reads_out"] + ".gz", file_paths["reads_map_out"] + ".gz"]
+	assert not os.path.exists(file_paths["reads_out"]) and not os.path.exists(file_paths["reads_map_out"])
+	assert read_output(*[file_path for file_path, file_path_archive in list_tuple_archive_files]) == list_of_outputs[1]
+
+	# failures are returned, naming the sample and its log file
+	sample_index, sample_seeds, file_paths, options = get_arguments(
+		"unknown_sequence", 0, read_gold_standard={b"seq1": b"genome1\t1"})
+	error = _anonymize_sample(sample_index, sample_seeds, file_paths, options)
+	assert isinstance(error, str)
+	assert error.startswith("Anonymization of sample 0 failed, see '{}'".format(file_paths["log"]))
+	assert "sequence_id 'seq2' not found in mapping" in error
+	error = _anonymize_sample(*get_arguments("missing_reads", 1, directory_input=tmp_path / "missing"))
+	assert isinstance(error, str) and error.startswith("Anonymization of sample 1 failed")
+
+def test_read_gold_standard_written_while_anonymizing_equals_that_of_id_mapping(tmp_path):
+	"""
+		This function tests if the read gold standard written while reads are anonymized has the rows
+		of the one written from the id mapping afterwards, and fails on reads of unknown sequences
+	"""
+	from fastaanonymizer import FastaAnonymizer
+	from scripts.GenomePreparation.genomestatistics import GenomeStatisticsIndex
+	from scripts.GoldStandardFileFormat.goldstandardfileformat import GoldStandardFileFormat
+
+	directory_reads = tmp_path / "reads"
+	directory_reads.mkdir()
+	reads = write_paired_reads(directory_reads, number_of_pairs=200)
+	file_path_genome_locations = tmp_path / "genome_locations.tsv"
+	file_path_metadata = tmp_path / "metadata.tsv"
+	with open(str(file_path_genome_locations), 'w') as genome_locations, open(str(file_path_metadata), 'w') as metadata:
+		metadata.write("genome_ID\tNCBI_ID\n")
+		for genome_id, tax_id, sequence_ids in (("genome1", "101", ("seq1", "seq3")), ("genome2", "102", ("seq2", ))):
+			file_path_genome = tmp_path / "{}.fna".format(genome_id)
+			file_path_genome.write_text("".join(">{} description\nACGTACGT\n".format(sequence_id) for sequence_id in sequence_ids))
+			genome_locations.write("{}\t{}\n".format(genome_id, file_path_genome))
+			metadata.write("{}\t{}\n".format(genome_id, tax_id))
+
+	gold_standard_file_format = GoldStandardFileFormat(verbose=False)
+	gold_standard = gold_standard_file_format.get_dict_sequence_to_read_gold_standard(
+		str(file_path_genome_locations), str(file_path_metadata))
+	assert gold_standard == {b"seq1": b"genome1\t101", b"seq3": b"genome1\t101", b"seq2": b"genome2\t102"}
+	directory_index = tmp_path / "index"
+	directory_index.mkdir()
+	assert gold_standard_file_format.get_dict_sequence_to_read_gold_standard(
+		str(file_path_genome_locations), str(file_path_metadata),
+		genome_statistics=GenomeStatisticsIndex(str(directory_index))) == gold_standard
+
+	list_of_outputs = []
+	for name, read_gold_standard in (("fused", gold_standard), ("id_mapping", None)):
+		directory = tmp_path / name
+		directory.mkdir()
+		anonymizer = FastaAnonymizer(seed=5, tmp_dir=str(directory), max_memory=2**-20, verbose=False)
+		file_path_output, file_path_mapping = anonymizer.interweave_shuffle_anonymize(
+			str(directory_reads), str(directory / "anonymous_reads.fq"), str(directory / "mapping.tsv"),
+			prefix="S0R", file_format="fastq", file_extension=".fq", gold_standard=read_gold_standard)
+		with open(file_path_output) as output_file:
+			list_of_outputs.append((output_file.read(), file_path_mapping))
+	(output_fused, file_path_mapping_fused), (output_id_mapping, file_path_id_mapping) = list_of_outputs
+	assert output_fused == output_id_mapping
+
+	stream_output = io.StringIO()
+	gold_standard_file_format.gs_read_mapping(
+		str(file_path_genome_locations), str(file_path_metadata), file_path_id_mapping, stream_output)
+	with open(file_path_mapping_fused) as mapping_file:
+		mapping_fused = mapping_file.read().splitlines()
+	mapping_id_mapping = stream_output.getvalue().splitlines()
+	assert mapping_fused[0] == mapping_id_mapping[0] == GoldStandardFileFormat.read_mapping_header.rstrip("\n")
+	assert len(mapping_fused) == len(reads) + 1
+	# rows are in the order of the anonymized reads, instead of sorted by anonymous id
+	assert sorted(mapping_fused[1:]) == sorted(mapping_id_mapping[1:])
+	assert [line.split("\t")[0] for line in mapping_fused[1:]] == [
+		line[1:] for line in output_fused.splitlines()[::4]]
+
+	directory = tmp_path / "unknown_sequence"
+	directory.mkdir()
+	anonymizer = FastaAnonymizer(seed=5, tmp_dir=str(directory), verbose=False)
+	with pytest.raises(KeyError, match="sequence_id 'seq2' not found in mapping"):
+		anonymizer.interweave_shuffle_anonymize(
+			str(directory_reads), str(directory / "anonymous_reads.fq"), str(directory / "mapping.tsv"),
+			prefix="S0R", file_format="fastq", file_extension=".fq", gold_standard={b"seq1": b"genome1\t101"})
+
+	directory_unnamed_reads = tmp_path / "unnamed_reads"
+	directory_unnamed_reads.mkdir()
+	for direction in (1, 2):
+		(directory_unnamed_reads / "seq1_{}.fq".format(direction)).write_text("@seq1/{}\nACGT\n+\nIIII\n".format(direction))
+	directory = tmp_path / "unnamed"
+	directory.mkdir()
+	anonymizer = FastaAnonymizer(seed=5, tmp_dir=str(directory), verbose=False)
+	with pytest.raises(ValueError, match="missing '-'"):
+		anonymizer.interweave_shuffle_anonymize(
+			str(directory_unnamed_reads), str(directory / "anonymous_reads.fq"), str(directory / "mapping.tsv"),
+			prefix="S0R", file_format="fastq", file_extension=".fq", gold_standard=gold_standard)
+
+def write_genome(file_path, sequence_lengths=(5000, 3000, 50)):
+	"""
+		Write a genome of random sequences, the second one with a run of 'N', and return its sequences by id
+	"""
+	sequences = get_random_sequences(sequence_lengths)
+	if "seq2" in sequences:
+		sequences["seq2"] = sequences["seq2"][:1000] + "N" * 20 + sequences["seq2"][1020:]
+	write_fasta(file_path, sequences, description=" description")
+	return sequences
+
+def simulate_reads(directory, genome_path, seed, error_rate_start=0.05, error_rate_end=0.25, bam=False):
+	"""
+		Simulate reads with the numpy simulator, return the content of the fastq files and the sam lines,
+		decoded from the bam file if one is written
+	"""
+	from scripts.ReadSimulationWrapper import numpy_simulator
+	from scripts.GoldStandardAssembly.bamwriter import BamWriter
+
+	directory.mkdir()
+	prefix = str(directory / "genome")
+	bam_writer = BamWriter(prefix + ".bam", tmp_dir=str(directory)) if bam else None
+	assert numpy_simulator.simulate_paired_reads(
+		genome_path, 30, prefix, 100, 270, 27, error_rate_start, error_rate_end, seed, batch_size=128,
+		bam_writer=bam_writer) is None
+	with open(prefix + "1.fq") as fastq_1, open(prefix + "2.fq") as fastq_2:
+		fastq = (fastq_1.read(), fastq_2.read())
+	if bam:
+		header, records, block_offsets = decode_bam(prefix + ".bam")
+		return fastq, header, [record[-1] for record in records]
+	with open(prefix + ".sam") as sam_file:
+		lines = sam_file.read().splitlines()
+	return fastq, [line for line in lines if line.startswith("@")], [line for line in lines if not line.startswith("@")]
+
+def test_numpy_simulator_applies_error_profile(tmp_path):
+	"""
+		This function tests if substitutions of simulated reads follow the error rates along each read,
+		ambiguous bases are kept, qualities reflect the error rates, and reads without errors match the reference
+	"""
+	from scripts.ReadSimulationWrapper import numpy_simulator
+
+	genome_path = str(tmp_path / "genome.fasta")
+	sequences = write_genome(genome_path)
+	complement = str.maketrans("ACGTN", "TGCAN")
+	for name, error_rate_start, error_rate_end in (("errors", 0.05, 0.25), ("exact", 0., 0.)):
+		fastq, header, sam_lines = simulate_reads(
+			tmp_path / name, genome_path, 1, error_rate_start, error_rate_end)
+		error_rates = numpy_simulator.get_error_rates(100, error_rate_start, error_rate_end)
+		quality = numpy_simulator.get_quality_string(error_rates).decode()
+		mismatches = []
+		for line in sam_lines:
+			read_name, flag, sequence_id, position, mapq, cigar = line.split("\t")[:6]
+			sequence, read_quality = line.split("\t")[9:11]
+			reference = sequences[sequence_id][int(position) - 1:int(position) + 99]
+			is_mismatch = np.array([base != reference_base for base, reference_base in zip(sequence, reference)])
+			# positions along the read, which is sequenced from the reverse strand if flagged
+			if int(flag) & 16:
+				is_mismatch = is_mismatch[::-1]
+				read_quality = read_quality[::-1]
+			assert read_quality == quality
+			assert cigar == "100M"
+			if "N" in reference:
+				assert all(base == "N" for base, reference_base in zip(sequence, reference) if reference_base == "N")
+				continue
+			mismatches.append(is_mismatch)
+		assert "seq3" not in "".join(sam_lines)
+		observed_error_rates = np.mean(mismatches, axis=0)
+		assert np.abs(observed_error_rates - error_rates).max() < 0.05
+		assert abs(observed_error_rates.mean() - error_rates.mean()) < 0.01
+		if error_rate_end == 0:
+			assert not np.any(mismatches)
+			# fastq reads are those of the sam file, in the orientation they were sequenced
+			for fastq_text in fastq:
+				for line in fastq_text.splitlines()[1::4]:
+					assert line in sequences["seq1"] + sequences["seq2"] or \
+						line.translate(complement)[::-1] in sequences["seq1"] + sequences["seq2"]
+
+def test_numpy_simulator_fastq_agrees_with_sam_and_bam(tmp_path):
+	"""
+		This function tests if fastq reads of the numpy simulator are those of its sam output, in the orientation sequenced,
+		if a bam file holds the same records sorted, byte by byte as written from the sam lines,
+		and if a seed always gives the same reads
+	"""
+	from scripts.GoldStandardAssembly.bamwriter import BamWriter
+
+	genome_path = str(tmp_path / "genome.fasta")
+	write_genome(genome_path)
+	fastq, header, sam_lines = simulate_reads(tmp_path / "sam", genome_path, 5)
+	assert header == ["@HD\tVN:1.4\tSO:unsorted", "@SQ\tSN:seq1\tLN:5000", "@SQ\tSN:seq2\tLN:3000", "@SQ\tSN:seq3\tLN:50"]
+
+	complement = str.maketrans("ACGTN", "TGCAN")
+	reads_of_sam = {}
+	for line in sam_lines:
+		fields = line.split("\t")
+		flag, sequence, quality = int(fields[1]), fields[9], fields[10]
+		if flag & 16:
+			sequence, quality = sequence.translate(complement)[::-1], quality[::-1]
+		reads_of_sam["{}/{}".format(fields[0], 1 if flag & 64 else 2)] = (sequence, quality)
+		# mates point at each other
+		assert fields[6] == "=" and int(fields[8]) != 0
+	reads_of_fastq = {}
+	for direction, fastq_text in enumerate(fastq, 1):
+		lines = fastq_text.splitlines()
+		for index in range(0, len(lines), 4):
+			assert lines[index].endswith("/{}".format(direction))
+			reads_of_fastq[lines[index][1:]] = (lines[index + 1], lines[index + 3])
+	assert len(reads_of_fastq) == len(sam_lines)
+	assert reads_of_fastq == reads_of_sam
+	assert all(re.match(r"^seq[12]-\d+/[12]$", read_id) for read_id in reads_of_fastq)
+
+	fastq_bam, header_bam, bam_lines = simulate_reads(tmp_path / "bam", genome_path, 5, bam=True)
+	assert fastq_bam == fastq
+	assert header_bam == ["@HD\tVN:1.4\tSO:coordinate"] + header[1:]
+	sort_key = lambda line: (line.split("\t")[2], int(line.split("\t")[3]))
+	assert [sort_key(line) for line in bam_lines] == sorted(sort_key(line) for line in bam_lines)
+	assert sorted(bam_lines) == sorted(sam_lines)
+	# records added from the arrays of the simulator are those encoded from its sam lines
+	bam_path = str(tmp_path / "bam" / "genome.bam")
+	with BamWriter(str(tmp_path / "sam" / "genome.bam"), tmp_dir=str(tmp_path)) as bam_writer:
+		bam_writer.write("".join(line + "\n" for line in header + sam_lines))
+	for extension in ("", ".bai"):
+		with open(str(tmp_path / "sam" / "genome.bam") + extension, 'rb') as bam_file_of_sam, \
+				open(bam_path + extension, 'rb') as bam_file:
+			assert bam_file_of_sam.read() == bam_file.read()
+
+	assert simulate_reads(tmp_path / "same_seed", genome_path, 5) == (fastq, header, sam_lines)
+	assert simulate_reads(tmp_path / "other_seed", genome_path, 6)[0] != fastq
+
+def test_subsampled_reads_keep_fastq_and_sam_read_names(tmp_path):
+	"""
+		This function tests if a subsample of simulated read pairs keeps the same read names in its fastq files and
+		its sam or bam output, if it holds the expected number of pairs, and if a seed always draws the same pairs
+	"""
+	from scripts.ReadSimulationWrapper import subsampler
+	from scripts.GoldStandardAssembly.bamwriter import BamWriter
+
+	genome_path = str(tmp_path / "genome.fasta")
+	write_genome(genome_path)
+	fastq, header, sam_lines = simulate_reads(tmp_path / "pool", genome_path, 3)
+	number_of_pairs = fastq[0].count("\n") // 4
+	prefix_input = str(tmp_path / "pool" / "genome")
+
+	def read_names(fastq_text):
+		return [line[1:].rsplit("/", 1)[0] for line in fastq_text.splitlines()[::4]]
+
+	list_of_samples = []
+	for name, seed in (("sample1", 7), ("sample2", 7), ("sample3", 8)):
+		(tmp_path / name).mkdir()
+		prefix_output = str(tmp_path / name / "genome")
+		assert subsampler.subsample_genome(prefix_input, prefix_output, 0.3, seed) is None
+		with open(prefix_output + "1.fq") as fastq_1, open(prefix_output + "2.fq") as fastq_2, \
+				open(prefix_output + ".sam") as sam_file:
+			sample = (fastq_1.read(), fastq_2.read(), sam_file.read().splitlines())
+		names_1, names_2 = read_names(sample[0]), read_names(sample[1])
+		assert names_1 == names_2
+		assert len(names_1) == int(round(number_of_pairs * 0.3))
+		assert [line for line in sample[2] if line.startswith("@")] == header
+		sam_names = [line.split("\t", 1)[0] for line in sample[2] if not line.startswith("@")]
+		assert sorted(sam_names) == sorted(names_1 * 2)
+		assert set(sample[2]) <= set(header + sam_lines)
+		list_of_samples.append(sample)
+	assert list_of_samples[0] == list_of_samples[1]
+	assert list_of_samples[0] != list_of_samples[2]
+
+	(tmp_path / "bam").mkdir()
+	prefix_output = str(tmp_path / "bam" / "genome")
+	bam_writer = BamWriter(prefix_output + ".bam", tmp_dir=str(tmp_path))
+	assert subsampler.subsample_genome(prefix_input, prefix_output, 0.3, 7, bam_writer) is None
+	header_bam, records, block_offsets = decode_bam(prefix_output + ".bam")
+	assert sorted(record[-1] for record in records) == sorted(
+		line for line in list_of_samples[0][2] if not line.startswith("@"))
+	assert subsampler.subsample_genome(str(tmp_path / "missing"), prefix_output, 0.3, 7).startswith(
+		"Subsampling reads of")
+
+def test_renamed_reads_of_parts_are_unique():
+	"""
+		This function tests if reads of the parts of a split job get unique names, of decimal and hexadecimal (wgsim)
+		indices, keeping suffixes and the name shared by both reads of a pair
+	"""
+	from scripts.ReadSimulationWrapper import part_merger
+
+	for number_of_parts in (2, 10, 11):
+		for read_format, suffixes in (("seq-1-{}", ("/1", "/2")), ("seq_1-{:x}", ("_12_340_0:0:0_0:0:0/1", "_12_340_0:0:0_0:0:0/2"))):
+			list_of_names = []
+			for part in range(number_of_parts):
+				for index in range(300):
+					pair_names = set()
+					for suffix in suffixes:
+						read_name = read_format.format(index) + suffix
+						renamed = part_merger.rename_read(read_name, part, number_of_parts)
+						assert renamed.endswith(suffix)
+						assert renamed.rsplit("-", 1)[0] == read_name.rsplit("-", 1)[0]
+						pair_names.add(part_merger.get_pair_name(renamed))
+					assert len(pair_names) == 1
+					list_of_names.append(pair_names.pop())
+			assert len(set(list_of_names)) == number_of_parts * 300
+	assert part_merger.rename_read("seq-ff_1_2/1", 3, 11) == "seq-ff03_1_2/1"
+	assert part_merger.get_pair_name("seq-ff03_1_2/1") == "seq-ff03"
+
+def test_deferred_jobs_are_split_by_fair_share_of_all_samples(tmp_path, monkeypatch):
+	"""
+		This function tests if jobs of deferred samples are split by a fair share of the jobs of all samples,
+		not of each sample
+	"""
+	from scripts.ReadSimulationWrapper.readsimulationwrapper import ReadSimulationNumpy
+
+	genome_path = str(tmp_path / "genome.fasta")
+	write_genome(genome_path)
+	with open(str(tmp_path / "genome_locations.tsv"), "w") as genome_locations:
+		genome_locations.write("genome\t{}\n".format(genome_path))
+	list_of_tasks = []
+	monkeypatch.setattr(ReadSimulationNumpy, "_run_tasks", lambda self, tasks: list_of_tasks.append(tasks))
+	monkeypatch.setattr(ReadSimulationNumpy, "_post_process", lambda self, directory_output, dict_id_file_path: None)
+	simulator = ReadSimulationNumpy(None, None, max_processes=2, seed=1, tmp_dir=str(tmp_path), verbose=False)
+	for deferred in (False, True):
+		if deferred:
+			simulator.defer_tasks()
+		for sample in ("sample1", "sample2"):
+			directory_output = tmp_path / "{}_{}".format(sample, deferred)
+			directory_output.mkdir()
+			with open(str(tmp_path / "distribution.tsv"), "w") as distribution:
+				distribution.write("genome\t1\n")
+			simulator.simulate(
+				str(tmp_path / "distribution.tsv"), str(tmp_path / "genome_locations.tsv"), str(directory_output),
+				100000, "mbarc", 270, 27)
+		if deferred:
+			simulator.run_deferred_tasks()
+	# each single sample is split among all processes, both samples together fill them unsplit
+	assert [len(tasks) for tasks in list_of_tasks] == [2, 2, 2]
+	assert [task.cost for task in list_of_tasks[2]] == [sum(task.cost for task in list_of_tasks[0])] * 2
+
+def sleep_timed(duration):
+	"""
+		Scheduled task returning when it started and ended
+	"""
+	start = time.time()
+	time.sleep(duration)
+	return start, time.time()
+
+def test_memory_budget_admits_tasks_fitting_into_it():
+	"""
+		This function tests if the memory budget admits the first task fitting into it, up to the maximum number of tasks,
+		and a task exceeding the budget on its own once no other task is running
+	"""
+	from scripts.parallel import TaskThread, _MemoryBudget
+
+	tasks = [TaskThread(sleep_timed, (0,), memory=memory) for memory in (60, 50, 30, 150, 10, 10)]
+	budget = _MemoryBudget(100, 3)
+	pending = list(tasks)
+	assert budget.admit(pending) is tasks[0]
+	# the second task does not fit, the third does
+	assert budget.admit(pending) is tasks[2]
+	assert budget.admit(pending) is tasks[4]
+	assert budget.memory == 100 and budget.tasks == 3
+	budget.release(tasks[4])
+	# the last task fits, but the maximum number of tasks is reached after it
+	assert budget.admit(pending) is tasks[5]
+	assert budget.memory == 100 and budget.tasks == 3
+	for task in (tasks[0], tasks[2], tasks[5]):
+		budget.release(task)
+	assert budget.memory == 0 and budget.tasks == 0
+	# the oversized task is admitted alone
+	assert budget.admit([tasks[3]]) is tasks[3]
+	assert budget.memory == 150 and budget.tasks == 1
+	assert not budget._fits(tasks[4])
+	budget.release(tasks[3])
+	assert budget._fits(tasks[1])
+
+def test_scheduled_tasks_keep_within_memory_budget():
+	"""
+		This function tests if tasks running at the same time keep the sum of their estimated memory within the budget,
+		and if a task exceeding the budget runs alone
+	"""
+	from scripts.parallel import TaskThread, runThreadScheduled
+
+	max_memory = 100
+	list_of_memory = [60, 50, 40, 30, 20, 20, 10, 150, 45, 35]
+	tasks = [
+		TaskThread(sleep_timed, (0.05,), cost=cost, memory=memory)
+		for cost, memory in zip(range(len(list_of_memory)), list_of_memory)]
+	list_of_return_values, busy_fraction = runThreadScheduled(tasks, maxThreads=4, maxMemory=max_memory)
+	intervals = list(zip(list_of_return_values, list_of_memory))
+	for (start, end), memory in intervals:
+		# tasks running at the start of a task, including itself
+		running = [
+			other_memory for (other_start, other_end), other_memory in intervals if other_start <= start < other_end]
+		if memory > max_memory:
+			assert running == [memory]
+		else:
+			assert sum(running) <= max_memory
+			assert len(running) <= 4
+
+def test_read_cache_restores_and_evicts_entries(tmp_path):
+	"""
+		This function tests if cached reads are restored with bam files into the bam directory, if incomplete or
+		oversized output is not cached, and if the least recently used entries are evicted beyond the cache size
+	"""
+	from scripts.ReadSimulationWrapper.readcache import ReadCache
+	from scripts.ReadSimulationWrapper.readsimulationwrapper import ReadSimulationNumpy
+
+	genome_path = str(tmp_path / "genome.fasta")
+	write_genome(genome_path)
+	simulate_reads(tmp_path / "reads", genome_path, 1, bam=True)
+	prefix = str(tmp_path / "reads" / "genome")
+	dict_name_to_file_path = {name: prefix + name for name in ("1.fq", "2.fq", ".bam", ".bam.bai")}
+	size = sum(os.path.getsize(file_path) for file_path in dict_name_to_file_path.values())
+
+	read_cache = ReadCache(str(tmp_path / "cache"), size, verbose=False)
+	simulator = ReadSimulationNumpy(None, None, tmp_dir=str(tmp_path), verbose=False, read_cache=read_cache)
+	key = ReadCache.get_key(["genome", 1])
+	assert read_cache.get_file_names(key) is None
+	assert read_cache.add(key, dict_name_to_file_path)
+	assert read_cache.get_file_names(key) == sorted(dict_name_to_file_path)
+	for name in ("sample", "bam"):
+		(tmp_path / name).mkdir()
+	job = {
+		"key": key, "genome_id": "genome1", "directory_output": str(tmp_path / "sample"),
+		"directory_bam": str(tmp_path / "bam")}
+	assert simulator._restore_cached_job(job)
+	assert sorted(os.listdir(str(tmp_path / "sample"))) == ["genome11.fq", "genome12.fq"]
+	assert sorted(os.listdir(str(tmp_path / "bam"))) == ["genome1.bam", "genome1.bam.bai"]
+	for name, file_path in dict_name_to_file_path.items():
+		directory = tmp_path / ("bam" if name.startswith(".bam") else "sample")
+		with open(file_path, 'rb') as original, open(str(directory / ("genome1" + name)), 'rb') as restored:
+			assert original.read() == restored.read()
+	assert not simulator._restore_cached_job(dict(job, key=ReadCache.get_key(["genome", 2])))
+
+	# incomplete and oversized output is not cached
+	with open(str(tmp_path / "truncated.fq"), 'w') as truncated:
+		truncated.write("@read\nACGT\n+\nIIII")
+	assert not read_cache.add(ReadCache.get_key(["truncated"]), {"1.fq": str(tmp_path / "truncated.fq")})
+	with open(prefix + ".bam", 'rb') as bam_file:
+		data = bam_file.read()
+	with open(str(tmp_path / "truncated.bam"), 'wb') as truncated:
+		truncated.write(data[:-28])
+	assert not read_cache.add(ReadCache.get_key(["truncated"]), {".bam": str(tmp_path / "truncated.bam")})
+	with open(str(tmp_path / "large.fq"), 'w') as large:
+		large.write("@read\n{}\n+\n{}\n".format("A" * size, "I" * size))
+	assert not read_cache.add(ReadCache.get_key(["large"]), {"1.fq": str(tmp_path / "large.fq")})
+	assert sorted(os.listdir(str(tmp_path / "cache"))) == [key]
+
+	# room for two entries of fastq files
+	fastq_size = os.path.getsize(prefix + "1.fq") + os.path.getsize(prefix + "2.fq")
+	read_cache = ReadCache(str(tmp_path / "lru_cache"), 2 * fastq_size + fastq_size // 2, verbose=False)
+	keys = [ReadCache.get_key(["genome", index]) for index in range(4)]
+	now = time.time()
+	for index in range(2):
+		assert read_cache.add(keys[index], {"1.fq": prefix + "1.fq", "2.fq": prefix + "2.fq"})
+		os.utime(str(tmp_path / "lru_cache" / keys[index]), (now - 100 + index, now - 100 + index))
+	# the older entry is used, the newer one is evicted
+	assert read_cache.get_file_names(keys[0]) == ["1.fq", "2.fq"]
+	assert read_cache.add(keys[2], {"1.fq": prefix + "1.fq", "2.fq": prefix + "2.fq"})
+	assert sorted(os.listdir(str(tmp_path / "lru_cache"))) == sorted([keys[0], keys[2]])
+	assert read_cache.get_file_names(keys[1]) is None
+	os.utime(str(tmp_path / "lru_cache" / keys[2]), (now - 200, now - 200))
+	assert read_cache.add(keys[3], {"1.fq": prefix + "1.fq", "2.fq": prefix + "2.fq"})
+	assert sorted(os.listdir(str(tmp_path / "lru_cache"))) == sorted([keys[0], keys[3]])
+
+def test_job_manifest_records_complete_output(tmp_path):
+	"""
+		This function tests if only complete bam, fastq and sam files are recorded, if a job is complete while its
+		parameters and output files are unchanged, and if an interrupted last entry of the manifest is ignored
+	"""
+	from scripts.jobmanifest import JobManifest
+	from scripts.GoldStandardAssembly.bamwriter import BamWriter
+
+	header, records = get_sam_lines(200)
+	with BamWriter(str(tmp_path / "reads.bam")) as bam_writer:
+		bam_writer.write("\n".join(header + records) + "\n")
+	with open(str(tmp_path / "reads.bam"), 'rb') as bam_file:
+		data = bam_file.read()
+	with open(str(tmp_path / "truncated.bam"), 'wb') as truncated:
+		truncated.write(data[:-1])
+	for name, text in (
+			("reads.fq", "@r\nACGT\n+\nIIII\n"), ("truncated.fq", "@r\nACGT\n+\nIIII"),
+			("reads.sam", "r\t4\n"), ("truncated.sam", "r\t4"), ("empty.sam", "")):
+		with open(str(tmp_path / name), 'w') as text_file:
+			text_file.write(text)
+	for name, is_complete in (
+			("reads.bam", True), ("truncated.bam", False), ("reads.fq", True), ("truncated.fq", False),
+			("reads.sam", True), ("truncated.sam", False), ("empty.sam", True), ("reads.bam.bai", True),
+			("missing.fq", False)):
+		assert JobManifest.is_complete_file(str(tmp_path / name)) == is_complete, name
+
+	file_path_manifest = str(tmp_path / "manifest.jsonl")
+	manifest = JobManifest(file_path_manifest, verbose=False)
+	complete = [str(tmp_path / name) for name in ("reads.bam", "reads.bam.bai", "reads.fq", "reads.sam")]
+	assert manifest.add("job1", ["parameter", 1], complete, seed=5)
+	assert not manifest.add("job2", ["parameter", 1], complete + [str(tmp_path / "truncated.fq")])
+	assert manifest.is_complete("job1", ["parameter", 1])
+	assert not manifest.is_complete("job1", ["parameter", 2])
+	assert not manifest.is_complete("job2", ["parameter", 1])
+	with open(file_path_manifest, 'a') as manifest_file:
+		manifest_file.write('{"job": "job2", "param')
+	manifest = JobManifest(file_path_manifest, verbose=False)
+	assert manifest.is_complete("job1", ["parameter", 1])
+	assert not manifest.is_complete("job2", ["parameter", 1])
+	with open(str(tmp_path / "reads.fq"), 'a') as fastq_file:
+		fastq_file.write("@s\nACGT\n+\nIIII\n")
+	assert not manifest.is_complete("job1", ["parameter", 1])
+
+def test_rerun_of_simulation_skips_completed_jobs(tmp_path, monkeypatch):
+	"""
+		This function tests if a rerun of a read simulation with a job manifest only simulates the genomes
+		whose output is missing or changed
+	"""
+	from scripts.jobmanifest import JobManifest
+	from scripts.ReadSimulationWrapper.readsimulationwrapper import ReadSimulationNumpy
+
+	with open(str(tmp_path / "genome_locations.tsv"), "w") as genome_locations, \
+			open(str(tmp_path / "distribution.tsv"), "w") as distribution:
+		for genome_id, sequence_lengths in (("genome1", (5000, 3000)), ("genome2", (4000,)), ("genome3", (2000,))):
+			genome_path = str(tmp_path / (genome_id + ".fasta"))
+			write_genome(genome_path, sequence_lengths)
+			genome_locations.write("{}\t{}\n".format(genome_id, genome_path))
+			distribution.write("{}\t1\n".format(genome_id))
+	(tmp_path / "sample").mkdir()
+
+	def simulate():
+		simulator = ReadSimulationNumpy(
+			None, None, seed=1, tmp_dir=str(tmp_path), verbose=False,
+			manifest=JobManifest(str(tmp_path / "manifest.jsonl"), verbose=False))
+		simulator.simulate(
+			str(tmp_path / "distribution.tsv"), str(tmp_path / "genome_locations.tsv"), str(tmp_path / "sample"),
+			100000, "mbarc", 270, 27)
+
+	list_of_tasks = []
+	run_tasks = ReadSimulationNumpy._run_tasks
+
+	def run_tasks_recorded(self, tasks):
+		list_of_tasks.append([task.args[2] for task in tasks])
+		run_tasks(self, tasks)
+	monkeypatch.setattr(ReadSimulationNumpy, "_run_tasks", run_tasks_recorded)
+
+	simulate()
+	names = sorted(os.listdir(str(tmp_path / "sample")))
+	with open(str(tmp_path / "sample" / "genome11.fq")) as fastq_file:
+		fastq = fastq_file.read()
+	simulate()
+	# a changed and a missing output file
+	with open(str(tmp_path / "sample" / "genome2.sam"), 'a') as sam_file:
+		sam_file.write("\n")
+	os.remove(str(tmp_path / "sample" / "genome32.fq"))
+	simulate()
+	prefix = str(tmp_path / "sample") + os.sep
+	assert [sorted(prefixes) for prefixes in list_of_tasks] == [
+		[prefix + "genome1", prefix + "genome2", prefix + "genome3"], [], [prefix + "genome2", prefix + "genome3"]]
+	assert sorted(os.listdir(str(tmp_path / "sample"))) == names
+	with open(str(tmp_path / "sample" / "genome11.fq")) as fastq_file:
+		assert fastq_file.read() == fastq
+
+def test_packed_sequence_round_trips_bases_and_masks():
+	"""
+		This function tests if 2 bit packed sequences decode to their upper case bases at any positions and slices,
+		with runs of lower case, ambiguous and other characters besides 'ACGT' masked as 'N'
+	"""
+	from scripts.GenomePreparation.genomestore import pack_sequence, PackedSequence
+
+	random_state = np.random.RandomState(0)
+	list_of_sequences = [b"", b"A", b"acgt", b"NNNNN", b"nACGTn", b"ACGTRYKMacgtNNnn-*ACG", b"NacgtSWBDHVN.x"]
+	for length in (997, 1000, 4003):
+		characters = random_state.choice(list(b"ACGTACGTACGTacgtNnRY-"), length).astype(np.uint8)
+		list_of_sequences.append(characters.tobytes())
+	for sequence in list_of_sequences:
+		expected = bytes(character if character in b"ACGT" else ord("N") for character in sequence.upper())
+		packed, n_intervals = pack_sequence(np.frombuffer(sequence, dtype=np.uint8))
+		assert len(packed) == (len(sequence) + 3) // 4
+		assert n_intervals == [[match.start(), match.end()] for match in re.finditer(b"N+", expected)]
+		for start, end in n_intervals:
+			assert set(expected[start:end]) == {ord("N")}
+		packed_sequence = PackedSequence(packed, len(sequence), n_intervals)
+		assert len(packed_sequence) == len(sequence)
+		assert packed_sequence[:].tobytes() == expected
+		assert packed_sequence[3:-2:3].tobytes() == expected[3:-2:3]
+		if len(sequence) == 0:
+			continue
+		positions = random_state.randint(0, len(sequence), (5, 7))
+		expected_array = np.frombuffer(expected, dtype=np.uint8)
+		assert packed_sequence[positions].shape == (5, 7)
+		assert np.array_equal(packed_sequence[positions], expected_array[positions])
+
+def test_gsa_contigs_of_genome_store_equal_those_of_fasta(tmp_path):
+	"""
+		This function tests if gold standard contigs sliced from a reference of a genome store
+		equal those sliced from its fasta file, including positions past the end of the reference
+	"""
+	from scripts.GenomePreparation.genomestore import GenomeStore, pack_sequence, PackedSequence
+	from scripts.GoldStandardAssembly import coverage
+
+	sequence = b"ACGTACGTAC"
+	starts = np.array([0, 2, 7, 11])
+	ends = np.array([4, 5, 12, 13])
+	packed, n_intervals = pack_sequence(np.frombuffer(sequence, dtype=np.uint8))
+	for min_coverage in (1, 2):
+		list_of_output = []
+		for reference in (sequence, PackedSequence(packed, len(sequence), n_intervals)):
+			stream_output = io.BytesIO()
+			coverage.write_contigs(
+				stream_output, "s", reference, coverage.get_coverage(starts, ends, len(sequence)),
+				min_coverage=min_coverage)
+			list_of_output.append(stream_output.getvalue())
+		assert list_of_output[0] == list_of_output[1]
+	assert list_of_output[0] == b">s_from_1_to_5_total_2\nGT\n>s_from_8_to_13_total_1\nN\n"
+
+	reference_path, bam_path = write_gsa_input(tmp_path)
+	genome_store = GenomeStore(str(tmp_path / "genome_store"))
+	genome_store.build([reference_path])
+	genome = genome_store.get_genome(reference_path)
+	assert genome is not None
+	for min_coverage in (1, 3):
+		list_of_output = []
+		for reference in (None, genome):
+			stream_output = io.BytesIO()
+			assert coverage.bam_reads_to_contigs(
+				[bam_path, bam_path], reference_path, stream_output, min_coverage=min_coverage, genome=reference) > 0
+			list_of_output.append(stream_output.getvalue())
+		assert list_of_output[0] == list_of_output[1]
+	file_path_contigs = str(tmp_path / "contigs.fasta")
+	assert coverage.write_contig_file([bam_path], reference_path, file_path_contigs, genome=genome) is None
+	with open(file_path_contigs, 'rb') as contigs:
+		contigs_of_store = contigs.read()
+	assert coverage.write_contig_file([bam_path], reference_path, file_path_contigs) is None
+	with open(file_path_contigs, 'rb') as contigs:
+		assert contigs.read() == contigs_of_store
+
+def test_genome_statistics_index_is_invalidated_by_changed_files(tmp_path, monkeypatch):
+	"""
+		This function tests if genome statistics agree with those of SeqIO, if they are read from the sidecar index
+		without parsing the genome again, and if a changed genome or a corrupt sidecar file is indexed anew
+	"""
+	from Bio import SeqIO
+	from scripts.GenomePreparation.genomestatistics import GenomeStatisticsIndex
+
+	genome_path = str(tmp_path / "genome.fasta")
+	sequences = write_genome(genome_path)
+	directory_index = str(tmp_path / "index")
+
+	def expected_statistics():
+		records = list(SeqIO.parse(genome_path, "fasta"))
+		with open(genome_path, 'rb') as genome_file:
+			md5 = hashlib.md5(genome_file.read()).hexdigest()
+		return {
+			"sequence_lengths": [[record.id, len(record.seq)] for record in records],
+			"min_length": min(len(record.seq) for record in records),
+			"total_length": sum(len(record.seq) for record in records),
+			"n_count": sum(str(record.seq).upper().count("N") for record in records),
+			"md5": md5}
+
+	statistics = GenomeStatisticsIndex(directory_index).get_statistics(genome_path)
+	assert {name: statistics[name] for name in expected_statistics()} == expected_statistics()
+	assert statistics["n_count"] == 20
+	assert len(os.listdir(directory_index)) == 1
+
+	# a new index of the same directory reads the sidecar file
+	scanned = []
+	scan = GenomeStatisticsIndex._scan
+
+	def scan_recorded(self, file_path, file_format, key=None):
+		scanned.append(file_path)
+		return scan(self, file_path, file_format, key)
+	monkeypatch.setattr(GenomeStatisticsIndex, "_scan", scan_recorded)
+	genome_statistics = GenomeStatisticsIndex(directory_index)
+	assert genome_statistics.get_statistics(genome_path) == statistics
+	assert genome_statistics.get_sequence_lengths(genome_path) == (50, 8050)
+	assert scanned == []
+
+	# a changed genome of the same size and a different validation are indexed anew
+	with open(genome_path, 'r+') as genome_file:
+		genome_file.seek(len(">seq1 description\n"))
+		genome_file.write("nnnn")
+	os.utime(genome_path, (os.stat(genome_path).st_atime, os.stat(genome_path).st_mtime + 10))
+	statistics_changed = genome_statistics.get_statistics(genome_path)
+	assert {name: statistics_changed[name] for name in expected_statistics()} == expected_statistics()
+	assert statistics_changed["n_count"] == 24 and statistics_changed["md5"] != statistics["md5"]
+	genome_statistics.get_statistics(genome_path, ambiguous=False)
+	assert len(scanned) == 2
+	assert GenomeStatisticsIndex(directory_index).get_statistics(genome_path, ambiguous=False)["n_count"] == 24
+	assert len(scanned) == 2
+
+	for file_name in os.listdir(directory_index):
+		with open(os.path.join(directory_index, file_name), 'w') as sidecar_file:
+			sidecar_file.write('{"key": ')
+	assert GenomeStatisticsIndex(directory_index).get_statistics(genome_path)["n_count"] == 24
+	assert len(scanned) == 3
+
+	with open(genome_path, 'a') as genome_file:
+		genome_file.write(">seq1\nACGT\n")
+	with pytest.raises(IOError):
+		GenomeStatisticsIndex(directory_index).get_statistics(genome_path)
+
+def write_pbsim_output(directory, genome_id, sequence_index, number_of_reads):
+	"""
+		Write reference, maf alignments and fastq reads like pbsim does for one sequence of a genome,
+		return its sequence id and the expected sam lines
+	"""
+	random_state = np.random.RandomState(sequence_index)
+	prefix = str(directory / "{}_{:04d}".format(genome_id, sequence_index))
+	sequence_id = "{}_seq{}".format(genome_id, sequence_index)
+	reference = "".join(random_state.choice(list("ACGT"), 2000))
+	with open(prefix + ".ref", 'w') as reference_file:
+		reference_file.write(">{} pbsim reference\n{}\n".format(sequence_id, "\n".join(
+			reference[index:index + 70] for index in range(0, len(reference), 70))))
+	sam_lines = []
+	with open(prefix + ".maf", 'w') as maf_file, open(prefix + ".fastq", 'w') as fastq_file:
+		maf_file.write("##maf version=1\n")
+		for index in range(number_of_reads):
+			start = int(random_state.randint(0, 1500))
+			aligned_reference = list(reference[start:start + 300])
+			aligned_read = list(aligned_reference)
+			for column in random_state.randint(0, 300, 20):
+				if random_state.rand() < .5:
+					aligned_reference[column] = "-"
+				elif aligned_reference[column] != "-":
+					aligned_read[column] = "-"
+			aligned_reference, aligned_read = "".join(aligned_reference), "".join(aligned_read)
+			strand = random_state.choice(["+", "-"])
+			read = aligned_read.replace("-", "")
+			quality = "".join(chr(33 + value) for value in random_state.randint(0, 41, len(read)))
+			read_id = "S{}_{}".format(sequence_index, index + 1)
+			maf_file.write("a score=0\ns ref {} {} + 2000 {}\ns {} 0 {} {} {} {}\n\n".format(
+				start, len(aligned_reference) - aligned_reference.count("-"), aligned_reference,
+				read_id, len(read), strand, len(read), aligned_read))
+			fastq_file.write("@{}\n{}\n+{}\n{}\n".format(read_id, read, read_id, quality))
+			# cigar of each alignment column: insertion, deletion or match
+			columns = [
+				"I" if base_reference == "-" else "D" if base_read == "-" else "M"
+				for base_reference, base_read in zip(aligned_reference, aligned_read)]
+			cigar = "".join(
+				"{}{}".format(len(list(group)), operation) for operation, group in itertools.groupby(columns))
+			sam_lines.append("\t".join([
+				"{}-{}".format(sequence_id, index + 1), "0" if strand == "+" else "16", sequence_id, str(start), "255",
+				cigar, "*", "0", str(len(read)), read, quality]))
+	return sequence_id, sam_lines
+
+def test_maf_converter_streams_pbsim_output_into_sam(tmp_path):
+	"""
+		This function tests if pbsim alignments and reads are converted into sam lines of each genome,
+		renamed fastq reads and a read id map, and if reads missing from a fastq file are reported
+	"""
+	from Bio import SeqIO
+	from scripts.ReadSimulationWrapper import maf_converter
+
+	expected = {}
+	for genome_id, sequence_index, number_of_reads in (("genome1", 1, 30), ("genome1", 2, 20), ("genome2", 1, 10)):
+		sequence_id, sam_lines = write_pbsim_output(tmp_path, genome_id, sequence_index, number_of_reads)
+		expected.setdefault(genome_id, []).append((sequence_id, sequence_index, sam_lines))
+	maf_converter.main(str(tmp_path))
+
+	for genome_id, list_of_sequences in expected.items():
+		with open(str(tmp_path / (genome_id + ".sam"))) as sam_file:
+			assert sam_file.read().splitlines() == ["@HD\tVN:1.4\tSQ:unsorted"] + [
+				"@SQ\tSN:{}\tLN:2000".format(sequence_id) for sequence_id, sequence_index, sam_lines in list_of_sequences] + [
+				line for sequence_id, sequence_index, sam_lines in list_of_sequences for line in sam_lines]
+		read_ids = []
+		for sequence_id, sequence_index, sam_lines in list_of_sequences:
+			prefix = str(tmp_path / "{}_{:04d}".format(genome_id, sequence_index))
+			original = list(SeqIO.parse(prefix + ".fastq", "fastq"))
+			renamed = list(SeqIO.parse(prefix + ".fq", "fastq"))
+			assert [record.id for record in renamed] == [line.split("\t")[0] for line in sam_lines]
+			assert [str(record.seq) for record in renamed] == [str(record.seq) for record in original]
+			assert [record.letter_annotations for record in renamed] == [record.letter_annotations for record in original]
+			read_ids.extend("{}\t{}".format(record.id, renamed_record.id) for record, renamed_record in zip(original, renamed))
+		with open(str(tmp_path / (genome_id + "_read_ids.tsv"))) as read_ids_file:
+			assert read_ids_file.read().splitlines() == read_ids
+
+	# reads of a '.fq' file are renamed in place
+	(tmp_path / "fq").mkdir()
+	sequence_id, sam_lines = write_pbsim_output(tmp_path / "fq", "genome1", 1, 5)
+	prefix = str(tmp_path / "fq" / "genome1_0001")
+	os.rename(prefix + ".fastq", prefix + ".fq")
+	maf_converter.main(str(tmp_path / "fq"))
+	assert [record.id for record in SeqIO.parse(prefix + ".fq", "fastq")] == [line.split("\t")[0] for line in sam_lines]
+	assert not os.path.exists(prefix + ".fq.tmp")
+
+	# a read missing from the fastq file
+	(tmp_path / "missing").mkdir()
+	write_pbsim_output(tmp_path / "missing", "genome1", 1, 5)
+	prefix = str(tmp_path / "missing" / "genome1_0001")
+	with open(prefix + ".fastq") as fastq_file:
+		lines = fastq_file.readlines()
+	with open(prefix + ".fastq", 'w') as fastq_file:
+		fastq_file.writelines(lines[:8] + lines[12:])
+	with pytest.raises(ValueError):
+		maf_converter.main(str(tmp_path / "missing"))
+
+def test_nanosim_reads_are_written_as_sam_and_fastq(tmp_path):
+	"""
+		This function tests if nanosim reads are written as sam lines and fastq records in a single pass,
+		named after the original sequence ids, with unaligned reads unmapped
+	"""
+	from Bio import SeqIO
+	from scripts.ReadSimulationWrapper import sam_from_reads
+
+	random_state = np.random.RandomState(0)
+	references = [("NC_000913.3", 5000), ("contig_2", 3000)]
+	reads = []
+	with open(str(tmp_path / "genome_reads.fasta"), 'w') as read_file:
+		for index in range(50):
+			name, length = references[index % 2]
+			fixed_name = name.split(".", 1)[0].replace("_", "-")
+			status = "unaligned" if index % 7 == 0 else "aligned"
+			strand = "R" if index % 3 == 0 else "F"
+			start = int(random_state.randint(0, length - 500))
+			sequence = "".join(random_state.choice(list("ACGT"), random_state.randint(100, 500)))
+			separator = ";" if index % 2 else "_"
+			read_file.write(">{}_{}_{}_{}_{}{}0_{}_0\n{}\n".format(
+				fixed_name, start, status, index, strand, separator, len(sequence), sequence))
+			reads.append((name, start, status, index, strand, sequence))
+
+	with open(str(tmp_path / "genome.sam"), 'w') as samfile, \
+			sam_from_reads.open_fastq(str(tmp_path), "genome") as fastq:
+		assert sam_from_reads.write_header(samfile, references) == references
+		sam_from_reads.write_sam(str(tmp_path / "genome_reads.fasta"), references, samfile, fastq)
+
+	expected = ["@HD\tVN:1.4\tSQ:unsorted", "@SQ\tSN:NC_000913.3\tLN:5000", "@SQ\tSN:contig_2\tLN:3000"]
+	for name, start, status, index, strand, sequence in reads:
+		if status == "unaligned":
+			flag, reference, position, cigar = "4", "*", "0", "*"
+		else:
+			flag, reference, position, cigar = "16" if strand == "R" else "0", name, str(start), "{}M".format(len(sequence))
+		expected.append("\t".join([
+			"{}-{}".format(name, index), flag, reference, position, "255", cigar, "*", "0", str(len(sequence)),
+			sequence, "*"]))
+	with open(str(tmp_path / "genome.sam")) as samfile:
+		assert samfile.read().splitlines() == expected
+	records = list(SeqIO.parse(str(tmp_path / "genome.fq"), "fastq"))
+	assert [(record.id, str(record.seq)) for record in records] == [
+		("{}-{}".format(name, index), sequence) for name, start, status, index, strand, sequence in reads]
+	assert all(set(record.letter_annotations["phred_quality"]) == {40} for record in records)
+
+def test_raw_records_round_trip_like_seqio(tmp_path):
+	"""
+		This function tests if raw fasta and fastq records have the ids and sequences SeqIO parses,
+		and if renamed records are written byte by byte like SeqIO writes them, wrapped fastq records included
+	"""
+	from Bio import SeqIO
+	from scripts import sequencerecords
+
+	random_state = np.random.RandomState(0)
+	fasta = []
+	for index, width in enumerate((60, 70, 80, 1000, 7)):
+		sequence = "".join(random_state.choice(list("ACGTNacgtn"), random_state.randint(50, 400)))
+		fasta.append(">seq{} description {}\n{}\n".format(index, index, "\n".join(
+			sequence[start:start + width] for start in range(0, len(sequence), width))))
+	fasta.append(">empty\n")
+	fasta.append(">crlf\r\nACGT \r\nAC\r\n\r\n")
+	fasta.append(">last\nACGTACGT")
+	fastq = []
+	for index in range(6):
+		sequence = "".join(random_state.choice(list("ACGTN"), random_state.randint(1, 200)))
+		quality = "".join(chr(33 + value) for value in random_state.randint(0, 41, len(sequence)))
+		separator = "+read{} description".format(index) if index % 2 else "+"
+		fastq.append("@read{} description\n{}\n{}\n{}\n".format(index, sequence, separator, quality))
+	fastq.append("@wrapped\nACGT\nACGT\n+\nIIII\nIIII\n")
+	fastq.append("@last\nACGT\n+\nIIII")
+
+	for file_format, text in (
+			("fasta", "".join(fasta)), ("fastq", "".join(fastq[:6]) + fastq[7]), ("fastq", "".join(fastq))):
+		file_path = str(tmp_path / "records.{}".format(file_format))
+		with open(file_path, 'w', newline="") as sequence_file:
+			sequence_file.write(text)
+		records = list(sequencerecords.read_file_records(file_path, file_format))
+		seq_records = list(SeqIO.parse(file_path, file_format))
+		assert len(records) == len(seq_records)
+		for index, (record, seq_record) in enumerate(zip(records, seq_records)):
+			assert record.endswith(b"\n")
+			assert sequencerecords.get_id(record).decode() == seq_record.id
+			assert sequencerecords.get_sequence(record, file_format).decode() == str(seq_record.seq)
+			assert sequencerecords.get_sequence_length(record, file_format) == len(seq_record)
+			new_id = "new_{}".format(index)
+			seq_record.id, seq_record.description = new_id, ""
+			assert sequencerecords.rename(record, new_id.encode(), file_format).decode() == seq_record.format(file_format)
+
+	# wrapped fastq records are read with SeqIO from seekable streams only
+	with open(str(tmp_path / "records.fastq"), 'rb') as stream_input:
+		data = stream_input.read()
+	reader = io.BufferedReader(io.BytesIO(data))
+	reader.seekable = lambda: False
+	with pytest.raises(ValueError):
+		list(sequencerecords.read_records(reader, "fastq"))
+	with pytest.raises(ValueError):
+		list(sequencerecords.read_records(io.BytesIO(b"ACGT\n>seq\nACGT\n"), "fasta"))